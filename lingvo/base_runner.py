@@ -25,6 +25,7 @@ import traceback
 
 from lingvo import base_trial
 import lingvo.compat as tf
+from lingvo.core import async_summary_writer
 from lingvo.core import cluster_factory
 from lingvo.core import early_stop
 from lingvo.core import py_utils
@@ -79,6 +80,8 @@ class BaseRunner(object):
     self._train_dir = os.path.join(self._logdir, 'train')
     self._graph = tf.Graph()
     self._summary_writer = None
+    # All summary writers created by _CreateSummaryWriter.
+    self._summary_writers = []
     self.initialize_tables = None
 
     early_stop.MetricHistory.SetLogdirInMetricHistories(p, logdir)
@@ -166,6 +169,7 @@ class BaseRunner(object):
     try:
       tf.logging.info('%s started.', job_name)
       loop_func(*loop_args)
+      self._FlushSummaryWriters()
       tf.logging.info('%s done.', job_name)
       return
     except py_utils.transient_tf_errors + (
@@ -300,8 +304,26 @@ class BaseRunner(object):
     return path
 
   def _CreateSummaryWriter(self, logdir):
-    """Creates and returns a tf summary writer."""
-    return tf.summary.FileWriter(logdir)
+    """Creates and returns a tf summary writer.
+
+    Events are written on a background thread, so that a slow `logdir`
+    filesystem does not stall the runner's loop.
+
+    Args:
+      logdir: The directory to write events to.
+
+    Returns:
+      An `.AsyncSummaryWriter`.
+    """
+    writer = async_summary_writer.AsyncSummaryWriter(
+        tf.summary.FileWriter(logdir))
+    self._summary_writers.append(writer)
+    return writer
+
+  def _FlushSummaryWriters(self):
+    """Blocks until the events queued so far are written to disk."""
+    for writer in self._summary_writers:
+      writer.flush(wait=True)
 
   def _WriteSummaries(self,
                       summary_writer,
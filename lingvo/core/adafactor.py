@@ -0,0 +1,182 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Adafactor: adaptive learning rates with sublinear memory cost.
+
+Reference:
+'Adafactor: Adaptive Learning Rates with Sublinear Memory Cost'
+https://arxiv.org/abs/1804.04235
+
+Like Adam without its first moment, Adafactor divides the gradients by the
+square root of an exponential moving average of their square. For a matrix of
+shape [..., R, C], the average is factored into a row average of shape
+[..., R] and a column average of shape [..., C], so its slots take R + C
+floats instead of R * C.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import lingvo.compat as tf
+from lingvo.core import py_utils
+
+
+def _ReduceRms(x):
+  return tf.sqrt(tf.reduce_mean(tf.square(x)))
+
+
+class AdafactorOptimizer(tf.train.Optimizer):
+  """Optimizer that implements the Adafactor algorithm."""
+
+  def __init__(self,
+               learning_rate,
+               decay_rate=None,
+               decay_exponent=0.8,
+               beta1=0.0,
+               clipping_threshold=1.0,
+               multiply_by_parameter_scale=False,
+               factored=True,
+               min_dim_size_to_factor=128,
+               epsilon1=1e-30,
+               epsilon2=1e-3,
+               use_locking=False,
+               name='Adafactor'):
+    """Constructs an AdafactorOptimizer.
+
+    Args:
+      learning_rate: A scalar, the step size, or the relative step size if
+        multiply_by_parameter_scale.
+      decay_rate: The decay rate of the second moment average. If None, it is
+        1 - (step + 1)^-decay_exponent, which increases with the global step.
+      decay_exponent: The exponent of the decay rate when decay_rate is None.
+      beta1: The decay rate of the first moment average. If 0, there is no
+        first moment, and no slot for it.
+      clipping_threshold: If set, the updates are scaled down so that their RMS
+        is at most clipping_threshold.
+      multiply_by_parameter_scale: If True, the step size of a variable is
+        learning_rate times the RMS of the variable (at least epsilon2).
+      factored: Whether to factor the second moment of matrices.
+      min_dim_size_to_factor: Only factor the second moment of variables whose
+        two last dimensions are at least this size.
+      epsilon1: Added to the squared gradients.
+      epsilon2: The min parameter scale, when multiply_by_parameter_scale.
+      use_locking: If True, use locks for the update operations.
+      name: The name of the optimizer.
+    """
+    super(AdafactorOptimizer, self).__init__(use_locking, name)
+    self._learning_rate = learning_rate
+    self._decay_rate = decay_rate
+    self._decay_exponent = decay_exponent
+    self._beta1 = beta1
+    self._clipping_threshold = clipping_threshold
+    self._multiply_by_parameter_scale = multiply_by_parameter_scale
+    self._factored = factored
+    self._min_dim_size_to_factor = min_dim_size_to_factor
+    self._epsilon1 = epsilon1
+    self._epsilon2 = epsilon2
+
+  def _IsFactored(self, shape):
+    """Whether the second moment of a variable of shape is factored."""
+    return (self._factored and shape.ndims is not None and shape.ndims >= 2 and
+            shape[-2] >= self._min_dim_size_to_factor and
+            shape[-1] >= self._min_dim_size_to_factor)
+
+  def _create_slots(self, var_list):
+    for var in var_list:
+      shape = var.shape
+      # Initializers rather than tensors, so that the slots can be created in
+      # a control flow context, e.g. by optimizer.Accumulator.
+      if self._beta1:
+        self._get_or_make_slot_with_initializer(var, tf.zeros_initializer(),
+                                                shape, var.dtype.base_dtype,
+                                                'm', self._name)
+      if self._IsFactored(shape):
+        self._get_or_make_slot_with_initializer(var, tf.zeros_initializer(),
+                                                shape[:-1], tf.float32, 'vr',
+                                                self._name)
+        self._get_or_make_slot_with_initializer(
+            var, tf.zeros_initializer(), shape[:-2].concatenate(shape[-1:]),
+            tf.float32, 'vc', self._name)
+      else:
+        self._get_or_make_slot_with_initializer(var, tf.zeros_initializer(),
+                                                shape, tf.float32, 'v',
+                                                self._name)
+
+  def _DecayRate(self):
+    if self._decay_rate is not None:
+      return tf.convert_to_tensor(self._decay_rate, tf.float32)
+    step = tf.cast(py_utils.GetGlobalStep(), tf.float32) + 1.
+    return 1. - tf.pow(step, -self._decay_exponent)
+
+  def _apply_dense(self, grad, var):
+    grad = tf.cast(grad, tf.float32)
+    grad_squared = tf.square(grad) + self._epsilon1
+    decay_rate = self._DecayRate()
+    mixing_rate = 1. - decay_rate
+    updates = []
+    if self._IsFactored(var.shape):
+      vr = self.get_slot(var, 'vr')
+      vc = self.get_slot(var, 'vc')
+      new_vr = (
+          decay_rate * vr + mixing_rate * tf.reduce_mean(grad_squared, -1))
+      new_vc = (
+          decay_rate * vc + mixing_rate * tf.reduce_mean(grad_squared, -2))
+      updates += [
+          tf.assign(vr, new_vr, use_locking=self._use_locking),
+          tf.assign(vc, new_vc, use_locking=self._use_locking)
+      ]
+      # The second moment estimate is outer(vr, vc) / mean(vr).
+      row_factor = tf.rsqrt(new_vr / tf.reduce_mean(new_vr, -1, keepdims=True))
+      col_factor = tf.rsqrt(new_vc)
+      x = (
+          grad * tf.expand_dims(row_factor, -1) *
+          tf.expand_dims(col_factor, -2))
+    else:
+      v = self.get_slot(var, 'v')
+      new_v = decay_rate * v + mixing_rate * grad_squared
+      updates.append(tf.assign(v, new_v, use_locking=self._use_locking))
+      x = grad * tf.rsqrt(new_v)
+
+    if self._clipping_threshold is not None:
+      x /= tf.maximum(1., _ReduceRms(x) / self._clipping_threshold)
+    step_size = tf.cast(self._learning_rate, tf.float32)
+    if self._multiply_by_parameter_scale:
+      step_size *= tf.maximum(
+          _ReduceRms(tf.cast(var, tf.float32)), self._epsilon2)
+    update = step_size * x
+    if self._beta1:
+      m = self.get_slot(var, 'm')
+      update = (
+          self._beta1 * tf.cast(m, tf.float32) + (1. - self._beta1) * update)
+      updates.append(
+          tf.assign(
+              m, tf.cast(update, m.dtype), use_locking=self._use_locking))
+    updates.append(
+        tf.assign_sub(
+            var, tf.cast(update, var.dtype.base_dtype),
+            use_locking=self._use_locking))
+    return tf.group(*updates)
+
+  def _resource_apply_dense(self, grad, handle):
+    return self._apply_dense(grad, handle)
+
+  def _apply_sparse(self, grad, var):
+    return self._apply_dense(tf.convert_to_tensor(grad), var)
+
+  def _resource_apply_sparse(self, grad, handle, indices):
+    return self._apply_dense(
+        tf.convert_to_tensor(
+            tf.IndexedSlices(grad, indices, tf.shape(handle))), handle)
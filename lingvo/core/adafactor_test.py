@@ -0,0 +1,93 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for adafactor."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import lingvo.compat as tf
+from lingvo.core import adafactor
+from lingvo.core import py_utils
+from lingvo.core import test_utils
+import numpy as np
+from six.moves import range
+
+
+class AdafactorTest(test_utils.TestCase):
+
+  def testSlots(self):
+    with self.session(graph=tf.Graph()):
+      py_utils.GetOrCreateGlobalStepVar()
+      w = tf.get_variable('w', [256, 128])
+      b = tf.get_variable('b', [128])
+      small = tf.get_variable('small', [8, 128])
+      loss = tf.reduce_sum(tf.square(w)) + tf.reduce_sum(b) + tf.reduce_sum(
+          small)
+      opt = adafactor.AdafactorOptimizer(0.1)
+      opt.minimize(loss)
+      self.assertEqual([256], opt.get_slot(w, 'vr').shape.as_list())
+      self.assertEqual([128], opt.get_slot(w, 'vc').shape.as_list())
+      self.assertIsNone(opt.get_slot(w, 'v'))
+      self.assertEqual([128], opt.get_slot(b, 'v').shape.as_list())
+      # Too small to be factored.
+      self.assertEqual([8, 128], opt.get_slot(small, 'v').shape.as_list())
+      # No first moment by default.
+      self.assertIsNone(opt.get_slot(w, 'm'))
+
+      opt = adafactor.AdafactorOptimizer(0.1, beta1=0.9, name='Momentum')
+      opt.minimize(loss)
+      self.assertEqual([256, 128], opt.get_slot(w, 'm').shape.as_list())
+
+  def testFactoredUpdate(self):
+    np.random.seed(12345)
+    w_init = np.random.normal(size=[4, 3]).astype(np.float32)
+    grad = np.random.normal(size=[4, 3]).astype(np.float32)
+    lr = 0.1
+    with self.session(graph=tf.Graph()) as sess:
+      py_utils.GetOrCreateGlobalStepVar()
+      w = tf.get_variable('w', initializer=w_init)
+      opt = adafactor.AdafactorOptimizer(
+          lr, min_dim_size_to_factor=1, clipping_threshold=None)
+      update_op = opt.apply_gradients([(tf.constant(grad), w)])
+      sess.run(tf.global_variables_initializer())
+      sess.run(update_op)
+      actual = sess.run(w)
+
+    # At step 0, the decay rate is 0: the averages are the squared gradients.
+    vr = np.mean(np.square(grad), axis=1)
+    vc = np.mean(np.square(grad), axis=0)
+    v = np.outer(vr, vc) / np.mean(vr)
+    self.assertAllClose(w_init - lr * grad / np.sqrt(v), actual, rtol=1e-5)
+
+  def testMinimize(self):
+    np.random.seed(12345)
+    target = np.random.normal(size=[256, 128]).astype(np.float32)
+    with self.session(graph=tf.Graph()) as sess:
+      global_step = py_utils.GetOrCreateGlobalStepVar()
+      w = tf.get_variable('w', [256, 128], initializer=tf.zeros_initializer())
+      loss = tf.reduce_mean(tf.square(w - target))
+      train_op = adafactor.AdafactorOptimizer(0.05).minimize(
+          loss, global_step=global_step)
+      sess.run(tf.global_variables_initializer())
+      initial_loss = sess.run(loss)
+      for _ in range(100):
+        sess.run(train_op)
+      self.assertLess(sess.run(loss), 0.5 * initial_loss)
+
+
+if __name__ == '__main__':
+  tf.test.main()
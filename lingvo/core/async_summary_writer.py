@@ -0,0 +1,192 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""A summary writer which writes events on a background thread.
+
+`tf.summary.FileWriter.add_summary` serializes the event on the caller's
+thread and blocks once the writer's small internal queue is full, e.g. while a
+slow `logdir` filesystem is being written to. `AsyncSummaryWriter` instead only
+appends to a bounded in-memory queue. A background thread drains the queue,
+merges consecutive scalar summaries of the same step into a single event, and
+writes them with the wrapped writer. When the queue is full, the oldest queued
+event is dropped and counted in `num_dropped`.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import threading
+
+import lingvo.compat as tf
+
+from tensorflow.core.framework import summary_pb2
+
+_SUMMARY = 'summary'
+_GRAPH = 'graph'
+
+
+def _IsScalarSummary(summary):
+  return (isinstance(summary, summary_pb2.Summary) and summary.value and
+          all(v.HasField('simple_value') for v in summary.value))
+
+
+class AsyncSummaryWriter(object):
+  """Wraps a `tf.summary.FileWriter` to write events asynchronously.
+
+  Supports the subset of the `tf.summary.FileWriter` interface used by the
+  runners: `add_summary`, `add_graph`, `flush`, `close` and `get_logdir`.
+  """
+
+  def __init__(self, writer, max_queue_size=10000):
+    """Constructor.
+
+    Args:
+      writer: The `tf.summary.FileWriter` to write events with.
+      max_queue_size: Maximum number of queued events. When exceeded, the
+        oldest queued events are dropped.
+    """
+    self._writer = writer
+    self._max_queue_size = max_queue_size
+    self._queue = collections.deque()
+    self._cv = threading.Condition()
+    self._num_enqueued = 0
+    self._num_dropped = 0
+    self._num_logged_dropped = 0
+    self._flush_pending = False
+    # Number of events enqueued before the last flush of `writer`.
+    self._num_flushed = 0
+    self._num_flushes = 0
+    self._closed = False
+    self._thread = threading.Thread(
+        target=self._Run, name='AsyncSummaryWriter')
+    self._thread.daemon = True
+    self._thread.start()
+
+  @property
+  def num_dropped(self):
+    """The number of events dropped because the queue was full."""
+    with self._cv:
+      return self._num_dropped
+
+  def get_logdir(self):
+    return self._writer.get_logdir()
+
+  def _Enqueue(self, item):
+    with self._cv:
+      if self._closed:
+        raise ValueError('AsyncSummaryWriter is closed.')
+      if len(self._queue) >= self._max_queue_size:
+        self._queue.popleft()
+        self._num_dropped += 1
+      self._queue.append(item)
+      self._num_enqueued += 1
+      self._cv.notify_all()
+
+  def add_summary(self, summary, global_step=None):
+    """Queues a `tf.Summary` proto or serialized summary for writing."""
+    self._Enqueue((_SUMMARY, summary, global_step))
+
+  def add_graph(self, graph, global_step=None):
+    """Queues `graph` for writing. It is serialized on the writer thread."""
+    self._Enqueue((_GRAPH, graph, global_step))
+
+  def flush(self, wait=False):
+    """Requests the events queued so far to be written to disk.
+
+    Args:
+      wait: If True, blocks until they are written. Otherwise returns
+        immediately.
+    """
+    with self._cv:
+      target = self._num_enqueued
+      num_flushes = self._num_flushes
+      self._flush_pending = True
+      self._cv.notify_all()
+      if not wait:
+        return
+      while ((self._num_flushed < target or self._num_flushes == num_flushes)
+             and self._thread.is_alive()):
+        self._cv.wait(1.0)
+
+  def close(self):
+    """Writes all queued events and closes the wrapped writer."""
+    with self._cv:
+      if self._closed:
+        return
+      self._closed = True
+      self._cv.notify_all()
+    self._thread.join()
+    self._writer.close()
+
+  def _Write(self, items):
+    """Writes `items`, merging consecutive scalars of the same step."""
+    merged = None
+    merged_step = None
+    for kind, value, step in items:
+      if kind == _SUMMARY and _IsScalarSummary(value):
+        if merged is not None and merged_step == step:
+          merged.value.extend(value.value)
+          continue
+        if merged is not None:
+          self._writer.add_summary(merged, merged_step)
+        merged = summary_pb2.Summary()
+        merged.CopyFrom(value)
+        merged_step = step
+        continue
+      if merged is not None:
+        self._writer.add_summary(merged, merged_step)
+        merged = None
+      if kind == _GRAPH:
+        self._writer.add_graph(value, step)
+      else:
+        self._writer.add_summary(value, step)
+    if merged is not None:
+      self._writer.add_summary(merged, merged_step)
+
+  def _Run(self):
+    """The writer thread."""
+    while True:
+      with self._cv:
+        while not (self._queue or self._flush_pending or self._closed):
+          self._cv.wait()
+        items = list(self._queue)
+        self._queue.clear()
+        num_enqueued = self._num_enqueued
+        flush = self._flush_pending or self._closed
+        self._flush_pending = False
+        closed = self._closed
+        num_dropped = self._num_dropped
+      if num_dropped > self._num_logged_dropped:
+        tf.logging.warning(
+            'AsyncSummaryWriter queue for %s is full, dropped %d events so '
+            'far.', self._writer.get_logdir(), num_dropped)
+        self._num_logged_dropped = num_dropped
+      try:
+        self._Write(items)
+        if flush:
+          self._writer.flush()
+      except Exception as e:  # pylint: disable=broad-except
+        # Failing to write summaries must not take down the runner.
+        tf.logging.error('AsyncSummaryWriter failed to write to %s: %s',
+                         self._writer.get_logdir(), e)
+      with self._cv:
+        if flush:
+          self._num_flushed = num_enqueued
+          self._num_flushes += 1
+        self._cv.notify_all()
+      if closed and not items:
+        return
@@ -0,0 +1,118 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for async_summary_writer."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import threading
+import time
+
+import lingvo.compat as tf
+from lingvo.core import async_summary_writer
+from lingvo.core import metrics
+from lingvo.core import test_utils
+
+
+class FakeWriter(object):
+  """Records the events written to it."""
+
+  def __init__(self):
+    self.summaries = []
+    self.graphs = []
+    self.num_flushes = 0
+    self.closed = False
+    # Blocks add_summary while cleared.
+    self.unblocked = threading.Event()
+    self.unblocked.set()
+
+  def get_logdir(self):
+    return '/fake'
+
+  def add_summary(self, summary, global_step=None):
+    self.unblocked.wait()
+    self.summaries.append((summary, global_step))
+
+  def add_graph(self, graph, global_step=None):
+    self.graphs.append((graph, global_step))
+
+  def flush(self):
+    self.num_flushes += 1
+
+  def close(self):
+    self.closed = True
+
+
+def _Tags(summary):
+  return [v.tag for v in summary.value]
+
+
+def _WaitUntilDequeued(writer):
+  """Waits for the writer thread to take all queued events."""
+  while writer._queue:  # pylint: disable=protected-access
+    time.sleep(0.01)
+
+
+class AsyncSummaryWriterTest(test_utils.TestCase):
+
+  def testMergesScalarsOfTheSameStep(self):
+    fake = FakeWriter()
+    writer = async_summary_writer.AsyncSummaryWriter(fake)
+    # Holds the writer thread so that all events are queued together.
+    fake.unblocked.clear()
+    writer.add_summary(metrics.CreateScalarSummary('unused', 0.), 0)
+    _WaitUntilDequeued(writer)
+    writer.add_summary(metrics.CreateScalarSummary('a', 1.), 1)
+    writer.add_summary(metrics.CreateScalarSummary('b', 2.), 1)
+    writer.add_summary(metrics.CreateScalarSummary('c', 3.), 2)
+    text = tf.Summary(value=[
+        tf.Summary.Value(tag='text', tensor=tf.make_tensor_proto(['hi']))
+    ])
+    writer.add_summary(text, 2)
+    writer.add_summary(metrics.CreateScalarSummary('d', 4.), 2)
+    writer.add_graph('graph', 3)
+    fake.unblocked.set()
+    writer.flush(wait=True)
+
+    self.assertEqual([(['unused'], 0), (['a', 'b'], 1), (['c'], 2),
+                      (['text'], 2), (['d'], 2)],
+                     [(_Tags(s), step) for s, step in fake.summaries])
+    self.assertEqual([('graph', 3)], fake.graphs)
+    self.assertGreaterEqual(fake.num_flushes, 1)
+    self.assertEqual(0, writer.num_dropped)
+    writer.close()
+    self.assertTrue(fake.closed)
+
+  def testDropsOldestWhenFull(self):
+    fake = FakeWriter()
+    writer = async_summary_writer.AsyncSummaryWriter(fake, max_queue_size=2)
+    fake.unblocked.clear()
+    writer.add_summary(metrics.CreateScalarSummary('blocking', 0.), 0)
+    _WaitUntilDequeued(writer)
+    for i in range(5):
+      writer.add_summary(metrics.CreateScalarSummary('s%d' % i, i), i)
+    self.assertEqual(3, writer.num_dropped)
+    fake.unblocked.set()
+    writer.close()
+    self.assertEqual(['blocking', 's3', 's4'],
+                     [_Tags(s)[0] for s, _ in fake.summaries])
+    with self.assertRaisesRegex(ValueError, 'closed'):
+      writer.add_summary(metrics.CreateScalarSummary('late', 0.), 5)
+
+
+if __name__ == '__main__':
+  tf.test.main()
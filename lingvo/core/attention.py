@@ -49,8 +49,9 @@ def _ConditionalDefun(cond, *args, **kwargs):
 def _ApplyAttentionDropout(params, x, global_step):
   """Apply attention dropout according to the given parameters.
 
-  If `params.atten_dropout_deterministic` is set to True, the dropout will be
-  fully deterministic.
+  If `params.atten_dropout_deterministic` is set to True, or within a
+  `.py_utils.DeterministicDropoutScope`, the dropout will be fully
+  deterministic.
 
   Args:
     params: The parameters of attention layer.
@@ -63,7 +64,8 @@ def _ApplyAttentionDropout(params, x, global_step):
   if params.atten_dropout_prob == 0:
     return x
 
-  if params.atten_dropout_deterministic:
+  if (params.atten_dropout_deterministic or
+      py_utils.UseDeterministicDropout()):
     seeds = py_utils.GenerateStepSeedPair(params, global_step)
     return py_utils.DeterministicDropout(x, 1.0 - params.atten_dropout_prob,
                                          seeds)
@@ -152,6 +152,19 @@ class BaseBeamSearchDecoder(BaseDecoder):
     """
     return encoder_outputs
 
+  def AddShortlistCandidates(self, encoder_outputs, src):
+    """Adds the target vocabulary shortlist candidates to encoder_outputs.
+
+    Args:
+      encoder_outputs: a NestedMap computed by encoder.
+      src: a NestedMap containing source input fields.
+
+    Returns:
+      encoder_outputs, with the candidates of the shortlist of the decoder if
+      it has one.
+    """
+    return encoder_outputs
+
   def BeamSearchDecode(self, encoder_outputs, num_hyps_per_beam_override=0):
     """Performs beam search based decoding.
 
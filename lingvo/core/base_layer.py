@@ -19,6 +19,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import contextlib
 import re
 import threading
 import lingvo.compat as tf
@@ -39,6 +40,36 @@ class _LocalLayerStack(threading.local):
 _LAYER_STACK = _LocalLayerStack()
 
 
+class _LocalFPropProfiling(threading.local):
+
+  def __init__(self):
+    super(_LocalFPropProfiling, self).__init__()
+    self.enabled = False
+
+
+_FPROP_PROFILING = _LocalFPropProfiling()
+
+
+@contextlib.contextmanager
+def ProfileFProp():
+  """Layers constructed in this context record the name scopes of FProp.
+
+  Each call to `FProp` of such a layer runs in a new name scope named after
+  the layer, which is appended to `layer.fprop_scopes`. `.layer_profiler` uses
+  them to attribute the ops of a graph to the layers. Ops of a layer are named
+  differently than without profiling, so only use it for profiling.
+
+  Yields:
+    Nothing.
+  """
+  enabled = _FPROP_PROFILING.enabled
+  _FPROP_PROFILING.enabled = True
+  try:
+    yield
+  finally:
+    _FPROP_PROFILING.enabled = enabled
+
+
 class Accumulator(object):
   """Layers can register accumulators to persist step-level state.
 
@@ -222,6 +253,12 @@ class BaseLayer(tf.Module):
         'If None/False, only variables explicitly in the '
         'SKIP_LP_REGULARIZATION collection will skip Lp regularization. '
         'Also propagated to child layers with default settings (None).')
+    p.Define(
+        'remat_policy', None,
+        'If not None, the params of a `.remat_policy.RematerializationPolicy` '
+        'which selects the layers of the layer stacks to rematerialize in the '
+        'backward pass. Also propagated to child layers with default '
+        'settings (None).')
     return p
 
   @staticmethod
@@ -244,6 +281,8 @@ class BaseLayer(tf.Module):
       to_params.allow_implicit_capture = from_params.allow_implicit_capture
     if to_params.skip_lp_regularization is None:
       to_params.skip_lp_regularization = from_params.skip_lp_regularization
+    if to_params.remat_policy is None and from_params.remat_policy is not None:
+      to_params.remat_policy = from_params.remat_policy.Copy()
 
     # Only copy from base when vn config is using the default setting.
     if to_params.vn == DefaultVN():
@@ -315,9 +354,24 @@ class BaseLayer(tf.Module):
     # self._var_symbolic_shape_map['var_name'] will be a tuple of integers or
     # symbolic expressions, one for each dimension of the variable.
     self._var_symbolic_shape_map = dict()
+    # Name scopes of the calls to FProp, if constructed under ProfileFProp().
+    self._fprop_scopes = []
+    if _FPROP_PROFILING.enabled:
+      self.FProp = self._ScopedFProp(self.FProp)
 
     self.AddExtraTheta('global_step', py_utils.GetGlobalStep())
 
+  def _ScopedFProp(self, fprop):
+    """Wraps fprop in a name scope recorded in self._fprop_scopes."""
+    scope_name = re.sub('[^a-zA-Z0-9_.-]+', '_', self.params.name)
+
+    def _FProp(*args, **kwargs):
+      with tf.name_scope(scope_name) as scope:
+        self._fprop_scopes.append(scope)
+        return fprop(*args, **kwargs)
+
+    return _FProp
+
   def FPropNestedMap(self, theta, input_map):
     """Forward propagation where input and output are both single NestedMap's.
 
@@ -424,6 +478,11 @@ class BaseLayer(tf.Module):
     else:
       return self.params.name
 
+  @property
+  def fprop_scopes(self):
+    """Name scopes of FProp calls, if constructed under ProfileFProp()."""
+    return self._fprop_scopes
+
   @property
   def layer_type(self):
     """Returns layer type prefixed with 'lingvo.'."""
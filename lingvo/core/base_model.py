@@ -122,6 +122,11 @@ class BaseTask(base_layer.BaseLayer):
     tp.Define('max_steps', 4 * 10**6, 'Maximum number of training steps.')
     tp.Define('tpu_steps_per_loop', 100, 'The number of training steps per '
               'training loop for TPUs.')
+    tp.Define(
+        'steps_per_loop', 1, 'The number of training steps per session run '
+        'of the non-TPU trainer. If > 1, the steps run in an in-graph loop, '
+        'eval metrics are averaged over the loop and only the per-example '
+        'tensors of its last step are processed.')
     tp.Define(
         'vn_start_step', 200000000,
         'Step starting from which variational noise is added to '
@@ -1055,6 +1060,11 @@ class BaseModel(base_layer.BaseLayer):
     tp.Define('max_steps', 4 * 10**6, 'Training max of 4M steps.')
     tp.Define('tpu_steps_per_loop', 100, 'The number of training steps per '
               'training loop for TPUs.')
+    tp.Define(
+        'steps_per_loop', 1, 'The number of training steps per session run '
+        'of the non-TPU trainer. If > 1, the steps run in an in-graph loop, '
+        'eval metrics are averaged over the loop and only the per-example '
+        'tensors of its last step are processed.')
     tp.Define(
         'ema_decay', 0.0,
         'If > 0, enable ExponentialMovingAverage during training '
@@ -1175,6 +1185,7 @@ class SingleTaskModel(BaseModel):
       tp.start_up_delay_steps = p.task.train.start_up_delay_steps
       tp.max_steps = p.task.train.max_steps
       tp.tpu_steps_per_loop = p.task.train.tpu_steps_per_loop
+      tp.steps_per_loop = p.task.train.steps_per_loop
       tp.ema_decay = p.task.train.ema_decay
       # init_from_checkpoint_rules does not need to be copied.
       tp.early_stop = p.task.train.early_stop
@@ -0,0 +1,353 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Resumable offline batch inference over text files with a `.Predictor`.
+
+Input lines are split into fixed size chunks. Worker processes parse the lines
+of a chunk, sort them by length to minimize padding, and build the feed arrays
+of every batch. The arrays are handed to the session process through files in
+a shared memory directory (`/dev/shm` by default) which are memory mapped
+instead of being pickled. While the session process runs one chunk, the
+workers prepare the next ones.
+
+Outputs of each chunk are restored to the original line order and written to
+a chunk file once the chunk is done, so an interrupted run resumes from the
+first unfinished chunk. When all chunks are done they are concatenated into
+the final output file.
+
+Example::
+
+  def ParseLine(line):
+    ids = tokenize(line)
+    return len(ids), ids
+
+  def MakeFeeds(elements):
+    return {'src_ids': PadToArray(elements)}
+
+  def FormatOutputs(fetched, num_examples):
+    return [DetokenizeHyp(fetched['topk_decoded'][i])
+            for i in range(num_examples)]
+
+  runner = batch_inference.BatchInferenceRunner(
+      inference_graph='/tmp/logdir/inference_graphs/inference.pbtxt',
+      checkpoint='/tmp/logdir/train/ckpt-00100000',
+      parse_fn=ParseLine, batch_fn=MakeFeeds, output_fn=FormatOutputs,
+      fetch_keys=['topk_decoded'])
+  runner.Run('/data/corpus-*.txt', '/tmp/out.txt')
+
+`parse_fn` and `batch_fn` run in worker processes and hence must be
+picklable, e.g. module level functions or `functools.partial` of them.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import functools
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+from lingvo import compat as tf
+from lingvo.core import predictor
+import numpy as np
+import six
+from six.moves import range
+
+_DEFAULT_SHM_DIR = '/dev/shm'
+
+
+def _SaveShared(arr, path):
+  """Writes `arr` to `path` so that it can be memory mapped."""
+  np.save(path, np.ascontiguousarray(arr))
+  return path
+
+
+def _LoadShared(path):
+  """Memory maps an array written by `_SaveShared`."""
+  return np.load(path, mmap_mode='r')
+
+
+def _PrepareChunk(parse_fn, batch_fn, batch_size, shm_dir, chunk):
+  """Parses and batches the lines of a chunk.
+
+  Args:
+    parse_fn: Callable mapping a line to a (length, element) pair.
+    batch_fn: Callable mapping a list of elements to a dict of feed name to
+      numpy array.
+    batch_size: Maximum number of elements per batch.
+    shm_dir: If not None, feed arrays are written to files in this directory
+      and the returned batches refer to them by path.
+    chunk: A (chunk_id, lines) pair.
+
+  Returns:
+    A (chunk_id, num_lines, batches) tuple, where batches is a list of
+    (indices, feeds) pairs. indices are the positions of the batch elements
+    within the chunk and feeds maps feed names to arrays or, if `shm_dir` is
+    set, to paths of arrays.
+  """
+  chunk_id, lines = chunk
+  parsed = [parse_fn(line) for line in lines]
+  # A stable sort keeps equal length inputs in their original order.
+  order = sorted(range(len(parsed)), key=lambda i: parsed[i][0])
+  batches = []
+  for b, start in enumerate(range(0, len(order), batch_size)):
+    indices = order[start:start + batch_size]
+    feeds = batch_fn([parsed[i][1] for i in indices])
+    if shm_dir is not None:
+      feeds = {
+          k: _SaveShared(
+              v, os.path.join(shm_dir, 'chunk%d_batch%d_%s.npy' %
+                              (chunk_id, b, k)))
+          for k, v in six.iteritems(feeds)
+      }
+    batches.append((indices, feeds))
+  return chunk_id, len(lines), batches
+
+
+def _PrepareAhead(pool, prepare_fn, chunks, max_in_flight):
+  """Yields `prepare_fn` of each of `chunks`, in order, computed by `pool`.
+
+  Unlike `pool.imap`, which consumes all of `chunks` at once and queues every
+  result, at most `max_in_flight` chunks are prepared ahead of the consumer, so
+  that prepared batches do not pile up in memory and in the shared memory
+  directory.
+
+  Args:
+    pool: A `multiprocessing.Pool`.
+    prepare_fn: Callable applied to each chunk in the pool.
+    chunks: An iterable of chunks.
+    max_in_flight: Maximum number of chunks submitted to the pool but not yet
+      yielded.
+
+  Yields:
+    `prepare_fn(chunk)` for each chunk of `chunks`.
+  """
+  assert max_in_flight > 0
+  chunks = iter(chunks)
+  in_flight = collections.deque()
+  for chunk in chunks:
+    in_flight.append(pool.apply_async(prepare_fn, (chunk,)))
+    if len(in_flight) == max_in_flight:
+      break
+  while in_flight:
+    result = in_flight.popleft().get()
+    # Keeps the workers busy while the consumer processes `result`.
+    for chunk in chunks:
+      in_flight.append(pool.apply_async(prepare_fn, (chunk,)))
+      break
+    yield result
+
+
+class BatchInferenceRunner(object):
+  """Runs a `.Predictor` over all lines of a set of text files."""
+
+  def __init__(self,
+               inference_graph,
+               checkpoint,
+               parse_fn,
+               batch_fn,
+               output_fn,
+               fetch_keys,
+               subgraph_name=None,
+               device_type='cpu',
+               tf_master='',
+               batch_size=64,
+               chunk_size=10000,
+               num_workers=4,
+               shm_dir=None):
+    """Constructor.
+
+    Args:
+      inference_graph: An InferenceGraph proto or the path to one.
+      checkpoint: The checkpoint to load.
+      parse_fn: Callable mapping an input line (without the trailing newline)
+        to a (length, element) pair. Lines are sorted by length before being
+        batched. Runs in worker processes.
+      batch_fn: Callable mapping a list of elements returned by `parse_fn` to
+        a dict of predictor feed name to numpy array. Runs in worker
+        processes.
+      output_fn: Callable taking a dict of fetch key to fetched value and the
+        number of examples in the batch, returning one output string per
+        example. Runs in the session process.
+      fetch_keys: The predictor fetches passed to `output_fn`.
+      subgraph_name: The inference subgraph to use.
+      device_type: Device type, either cpu, gpu, or tpu.
+      tf_master: tf_master for the predictor session.
+      batch_size: Maximum number of examples per batch.
+      chunk_size: Number of lines per chunk. Lines are sorted by length within
+        a chunk, and progress is checkpointed after every chunk.
+      num_workers: Number of parsing and batching processes. If 0, chunks are
+        prepared in the session process.
+      shm_dir: Directory to exchange batches through. Defaults to /dev/shm if
+        it exists, else the system temp directory.
+    """
+    self._parse_fn = parse_fn
+    self._batch_fn = batch_fn
+    self._output_fn = output_fn
+    self._fetch_keys = list(fetch_keys)
+    self._batch_size = batch_size
+    self._chunk_size = chunk_size
+    self._num_workers = num_workers
+    if shm_dir is None:
+      shm_dir = (
+          _DEFAULT_SHM_DIR
+          if os.path.isdir(_DEFAULT_SHM_DIR) else tempfile.gettempdir())
+    # A private subdirectory avoids clashes between concurrent runners.
+    self._shm_dir = tempfile.mkdtemp(prefix='batch_inference_', dir=shm_dir)
+    # Workers are forked before TensorFlow creates any session threads.
+    self._pool = (
+        multiprocessing.Pool(num_workers) if num_workers > 0 else None)
+    self._predictor = predictor.Predictor(
+        inference_graph=inference_graph,
+        subgraph_name=subgraph_name,
+        checkpoint=checkpoint,
+        device_type=device_type,
+        tf_master=tf_master)
+
+  def Close(self):
+    """Terminates the worker processes and removes shared files."""
+    if self._pool:
+      self._pool.terminate()
+      self._pool.join()
+      self._pool = None
+    if os.path.isdir(self._shm_dir):
+      shutil.rmtree(self._shm_dir)
+
+  def _ChunkPath(self, output_path, chunk_id):
+    return '%s-chunk-%.5d' % (output_path, chunk_id)
+
+  def _ProgressPath(self, output_path):
+    return output_path + '.progress'
+
+  def _LoadProgress(self, output_path):
+    """Returns the ids of chunks already done by a previous run."""
+    progress_path = self._ProgressPath(output_path)
+    if not tf.io.gfile.exists(progress_path):
+      return set()
+    with tf.io.gfile.GFile(progress_path) as f:
+      progress = json.loads(f.read())
+    if progress['chunk_size'] != self._chunk_size:
+      raise ValueError(
+          'Cannot resume %s: chunk_size changed from %d to %d.' %
+          (output_path, progress['chunk_size'], self._chunk_size))
+    return set(progress['done_chunks'])
+
+  def _SaveProgress(self, output_path, done_chunks):
+    progress_path = self._ProgressPath(output_path)
+    with tf.io.gfile.GFile(progress_path + '.tmp', 'w') as f:
+      f.write(
+          json.dumps({
+              'chunk_size': self._chunk_size,
+              'done_chunks': sorted(done_chunks),
+          }))
+    tf.io.gfile.rename(progress_path + '.tmp', progress_path, overwrite=True)
+
+  def _Chunks(self, input_file_pattern, done_chunks):
+    """Yields (chunk_id, lines) of chunks not in `done_chunks`."""
+    filenames = sorted(tf.io.gfile.glob(input_file_pattern))
+    if not filenames:
+      raise ValueError('No files match %s.' % input_file_pattern)
+    chunk_id = 0
+    lines = []
+    for filename in filenames:
+      with tf.io.gfile.GFile(filename) as f:
+        for line in f:
+          lines.append(line.rstrip('\n'))
+          if len(lines) == self._chunk_size:
+            if chunk_id not in done_chunks:
+              yield chunk_id, lines
+            chunk_id += 1
+            lines = []
+    if lines and chunk_id not in done_chunks:
+      yield chunk_id, lines
+
+  def _RunChunk(self, num_lines, batches):
+    """Runs the predictor on the batches of a chunk.
+
+    Returns:
+      The outputs of the chunk, in the original line order.
+    """
+    outputs = [None] * num_lines
+    for indices, feeds in batches:
+      if self._pool:
+        paths = feeds
+        feeds = {k: _LoadShared(v) for k, v in six.iteritems(paths)}
+      fetched = self._predictor.Run(self._fetch_keys, **feeds)
+      batch_outputs = self._output_fn(
+          dict(zip(self._fetch_keys, fetched)), len(indices))
+      assert len(batch_outputs) == len(indices), (len(batch_outputs),
+                                                  len(indices))
+      for i, out in zip(indices, batch_outputs):
+        outputs[i] = out
+      if self._pool:
+        for path in six.itervalues(paths):
+          os.remove(path)
+    return outputs
+
+  def Run(self, input_file_pattern, output_path):
+    """Runs inference on all lines matching `input_file_pattern`.
+
+    Args:
+      input_file_pattern: A glob of text files with one input per line. Files
+        are read in sorted order.
+      output_path: The output file. Contains one output line per input line,
+        in the input order.
+
+    Returns:
+      The number of chunks run, excluding those done by previous runs.
+    """
+    done_chunks = self._LoadProgress(output_path)
+    if done_chunks:
+      tf.logging.info('Resuming %s with %d chunks done.', output_path,
+                      len(done_chunks))
+    chunks = self._Chunks(input_file_pattern, done_chunks)
+    if self._pool:
+      prepare_fn = functools.partial(_PrepareChunk, self._parse_fn,
+                                     self._batch_fn, self._batch_size,
+                                     self._shm_dir)
+      # While the session process runs a chunk, each worker prepares at most
+      # one of the next chunks.
+      prepared = _PrepareAhead(self._pool, prepare_fn, chunks,
+                               self._num_workers)
+    else:
+      prepared = (_PrepareChunk(self._parse_fn, self._batch_fn,
+                                self._batch_size, None, c) for c in chunks)
+
+    num_run = 0
+    for chunk_id, num_lines, batches in prepared:
+      outputs = self._RunChunk(num_lines, batches)
+      chunk_path = self._ChunkPath(output_path, chunk_id)
+      with tf.io.gfile.GFile(chunk_path, 'w') as f:
+        for out in outputs:
+          f.write(out + '\n')
+      done_chunks.add(chunk_id)
+      self._SaveProgress(output_path, done_chunks)
+      num_run += 1
+      tf.logging.info('Done chunk %d (%d lines).', chunk_id, num_lines)
+
+    # All chunks are done, merge them in order.
+    with tf.io.gfile.GFile(output_path, 'w') as out_f:
+      for chunk_id in sorted(done_chunks):
+        with tf.io.gfile.GFile(self._ChunkPath(output_path, chunk_id)) as f:
+          out_f.write(f.read())
+    for chunk_id in done_chunks:
+      tf.io.gfile.remove(self._ChunkPath(output_path, chunk_id))
+    if done_chunks:
+      tf.io.gfile.remove(self._ProgressPath(output_path))
+    return num_run
@@ -0,0 +1,182 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for lingvo.core.batch_inference."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import multiprocessing
+import os
+
+import lingvo.compat as tf
+from lingvo.core import base_input_generator
+from lingvo.core import base_model
+from lingvo.core import batch_inference
+from lingvo.core import inference_graph_exporter
+from lingvo.core import inference_graph_pb2
+from lingvo.core import test_utils
+import numpy as np
+from six.moves import range
+
+
+class DummyModel(base_model.BaseTask):
+
+  def Inference(self):
+    with tf.name_scope('inference'):
+      ids = tf.placeholder(name='ids', dtype=tf.int32, shape=[None, None])
+      lens = tf.reduce_sum(tf.cast(tf.greater(ids, 0), tf.int32), axis=1)
+      inference_graph = inference_graph_pb2.InferenceGraph()
+      subgraph = inference_graph.subgraphs['default']
+      subgraph.feeds['ids'] = ids.name
+      subgraph.fetches['lens'] = lens.name
+      subgraph.fetches['padded_len'] = tf.shape(ids)[1].name
+      return inference_graph
+
+
+def _ParseLine(line):
+  ids = [int(x) for x in line.split()]
+  return len(ids), ids
+
+
+def _MakeFeeds(elements):
+  max_len = max(len(x) for x in elements)
+  ids = np.zeros([len(elements), max_len], dtype=np.int32)
+  for i, x in enumerate(elements):
+    ids[i, :len(x)] = x
+  return {'ids': ids}
+
+
+def _FormatOutputs(fetched, num_examples):
+  return [
+      '%d %d' % (fetched['lens'][i], fetched['padded_len'])
+      for i in range(num_examples)
+  ]
+
+
+def _Square(x):
+  return x * x
+
+
+class BatchInferenceTest(test_utils.TestCase):
+
+  def _InferenceGraph(self):
+    p = base_model.SingleTaskModel.Params(DummyModel.Params().Set(name='test'))
+    p.input = base_input_generator.BaseInputGenerator.Params().Set(name='test')
+    return inference_graph_exporter.InferenceGraphExporter.Export(p)
+
+  def _WriteInputs(self, lengths):
+    input_dir = os.path.join(self.get_temp_dir(), 'inputs')
+    tf.io.gfile.makedirs(input_dir)
+    # Splits the lines over two files.
+    half = len(lengths) // 2
+    for i, part in enumerate([lengths[:half], lengths[half:]]):
+      with tf.io.gfile.GFile(os.path.join(input_dir, 'in-%d' % i), 'w') as f:
+        for l in part:
+          f.write(' '.join(['1'] * l) + '\n')
+    return os.path.join(input_dir, 'in-*')
+
+  def _Runner(self, num_workers):
+    return batch_inference.BatchInferenceRunner(
+        inference_graph=self._InferenceGraph(),
+        checkpoint=None,
+        parse_fn=_ParseLine,
+        batch_fn=_MakeFeeds,
+        output_fn=_FormatOutputs,
+        fetch_keys=['lens', 'padded_len'],
+        batch_size=2,
+        chunk_size=4,
+        num_workers=num_workers,
+        shm_dir=self.get_temp_dir())
+
+  def _ReadOutputs(self, output_path):
+    with tf.io.gfile.GFile(output_path) as f:
+      return [[int(x) for x in line.split()] for line in f.read().splitlines()]
+
+  def _Run(self, num_workers):
+    lengths = [5, 1, 4, 2, 3, 3, 1]
+    pattern = self._WriteInputs(lengths)
+    output_path = os.path.join(self.get_temp_dir(), 'out_%d' % num_workers)
+    runner = self._Runner(num_workers)
+    try:
+      self.assertEqual(2, runner.Run(pattern, output_path))
+    finally:
+      runner.Close()
+    outputs = self._ReadOutputs(output_path)
+    # Outputs are in the input order.
+    self.assertEqual(lengths, [x[0] for x in outputs])
+    # Sorting within chunks [5, 1, 4, 2] and [3, 3, 1] batches 1 with 2, 4
+    # with 5, 1 with 3, and 3 alone.
+    self.assertEqual([5, 2, 5, 2, 3, 3, 3], [x[1] for x in outputs])
+    self.assertFalse(tf.io.gfile.exists(output_path + '.progress'))
+
+  def testInProcess(self):
+    self._Run(num_workers=0)
+
+  def testWorkers(self):
+    self._Run(num_workers=2)
+
+  def testPrepareAheadIsBounded(self):
+    num_pulled = [0]
+
+    def Chunks():
+      for i in range(10):
+        num_pulled[0] += 1
+        yield i
+
+    pool = multiprocessing.Pool(2)
+    try:
+      results = []
+      for i, result in enumerate(
+          batch_inference._PrepareAhead(pool, _Square, Chunks(), 2)):
+        # The yielded chunk and at most 2 chunks ahead of it were pulled.
+        self.assertLessEqual(num_pulled[0], i + 3)
+        results.append(result)
+    finally:
+      pool.terminate()
+      pool.join()
+    self.assertEqual([i * i for i in range(10)], results)
+
+  def testResume(self):
+    lengths = [5, 1, 4, 2, 3, 3, 1]
+    pattern = self._WriteInputs(lengths)
+    output_path = os.path.join(self.get_temp_dir(), 'out_resume')
+    # Pretends the first chunk was done by a previous run.
+    with tf.io.gfile.GFile(output_path + '-chunk-00000', 'w') as f:
+      f.write('previous\n')
+    with tf.io.gfile.GFile(output_path + '.progress', 'w') as f:
+      f.write(json.dumps({'chunk_size': 4, 'done_chunks': [0]}))
+    runner = self._Runner(num_workers=0)
+    self.assertEqual(1, runner.Run(pattern, output_path))
+    runner.Close()
+    with tf.io.gfile.GFile(output_path) as f:
+      self.assertEqual(['previous', '3 3', '3 3', '1 3'],
+                       f.read().splitlines())
+
+  def testResumeWithDifferentChunkSizeRaises(self):
+    pattern = self._WriteInputs([1, 2])
+    output_path = os.path.join(self.get_temp_dir(), 'out_bad_resume')
+    with tf.io.gfile.GFile(output_path + '.progress', 'w') as f:
+      f.write(json.dumps({'chunk_size': 100, 'done_chunks': [0]}))
+    runner = self._Runner(num_workers=0)
+    with self.assertRaisesRegex(ValueError, 'chunk_size changed'):
+      runner.Run(pattern, output_path)
+    runner.Close()
+
+
+if __name__ == '__main__':
+  tf.test.main()
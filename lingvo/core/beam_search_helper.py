@@ -65,11 +65,15 @@ BeamSearchDecodeOutput = collections.namedtuple(
     'BeamSearchDecodeOutput',
     [
         'done_hyps', 'topk_hyps', 'topk_ids', 'topk_lens', 'topk_scores',
-        'topk_decoded', 'other_states'
+        'topk_decoded', 'other_states', 'active_batch_fraction'
     ],
 )
-# Make the last attribute default to None.
-BeamSearchDecodeOutput.__new__.__defaults__ = (None,)
+# Make the last two attributes default to None.
+BeamSearchDecodeOutput.__new__.__defaults__ = (None, None)
+
+# The log prob of </s> fed to the hyps of done beams when the active batch is
+# compacted, below local_eos_threshold so that they are never terminated.
+_DONE_BEAM_EOS_LOG_PROB = -1e9
 
 
 class BeamSearchHelper(base_layer.BaseLayer):
@@ -244,6 +248,18 @@ class BeamSearchHelper(base_layer.BaseLayer):
         'local_eos_threshold', -100.0,
         'During beam search, allow </s> to terminate a hyp if the local score '
         'for </s> is greater than local_eos_threshold.')
+    p.Define(
+        'compact_every_n_steps', 0, 'If > 0, the hyps of the beams which are '
+        'done are removed from the batch the callbacks compute on every this '
+        'many steps, instead of being extended until all beams of the batch '
+        'are done. The client states and the encoder outputs are gathered '
+        'down to the active beams, the encoder outputs along axis 1 for '
+        'tensors of rank >= 2, i.e. they are assumed to be time major as '
+        'encoder_outputs.padding. Done beams no longer collect terminated '
+        'hyps, which only affects hyps scoring worse than beam_size below '
+        'the best one. The final other_states are not returned in this '
+        'mode. Not supported with force_eos_in_last_step, which would '
+        'terminate the hyps of done beams.')
     p.name = 'beam_search'
     return p
 
@@ -252,11 +268,18 @@ class BeamSearchHelper(base_layer.BaseLayer):
     super(BeamSearchHelper, self).__init__(params)
     p = self.params
     self._model_uses_eoc_id = p.target_eoc_id >= 0
+    if p.compact_every_n_steps:
+      assert p.compact_every_n_steps > 0
+      assert not p.batch_major_compute, (
+          'Active batch compaction does not support batch_major_compute.')
+      assert not p.force_eos_in_last_step, (
+          'Active batch compaction does not support force_eos_in_last_step.')
 
   def _BeamSearchStep(self, theta, encoder_outputs, cur_step, step_ids,
                       core_bs_states, other_states, num_hyps_per_beam,
                       pre_beam_search_step_callback,
-                      post_beam_search_step_callback):
+                      post_beam_search_step_callback,
+                      active_beams=None):
     """Extend beam search hyps for one step.
 
       | num_beams = Number of source sequences to be decoded.
@@ -286,6 +309,10 @@ class BeamSearchHelper(base_layer.BaseLayer):
         See class header comments for more details.
       post_beam_search_step_callback: The `PostBeamSearchStepCallback` callback.
         See class header comments for more details.
+      active_beams: Optional int tensor of shape [num_active_beams], the ids of
+        the beams which are not done yet, in increasing order. If set,
+        'encoder_outputs' and 'other_states' only cover these beams, see
+        `p.compact_every_n_steps`.
 
     Returns:
       A tuple of following elements for the next beam search step,
@@ -293,8 +320,19 @@ class BeamSearchHelper(base_layer.BaseLayer):
     """
     p = self.params
 
-    bs_results, other_states = pre_beam_search_step_callback(
-        theta, encoder_outputs, step_ids, other_states, num_hyps_per_beam)
+    if active_beams is not None:
+      num_beams = tf.shape(core_bs_states[0])[0]
+      num_active_beams = tf.size(active_beams)
+      # [num_hyps_per_beam * num_active_beams], the ids of the active hyps.
+      active_hyp_ids = _HypIds(active_beams, num_beams, num_hyps_per_beam)
+      bs_results, other_states = pre_beam_search_step_callback(
+          theta, encoder_outputs, tf.gather(step_ids, active_hyp_ids),
+          other_states, num_hyps_per_beam)
+      bs_results = self._ScatterToAllHyps(bs_results, active_hyp_ids,
+                                          tf.shape(step_ids)[0])
+    else:
+      bs_results, other_states = pre_beam_search_step_callback(
+          theta, encoder_outputs, step_ids, other_states, num_hyps_per_beam)
 
     (best_scores, cumulative_scores, in_scores, in_hyps, in_prev_hyps,
      in_done_hyps, in_atten_probs) = core_bs_states
@@ -346,6 +384,18 @@ class BeamSearchHelper(base_layer.BaseLayer):
     new_bs_states = (out_best_scores, out_cumulative_scores, out_scores,
                      out_hyps, out_prev_hyps, out_done_hyps, out_atten_probs)
 
+    callback_step_ids = new_step_ids
+    if active_beams is not None:
+      # Hyps are only reordered within their beam, so the previous hyps of the
+      # active hyps are active too. Maps them to the active hyps.
+      beam_positions = tf.scatter_nd(
+          tf.expand_dims(active_beams, 1), tf.range(num_active_beams),
+          [num_beams])
+      old_hyp_ids = tf.gather(old_hyp_ids, active_hyp_ids)
+      old_hyp_ids = ((old_hyp_ids // num_beams) * num_active_beams +
+                     tf.gather(beam_positions, old_hyp_ids % num_beams))
+      callback_step_ids = tf.gather(new_step_ids, active_hyp_ids)
+
     def ReOrderHyps(x_in):
       """Reorders x_in based on prev hyp ids."""
       if (isinstance(x_in, tf.Tensor) and x_in.shape.ndims and
@@ -367,12 +417,73 @@ class BeamSearchHelper(base_layer.BaseLayer):
     new_other_states = other_states.Transform(ReOrderHyps)
 
     final_other_states = post_beam_search_step_callback(theta, encoder_outputs,
-                                                        new_step_ids,
+                                                        callback_step_ids,
                                                         new_other_states)
 
     return (cur_step + 1, all_done, new_step_ids, new_bs_states,
             final_other_states)
 
+  def _ScatterToAllHyps(self, bs_results, active_hyp_ids, num_hyps):
+    """Scatters the results of the active hyps back to all hyps.
+
+    The hyps of done beams get log probs which keep their scores and never
+    terminate them, so that their beams stay done.
+
+    Args:
+      bs_results: A `.NestedMap` returned by the `PreBeamSearchStepCallback`
+        for the active hyps.
+      active_hyp_ids: An int tensor of shape [num_active_hyps], the ids of the
+        active hyps.
+      num_hyps: A scalar int tensor, the number of all hyps.
+
+    Returns:
+      A `.NestedMap` of the results of all hyps.
+    """
+    p = self.params
+    indices = tf.expand_dims(active_hyp_ids, 1)
+    log_probs = bs_results.log_probs
+    vocab_size = tf.shape(log_probs)[1]
+    is_done = 1.0 - tf.scatter_nd(
+        indices, tf.ones_like(active_hyp_ids, dtype=log_probs.dtype),
+        [num_hyps])
+    done_log_probs = tf.expand_dims(is_done, 1) * tf.one_hot(
+        [p.target_eos_id],
+        vocab_size,
+        on_value=_DONE_BEAM_EOS_LOG_PROB,
+        dtype=log_probs.dtype)
+    results = py_utils.NestedMap(
+        log_probs=tf.scatter_nd(indices, log_probs, [num_hyps, vocab_size]) +
+        done_log_probs,
+        atten_probs=tf.scatter_nd(
+            indices, bs_results.atten_probs,
+            [num_hyps, tf.shape(bs_results.atten_probs)[1]]))
+    if self._model_uses_eoc_id:
+      is_last_chunk = tf.cast(bs_results.is_last_chunk, tf.int32)
+      results.is_last_chunk = tf.cast(
+          tf.scatter_nd(indices, is_last_chunk,
+                        tf.concat([[num_hyps],
+                                   tf.shape(is_last_chunk)[1:]], 0)), tf.bool)
+    return results
+
+  def _BeamIsActive(self, core_bs_states, num_hyps_per_beam):
+    """Returns whether each beam is not done yet, [num_beams].
+
+    Mirrors the all_done condition of `ops.beam_search_step` per beam.
+    """
+    p = self.params
+    (best_scores, cumulative_scores, _, _, _, done_hyps, _) = core_bs_states
+    # [num_hyps_per_beam, num_beams].
+    cumulative_scores = tf.reshape(cumulative_scores, [num_hyps_per_beam, -1])
+    is_active = tf.reduce_any(
+        cumulative_scores > best_scores - p.beam_size, axis=0)
+    if p.ensure_full_beam:
+      num_done_hyps = tf.reduce_sum(
+          tf.reshape(
+              tf.cast(tf.not_equal(done_hyps, ''), tf.int32),
+              [-1, num_hyps_per_beam, tf.size(best_scores)]), [0, 1])
+      is_active = tf.logical_or(is_active, num_done_hyps < num_hyps_per_beam)
+    return is_active
+
   def BeamSearchDecode(self,
                        theta,
                        encoder_outputs,
@@ -454,22 +565,31 @@ class BeamSearchHelper(base_layer.BaseLayer):
               new_other_states.Flatten())
 
     flat_other_states = other_states.Flatten()
-    _, _, _, final_bs_states, flat_final_other_states = tf.while_loop(
-        LoopContinue,
-        LoopBody,
-        loop_vars=(cur_step, all_done, step_ids, core_bs_states,
-                   flat_other_states),
-        parallel_iterations=10,
-        back_prop=False,
-        swap_memory=False,
-        shape_invariants=(tf.TensorShape(cur_step.get_shape()),
-                          tf.TensorShape(all_done.get_shape()),
-                          tf.TensorShape(step_ids.get_shape()),
-                          _GetShapes(core_bs_states),
-                          _GetShapes(flat_other_states, none_shapes=True)))
+    active_batch_fraction = None
+    if p.compact_every_n_steps:
+      final_bs_states, active_batch_fraction = self._CompactingBeamSearchLoop(
+          theta, encoder_outputs, max_steps, cur_step, all_done, step_ids,
+          core_bs_states, other_states, num_hyps_per_beam,
+          pre_beam_search_step_callback, post_beam_search_step_callback)
+      # The states of the done beams were dropped.
+      final_other_states = None
+    else:
+      _, _, _, final_bs_states, flat_final_other_states = tf.while_loop(
+          LoopContinue,
+          LoopBody,
+          loop_vars=(cur_step, all_done, step_ids, core_bs_states,
+                     flat_other_states),
+          parallel_iterations=10,
+          back_prop=False,
+          swap_memory=False,
+          shape_invariants=(tf.TensorShape(cur_step.get_shape()),
+                            tf.TensorShape(all_done.get_shape()),
+                            tf.TensorShape(step_ids.get_shape()),
+                            _GetShapes(core_bs_states),
+                            _GetShapes(flat_other_states, none_shapes=True)))
+      final_other_states = other_states.Pack(flat_final_other_states)
     # [target_seq_len, num_beams * num_hyps_per_beam].
     final_done_hyps = final_bs_states[5]
-    final_other_states = other_states.Pack(flat_final_other_states)
 
     # TODO(rpang): avoid inspecting 'encoder_outputs'.
     source_paddings = encoder_outputs.padding
@@ -503,7 +623,149 @@ class BeamSearchHelper(base_layer.BaseLayer):
 
     return BeamSearchDecodeOutput(final_done_hyps, topk_hyps, topk_ids,
                                   topk_lens, topk_scores, None,
-                                  final_other_states)
+                                  final_other_states, active_batch_fraction)
+
+  def _CompactingBeamSearchLoop(self, theta, encoder_outputs, max_steps,
+                                cur_step, all_done, step_ids, core_bs_states,
+                                other_states, num_hyps_per_beam,
+                                pre_beam_search_step_callback,
+                                post_beam_search_step_callback):
+    """Runs the beam search steps, compacting the active batch.
+
+    Every `p.compact_every_n_steps` steps, the beams which are done are removed
+    from the client states and the encoder outputs, so that the callbacks only
+    compute on the hyps of the active beams. The core beam search states always
+    cover all hyps.
+
+    Returns:
+      A tuple (core_bs_states, active_batch_fraction), the final core beam
+      search states and the fraction of the beams the callbacks computed on,
+      averaged over the steps.
+    """
+    p = self.params
+    num_beams = tf.shape(core_bs_states[0])[0]
+
+    # Only the tensors of the encoder outputs are compacted.
+    flat_encoder_outputs = encoder_outputs.Flatten()
+    encoder_tensor_ids = [
+        i for i, x in enumerate(flat_encoder_outputs)
+        if isinstance(x, tf.Tensor)
+    ]
+    encoder_tensors = [flat_encoder_outputs[i] for i in encoder_tensor_ids]
+
+    def PackEncoderOutputs(tensors):
+      flat = list(flat_encoder_outputs)
+      for i, x in zip(encoder_tensor_ids, tensors):
+        flat[i] = x
+      return encoder_outputs.Pack(flat)
+
+    def LoopContinue(cur_step, all_done, *unused_args):
+      return tf.logical_and(cur_step < max_steps, tf.logical_not(all_done))
+
+    def LoopBody(cur_step, unused_all_done, step_ids, core_bs_states,
+                 other_states_list, active_beams, encoder_tensors,
+                 num_active_beams_sum):
+      num_active_beams_sum += tf.cast(tf.size(active_beams), tf.float32)
+      (cur_step, all_done, new_step_ids, new_bs_states,
+       new_other_states) = self._BeamSearchStep(
+           theta, PackEncoderOutputs(encoder_tensors), cur_step, step_ids,
+           core_bs_states, other_states.Pack(other_states_list),
+           num_hyps_per_beam, pre_beam_search_step_callback,
+           post_beam_search_step_callback, active_beams=active_beams)
+      other_states_list = new_other_states.Flatten()
+
+      # [num_active_beams], whether each of the active beams is not done yet.
+      keep = tf.gather(
+          self._BeamIsActive(new_bs_states, num_hyps_per_beam), active_beams)
+
+      def Compact():
+        keep_ids = tf.cast(tf.reshape(tf.where(keep), [-1]), tf.int32)
+        keep_hyp_ids = _HypIds(keep_ids, tf.size(active_beams),
+                               num_hyps_per_beam)
+        return (tf.gather(active_beams, keep_ids),
+                [self._GatherHyps(x, keep_hyp_ids) for x in other_states_list],
+                [_GatherBeams(x, keep_ids) for x in encoder_tensors])
+
+      def NoCompact():
+        return active_beams, other_states_list, encoder_tensors
+
+      should_compact = tf.logical_and(
+          tf.equal(cur_step % p.compact_every_n_steps, 0),
+          tf.logical_and(
+              tf.logical_not(all_done), tf.logical_not(tf.reduce_all(keep))))
+      active_beams, other_states_list, encoder_tensors = tf.cond(
+          should_compact, Compact, NoCompact)
+      return (cur_step, all_done, new_step_ids, new_bs_states,
+              other_states_list, active_beams, encoder_tensors,
+              num_active_beams_sum)
+
+    flat_other_states = other_states.Flatten()
+    active_beams = tf.range(num_beams)
+    num_active_beams_sum = tf.constant(0.0)
+    (num_steps, _, _, final_bs_states, _, _, _,
+     num_active_beams_sum) = tf.while_loop(
+         LoopContinue,
+         LoopBody,
+         loop_vars=(cur_step, all_done, step_ids, core_bs_states,
+                    flat_other_states, active_beams, encoder_tensors,
+                    num_active_beams_sum),
+         parallel_iterations=10,
+         back_prop=False,
+         swap_memory=False,
+         shape_invariants=(tf.TensorShape(cur_step.get_shape()),
+                           tf.TensorShape(all_done.get_shape()),
+                           tf.TensorShape(step_ids.get_shape()),
+                           _GetShapes(core_bs_states),
+                           _GetShapes(flat_other_states, none_shapes=True),
+                           tf.TensorShape([None]),
+                           [_ActiveBeamsShape(x) for x in encoder_tensors],
+                           tf.TensorShape([])))
+    active_batch_fraction = num_active_beams_sum / tf.cast(
+        tf.maximum(num_steps, 1) * num_beams, tf.float32)
+    return final_bs_states, active_batch_fraction
+
+  def _GatherHyps(self, x, hyp_ids):
+    """Gathers the client state 'x' of hyps 'hyp_ids', as in ReOrderHyps."""
+    p = self.params
+    if not x.shape.ndims:
+      return x
+    if x.shape.ndims > 2 and not p.batch_major_state:
+      return tf.gather(x, hyp_ids, axis=1)
+    return tf.gather(x, hyp_ids)
+
+
+def _HypIds(beam_ids, num_beams, num_hyps_per_beam):
+  """Returns the ids of the hyps of beams 'beam_ids' among 'num_beams' beams.
+
+  The hyps are ordered as the hyps of a beam search batch, i.e. hyp 'h' of the
+  i-th beam of 'beam_ids' is at index ``(h * len(beam_ids) + i)``.
+
+  Args:
+    beam_ids: An int tensor of shape [n], the ids of the beams.
+    num_beams: A scalar int tensor, the number of beams.
+    num_hyps_per_beam: Num of hyps per beam.
+
+  Returns:
+    An int tensor of shape [num_hyps_per_beam * n].
+  """
+  offsets = tf.expand_dims(tf.range(num_hyps_per_beam) * num_beams, 1)
+  return tf.reshape(offsets + tf.expand_dims(beam_ids, 0), [-1])
+
+
+def _GatherBeams(x, beam_ids):
+  """Gathers the time major encoder output 'x' of beams 'beam_ids'."""
+  if not x.shape.ndims:
+    return x
+  return tf.gather(x, beam_ids, axis=min(x.shape.ndims - 1, 1))
+
+
+def _ActiveBeamsShape(x):
+  """Returns the shape invariant of encoder output 'x' during compaction."""
+  if not x.shape.ndims:
+    return x.shape
+  dims = x.shape.as_list()
+  dims[min(len(dims) - 1, 1)] = None
+  return tf.TensorShape(dims)
 
 
 def _GetShapes(tensors, none_shapes=False):
@@ -552,7 +814,7 @@ def MergeBeamSearchOutputs(max_hyps_per_beam, beam_search_outputs):
     ],
                                                tf.shape(output.topk_hyps)[1])
     for k, v in six.iteritems(output._asdict()):
-      if v is None:
+      if v is None or k == 'active_batch_fraction':
         continue
       if k == 'done_hyps':
         v = tf.transpose(v)
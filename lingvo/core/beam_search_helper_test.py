@@ -166,6 +166,90 @@ class BeamSearchHelperTest(test_utils.TestCase):
       self.assertEqual(expected_topk_lens, topk_lens.tolist())
       self.assertAllClose(expected_topk_scores, topk_scores)
 
+  def _DecodeWithCompaction(self, compact_every_n_steps):
+    num_hyps_per_beam = 2
+    # The logits of the first step. Beam 0 emits </s> right away, and its
+    # other hyps fall out of the beam.
+    first_logits_per_beam = np.array(
+        [[0., -5., 10., 1., 2., 3.], [0., 1., 2.5, 2., 3., 4.]],
+        dtype=np.float32)
+    # The logits of the next steps. Beam 0 no longer emits </s>, beam 1 emits
+    # it within valid_eos_max_logit_delta of its best extension.
+    logits_per_beam = np.array(
+        [[0., 1., -20., 2., 3., 4.], [0., 1., 2.5, 2., 3., 4.]],
+        dtype=np.float32)
+    with self.session(use_gpu=False, graph=tf.Graph()) as sess:
+      p = beam_search_helper.BeamSearchHelper.Params().Set(
+          name='bsh',
+          target_seq_len=6,
+          compact_every_n_steps=compact_every_n_steps)
+      bs_helper = p.Instantiate()
+
+      def InitBeamSearchCallBack(unused_theta, encoder_outputs,
+                                 num_hyps_per_beam):
+        num_beams = py_utils.GetShape(encoder_outputs.padding)[1]
+        num_hyps = num_beams * num_hyps_per_beam
+        return (py_utils.NestedMap({
+            'log_probs': tf.zeros([num_hyps, 6]),
+            'atten_probs': tf.zeros([num_hyps, 3]),
+        }), py_utils.NestedMap(beam_ids=tf.range(num_hyps) % num_beams))
+
+      def PreBeamSearchStepCallback(unused_theta, encoder_outputs, step_ids,
+                                    states, num_hyps_per_beam):
+        # The states and the encoder outputs must cover the same beams.
+        first_logits = tf.gather(first_logits_per_beam, states.beam_ids)
+        first_logits = py_utils.with_dependencies([
+            py_utils.assert_equal(
+                tf.tile(encoder_outputs.encoded[0], [num_hyps_per_beam, 1]),
+                first_logits)
+        ], first_logits)
+        logits = tf.where(
+            tf.equal(step_ids[:, 0], p.target_sos_id), first_logits,
+            tf.gather(logits_per_beam, states.beam_ids))
+        return (py_utils.NestedMap({
+            'atten_probs': tf.zeros([tf.shape(logits)[0], 3]),
+            'log_probs': tf.nn.log_softmax(logits)
+        }), states)
+
+      def PostBeamSearchStepCallback(unused_theta, unused_encoder_outputs,
+                                     unused_new_step_ids, states):
+        return states
+
+      encoder_outputs = py_utils.NestedMap(
+          encoded=tf.tile(
+              tf.expand_dims(first_logits_per_beam, 0), [3, 1, 1]),
+          padding=tf.zeros([3, 2]))
+      decoder_output = bs_helper.BeamSearchDecode(
+          py_utils.NestedMap(), encoder_outputs, num_hyps_per_beam,
+          InitBeamSearchCallBack, PreBeamSearchStepCallback,
+          PostBeamSearchStepCallback)
+      fetches = [
+          decoder_output.topk_ids, decoder_output.topk_lens,
+          decoder_output.topk_scores
+      ]
+      if compact_every_n_steps:
+        fetches.append(decoder_output.active_batch_fraction)
+      return sess.run(fetches)
+
+  def testCompactEveryNSteps(self):
+    topk_ids, topk_lens, topk_scores = self._DecodeWithCompaction(0)
+    (compact_topk_ids, compact_topk_lens, compact_topk_scores,
+     active_batch_fraction) = self._DecodeWithCompaction(1)
+    # All hyps are unchanged. Hyps are ordered as [beam, hyp]: beam 0 has a
+    # single terminated hyp, beam 1 terminates after 1 and 2 steps.
+    self.assertAllEqual(topk_ids, compact_topk_ids)
+    self.assertAllEqual(topk_lens, compact_topk_lens)
+    self.assertAllClose(topk_scores, compact_topk_scores)
+    self.assertAllEqual([1, 0, 1, 2], compact_topk_lens)
+    # Beam 0 is removed from the batch after the first of the 6 steps.
+    self.assertAllClose((2. + 5.) / (6. * 2.), active_batch_fraction)
+
+  def testCompactionDoesNotSupportForceEos(self):
+    p = beam_search_helper.BeamSearchHelper.Params().Set(
+        name='bsh', force_eos_in_last_step=True, compact_every_n_steps=1)
+    with self.assertRaisesRegex(AssertionError, 'force_eos_in_last_step'):
+      p.Instantiate()
+
 
 class MergeBeamSearchOutputsTest(test_utils.TestCase):
 
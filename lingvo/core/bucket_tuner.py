@@ -0,0 +1,289 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Picks bucket boundaries and batch limits from observed sequence lengths.
+
+`SolveBuckets` chooses `bucket_upper_bound` minimizing the number of padded
+tokens, assuming each example is padded up to its bucket's upper bound, and
+sets each bucket's `bucket_batch_limit` to the largest batch whose padded size
+fits a tokens-per-batch memory budget.
+
+Lengths are either sampled offline from an input generator's configured
+`file_datasource` with `SampleLengths`, or collected online from fetched
+`bucket_keys` with `OnlineBucketTuner`, which keeps a reservoir of lengths and
+periodically re-solves.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import lingvo.compat as tf
+from lingvo.core import cluster_factory
+from lingvo.core import py_utils
+import numpy as np
+from six.moves import range
+
+
+def _Candidates(lengths, max_candidates):
+  """Returns sorted candidate upper bounds for `lengths`."""
+  candidates = np.unique(lengths)
+  if len(candidates) > max_candidates:
+    idx = np.linspace(0, len(candidates) - 1, max_candidates).astype(np.int64)
+    candidates = np.unique(candidates[idx])
+  return candidates
+
+
+def SolveBuckets(lengths,
+                 num_buckets,
+                 tokens_per_batch,
+                 max_batch_size=None,
+                 batch_multiple=1,
+                 max_candidates=512):
+  """Solves for bucket boundaries and per-bucket batch limits.
+
+  Args:
+    lengths: A list or numpy vector of positive sequence lengths (bucket keys).
+    num_buckets: Maximum number of buckets.
+    tokens_per_batch: Memory budget of a batch, as the number of (padded)
+      tokens, i.e. `bucket_batch_limit[i] * bucket_upper_bound[i]`.
+    max_batch_size: If set, an upper bound on every `bucket_batch_limit`.
+    batch_multiple: Batch limits are rounded down to a multiple of this value
+      (e.g. 8 for TPUs). Raises a ValueError if a batch of `batch_multiple`
+      examples of the largest length does not fit in `tokens_per_batch`.
+    max_candidates: Boundaries are chosen among at most these many distinct
+      quantiles of `lengths` to bound the cost of the solver.
+
+  Returns:
+    A `.NestedMap` with:
+
+    - bucket_upper_bound: a sorted list of ints. The last one is the largest
+      observed length, so no sampled example is dropped.
+    - bucket_batch_limit: a list of ints of the same size.
+    - padding_ratio: the estimated fraction of padded tokens.
+  """
+  lengths = np.sort(np.asarray(lengths, dtype=np.int64))
+  assert lengths.size, 'No lengths to solve buckets for.'
+  assert num_buckets > 0
+  candidates = _Candidates(lengths, max_candidates)
+  num_candidates = len(candidates)
+  num_buckets = min(num_buckets, num_candidates)
+
+  # counts[i] / sums[i]: number / total length of examples <= candidates[i],
+  # with a leading 0 for "no examples".
+  counts = np.concatenate(
+      [[0], np.searchsorted(lengths, candidates, side='right')])
+  cumsum = np.concatenate([[0], np.cumsum(lengths)])
+  sums = cumsum[counts]
+
+  # cost[k, i]: min padded tokens covering lengths <= candidates[i - 1] using
+  # k buckets whose last upper bound is candidates[i - 1]. cost[k, 0] is the
+  # empty prefix.
+  inf = np.iinfo(np.int64).max // 4
+  cost = np.full([num_buckets + 1, num_candidates + 1], inf, dtype=np.int64)
+  arg = np.zeros([num_buckets + 1, num_candidates + 1], dtype=np.int64)
+  cost[0, 0] = 0
+  for k in range(1, num_buckets + 1):
+    for i in range(k, num_candidates + 1):
+      j = np.arange(k - 1, i)
+      bound = candidates[i - 1]
+      padded = (counts[i] - counts[j]) * bound - (sums[i] - sums[j])
+      total = cost[k - 1, j] + padded
+      best = int(np.argmin(total))
+      cost[k, i] = total[best]
+      arg[k, i] = j[best]
+
+  # Ties are broken towards fewer buckets.
+  k = int(np.argmin(cost[1:, num_candidates])) + 1
+  boundaries = []
+  i = num_candidates
+  while k > 0:
+    boundaries.append(int(candidates[i - 1]))
+    i = arg[k, i]
+    k -= 1
+  boundaries.reverse()
+
+  if boundaries[-1] * batch_multiple > tokens_per_batch:
+    raise ValueError(
+        'tokens_per_batch %d is too small for %d examples of length %d.' %
+        (tokens_per_batch, batch_multiple, boundaries[-1]))
+  batch_limits = []
+  for bound in boundaries:
+    limit = tokens_per_batch // bound
+    if max_batch_size:
+      limit = min(limit, max(max_batch_size, batch_multiple))
+    limit = limit // batch_multiple * batch_multiple
+    batch_limits.append(int(limit))
+
+  total_tokens = int(
+      np.sum(np.asarray(boundaries)[np.searchsorted(boundaries, lengths)]))
+  return py_utils.NestedMap(
+      bucket_upper_bound=boundaries,
+      bucket_batch_limit=batch_limits,
+      padding_ratio=float(cost[len(boundaries), num_candidates]) /
+      total_tokens)
+
+
+def ParamsOverride(result, prefix='input'):
+  """Returns `result` of `SolveBuckets` as text for `Params.FromText`.
+
+  The returned text can be passed via `--model_params_override` or saved to a
+  file for `--model_params_file_override`.
+
+  Args:
+    result: A `.NestedMap` returned by `SolveBuckets`.
+    prefix: Path to the input generator params within the model params.
+  """
+  return ('%s.bucket_upper_bound : %s\n%s.bucket_batch_limit : %s\n' %
+          (prefix, result.bucket_upper_bound, prefix,
+           result.bucket_batch_limit))
+
+
+def _BatchLengths(batch):
+  """Returns the lengths of the examples in a fetched input batch."""
+  if 'bucket_keys' in batch:
+    return np.reshape(batch.bucket_keys, [-1])
+  # Fall back to the longest unpadded sequence of each example.
+  lengths = None
+  for key, v in batch.FlattenItems():
+    if key.split('.')[-1].endswith('paddings') and np.ndim(v) == 2:
+      l = np.sum(1. - v, axis=1).astype(np.int64)
+      lengths = l if lengths is None else np.maximum(lengths, l)
+  if lengths is None:
+    raise ValueError('Input batch has neither bucket_keys nor paddings.')
+  return lengths
+
+
+def SampleLengths(input_params, num_samples, batch_size=128):
+  """Samples example lengths from a sequence input generator.
+
+  The input generator is instantiated with a single bucket accepting every
+  example, so the sampled lengths follow the distribution of the configured
+  `file_datasource` rather than of the current buckets.
+
+  Args:
+    input_params: Params of a `.BaseSequenceInputGenerator`.
+    num_samples: Number of lengths to sample.
+    batch_size: Batch size used to read the examples.
+
+  Returns:
+    A numpy vector of at most `num_samples` lengths. Fewer are returned if the
+    input runs out of data.
+  """
+  p = input_params.Copy()
+  p.bucket_upper_bound = [np.iinfo(np.int32).max]
+  p.bucket_batch_limit = [batch_size]
+  lengths = []
+  num_lengths = 0
+  graph = tf.Graph()
+  with graph.as_default():
+    cluster = cluster_factory.Current()
+    with cluster, tf.device(cluster.input_device):
+      batch = p.Instantiate().GetPreprocessedInputBatch()
+    initialize_tables = tf.tables_initializer()
+  with tf.Session(graph=graph) as sess:
+    sess.run(initialize_tables)
+    try:
+      while num_lengths < num_samples:
+        l = _BatchLengths(py_utils.NestedMap(sess.run(batch)))
+        lengths.append(l)
+        num_lengths += len(l)
+    except tf.errors.OutOfRangeError:
+      tf.logging.info('Input exhausted after %d samples.', num_lengths)
+  if not lengths:
+    return np.zeros([0], dtype=np.int64)
+  return np.concatenate(lengths)[:num_samples]
+
+
+class OnlineBucketTuner(object):
+  """Periodically re-solves buckets from a reservoir of observed lengths.
+
+  Example usage, e.g. from a task's `ProcessFPropResults` with `bucket_keys`
+  exported as a per-example tensor::
+
+    tuner = bucket_tuner.OnlineBucketTuner(
+        num_buckets=8, tokens_per_batch=8192, solve_every_n=100000,
+        override_path=os.path.join(logdir, 'bucket_override.txt'))
+    ...
+    result = tuner.Update(per_example_tensors['bucket_keys'])
+    if result:
+      tf.logging.info('New buckets: %s', result)
+  """
+
+  def __init__(self,
+               num_buckets,
+               tokens_per_batch,
+               solve_every_n=100000,
+               num_samples=100000,
+               max_batch_size=None,
+               batch_multiple=1,
+               override_path=None,
+               override_prefix='input'):
+    """Constructor.
+
+    Args:
+      num_buckets: See `SolveBuckets`.
+      tokens_per_batch: See `SolveBuckets`.
+      solve_every_n: Re-solve after every these many observed lengths.
+      num_samples: Size of the reservoir of lengths.
+      max_batch_size: See `SolveBuckets`.
+      batch_multiple: See `SolveBuckets`.
+      override_path: If set, the latest solution is written to this file in
+        the `--model_params_file_override` format.
+      override_prefix: Path to the input generator params within the model
+        params, used when writing `override_path`.
+    """
+    self._num_buckets = num_buckets
+    self._tokens_per_batch = tokens_per_batch
+    self._solve_every_n = solve_every_n
+    self._max_batch_size = max_batch_size
+    self._batch_multiple = batch_multiple
+    self._override_path = override_path
+    self._override_prefix = override_prefix
+    self._sampler = py_utils.UniformSampler(num_samples)
+    self._num_since_solve = 0
+    self._result = None
+
+  @property
+  def result(self):
+    """The latest `SolveBuckets` result, or None."""
+    return self._result
+
+  def Update(self, lengths):
+    """Adds observed lengths and re-solves if it is time.
+
+    Args:
+      lengths: A list or numpy array of observed lengths (bucket keys).
+
+    Returns:
+      The new `SolveBuckets` result if buckets were re-solved, else None.
+    """
+    for l in np.reshape(lengths, [-1]):
+      self._sampler.Add(int(l))
+    self._num_since_solve += np.size(lengths)
+    if self._num_since_solve < self._solve_every_n:
+      return None
+    self._num_since_solve = 0
+    self._result = SolveBuckets(
+        self._sampler.samples,
+        self._num_buckets,
+        self._tokens_per_batch,
+        max_batch_size=self._max_batch_size,
+        batch_multiple=self._batch_multiple)
+    tf.logging.info('Re-solved buckets: %s', self._result)
+    if self._override_path:
+      with tf.io.gfile.GFile(self._override_path, 'w') as f:
+        f.write(ParamsOverride(self._result, self._override_prefix))
+    return self._result
@@ -0,0 +1,135 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for bucket_tuner."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import itertools
+import os
+
+import lingvo.compat as tf
+from lingvo.core import base_input_generator
+from lingvo.core import bucket_tuner
+from lingvo.core import hyperparams
+from lingvo.core import py_utils
+from lingvo.core import test_utils
+import numpy as np
+from six.moves import range
+
+
+class ToySequenceInputGenerator(
+    base_input_generator.BaseSequenceInputGenerator):
+
+  def InputBatch(self):
+    b = self.scaled_bucket_batch_limit[0]
+    return py_utils.NestedMap(
+        bucket_keys=tf.tile(tf.constant([3, 7], dtype=tf.int32), [b]))
+
+
+def _PaddedTokens(bounds, lengths):
+  bounds = np.asarray(bounds)
+  return np.sum(bounds[np.searchsorted(bounds, lengths)] - lengths)
+
+
+class BucketTunerTest(test_utils.TestCase):
+
+  def testSolveBuckets(self):
+    result = bucket_tuner.SolveBuckets([3, 3, 4, 10, 10, 11, 30],
+                                       num_buckets=3,
+                                       tokens_per_batch=120)
+    self.assertEqual([4, 11, 30], result.bucket_upper_bound)
+    self.assertEqual([30, 10, 4], result.bucket_batch_limit)
+    self.assertAllClose(4. / 75., result.padding_ratio)
+
+  def testSolveBucketsIsOptimal(self):
+    np.random.seed(12345)
+    for _ in range(10):
+      lengths = np.random.randint(1, 50, size=30)
+      result = bucket_tuner.SolveBuckets(
+          lengths, num_buckets=3, tokens_per_batch=1000)
+      candidates = np.unique(lengths)
+      best = min(
+          _PaddedTokens(list(c) + [candidates[-1]], lengths)
+          for c in itertools.combinations(candidates[:-1], 2))
+      self.assertEqual(best,
+                       _PaddedTokens(result.bucket_upper_bound, lengths))
+
+  def testSolveBucketsBatchLimits(self):
+    result = bucket_tuner.SolveBuckets([5, 20, 100],
+                                       num_buckets=3,
+                                       tokens_per_batch=1000,
+                                       max_batch_size=64,
+                                       batch_multiple=8)
+    self.assertEqual([5, 20, 100], result.bucket_upper_bound)
+    self.assertEqual([64, 48, 8], result.bucket_batch_limit)
+
+  def testSolveBucketsBatchLimitsWithinBudget(self):
+    result = bucket_tuner.SolveBuckets([20, 30, 40],
+                                       num_buckets=3,
+                                       tokens_per_batch=100,
+                                       batch_multiple=2)
+    self.assertEqual([20, 30, 40], result.bucket_upper_bound)
+    self.assertEqual([4, 2, 2], result.bucket_batch_limit)
+    with self.assertRaisesRegex(ValueError, 'too small'):
+      bucket_tuner.SolveBuckets([500], 2, 100)
+
+  def testSolveBucketsFewDistinctLengths(self):
+    result = bucket_tuner.SolveBuckets([4, 4, 9],
+                                       num_buckets=8,
+                                       tokens_per_batch=36)
+    self.assertEqual([4, 9], result.bucket_upper_bound)
+    self.assertEqual([9, 4], result.bucket_batch_limit)
+    self.assertEqual(0., result.padding_ratio)
+
+  def testParamsOverride(self):
+    p = hyperparams.Params()
+    p.Define('input', hyperparams.Params(), '')
+    p.input.Define('bucket_upper_bound', [1], '')
+    p.input.Define('bucket_batch_limit', [1], '')
+    result = bucket_tuner.SolveBuckets([3, 3, 4, 10, 10, 11, 30],
+                                       num_buckets=3,
+                                       tokens_per_batch=120)
+    p.FromText(bucket_tuner.ParamsOverride(result))
+    self.assertEqual([4, 11, 30], p.input.bucket_upper_bound)
+    self.assertEqual([30, 10, 4], p.input.bucket_batch_limit)
+
+  def testSampleLengths(self):
+    p = ToySequenceInputGenerator.Params()
+    lengths = bucket_tuner.SampleLengths(p, num_samples=10, batch_size=4)
+    self.assertAllEqual([3, 7] * 5, lengths)
+
+  def testOnlineBucketTuner(self):
+    override_path = os.path.join(self.get_temp_dir(), 'override.txt')
+    tuner = bucket_tuner.OnlineBucketTuner(
+        num_buckets=2,
+        tokens_per_batch=100,
+        solve_every_n=6,
+        num_samples=100,
+        override_path=override_path)
+    self.assertIsNone(tuner.Update([5, 5, 10]))
+    self.assertIsNone(tuner.result)
+    result = tuner.Update([5, 10, 10])
+    self.assertEqual([5, 10], result.bucket_upper_bound)
+    self.assertEqual([20, 10], result.bucket_batch_limit)
+    self.assertEqual(result, tuner.result)
+    with tf.io.gfile.GFile(override_path) as f:
+      self.assertEqual(bucket_tuner.ParamsOverride(result), f.read())
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -20,6 +20,7 @@ from __future__ import division
 from __future__ import print_function
 
 import heapq
+import re
 import threading
 import lingvo.compat as tf
 from lingvo.core import hyperparams
@@ -112,6 +113,23 @@ class _Cluster(object):
     p.Define(
         'add_summary', None, 'Whether to add summaries. If None, '
         'decides based on the job type.')
+    p.Define(
+        'var_placement_strategy', None,
+        'How variables are placed on the ps devices, see GetPlacer(). If '
+        'None, uses the least loaded policy.')
+    p.Define(
+        'var_traffic_weights', [],
+        'For the traffic_balanced placement strategy: a list of (regex, '
+        'weight) pairs. The estimated traffic per step of a variable whose '
+        'name matches regex is weight times its size, e.g. weight > 1 for '
+        'embedding and softmax shards which are read and updated more often '
+        'than other variables. The first match applies, and the default '
+        'weight is 1.')
+    p.Define(
+        'var_traffic_weights_file', '',
+        'Optional file with more var_traffic_weights, one "<regex> <weight>" '
+        'per line, e.g. access frequencies measured by a short profiling '
+        'run. They take precedence over var_traffic_weights.')
     return p
 
   @classmethod
@@ -403,7 +421,13 @@ class _Cluster(object):
 
     Args:
       strategy: A string. Identifier for a placement strategy. By default, we
-        use a least loaded policy to place variables.
+        use params.var_placement_strategy, or a least loaded policy to place
+        variables if it is None. Supported strategies are:
+
+        - 'least_loaded': balances the total bytes of the variables.
+        - 'traffic_balanced': balances the estimated traffic of the variables,
+          see params.var_traffic_weights, and places slot variables with their
+          primaries.
 
     Returns:
       Returns a device function can be used in tf.device().
@@ -411,13 +435,48 @@ class _Cluster(object):
     Raises:
       ValueError: when strategy is not supported.
     """
+    if strategy is None:
+      strategy = self.params.var_placement_strategy or 'least_loaded'
     if self.job == 'evaler' or self.job == 'decoder':
       # Currently, we only support evaler/decoder uses 1 accelerator.
       return self.ListDevices(self.job_spec)[self.task, 0]
-    elif strategy is None:
+    elif strategy == 'least_loaded':
       return _LeastLoadedPlacer(self).DeviceFunction
+    elif strategy == 'traffic_balanced':
+      return _TrafficBalancedPlacer(self).DeviceFunction
     raise ValueError('Unsupported placement policy: ', strategy)
 
+  def VarPlacementSummary(self, variables):
+    """Returns a text table of the load of variables per device.
+
+    Args:
+      variables: A list of placed tf.Variable.
+
+    Returns:
+      A string with the number of variables, their total bytes and estimated
+      traffic per step (see params.var_traffic_weights) for each device.
+      Slot variables, e.g. optimizer accumulators, count towards bytes but
+      not traffic.
+    """
+    estimator = _VarTrafficEstimator(self.params)
+    var_names = set(v.op.name for v in variables)
+    # device -> [num_vars, bytes, traffic]
+    loads = {}
+    for v in variables:
+      num_bytes = _VarBytes(v.op)
+      load = loads.setdefault(v.device, [0, 0, 0])
+      load[0] += 1
+      load[1] += num_bytes
+      if py_utils.PrimaryVariableName(v.op, var_names) is None:
+        load[2] += estimator(v.op.name, num_bytes)
+    lines = ['%-60s %8s %16s %16s' % ('device', '#vars', 'bytes', 'traffic')]
+    for device in sorted(loads):
+      lines.append('%-60s %8d %16d %16d' % ((device,) + tuple(loads[device])))
+    total = np.sum(list(loads.values()), axis=0) if loads else [0, 0, 0]
+    lines.append('%-60s %8d %16d %16d' %
+                 ('total', total[0], total[1], total[2]))
+    return '\n'.join(lines)
+
   @property
   def add_summary(self):
     p = self.params
@@ -440,10 +499,6 @@ class _Cluster(object):
     return tf.train.ClusterSpec({job: workers}).as_cluster_def()
 
 
-# Ops that must be placed on the 'ps' devices.
-_VAR_OPS = ['Variable', 'VariableV2', 'AutoReloadVariable', 'VarHandleOp']
-
-
 class VarPlacer(object):
   """Placer which places variables across a set of devices.
 
@@ -471,7 +526,7 @@ class VarPlacer(object):
       return op.device
 
     # Place vars according our policy.
-    if op.type in _VAR_OPS:
+    if op.type in py_utils.VARIABLE_OPS:
       return self._AssignVar(op)
 
     # The default policy is to place the op on the 1st device visible
@@ -482,6 +537,42 @@ class VarPlacer(object):
     return self._devices[task, 0]
 
 
+def _VarBytes(var_op):
+  """Returns the size in bytes of the variable created by var_op."""
+  size = var_op.get_attr('dtype').size
+  shape = tf.TensorShape(var_op.get_attr('shape'))
+  if shape.num_elements() is None:
+    assert var_op.name.endswith(
+        'wb/var'), 'Unexpected name pattern: %s' % var_op.name
+    # CuDNN RNN vars shape aren't known statically, decide to make a constant
+    # estimate to avoid introducing more complexities.
+    return 10 * 1024**2 * size
+  return shape.num_elements() * size
+
+
+class _VarTrafficEstimator(object):
+  """Estimates the network traffic per step of variables on ps devices."""
+
+  def __init__(self, params):
+    weights = []
+    if params.var_traffic_weights_file:
+      with tf.io.gfile.GFile(params.var_traffic_weights_file) as f:
+        for line in f:
+          line = line.strip()
+          if line and not line.startswith('#'):
+            regex, weight = line.rsplit(None, 1)
+            weights.append((regex, float(weight)))
+    weights += list(params.var_traffic_weights)
+    self._weights = [(re.compile(regex), weight) for regex, weight in weights]
+
+  def __call__(self, var_name, num_bytes):
+    """Returns the estimated traffic of a variable of num_bytes bytes."""
+    for regex, weight in self._weights:
+      if regex.match(var_name):
+        return weight * num_bytes
+    return num_bytes
+
+
 class _LeastLoadedPlacer(VarPlacer):
   """Placer which places a variable on the least loaded var device.
 
@@ -498,19 +589,53 @@ class _LeastLoadedPlacer(VarPlacer):
     self._var_space_pq = [(0, d) for d in var_devices]
 
   def _AssignVar(self, var_op):
-    size = var_op.get_attr('dtype').size
-    shape = tf.TensorShape(var_op.get_attr('shape'))
     assert self._var_space_pq, ('No ps devices to use.')
     allocated, device = heapq.heappop(self._var_space_pq)
-    if shape.num_elements() is None:
-      assert var_op.name.endswith(
-          'wb/var'), 'Unexpected name pattern: %s' % var_op.name
-      # CuDNN RNN vars shape aren't known statically, decide to make a constant
-      # estimate to avoid introducing more complexities.
-      allocated += 10 * 1024**2 * size
-    else:
-      allocated += shape.num_elements() * size
+    allocated += _VarBytes(var_op)
     heapq.heappush(self._var_space_pq, (allocated, device))
     tf.logging.info('Place variable %s on %s %d', var_op.name, device,
                     allocated)
     return device
+
+
+class _TrafficBalancedPlacer(VarPlacer):
+  """Placer which places a variable on the var device with the least traffic.
+
+  A few variables, e.g. embedding and softmax shards, are read and updated far
+  more often than the others. Balancing bytes alone can put several of them
+  on the same ps task, which then becomes a network hot spot. Instead, we
+  balance the estimated traffic per step of the variables (see
+  cluster.params.var_traffic_weights), and break ties by bytes.
+
+  Slot variables (e.g. optimizer accumulators) are placed with their primary
+  variable: they are updated where the primary is and add to its device's
+  bytes, but not to its traffic.
+  """
+
+  def __init__(self, cluster):
+    super(_TrafficBalancedPlacer, self).__init__(cluster)
+    self._var_devices = cluster.ListDevices(
+        cluster.params.ps).flatten().tolist()
+    tf.logging.info('_TrafficBalancedPlacer : %s', self._var_devices)
+    self._estimator = _VarTrafficEstimator(cluster.params)
+    # device -> [traffic, bytes]
+    self._loads = {d: [0, 0] for d in self._var_devices}
+    # The devices of the variables placed so far, by op name.
+    self._placed_vars = {}
+
+  def _AssignVar(self, var_op):
+    assert self._var_devices, ('No ps devices to use.')
+    num_bytes = _VarBytes(var_op)
+    primary = py_utils.PrimaryVariableName(var_op, self._placed_vars)
+    if primary is not None:
+      device = self._placed_vars[primary]
+      traffic = 0
+    else:
+      device = min(self._var_devices, key=lambda d: tuple(self._loads[d]))
+      traffic = self._estimator(var_op.name, num_bytes)
+    self._placed_vars[var_op.name] = device
+    self._loads[device][0] += traffic
+    self._loads[device][1] += num_bytes
+    tf.logging.info('Place variable %s on %s %d %d', var_op.name, device,
+                    self._loads[device][0], self._loads[device][1])
+    return device
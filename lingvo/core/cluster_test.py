@@ -19,6 +19,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
+
 import lingvo.compat as tf
 from lingvo.core import cluster_factory
 from lingvo.core import py_utils
@@ -240,6 +242,62 @@ class ClusterTest(test_utils.TestCase):
         c._MakeDeviceString(
             job_name='/job:trainer', task_id=0, device_name='CPU', device_id=0))
 
+  def _PlaceEmbeddings(self, p):
+    """Places a large variable, two embeddings and a slot of one of them."""
+    p.worker.name = '/job:trainer'
+    p.ps.name = '/job:ps'
+    p.ps.replicas = 2
+    c = cluster_factory.Cluster(p)
+    g = tf.Graph()
+    with g.as_default():
+      with tf.device(c.GetPlacer()):
+        vs = [
+            tf.get_variable('large', (10000,)),
+            tf.get_variable('emb0', (1000,)),
+            tf.get_variable('emb1', (1000,)),
+            tf.get_variable('emb0/Adam', (1000,)),
+        ]
+    return c, vs
+
+  def testLeastLoadedPlacerStrategy(self):
+    p = cluster_factory.Cluster.Params()
+    p.var_placement_strategy = 'least_loaded'
+    _, vs = self._PlaceEmbeddings(p)
+    # Both embeddings end up on the ps task without the large variable.
+    self.assertEqual(
+        [0, 1, 1, 1],
+        [tf.DeviceSpec.from_string(v.device).task for v in vs])
+
+  def testTrafficBalancedPlacer(self):
+    p = cluster_factory.Cluster.Params()
+    p.var_placement_strategy = 'traffic_balanced'
+    p.var_traffic_weights = [('emb', 100.)]
+    c, vs = self._PlaceEmbeddings(p)
+    # The embeddings are on different ps tasks, and the slot with its primary.
+    self.assertEqual(
+        [0, 1, 0, 1],
+        [tf.DeviceSpec.from_string(v.device).task for v in vs])
+    summary = c.VarPlacementSummary(vs).splitlines()
+    self.assertEqual(4, len(summary))
+    # The slot adds to the bytes but not to the traffic of its device.
+    self.assertEqual(['2', '44000', '440000'], summary[1].split()[1:])
+    self.assertEqual(['2', '8000', '400000'], summary[2].split()[1:])
+    self.assertEqual(['4', '52000', '840000'], summary[3].split()[1:])
+
+  def testTrafficBalancedPlacerWeightsFile(self):
+    weights_file = os.path.join(self.get_temp_dir(), 'weights.txt')
+    with tf.io.gfile.GFile(weights_file, 'w') as f:
+      f.write('# Accesses per step.\nemb.* 100\n')
+    p = cluster_factory.Cluster.Params()
+    p.var_placement_strategy = 'traffic_balanced'
+    p.var_traffic_weights_file = weights_file
+    # The weights of the file take precedence.
+    p.var_traffic_weights = [('emb', 1.)]
+    _, vs = self._PlaceEmbeddings(p)
+    self.assertEqual(
+        [0, 1, 0, 1],
+        [tf.DeviceSpec.from_string(v.device).task for v in vs])
+
   def testDeviceListOneRepliaCpu(self):
     p = cluster_factory.Cluster.Params()
     p.mode = 'async'
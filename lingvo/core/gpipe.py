@@ -39,6 +39,7 @@ from lingvo.core import base_layer
 from lingvo.core import builder_layers
 from lingvo.core import py_utils
 from lingvo.core import recurrent
+from lingvo.core import remat_policy
 from lingvo.core import tshape
 from six.moves import range
 
@@ -152,16 +153,22 @@ class FeatureExtractionLayer(base_layer.BaseLayer):
       sub.name = p.variable_name_prefix + sub.name
       self.CreateChild(sub.name, sub)
       self._seq.append((sub.name, self.children[sub.name]))
+    self._remat_policy = remat_policy.Instantiate(p.remat_policy)
 
   def FProp(self, theta, *args):
     p = self.params
     assert len(args) > p.num_act_inputs
     out_args = args[:-p.num_act_inputs] if p.num_act_inputs > 0 else args
     extra_args = args[-p.num_act_inputs:] if p.num_act_inputs > 0 else ()
-    for (name, ch) in self._seq:
+    for i, (name, ch) in enumerate(self._seq):
       th = theta[name]
       out_args = _ToTuple(out_args)
-      out_args = ch.FProp(th, *out_args)
+      if name in p.act_fetch_layers:
+        # The fetched activation must be a tensor of the cell.
+        out_args = ch.FProp(th, *out_args)
+      else:
+        out_args = remat_policy.LayerFProp(self._remat_policy, i, ch, th,
+                                           *out_args)
     # Append fetched activations to fprop outputs.
     for fetch_layer in p.act_fetch_layers:
       assert fetch_layer in self.children
@@ -191,6 +198,19 @@ class FeatureExtractionLayer(base_layer.BaseLayer):
     return py_utils.NestedMap(flops=total, out_shapes=seq_args + extra_args)
 
 
+def _FlattenSequentialLayers(p):
+  """Recursively concatenates SequentialLayer into a list of layer params."""
+  if isinstance(p, list):
+    return p
+  if p.cls not in [builder_layers.SequentialLayer, FeatureExtractionLayer]:
+    return [p.Copy()]
+  subs = []
+  for _ in range(p.repeat):
+    for s in p.sub:
+      subs += _FlattenSequentialLayers(s)
+  return subs
+
+
 def PartitionSequentialLayers(params, num_partitions, *shapes):
   r"""Partition a layer composed of sequential layers.
 
@@ -206,20 +226,7 @@ def PartitionSequentialLayers(params, num_partitions, *shapes):
   Returns:
     A list of FeatureExtractionLayer params.
   """
-
-  # Recursively concatenate SequentialLayer into a list.
-  def FlattenSeq(p):
-    if isinstance(p, list):
-      return p
-    if p.cls not in [builder_layers.SequentialLayer, FeatureExtractionLayer]:
-      return [p.Copy()]
-    subs = []
-    for _ in range(p.repeat):
-      for s in p.sub:
-        subs += FlattenSeq(s)
-    return subs
-
-  subs = FlattenSeq(params)
+  subs = _FlattenSequentialLayers(params)
 
   assert len(shapes) == 1
   tf.logging.info('num_partitions: {} input_shape: {}'.format(
@@ -263,6 +270,138 @@ def PartitionSequentialLayers(params, num_partitions, *shapes):
   return seqs
 
 
+def _ParamBytes(p):
+  """Returns the bytes of the variables of the layer of params p."""
+  with tf.Graph().as_default():
+    layer = p.Copy().Instantiate()
+    return sum(v.shape.num_elements() * v.dtype.base_dtype.size
+               for v in layer.vars.Flatten())
+
+
+def BalancedPartitionSequentialLayers(params,
+                                      num_partitions,
+                                      shapes,
+                                      flops_weight=1.0,
+                                      param_bytes_weight=0.0,
+                                      act_bytes_weight=0.0,
+                                      max_stage_bytes=None,
+                                      num_micro_batches=1,
+                                      bytes_per_element=4):
+  """Partitions sequential layers to minimize the cost of the costliest stage.
+
+  The cost of a stage is::
+
+      flops_weight * FLOPs + param_bytes_weight * parameter bytes
+          + act_bytes_weight * activation bytes
+
+  of its layers, from their FPropMeta and their variables. Unlike the
+  cumulative histogram of PartitionSequentialLayers, the partition is optimal:
+  it is found by dynamic programming over the contiguous partitions.
+
+  Args:
+    params: A layer param or a list of layer param.
+    num_partitions: The desired number of partitions.
+    shapes: A tuple of tshape.Shape representing input tensors to the first
+      layer.
+    flops_weight: The weight of the FLOPs in the cost of a stage.
+    param_bytes_weight: The weight of the parameter bytes in the cost of a
+      stage.
+    act_bytes_weight: The weight of the bytes of the layer outputs in the cost
+      of a stage.
+    max_stage_bytes: If set, the max memory of a stage: the bytes of its
+      parameters, plus num_micro_batches times the bytes of its layer outputs.
+    num_micro_batches: The number of micro batches of the pipeline, for the
+      memory of the stages and their predicted bubble.
+    bytes_per_element: The bytes of an element of the layer outputs.
+
+  Returns:
+    A list of FeatureExtractionLayer params.
+
+  Raises:
+    ValueError: if there are fewer layers than partitions, or if no partition
+      fits in max_stage_bytes.
+  """
+  subs = _FlattenSequentialLayers(params)
+  num_layers = len(subs)
+  if num_layers < num_partitions:
+    raise ValueError('Cannot partition %d layers into %d partitions.' %
+                     (num_layers, num_partitions))
+  needs_param_bytes = param_bytes_weight or max_stage_bytes is not None
+
+  # Prefix sums of the cost and the memory of the layers.
+  costs, memories, flops = [0.], [0.], [0.]
+  for i, s in enumerate(subs):
+    s.name = 'cell_%03d' % i
+    meta = s.cls.FPropMeta(s, *shapes)
+    shapes = _ToTuple(meta.out_shapes)
+    act_bytes = bytes_per_element * sum(
+        x.num_elements() for x in shapes if isinstance(x, tshape.Shape))
+    param_bytes = _ParamBytes(s) if needs_param_bytes else 0
+    cost = (
+        flops_weight * meta.flops + param_bytes_weight * param_bytes +
+        act_bytes_weight * act_bytes)
+    costs.append(costs[-1] + cost)
+    memories.append(memories[-1] + param_bytes + num_micro_batches * act_bytes)
+    flops.append(flops[-1] + meta.flops)
+
+  # best[k][j] is the min cost of the costliest stage of the first j layers in
+  # k stages, whose last stage starts at layer split[k][j].
+  inf = float('inf')
+  best = [[inf] * (num_layers + 1) for _ in range(num_partitions + 1)]
+  split = [[0] * (num_layers + 1) for _ in range(num_partitions + 1)]
+  best[0][0] = 0.
+  for k in range(1, num_partitions + 1):
+    for j in range(k, num_layers - num_partitions + k + 1):
+      for i in range(k - 1, j):
+        if best[k - 1][i] == inf:
+          continue
+        if (max_stage_bytes is not None and
+            memories[j] - memories[i] > max_stage_bytes):
+          continue
+        cost = max(best[k - 1][i], costs[j] - costs[i])
+        if cost < best[k][j]:
+          best[k][j] = cost
+          split[k][j] = i
+  if best[num_partitions][num_layers] == inf:
+    raise ValueError(
+        'Cannot partition %d layers into %d partitions of at most %d bytes.' %
+        (num_layers, num_partitions, max_stage_bytes))
+
+  boundaries = [num_layers]
+  for k in range(num_partitions, 0, -1):
+    boundaries.append(split[k][boundaries[-1]])
+  boundaries.reverse()
+
+  # The cost of the costliest stage of PartitionSequentialLayers, which buckets
+  # the cumulative FLOPs.
+  heuristic_costs = [0.] * num_partitions
+  for i in range(num_layers):
+    j = min(
+        int(flops[i + 1] / max(flops[-1], 1e-30) * num_partitions),
+        num_partitions - 1)
+    heuristic_costs[j] += costs[i + 1] - costs[i]
+  tf.logging.info(
+      'Max stage cost %.4g, vs %.4g when partitioning by cumulative FLOPs.',
+      best[num_partitions][num_layers], max(heuristic_costs))
+
+  # Every stage runs num_micro_batches times, in a pipeline of
+  # num_micro_batches + num_partitions - 1 steps of the costliest stage.
+  max_cost = max(best[num_partitions][num_layers], 1e-30)
+  pipeline_steps = num_micro_batches + num_partitions - 1
+  seqs = []
+  for i in range(num_partitions):
+    start, end = boundaries[i], boundaries[i + 1]
+    cost = costs[end] - costs[start]
+    tf.logging.info(
+        'Partition %d #subs %d #cost %.4g #bytes %d #bubble %.3f', i,
+        end - start, cost, memories[end] - memories[start],
+        1. - num_micro_batches * cost / (pipeline_steps * max_cost))
+    seqs.append(
+        FeatureExtractionLayer.Params().Set(
+            name='d%d' % i, sub=subs[start:end]))
+  return seqs
+
+
 class SeqLayer(base_layer.BaseLayer):
   """Round-robin every children cells in cell_tpl among worker devices."""
 
@@ -24,6 +24,7 @@ from lingvo.core import base_layer
 from lingvo.core import py_utils
 from lingvo.core import test_utils
 from lingvo.core import tshape
+from lingvo.core.gpipe import BalancedPartitionSequentialLayers
 from lingvo.core.gpipe import FeatureExtractionLayer
 from lingvo.core.gpipe import PartitionSequentialLayers
 from lingvo.core.gpipe import PipeliningLayer
@@ -76,8 +77,29 @@ class _SimpyLayer(base_layer.BaseLayer):
     return py_utils.NestedMap(flops=1, out_shapes=(inputs,))
 
 
-def _Partition(params, num_splits, *shapes):
-  seqs = PartitionSequentialLayers(params, num_splits, *shapes)
+class _FlopsLayer(base_layer.BaseLayer):
+  """Identity layer with a given cost."""
+
+  @classmethod
+  def Params(cls):
+    p = super(_FlopsLayer, cls).Params()
+    p.Define('flops', 1, 'The flops of the layer.')
+    return p
+
+  def FProp(self, theta, inputs):
+    return inputs
+
+  @classmethod
+  def FPropMeta(cls, p, inputs):
+    py_utils.CheckShapes((inputs,))
+    return py_utils.NestedMap(flops=p.flops, out_shapes=(inputs,))
+
+
+def _Partition(params, num_splits, *shapes, **kwargs):
+  if kwargs.get('balanced'):
+    seqs = BalancedPartitionSequentialLayers(params, num_splits, shapes)
+  else:
+    seqs = PartitionSequentialLayers(params, num_splits, *shapes)
   return [
       FeatureExtractionLayer.Params().Set(name='d%d' % i, sub=seqs[i].sub)
       for i in range(len(seqs))
@@ -144,6 +166,7 @@ class DummyPipelineCnnTest(test_utils.TestCase):
   def _verify_timestep_counts(self,
                               num_splits,
                               auto_partition=False,
+                              balanced_partition=False,
                               micro_batch_size=None):
     num_micro_batches = 8
     batch_size = 16
@@ -158,9 +181,11 @@ class DummyPipelineCnnTest(test_utils.TestCase):
         net = PipeliningLayer.Params().Set(
             name='pipeline',
             num_micro_batches=num_micro_batches,
-            cell_tpl=_Partition(layers, num_splits,
-                                tshape.Shape([batch_size, 8, 8,
-                                              1]))).Instantiate()
+            cell_tpl=_Partition(
+                layers,
+                num_splits,
+                tshape.Shape([batch_size, 8, 8, 1]),
+                balanced=balanced_partition)).Instantiate()
       else:
         net = _BuildDummyPipelineCnn(
             num_splits=num_splits,
@@ -210,6 +235,47 @@ class DummyPipelineCnnTest(test_utils.TestCase):
   def testDummyPipelineCnnAutoPartitionFourSplits(self):
     self._verify_timestep_counts(num_splits=4, auto_partition=True)
 
+  def testDummyPipelineCnnBalancedPartitionFourSplits(self):
+    self._verify_timestep_counts(
+        num_splits=4, auto_partition=True, balanced_partition=True)
+
+
+class BalancedPartitionSequentialLayersTest(test_utils.TestCase):
+
+  def _NumSubs(self, seqs):
+    return [len(seq.sub) for seq in seqs]
+
+  def testMinimizesCostliestStage(self):
+    layers = [
+        _FlopsLayer.Params().Set(name='layer_%d' % i, flops=flops)
+        for i, flops in enumerate([1, 1, 1, 1, 10, 1, 1, 1])
+    ]
+    shapes = (tshape.Shape([4, 8]),)
+    seqs = BalancedPartitionSequentialLayers(layers, 3, shapes)
+    self.assertEqual([4, 1, 3], self._NumSubs(seqs))
+    self.assertEqual(['d0', 'd1', 'd2'], [seq.name for seq in seqs])
+    with self.assertRaisesRegex(ValueError, 'Cannot partition'):
+      BalancedPartitionSequentialLayers(layers, 9, shapes)
+
+  def testParamBytesAndMaxStageBytes(self):
+    layers = [
+        _SimpyLayer.Params().Set(name='layer_%d' % i) for i in range(16)
+    ]
+    shapes = (tshape.Shape([16, 8, 8, 1]),)
+    # Each layer has a 3x3 filter, and outputs 16 * 8 * 8 floats.
+    layer_bytes = 9 * 4 + 16 * 8 * 8 * 4
+    seqs = BalancedPartitionSequentialLayers(
+        layers,
+        4,
+        shapes,
+        flops_weight=0.,
+        param_bytes_weight=1.,
+        max_stage_bytes=4 * layer_bytes)
+    self.assertEqual([4, 4, 4, 4], self._NumSubs(seqs))
+    with self.assertRaisesRegex(ValueError, 'at most'):
+      BalancedPartitionSequentialLayers(
+          layers, 4, shapes, max_stage_bytes=4 * layer_bytes - 1)
+
 
 if __name__ == '__main__':
   tf.test.main()
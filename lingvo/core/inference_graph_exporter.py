@@ -25,12 +25,12 @@ import re
 import lingvo.compat as tf
 from lingvo.core import base_model
 from lingvo.core import bfloat16_variables
+from lingvo.core import inference_graph_io
 from lingvo.core import inference_graph_pb2
+from lingvo.core import inference_graph_quantizer
 from lingvo.core import py_utils
 import six
 
-from google.protobuf import text_format
-
 FLAGS = tf.flags.FLAGS
 
 # InferenceDeviceOptions contains options to configure inference on the device.
@@ -307,7 +307,9 @@ class InferenceGraphExporter(object):
                  dtype_override=None),
              freeze_checkpoint=None,
              freeze_defaults=False,
+             quantize_weights=False,
              export_path=None,
+             export_binary=False,
              subgraph_filter=None,
              random_seed=None,
              disable_packed_input=True):
@@ -325,7 +327,13 @@ class InferenceGraphExporter(object):
         given.
       freeze_defaults: Default initializes the graph and freeze. Useful for
         early testing of downstream tools without having a checkpoint.
+      quantize_weights: Quantizes the weights of the frozen graph to int8, see
+        `.inference_graph_quantizer`. Requires freeze_checkpoint or
+        freeze_defaults.
       export_path: If not None, write the inference graph in ASCII to this path.
+      export_binary: Write the inference graph to export_path in the binary
+        format of `.inference_graph_io` instead, with the large constants (e.g.
+        the weights of a frozen graph) in a memory mappable side file.
       subgraph_filter: A list of subgraph names. If not None or empty, export
         only this list of inference subgraphs.
       random_seed: Fixes the random seed in the exported inference graph.
@@ -335,9 +343,13 @@ class InferenceGraphExporter(object):
       InferenceGraph proto.
 
     Raises:
-      ValueError: if the model does not support the listed subgraphs.
+      ValueError: if the model does not support the listed subgraphs, or if
+        quantize_weights is set without freezing the graph.
     """
     assert issubclass(model_cfg.cls, base_model.BaseModel)
+    if quantize_weights and not (freeze_checkpoint or freeze_defaults):
+      raise ValueError('quantize_weights requires a frozen graph, i.e. '
+                       'freeze_checkpoint or freeze_defaults.')
 
     # Disable assertions unless user explicitly enables it.
     if FLAGS['enable_asserts'].using_default_value:
@@ -463,6 +475,9 @@ class InferenceGraphExporter(object):
       elif freeze_defaults:
         tf.logging.info('Default initializing graph and freezing.')
         graph_def = _FreezeDefaults(graph, output_op_names)
+      if quantize_weights:
+        tf.logging.info('Quantizing the weights to int8.')
+        graph_def = inference_graph_quantizer.QuantizeWeights(graph_def)
     else:
       output_op_names = GetOutputOpNames(graph, inference_graph_proto)
 
@@ -491,8 +506,8 @@ class InferenceGraphExporter(object):
     inference_graph_proto.graph_def.CopyFrom(graph_def)
 
     if export_path:
-      with tf.gfile.Open(export_path, 'w') as f:
-        f.write(text_format.MessageToString(inference_graph_proto))
+      inference_graph_io.WriteInferenceGraph(
+          inference_graph_proto, export_path, binary=export_binary)
     return inference_graph_proto
 
   @classmethod
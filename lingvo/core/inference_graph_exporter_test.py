@@ -292,6 +292,19 @@ class InferenceGraphExporterLinearModelTest(test_utils.TestCase):
     with tf.Graph().as_default():
       tf.import_graph_def(inference_graph.graph_def)
 
+  def testExportFreezeDefaultQuantizeWeights(self):
+    params = model_registry.GetParams('test.LinearModelParams', 'Test')
+    with self.assertRaisesRegex(ValueError, 'quantize_weights'):
+      inference_graph_exporter.InferenceGraphExporter.Export(
+          params, quantize_weights=True, subgraph_filter=['default'])
+    inference_graph = inference_graph_exporter.InferenceGraphExporter.Export(
+        params,
+        freeze_defaults=True,
+        quantize_weights=True,
+        subgraph_filter=['default'])
+    with tf.Graph().as_default():
+      tf.import_graph_def(inference_graph.graph_def)
+
   def testTpuBfloat16OverrideExport(self):
     """Test that we can export with tf.bfloat16 dtype."""
     params = model_registry.GetParams('test.LinearModelTpuParams', 'Test')
@@ -0,0 +1,144 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Reads and writes InferenceGraph protos, in text or binary format.
+
+The text format is the InferenceGraph proto in ASCII.
+
+The binary format is made of two files:
+
+- path: a header, followed by the serialized InferenceGraph proto. The
+  content of the large constants of its graph_def is replaced by their range
+  in the weights file.
+- path + '.weights': the content of the large constants, each aligned to
+  _ALIGNMENT bytes.
+
+Frozen graphs embed all the weights as constants. In the binary format, they
+are neither converted to text nor parsed by protobuf: the serialized proto
+only holds the graph structure, and the weights file is memory mapped when
+loaded from a local path. ReadInferenceGraph puts the weights back into the
+constants though, so the loaded graph_def is still subject to the 2GB size
+limit of a proto when it is imported.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import mmap
+
+import lingvo.compat as tf
+from lingvo.core import inference_graph_pb2
+
+from google.protobuf import text_format
+
+# First bytes of an InferenceGraph in binary format.
+_BINARY_HEADER = b'\x00lingvo.InferenceGraph.binary.v1\n'
+
+# Attr of the constants stored in the weights file, with their offset and size.
+_WEIGHTS_RANGE_ATTR = '_lingvo_weights_range'
+
+_ALIGNMENT = 64
+
+
+def WeightsPath(path):
+  """Returns the path of the weights file of a binary InferenceGraph."""
+  return path + '.weights'
+
+
+def WriteInferenceGraph(inference_graph, path, binary=False, min_bytes=1024):
+  """Writes an InferenceGraph proto.
+
+  Args:
+    inference_graph: An InferenceGraph proto.
+    path: The path to write to. In binary format, the weights are written to
+      WeightsPath(path).
+    binary: Whether to write in binary format, or in text format.
+    min_bytes: In binary format, the minimum size of the content of a constant
+      to be written in the weights file.
+  """
+  if not binary:
+    with tf.gfile.Open(path, 'w') as f:
+      f.write(text_format.MessageToString(inference_graph))
+    return
+
+  stripped = inference_graph_pb2.InferenceGraph()
+  stripped.CopyFrom(inference_graph)
+  offset = 0
+  with tf.gfile.Open(WeightsPath(path), 'wb') as f:
+    for node in stripped.graph_def.node:
+      if node.op != 'Const':
+        continue
+      tensor = node.attr['value'].tensor
+      size = len(tensor.tensor_content)
+      if size < min_bytes:
+        continue
+      padding = -offset % _ALIGNMENT
+      f.write(b'\x00' * padding)
+      offset += padding
+      f.write(tensor.tensor_content)
+      tensor.ClearField('tensor_content')
+      node.attr[_WEIGHTS_RANGE_ATTR].list.i.extend([offset, size])
+      offset += size
+  with tf.gfile.Open(path, 'wb') as f:
+    f.write(_BINARY_HEADER)
+    f.write(stripped.SerializeToString())
+
+
+def _ReadWeights(path):
+  """Returns the content of a weights file, memory mapped if it is local."""
+  try:
+    with open(path, 'rb') as f:
+      if f.read(1):
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+  except IOError:
+    # Not a local file, e.g. on a remote file system.
+    pass
+  with tf.gfile.Open(path, 'rb') as f:
+    return f.read()
+
+
+def ReadInferenceGraph(path):
+  """Reads an InferenceGraph proto written in text or binary format.
+
+  Args:
+    path: The path to the file to read.
+
+  Returns:
+    An InferenceGraph proto.
+  """
+  inference_graph = inference_graph_pb2.InferenceGraph()
+  with tf.gfile.Open(path, 'rb') as f:
+    is_binary = f.read(len(_BINARY_HEADER)) == _BINARY_HEADER
+    if is_binary:
+      inference_graph.ParseFromString(f.read())
+  if not is_binary:
+    with tf.gfile.Open(path, 'r') as f:
+      text_format.Parse(f.read(), inference_graph)
+    return inference_graph
+
+  weights = None
+  for node in inference_graph.graph_def.node:
+    if _WEIGHTS_RANGE_ATTR not in node.attr:
+      continue
+    if weights is None:
+      weights = _ReadWeights(WeightsPath(path))
+    offset, size = node.attr[_WEIGHTS_RANGE_ATTR].list.i
+    # Slicing copies the content out of the mapping.
+    node.attr['value'].tensor.tensor_content = weights[offset:offset + size]
+    del node.attr[_WEIGHTS_RANGE_ATTR]
+  if isinstance(weights, mmap.mmap):
+    weights.close()
+  return inference_graph
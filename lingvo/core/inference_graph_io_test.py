@@ -0,0 +1,136 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for inference_graph_io."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+import time
+
+import lingvo.compat as tf
+from lingvo.core import inference_graph_io
+from lingvo.core import inference_graph_pb2
+from lingvo.core import test_utils
+import numpy as np
+
+
+def _FrozenInferenceGraph(num_weights):
+  """Returns an InferenceGraph with num_weights floats as constants."""
+  graph = tf.Graph()
+  with graph.as_default():
+    x = tf.placeholder(tf.float32, [None, 256], name='input')
+    w = tf.constant(
+        np.random.RandomState(12345).uniform(
+            size=[num_weights // 256, 256]).astype(np.float32),
+        name='w')
+    b = tf.constant([1., 2.], name='b')
+    y = tf.matmul(x, w, transpose_b=True)
+    y = tf.identity(y + tf.reduce_sum(b), name='output')
+  inference_graph = inference_graph_pb2.InferenceGraph()
+  inference_graph.graph_def.CopyFrom(graph.as_graph_def())
+  subgraph = inference_graph.subgraphs['default']
+  subgraph.feeds['input'] = x.name
+  subgraph.fetches['output'] = y.name
+  return inference_graph
+
+
+class InferenceGraphIoTest(test_utils.TestCase):
+
+  def testTextFormat(self):
+    inference_graph = _FrozenInferenceGraph(1024)
+    path = os.path.join(self.get_temp_dir(), 'text.pbtxt')
+    inference_graph_io.WriteInferenceGraph(inference_graph, path)
+    self.assertFalse(tf.gfile.Exists(inference_graph_io.WeightsPath(path)))
+    self.assertProtoEquals(inference_graph,
+                           inference_graph_io.ReadInferenceGraph(path))
+
+  def testBinaryFormat(self):
+    inference_graph = _FrozenInferenceGraph(64 * 1024)
+    path = os.path.join(self.get_temp_dir(), 'binary.pb')
+    inference_graph_io.WriteInferenceGraph(inference_graph, path, binary=True)
+    # The weights are in the side file, the small constant b is not.
+    self.assertLess(tf.gfile.Stat(path).length, 64 * 1024 * 4)
+    self.assertEqual(
+        64 * 1024 * 4,
+        tf.gfile.Stat(inference_graph_io.WeightsPath(path)).length)
+    # The inference graph is not modified.
+    self.assertProtoEquals(_FrozenInferenceGraph(64 * 1024), inference_graph)
+
+    loaded = inference_graph_io.ReadInferenceGraph(path)
+    self.assertProtoEquals(inference_graph, loaded)
+    with tf.Graph().as_default(), self.session() as sess:
+      tf.import_graph_def(loaded.graph_def, name='')
+      output = sess.run(
+          loaded.subgraphs['default'].fetches['output'],
+          feed_dict={
+              loaded.subgraphs['default'].feeds['input']: np.ones([2, 256])
+          })
+    self.assertEqual((2, 256), output.shape)
+
+  def testBinaryFormatWithoutLargeConstants(self):
+    inference_graph = _FrozenInferenceGraph(1024)
+    path = os.path.join(self.get_temp_dir(), 'small.pb')
+    inference_graph_io.WriteInferenceGraph(
+        inference_graph, path, binary=True, min_bytes=1024 * 1024)
+    self.assertEqual(
+        0,
+        tf.gfile.Stat(inference_graph_io.WeightsPath(path)).length)
+    self.assertProtoEquals(inference_graph,
+                           inference_graph_io.ReadInferenceGraph(path))
+
+
+class InferenceGraphIoBenchmark(tf.test.Benchmark):
+  """Compares the cold start of text and binary inference graphs.
+
+  The cold start is the time to read an inference graph and import it in a
+  new graph, i.e. what Predictor does before creating its session.
+  """
+
+  def _ColdStart(self, path):
+    start = time.time()
+    inference_graph = inference_graph_io.ReadInferenceGraph(path)
+    with tf.Graph().as_default():
+      tf.import_graph_def(inference_graph.graph_def, name='')
+    return time.time() - start
+
+  def benchmarkColdStart(self):
+    temp_dir = tf.test.get_temp_dir()
+    for num_weights in [1024**2, 16 * 1024**2]:
+      inference_graph = _FrozenInferenceGraph(num_weights)
+      text_path = os.path.join(temp_dir, 'cold_start.pbtxt')
+      binary_path = os.path.join(temp_dir, 'cold_start.pb')
+      inference_graph_io.WriteInferenceGraph(inference_graph, text_path)
+      inference_graph_io.WriteInferenceGraph(
+          inference_graph, binary_path, binary=True)
+      text_wall_time = self._ColdStart(text_path)
+      self.report_benchmark(
+          name='ColdStart_%d_weights' % num_weights,
+          iters=1,
+          wall_time=self._ColdStart(binary_path),
+          extras={
+              'text_wall_time': text_wall_time,
+              'text_bytes': tf.gfile.Stat(text_path).length,
+              'binary_bytes': (
+                  tf.gfile.Stat(binary_path).length +
+                  tf.gfile.Stat(
+                      inference_graph_io.WeightsPath(binary_path)).length),
+          })
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -0,0 +1,273 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Post-training int8 quantization of the weights of frozen inference graphs.
+
+QuantizeWeights() rewrites the float constants of a frozen graph which are
+the weights of matmuls (e.g. `.layers.ProjectionLayer`,
+`.layers.SimpleFullSoftmax`) or the tables of gathers (e.g. the embeddings
+of `.layers.EmbeddingLayer`) into int8 constants with a float scale per
+channel, dequantized on the fly::
+
+    w = Cast(w/quantized) * w/scale
+
+The int8 weights are read through a PlaceholderWithDefault, so that constant
+folding does not turn them back into float constants when the graph is
+optimized.
+
+Channels are the output features of matmul weights, and the rows of gathered
+tables. The scales only depend on the weights, so no calibration data is
+needed. CompareInferenceGraphs() compares the outputs, latency and weight
+bytes of the quantized graph with the float one on sample batches.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+import time
+
+import lingvo.compat as tf
+from lingvo.core import py_utils
+import numpy as np
+import six
+from six.moves import range
+from six.moves import zip
+
+# Ops which pass their input through, with the same channels.
+_PASS_THROUGH_OPS = ('Identity', 'ConcatV2')
+
+
+def _ChannelAxis(name, rank, consumers):
+  """Returns the channel axis of the weights of a constant, or None.
+
+  Args:
+    name: The name of a constant node.
+    rank: The rank of the constant.
+    consumers: A dict from node name to a list of (node, input index) of the
+      nodes consuming it.
+
+  Returns:
+    The axis along which to compute the scales, or None if the constant is not
+    the weight of a matmul or the table of a gather.
+  """
+  for node, index in consumers.get(name, []):
+    if node.op in _PASS_THROUGH_OPS:
+      axis = _ChannelAxis(node.name, rank, consumers)
+      if axis is not None:
+        return axis
+    elif node.op in ('Gather', 'GatherV2') and index == 0:
+      return 0
+    elif node.op == 'MatMul' and rank == 2:
+      if index == 0:
+        return 1 if node.attr['transpose_a'].b else 0
+      return 0 if node.attr['transpose_b'].b else 1
+    elif node.op in ('BatchMatMul', 'BatchMatMulV2'):
+      if index == 0:
+        return rank - 1 if node.attr['adj_x'].b else rank - 2
+      return rank - 2 if node.attr['adj_y'].b else rank - 1
+    elif node.op == 'Einsum':
+      return rank - 1
+  return None
+
+
+def _Quantize(weights, axis):
+  """Returns int8 weights and float32 scales along axis."""
+  reduce_axes = tuple(a for a in range(weights.ndim) if a != axis)
+  scale = np.max(np.abs(weights), axis=reduce_axes, keepdims=True) / 127.
+  scale = np.where(scale > 0., scale, 1.).astype(np.float32)
+  quantized = np.clip(np.round(weights / scale), -127, 127).astype(np.int8)
+  return quantized, scale
+
+
+def QuantizeWeights(graph_def, min_elements=1024):
+  """Quantizes the float weights of a frozen graph to int8.
+
+  Args:
+    graph_def: A frozen tf.GraphDef, e.g. the graph_def of an InferenceGraph
+      exported with freeze_checkpoint.
+    min_elements: The minimum number of elements of a weight to quantize.
+      Smaller weights, e.g. biases, are kept in float.
+
+  Returns:
+    A new tf.GraphDef, where each quantized weight is computed by a node of the
+    same name from an int8 constant and a float32 scale per channel.
+  """
+  quantized_graph_def = tf.GraphDef()
+  quantized_graph_def.CopyFrom(graph_def)
+  graph_def = quantized_graph_def
+  consumers = collections.defaultdict(list)
+  for node in graph_def.node:
+    for index, node_input in enumerate(node.input):
+      if not node_input.startswith('^'):
+        consumers[node_input.split(':')[0]].append((node, index))
+  node_names = set(node.name for node in graph_def.node)
+
+  for node in list(graph_def.node):
+    if (node.op != 'Const' or
+        node.attr['dtype'].type != tf.float32.as_datatype_enum):
+      continue
+    weights = tf.make_ndarray(node.attr['value'].tensor)
+    if weights.size < min_elements or weights.ndim < 2:
+      continue
+    axis = _ChannelAxis(node.name, weights.ndim, consumers)
+    names = [
+        node.name + suffix
+        for suffix in ('/quantized_const', '/quantized', '/scale', '/cast')
+    ]
+    if axis is None or any(name in node_names for name in names):
+      continue
+    quantized, scale = _Quantize(weights, axis)
+
+    const_node = graph_def.node.add(
+        name=names[0], op='Const', device=node.device)
+    const_node.attr['dtype'].type = tf.int8.as_datatype_enum
+    const_node.attr['value'].tensor.CopyFrom(tf.make_tensor_proto(quantized))
+    # Constant folding does not go through PlaceholderWithDefault, so the
+    # weights are not converted back to float constants by the optimizers.
+    quantized_node = graph_def.node.add(
+        name=names[1],
+        op='PlaceholderWithDefault',
+        input=[names[0]],
+        device=node.device)
+    quantized_node.attr['dtype'].type = tf.int8.as_datatype_enum
+    quantized_node.attr['shape'].shape.CopyFrom(
+        tf.TensorShape(quantized.shape).as_proto())
+    scale_node = graph_def.node.add(
+        name=names[2], op='Const', device=node.device)
+    scale_node.attr['dtype'].type = tf.float32.as_datatype_enum
+    scale_node.attr['value'].tensor.CopyFrom(tf.make_tensor_proto(scale))
+    cast_node = graph_def.node.add(
+        name=names[3], op='Cast', input=[names[1]], device=node.device)
+    cast_node.attr['SrcT'].type = tf.int8.as_datatype_enum
+    cast_node.attr['DstT'].type = tf.float32.as_datatype_enum
+    # The consumers of the weights now read the dequantized weights.
+    node.op = 'Mul'
+    node.ClearField('attr')
+    node.attr['T'].type = tf.float32.as_datatype_enum
+    control_inputs = [x for x in node.input if x.startswith('^')]
+    del node.input[:]
+    node.input.extend([names[3], names[2]] + control_inputs)
+    node_names.update(names)
+  return graph_def
+
+
+def WeightBytes(graph_def):
+  """Returns the bytes of the constants of a graph."""
+  num_bytes = 0
+  for node in graph_def.node:
+    if node.op == 'Const':
+      num_bytes += tf.make_ndarray(node.attr['value'].tensor).nbytes
+  return num_bytes
+
+
+def _RunInferenceGraph(inference_graph, subgraph_name, fetch_keys,
+                       feed_batches):
+  """Runs fetch_keys on each batch, returns the results and mean latency."""
+  subgraph = inference_graph.subgraphs[subgraph_name]
+  graph = tf.Graph()
+  with graph.as_default():
+    tf.import_graph_def(inference_graph.graph_def, name='')
+  results = []
+  with tf.Session(graph=graph, config=py_utils.SessionConfig()) as sess:
+    try:
+      sess.run(graph.get_operation_by_name('init_all_tables'))
+    except KeyError:
+      pass
+    fetches = [subgraph.fetches[key] for key in fetch_keys]
+
+    def _Run(batch):
+      feed_dict = {subgraph.feeds[k]: v for k, v in six.iteritems(batch)}
+      return sess.run(fetches, feed_dict=feed_dict)
+
+    # Warm up, so that the latency excludes the graph initialization.
+    _Run(feed_batches[0])
+    start = time.time()
+    for batch in feed_batches:
+      results.append(_Run(batch))
+    latency = (time.time() - start) / len(feed_batches)
+  return results, latency
+
+
+def CompareInferenceGraphs(float_graph,
+                           quantized_graph,
+                           feed_batches,
+                           fetch_keys,
+                           subgraph_name='default'):
+  """Compares a quantized inference graph with the float one.
+
+  Args:
+    float_graph: An InferenceGraph proto, with float weights.
+    quantized_graph: The same InferenceGraph, with quantized weights.
+    feed_batches: A non empty list of dicts from feed name to value, e.g. a
+      small sample of input batches.
+    fetch_keys: The names of the fetches to compare.
+    subgraph_name: The subgraph to run.
+
+  Returns:
+    A `.NestedMap` with:
+
+    - float_latency, quantized_latency: the mean seconds per batch.
+    - float_weight_bytes, quantized_weight_bytes: the bytes of the constants.
+    - fetches: a dict from fetch key to a `.NestedMap` of the 'max_abs_diff'
+      and 'mean_abs_diff' of floating point fetches, and the 'agreement'
+      (the fraction of equal values) of the others, e.g. ids or strings.
+  """
+  float_results, float_latency = _RunInferenceGraph(float_graph, subgraph_name,
+                                                    fetch_keys, feed_batches)
+  quantized_results, quantized_latency = _RunInferenceGraph(
+      quantized_graph, subgraph_name, fetch_keys, feed_batches)
+
+  fetches = {}
+  for i, key in enumerate(fetch_keys):
+    expected = [np.asarray(result[i]) for result in float_results]
+    actual = [np.asarray(result[i]) for result in quantized_results]
+    if np.issubdtype(expected[0].dtype, np.floating):
+      diffs = np.concatenate(
+          [np.abs(e - a).ravel() for e, a in zip(expected, actual)])
+      fetches[key] = py_utils.NestedMap(
+          max_abs_diff=float(np.max(diffs)) if diffs.size else 0.,
+          mean_abs_diff=float(np.mean(diffs)) if diffs.size else 0.)
+    else:
+      equal = np.concatenate(
+          [np.equal(e, a).ravel() for e, a in zip(expected, actual)])
+      fetches[key] = py_utils.NestedMap(
+          agreement=float(np.mean(equal)) if equal.size else 1.)
+
+  return py_utils.NestedMap(
+      float_latency=float_latency,
+      quantized_latency=quantized_latency,
+      float_weight_bytes=WeightBytes(float_graph.graph_def),
+      quantized_weight_bytes=WeightBytes(quantized_graph.graph_def),
+      fetches=fetches)
+
+
+def FormatComparison(comparison):
+  """Returns a text report of the result of CompareInferenceGraphs()."""
+  lines = [
+      '%-20s %12s %12s' % ('', 'float', 'quantized'),
+      '%-20s %12.3f %12.3f' % ('latency (ms)', 1e3 * comparison.float_latency,
+                               1e3 * comparison.quantized_latency),
+      '%-20s %12.1f %12.1f' %
+      ('weights (MiB)', comparison.float_weight_bytes / 1024.**2,
+       comparison.quantized_weight_bytes / 1024.**2),
+      '',
+  ]
+  for key in sorted(comparison.fetches):
+    stats = comparison.fetches[key]
+    lines.append('%-20s %s' % (key, ', '.join(
+        '%s=%.6g' % (name, stats[name]) for name in sorted(stats))))
+  return '\n'.join(lines)
@@ -0,0 +1,115 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for inference_graph_quantizer."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import lingvo.compat as tf
+from lingvo.core import inference_graph_pb2
+from lingvo.core import inference_graph_quantizer
+from lingvo.core import test_utils
+import numpy as np
+
+
+def _FrozenInferenceGraph():
+  """Returns a frozen embedding, projection and softmax InferenceGraph."""
+  rng = np.random.RandomState(12345)
+  graph = tf.Graph()
+  with graph.as_default():
+    ids = tf.placeholder(tf.int32, [None], name='ids')
+    emb = tf.constant(
+        rng.normal(size=[100, 32]).astype(np.float32), name='emb/var')
+    w = tf.constant(rng.normal(size=[32, 64]).astype(np.float32), name='w/var')
+    b = tf.constant(rng.normal(size=[64]).astype(np.float32), name='b/var')
+    softmax_w = tf.constant(
+        rng.normal(size=[100, 64]).astype(np.float32), name='softmax/var')
+    h = tf.nn.relu(tf.matmul(tf.gather(tf.identity(emb), ids), w) + b)
+    logits = tf.matmul(h, softmax_w, transpose_b=True, name='logits')
+    top_ids = tf.argmax(logits, axis=-1, name='top_ids')
+  inference_graph = inference_graph_pb2.InferenceGraph()
+  inference_graph.graph_def.CopyFrom(graph.as_graph_def())
+  subgraph = inference_graph.subgraphs['default']
+  subgraph.feeds['ids'] = ids.name
+  subgraph.fetches['logits'] = logits.name
+  subgraph.fetches['top_ids'] = top_ids.name
+  return inference_graph
+
+
+class InferenceGraphQuantizerTest(test_utils.TestCase):
+
+  def _Nodes(self, graph_def):
+    return {node.name: node for node in graph_def.node}
+
+  def testQuantizeWeights(self):
+    inference_graph = _FrozenInferenceGraph()
+    graph_def = inference_graph_quantizer.QuantizeWeights(
+        inference_graph.graph_def)
+    nodes = self._Nodes(graph_def)
+    for name in ['emb/var', 'w/var', 'softmax/var']:
+      self.assertEqual('Mul', nodes[name].op)
+      self.assertEqual(tf.int8.as_datatype_enum,
+                       nodes[name + '/quantized_const'].attr['dtype'].type)
+    # The bias is too small to be quantized.
+    self.assertEqual('Const', nodes['b/var'].op)
+    # The input graph is not modified.
+    self.assertEqual('Const',
+                     self._Nodes(inference_graph.graph_def)['w/var'].op)
+
+    def _ScaleShape(name):
+      return tf.make_ndarray(
+          nodes[name + '/scale'].attr['value'].tensor).shape
+
+    # Per row of the embeddings, per output of the projection and the softmax.
+    self.assertEqual((100, 1), _ScaleShape('emb/var'))
+    self.assertEqual((1, 64), _ScaleShape('w/var'))
+    self.assertEqual((100, 1), _ScaleShape('softmax/var'))
+
+    with tf.Graph().as_default(), self.session() as sess:
+      tf.import_graph_def(graph_def, name='')
+      quantized_w = sess.run('w/var:0')
+    expected_w = tf.make_ndarray(
+        self._Nodes(inference_graph.graph_def)['w/var'].attr['value'].tensor)
+    self.assertAllClose(
+        expected_w,
+        quantized_w,
+        atol=np.max(np.abs(expected_w)) / 127.,
+        rtol=0.)
+
+  def testCompareInferenceGraphs(self):
+    float_graph = _FrozenInferenceGraph()
+    quantized_graph = inference_graph_pb2.InferenceGraph()
+    quantized_graph.CopyFrom(float_graph)
+    quantized_graph.graph_def.CopyFrom(
+        inference_graph_quantizer.QuantizeWeights(float_graph.graph_def))
+    feed_batches = [{'ids': np.arange(i, 100, 7)} for i in range(4)]
+    comparison = inference_graph_quantizer.CompareInferenceGraphs(
+        float_graph, quantized_graph, feed_batches, ['logits', 'top_ids'])
+    self.assertLess(comparison.quantized_weight_bytes,
+                    0.35 * comparison.float_weight_bytes)
+    self.assertGreater(comparison.float_latency, 0.)
+    self.assertGreater(comparison.quantized_latency, 0.)
+    self.assertGreater(comparison.fetches['logits'].max_abs_diff, 0.)
+    self.assertLess(comparison.fetches['logits'].mean_abs_diff, 1.)
+    self.assertGreater(comparison.fetches['top_ids'].agreement, 0.9)
+    report = inference_graph_quantizer.FormatComparison(comparison)
+    self.assertIn('latency', report)
+    self.assertIn('top_ids', report)
+
+
+if __name__ == '__main__':
+  tf.test.main()
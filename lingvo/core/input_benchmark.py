@@ -0,0 +1,266 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Throughput benchmark for input generators.
+
+Instantiates an input generator in its own graph and drains its
+`GetPreprocessedInputBatch()` as fast as possible, reporting records/sec,
+batches/sec, and per-bucket padding ratio and fill latency. `SweepInputParams`
+repeats the benchmark over a grid of `file_parallelism`,
+`num_batcher_threads` and `file_buffer_size` values to pick the fastest
+configuration for the current machine.
+
+Example usage::
+
+  p = model_registry.GetParams('mt.wmt14_en_de.WmtEnDeTransformerBase',
+                               'Train').input
+  results = input_benchmark.SweepInputParams(p, num_batches=200)
+  print(input_benchmark.FormatSweepResults(results))
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import itertools
+import time
+
+import lingvo.compat as tf
+from lingvo.core import cluster_factory
+from lingvo.core import py_utils
+import numpy as np
+import six
+from six.moves import range
+from six.moves import zip
+
+# Input params that are swept by `SweepInputParams` by default.
+DEFAULT_SWEEP = {
+    'file_parallelism': [1, 4, 16, 32],
+    'num_batcher_threads': [1, 4, 16],
+    'file_buffer_size': [1000, 10000],
+}
+
+
+class InputBenchmarkStats(object):
+  """Accumulates throughput and padding statistics over fetched batches."""
+
+  def __init__(self, bucket_upper_bound=None):
+    """Constructor.
+
+    Args:
+      bucket_upper_bound: Optional sorted list of bucket upper bounds used by
+        the input generator. Used to map a batch's `bucket_keys` to a bucket.
+        If None, all batches are attributed to a single bucket.
+    """
+    self._bucket_upper_bound = (
+        list(bucket_upper_bound) if bucket_upper_bound else None)
+    self._start_time = None
+    self._end_time = None
+    self._num_batches = 0
+    self._num_records = 0
+    # Per bucket index: [num_batches, num_records, padded, total,
+    # total_fill_latency, last_emit_time].
+    self._buckets = {}
+
+  def Start(self, now=None):
+    """Marks the beginning of the measured interval."""
+    self._start_time = time.time() if now is None else now
+    self._end_time = self._start_time
+
+  def _BucketIndex(self, batch):
+    """Returns the bucket index of `batch`."""
+    if not self._bucket_upper_bound or 'bucket_keys' not in batch:
+      return 0
+    key = np.max(batch.bucket_keys)
+    return int(
+        min(
+            np.searchsorted(self._bucket_upper_bound, key, side='left'),
+            len(self._bucket_upper_bound) - 1))
+
+  @staticmethod
+  def _NumRecords(batch):
+    """Returns the number of records in `batch`."""
+    if 'bucket_keys' in batch:
+      return int(np.size(batch.bucket_keys))
+    for v in batch.Flatten():
+      if np.ndim(v) > 0:
+        return int(np.shape(v)[0])
+    return 0
+
+  @staticmethod
+  def _Padding(batch):
+    """Returns (num padded positions, num positions) over all paddings."""
+    padded, total = 0.0, 0
+    for key, v in batch.FlattenItems():
+      if key.split('.')[-1].endswith('paddings'):
+        padded += float(np.sum(v))
+        total += int(np.size(v))
+    return padded, total
+
+  def Update(self, batch, now=None):
+    """Records a fetched batch.
+
+    Args:
+      batch: A `.NestedMap` of numpy arrays as returned by `sess.run`.
+      now: Optional timestamp of when `batch` was fetched.
+    """
+    now = time.time() if now is None else now
+    if self._start_time is None:
+      self.Start(now)
+    batch = py_utils.NestedMap(batch)
+    num_records = self._NumRecords(batch)
+    padded, total = self._Padding(batch)
+    bucket = self._BucketIndex(batch)
+    if bucket not in self._buckets:
+      self._buckets[bucket] = [0, 0, 0.0, 0, 0.0, self._start_time]
+    stats = self._buckets[bucket]
+    stats[0] += 1
+    stats[1] += num_records
+    stats[2] += padded
+    stats[3] += total
+    stats[4] += now - stats[5]
+    stats[5] = now
+    self._num_batches += 1
+    self._num_records += num_records
+    self._end_time = now
+
+  def Summary(self):
+    """Returns a `.NestedMap` summarizing the recorded batches."""
+    elapsed = max(self._end_time - self._start_time,
+                  1e-9) if self._start_time is not None else 0.
+    ret = py_utils.NestedMap()
+    ret.num_batches = self._num_batches
+    ret.num_records = self._num_records
+    ret.elapsed_secs = elapsed
+    ret.batches_per_sec = self._num_batches / elapsed if elapsed else 0.
+    ret.records_per_sec = self._num_records / elapsed if elapsed else 0.
+    total_padded = sum(s[2] for s in six.itervalues(self._buckets))
+    total_size = sum(s[3] for s in six.itervalues(self._buckets))
+    ret.padding_ratio = total_padded / total_size if total_size else 0.
+    ret.buckets = []
+    for bucket in sorted(self._buckets):
+      n, records, padded, total, latency, _ = self._buckets[bucket]
+      ret.buckets.append(
+          py_utils.NestedMap(
+              bucket=bucket,
+              upper_bound=(self._bucket_upper_bound[bucket]
+                           if self._bucket_upper_bound else None),
+              num_batches=n,
+              num_records=records,
+              padding_ratio=padded / total if total else 0.,
+              fill_latency_secs=latency / n))
+    return ret
+
+
+def FormatSummary(summary):
+  """Returns a human readable text for an `InputBenchmarkStats` summary."""
+  lines = [
+      'batches: %d records: %d elapsed: %.2fs' %
+      (summary.num_batches, summary.num_records, summary.elapsed_secs),
+      'batches/sec: %.2f records/sec: %.2f padding ratio: %.3f' %
+      (summary.batches_per_sec, summary.records_per_sec,
+       summary.padding_ratio),
+      '%8s %12s %10s %10s %10s %14s' % ('bucket', 'upper_bound', 'batches',
+                                        'records', 'padding', 'fill_latency'),
+  ]
+  for b in summary.buckets:
+    lines.append('%8d %12s %10d %10d %10.3f %13.4fs' %
+                 (b.bucket, b.upper_bound, b.num_batches, b.num_records,
+                  b.padding_ratio, b.fill_latency_secs))
+  return '\n'.join(lines)
+
+
+def BenchmarkInput(input_params, num_batches=100, num_warmup_batches=10):
+  """Drains an input generator and measures its throughput.
+
+  Args:
+    input_params: Params of a `.BaseInputGenerator`.
+    num_batches: Number of batches to measure.
+    num_warmup_batches: Number of batches fetched before measuring. Allows
+      the input op to fill its buffers.
+
+  Returns:
+    A `.NestedMap` as returned by `InputBenchmarkStats.Summary()`. Fewer than
+    `num_batches` are measured if the input reaches the end of its data.
+  """
+  input_params = input_params.Copy()
+  bucket_upper_bound = None
+  if 'bucket_upper_bound' in input_params:
+    bucket_upper_bound = input_params.bucket_upper_bound
+  stats = InputBenchmarkStats(bucket_upper_bound)
+  graph = tf.Graph()
+  with graph.as_default():
+    cluster = cluster_factory.Current()
+    with cluster, tf.device(cluster.input_device):
+      inp = input_params.Instantiate()
+      batch = inp.GetPreprocessedInputBatch()
+    initialize_tables = tf.tables_initializer()
+  with tf.Session(graph=graph) as sess:
+    sess.run(initialize_tables)
+    try:
+      for _ in range(num_warmup_batches):
+        sess.run(batch)
+      stats.Start()
+      for _ in range(num_batches):
+        stats.Update(sess.run(batch))
+    except tf.errors.OutOfRangeError:
+      tf.logging.info('Input exhausted after %d measured batches.',
+                      stats.Summary().num_batches)
+  return stats.Summary()
+
+
+def SweepInputParams(input_params,
+                     sweep=None,
+                     num_batches=100,
+                     num_warmup_batches=10):
+  """Benchmarks `input_params` over a grid of input op settings.
+
+  Args:
+    input_params: Params of a `.BaseInputGeneratorFromFiles`.
+    sweep: A dict from input param name to a list of values to try. Defaults
+      to `DEFAULT_SWEEP`. Names not defined in `input_params` are ignored.
+    num_batches: Number of batches to measure per setting.
+    num_warmup_batches: Number of warmup batches per setting.
+
+  Returns:
+    A list of (overrides, summary) pairs sorted by decreasing records/sec,
+    where overrides is a dict of the swept param values and summary is
+    returned by `BenchmarkInput`. The first entry is the suggested config.
+  """
+  sweep = DEFAULT_SWEEP if sweep is None else sweep
+  names = sorted(k for k in sweep if k in input_params)
+  results = []
+  for values in itertools.product(*[sweep[k] for k in names]):
+    overrides = dict(zip(names, values))
+    p = input_params.Copy().Set(**overrides)
+    tf.logging.info('Benchmarking input with %s', overrides)
+    summary = BenchmarkInput(p, num_batches, num_warmup_batches)
+    tf.logging.info('%s: records/sec %.2f', overrides, summary.records_per_sec)
+    results.append((overrides, summary))
+  return sorted(results, key=lambda x: -x[1].records_per_sec)
+
+
+def FormatSweepResults(results):
+  """Returns a human readable text for the output of `SweepInputParams`."""
+  lines = []
+  for overrides, summary in results:
+    lines.append('%-70s records/sec: %10.2f batches/sec: %8.2f' %
+                 (', '.join('%s=%s' % kv for kv in sorted(overrides.items())),
+                  summary.records_per_sec, summary.batches_per_sec))
+  if results:
+    lines.append('Suggested input params override: %s' %
+                 ', '.join('%s=%s' % kv for kv in sorted(results[0][0].items())))
+    lines.append(FormatSummary(results[0][1]))
+  return '\n'.join(lines)
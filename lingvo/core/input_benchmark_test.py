@@ -0,0 +1,103 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for input_benchmark."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import lingvo.compat as tf
+from lingvo.core import base_input_generator
+from lingvo.core import input_benchmark
+from lingvo.core import py_utils
+from lingvo.core import test_utils
+import numpy as np
+
+
+class ToyInputGenerator(base_input_generator.BaseInputGenerator):
+
+  def InputBatch(self):
+    b = self.params.batch_size
+    return py_utils.NestedMap(
+        ids=tf.zeros([b, 5], dtype=tf.int32),
+        paddings=tf.concat([tf.zeros([b, 3]), tf.ones([b, 2])], axis=1))
+
+
+class InputBenchmarkTest(test_utils.TestCase):
+
+  def testStats(self):
+    stats = input_benchmark.InputBenchmarkStats(bucket_upper_bound=[10, 20])
+    stats.Start(now=0.)
+
+    def _Batch(keys, num_padded):
+      paddings = np.zeros([len(keys), 4])
+      paddings[:, :num_padded] = 1.
+      return py_utils.NestedMap(
+          bucket_keys=np.array(keys),
+          src=py_utils.NestedMap(paddings=paddings))
+
+    stats.Update(_Batch([3, 8], 2), now=1.)
+    stats.Update(_Batch([15, 12, 18], 1), now=4.)
+    stats.Update(_Batch([9, 10], 0), now=5.)
+    summary = stats.Summary()
+    self.assertEqual(3, summary.num_batches)
+    self.assertEqual(7, summary.num_records)
+    self.assertAllClose(0.6, summary.batches_per_sec)
+    self.assertAllClose(1.4, summary.records_per_sec)
+    self.assertAllClose(7. / 28., summary.padding_ratio)
+    self.assertEqual(2, len(summary.buckets))
+    b0, b1 = summary.buckets
+    self.assertEqual(10, b0.upper_bound)
+    self.assertEqual(2, b0.num_batches)
+    self.assertAllClose(4. / 16., b0.padding_ratio)
+    # Bucket 0 emitted at 1s and 5s.
+    self.assertAllClose(2.5, b0.fill_latency_secs)
+    self.assertEqual(20, b1.upper_bound)
+    self.assertAllClose(0.25, b1.padding_ratio)
+    self.assertAllClose(4., b1.fill_latency_secs)
+    # Exercise the format function.
+    input_benchmark.FormatSummary(summary)
+
+  def testBenchmarkInput(self):
+    p = ToyInputGenerator.Params().Set(batch_size=3)
+    summary = input_benchmark.BenchmarkInput(
+        p, num_batches=4, num_warmup_batches=1)
+    self.assertEqual(4, summary.num_batches)
+    self.assertEqual(12, summary.num_records)
+    self.assertAllClose(0.4, summary.padding_ratio)
+    self.assertGreater(summary.records_per_sec, 0.)
+
+  def testSweepInputParams(self):
+    p = ToyInputGenerator.Params().Set(batch_size=3)
+    results = input_benchmark.SweepInputParams(
+        p,
+        sweep={
+            'batch_size': [1, 2],
+            'file_parallelism': [4],
+        },
+        num_batches=2,
+        num_warmup_batches=0)
+    self.assertEqual(2, len(results))
+    self.assertCountEqual([{'batch_size': 1}, {'batch_size': 2}],
+                          [overrides for overrides, _ in results])
+    self.assertGreaterEqual(results[0][1].records_per_sec,
+                            results[1][1].records_per_sec)
+    # Exercise the format function.
+    input_benchmark.FormatSweepResults(results)
+
+
+if __name__ == '__main__':
+  tf.test.main()
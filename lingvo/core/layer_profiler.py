@@ -0,0 +1,388 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Profiles the FLOPs, parameter reads and run time of each layer of a model.
+
+Usage::
+
+    with base_layer.ProfileFProp():
+      model = model_params.Instantiate()
+    model.ConstructFPropBPropGraph()
+    run_metadata = layer_profiler.RunTraced(sess, model.GetTask().train_op)
+    profile = layer_profiler.ProfileLayers(model, tf.get_default_graph(),
+                                           run_metadata)
+    print(layer_profiler.FormatProfile(profile))
+
+Layers constructed under `base_layer.ProfileFProp()` run each FProp call in a
+name scope of their own. Every op of the graph is attributed to the innermost
+layer whose FProp created it, and gradient ops to the layer of the op they
+differentiate.
+
+For each layer, the profile has:
+
+- fprop_flops, bprop_flops: the FLOPs of matmuls, convolutions, einsums,
+  elementwise ops and reductions, computed from the op shapes. Shapes are the
+  ones of the traced run if given, otherwise the static shapes; ops whose
+  shapes are unknown are counted in num_unknown_shape_ops.
+- param_bytes: the bytes of the variables read by the forward ops of the
+  layer.
+- micros: the run time of the ops of the layer in the traced run.
+
+Ops inside functions (e.g. `.recurrent` cells) are not profiled, only the op
+calling the function, whose run time covers them. Ops in tf.while_loop bodies
+count once, not once per iteration.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+
+import lingvo.compat as tf
+from lingvo.core import base_layer
+from lingvo.core import py_utils
+import numpy as np
+from six.moves import range
+from six.moves import zip
+
+# FLOPs per output element of elementwise ops.
+_ELEMENTWISE_FLOPS = {
+    'Add': 1,
+    'AddN': 1,
+    'AddV2': 1,
+    'BiasAdd': 1,
+    'BiasAddGrad': 1,
+    'Div': 1,
+    'Erf': 1,
+    'Exp': 1,
+    'FloorDiv': 1,
+    'LeakyRelu': 1,
+    'Log': 1,
+    'Maximum': 1,
+    'Minimum': 1,
+    'Mul': 1,
+    'Neg': 1,
+    'Pow': 1,
+    'RealDiv': 1,
+    'Reciprocal': 1,
+    'Relu': 1,
+    'Relu6': 1,
+    'ReluGrad': 1,
+    'Rsqrt': 1,
+    'Sigmoid': 1,
+    'SigmoidGrad': 1,
+    'Softplus': 1,
+    'Sqrt': 1,
+    'Square': 1,
+    'SquaredDifference': 1,
+    'Sub': 1,
+    'Tanh': 1,
+    'TanhGrad': 1,
+    # The max, exp, sum and division of each element.
+    'LogSoftmax': 4,
+    'Softmax': 4,
+}
+
+# Ops which compute one FLOP per input element.
+_REDUCTION_OPS = frozenset(
+    ['ArgMax', 'ArgMin', 'Max', 'Mean', 'Min', 'Prod', 'Sum'])
+
+
+def _NumElements(shape):
+  return int(np.prod(shape, dtype=np.int64))
+
+
+def _EinsumFlops(equation, input_shapes):
+  """Returns the FLOPs of an einsum, or None if its shapes are unknown."""
+  equation = tf.compat.as_text(equation).replace(' ', '')
+  if '.' in equation:
+    # Ellipses make the size of each index ambiguous.
+    return None
+  terms = equation.split('->')[0].split(',')
+  sizes = {}
+  for term, shape in zip(terms, input_shapes):
+    if len(term) != len(shape):
+      return None
+    sizes.update(zip(term, shape))
+  flops = _NumElements(list(sizes.values()))
+  # A multiply and an add per element of the product of the inputs.
+  return 2 * flops if len(terms) > 1 else flops
+
+
+def OpFlops(op, shape_fn):
+  """Returns the FLOPs of op, or None if they are unknown.
+
+  Args:
+    op: A tf.Operation.
+    shape_fn: A function from a tensor to its shape as a list of ints, or None
+      if it is unknown.
+  """
+  if op.type in _ELEMENTWISE_FLOPS:
+    out = shape_fn(op.outputs[0])
+    if out is None:
+      return None
+    return _ELEMENTWISE_FLOPS[op.type] * _NumElements(out)
+  if op.type in _REDUCTION_OPS:
+    inputs = shape_fn(op.inputs[0])
+    return None if inputs is None else _NumElements(inputs)
+  if op.type == 'MatMul':
+    a, out = shape_fn(op.inputs[0]), shape_fn(op.outputs[0])
+    if a is None or out is None:
+      return None
+    k = a[0] if op.get_attr('transpose_a') else a[1]
+    return 2 * _NumElements(out) * k
+  if op.type in ('BatchMatMul', 'BatchMatMulV2'):
+    a, out = shape_fn(op.inputs[0]), shape_fn(op.outputs[0])
+    if a is None or out is None:
+      return None
+    k = a[-2] if op.get_attr('adj_x') else a[-1]
+    return 2 * _NumElements(out) * k
+  if op.type in ('Conv2D', 'DepthwiseConv2dNative'):
+    kernel, out = shape_fn(op.inputs[1]), shape_fn(op.outputs[0])
+    if kernel is None or out is None:
+      return None
+    # Depthwise convolutions do not sum over the input channels.
+    in_channels = kernel[2] if op.type == 'Conv2D' else 1
+    return 2 * _NumElements(out) * kernel[0] * kernel[1] * in_channels
+  if op.type in ('Conv2DBackpropInput', 'Conv2DBackpropFilter'):
+    out_backprop = shape_fn(op.inputs[2])
+    if op.type == 'Conv2DBackpropInput':
+      kernel = shape_fn(op.inputs[1])
+    else:
+      kernel = shape_fn(op.outputs[0])
+    if kernel is None or out_backprop is None:
+      return None
+    return 2 * _NumElements(out_backprop) * kernel[0] * kernel[1] * kernel[2]
+  if op.type == 'Einsum':
+    input_shapes = [shape_fn(t) for t in op.inputs]
+    if any(shape is None for shape in input_shapes):
+      return None
+    return _EinsumFlops(op.get_attr('equation'), input_shapes)
+  return 0
+
+
+def _LayerScopes(layer, scopes):
+  """Adds the name scopes of the FProp calls of layer and its children."""
+  for scope in layer.fprop_scopes:
+    scopes[scope] = layer.path
+  for child in layer.children.Flatten():
+    if isinstance(child, base_layer.BaseLayer):
+      _LayerScopes(child, scopes)
+
+
+def _AttributeOp(op_name, scopes):
+  """Returns the layer path of an op, and whether it is a gradient op."""
+  parts = op_name.split('/')
+  is_gradient = False
+  for i, part in enumerate(parts):
+    if part.startswith('gradients'):
+      # Gradient ops are named after the op they differentiate.
+      parts = parts[i + 1:]
+      is_gradient = True
+      break
+  for i in range(len(parts) - 1, 0, -1):
+    path = scopes.get('/'.join(parts[:i]) + '/')
+    if path is not None:
+      return path, is_gradient
+  return None, is_gradient
+
+
+def _Stats():
+  return py_utils.NestedMap(
+      fprop_flops=0,
+      bprop_flops=0,
+      param_bytes=0,
+      micros=0,
+      num_ops=0,
+      num_unknown_shape_ops=0)
+
+
+def _AddStats(to_stats, stats):
+  for key in stats:
+    to_stats[key] += stats[key]
+
+
+def RunTraced(sess, fetches, feed_dict=None):
+  """Runs fetches once with a full trace, and returns its tf.RunMetadata."""
+  run_metadata = tf.RunMetadata()
+  sess.run(
+      fetches,
+      feed_dict=feed_dict,
+      options=tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE),
+      run_metadata=run_metadata)
+  return run_metadata
+
+
+def _TracedOps(run_metadata):
+  """Returns the run time and output shapes of the ops of a traced run.
+
+  Args:
+    run_metadata: A tf.RunMetadata with step_stats.
+
+  Returns:
+    A (micros, shapes) pair, of a dict from op name to its run time, and a dict
+    from tensor name to its shape.
+  """
+  micros = {}
+  shapes = {}
+  for dev_stats in run_metadata.step_stats.dev_stats:
+    # The GPU stream and memcpy stats duplicate the ones of the device.
+    if '/stream:' in dev_stats.device or '/memcpy' in dev_stats.device:
+      continue
+    for node_stats in dev_stats.node_stats:
+      name = node_stats.node_name.split(':')[0]
+      micros[name] = micros.get(name, 0) + node_stats.all_end_rel_micros
+      for output in node_stats.output:
+        shapes['%s:%d' % (name, output.slot)] = [
+            dim.size for dim in output.tensor_description.shape.dim
+        ]
+  return micros, shapes
+
+
+def ProfileLayers(root, graph, run_metadata=None):
+  """Profiles the ops of a graph per layer.
+
+  Args:
+    root: The root layer of the model, constructed under
+      `base_layer.ProfileFProp()`.
+    graph: The tf.Graph the FProp of root was called in.
+    run_metadata: Optional tf.RunMetadata of a traced run of graph, e.g. the
+      result of RunTraced(). Provides the run time of the layers, and the
+      shapes unknown statically.
+
+  Returns:
+    A `.NestedMap` with:
+
+    - root: a `.NestedMap` of 'name', 'path', 'self' (the stats of the ops
+      of the layer excluding the ones of its children), 'total' (the stats
+      including its children) and 'children' (a list of the same structure)
+      for root.
+    - other: the stats of the ops not attributed to any layer.
+    - has_timing: whether run_metadata was given.
+  """
+  scopes = {}
+  _LayerScopes(root, scopes)
+  micros, traced_shapes = _TracedOps(run_metadata) if run_metadata else ({},
+                                                                          {})
+
+  def _Shape(tensor):
+    if tensor.name in traced_shapes:
+      return traced_shapes[tensor.name]
+    if tensor.shape.is_fully_defined():
+      return tensor.shape.as_list()
+    return None
+
+  self_stats = {}
+  other = _Stats()
+  read_vars = {}
+  for op in graph.get_operations():
+    path, is_gradient = _AttributeOp(op.name, scopes)
+    if path is None:
+      stats = other
+    else:
+      stats = self_stats.setdefault(path, _Stats())
+    stats.num_ops += 1
+    stats.micros += micros.get(op.name, 0)
+    flops = OpFlops(op, _Shape)
+    if flops is None:
+      stats.num_unknown_shape_ops += 1
+    elif is_gradient:
+      stats.bprop_flops += flops
+    else:
+      stats.fprop_flops += flops
+    if is_gradient or op.type in py_utils.VARIABLE_OPS:
+      continue
+    for tensor in op.inputs:
+      if tensor.dtype.base_dtype == tf.resource:
+        continue
+      var_op = py_utils.VariableOpOf(tensor)
+      if var_op is None or var_op.name in read_vars.setdefault(path, set()):
+        continue
+      read_vars[path].add(var_op.name)
+      shape = _Shape(tensor)
+      if shape is not None:
+        stats.param_bytes += _NumElements(shape) * tensor.dtype.base_dtype.size
+
+  def _Profile(layer):
+    node = py_utils.NestedMap(
+        name=layer.params.name,
+        path=layer.path,
+        self=self_stats.get(layer.path, _Stats()),
+        total=_Stats(),
+        children=[])
+    _AddStats(node.total, node.self)
+    for child in layer.children.Flatten():
+      if isinstance(child, base_layer.BaseLayer):
+        child_node = _Profile(child)
+        _AddStats(node.total, child_node.total)
+        node.children.append(child_node)
+    return node
+
+  return py_utils.NestedMap(
+      root=_Profile(root), other=other, has_timing=run_metadata is not None)
+
+
+def ProfileToJson(profile):
+  """Returns the result of ProfileLayers() as a JSON string."""
+  return json.dumps(profile, indent=2, sort_keys=True)
+
+
+def FormatProfile(profile, max_depth=None):
+  """Returns a text table of the result of ProfileLayers().
+
+  Args:
+    profile: The result of ProfileLayers().
+    max_depth: If set, the layers deeper than max_depth below the root are not
+      listed (their stats are still included in their ancestors).
+
+  Returns:
+    A string with one row per layer, indented by depth, with its total stats.
+  """
+  total_micros = profile.root.total.micros + profile.other.micros
+  header = ['layer', 'fprop GFLOPs', 'bprop GFLOPs', 'params MiB']
+  if profile.has_timing:
+    header += ['ms', '% time']
+  lines = ['%-50s' % header[0] + ''.join(' %12s' % h for h in header[1:])]
+
+  def _Row(name, stats):
+    values = [
+        '%.3f' % (stats.fprop_flops / 1e9),
+        '%.3f' % (stats.bprop_flops / 1e9),
+        '%.2f' % (stats.param_bytes / 1024.**2)
+    ]
+    if profile.has_timing:
+      values += [
+          '%.3f' % (stats.micros / 1e3),
+          '%.1f' % (100. * stats.micros / max(total_micros, 1))
+      ]
+    lines.append('%-50s' % name + ''.join(' %12s' % v for v in values))
+
+  def _Walk(node, depth):
+    _Row('  ' * depth + node.name, node.total)
+    if max_depth is None or depth < max_depth:
+      for child in node.children:
+        _Walk(child, depth + 1)
+
+  _Walk(profile.root, 0)
+  _Row('(other)', profile.other)
+  num_unknown = (
+      profile.root.total.num_unknown_shape_ops +
+      profile.other.num_unknown_shape_ops)
+  if num_unknown:
+    lines.append('')
+    lines.append('%d ops with unknown shapes are not counted in the FLOPs.' %
+                 num_unknown)
+  return '\n'.join(lines)
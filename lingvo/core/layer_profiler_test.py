@@ -0,0 +1,103 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for layer_profiler."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+
+import lingvo.compat as tf
+from lingvo.core import base_layer
+from lingvo.core import layer_profiler
+from lingvo.core import layers
+from lingvo.core import test_utils
+import numpy as np
+
+
+class LayerProfilerTest(test_utils.TestCase):
+
+  def _BuildNet(self, batch_size):
+    """Returns a profiled 2 layers net, its input and its train op."""
+    p = layers.FeedForwardNet.Params().Set(
+        name='ffn', input_dim=8, hidden_layer_dims=[16, 4])
+    with base_layer.ProfileFProp():
+      net = p.Instantiate()
+    inputs = tf.placeholder(tf.float32, [batch_size, 8])
+    loss = tf.reduce_sum(net.FPropDefaultTheta(inputs))
+    grads = tf.gradients(loss, net.vars.Flatten())
+    return net, inputs, tf.group(grads)
+
+  def _Child(self, node, path):
+    return [child for child in node.children if child.path == path][0]
+
+  def testProfileFProp(self):
+    with self.session():
+      net, _, _ = self._BuildNet(2)
+      self.assertLen(net.fprop_scopes, 1)
+      self.assertLen(net.fc[0].fprop_scopes, 1)
+      self.assertTrue(net.fc[0].fprop_scopes[0].startswith(
+          net.fprop_scopes[0]))
+
+      p = layers.FeedForwardNet.Params().Set(
+          name='unprofiled', input_dim=8, hidden_layer_dims=[4])
+      unprofiled = p.Instantiate()
+      unprofiled.FPropDefaultTheta(tf.zeros([2, 8]))
+      self.assertEmpty(unprofiled.fprop_scopes)
+
+  def testProfileLayersStatic(self):
+    with self.session() as sess:
+      net, _, _ = self._BuildNet(2)
+      profile = layer_profiler.ProfileLayers(net, sess.graph)
+    self.assertFalse(profile.has_timing)
+    self.assertEqual('ffn', profile.root.path)
+    fc0 = self._Child(profile.root, 'ffn.ffn_0')
+    self.assertGreaterEqual(fc0.total.fprop_flops, 2 * 2 * 8 * 16)
+    self.assertGreaterEqual(fc0.total.bprop_flops, 2 * 2 * 8 * 16)
+    self.assertGreaterEqual(fc0.total.param_bytes, 8 * 16 * 4)
+    # The totals of the root include the ones of its children.
+    self.assertGreaterEqual(
+        profile.root.total.fprop_flops,
+        sum(child.total.fprop_flops for child in profile.root.children))
+
+    table = layer_profiler.FormatProfile(profile)
+    self.assertIn('ffn_0', table)
+    self.assertNotIn('% time', table)
+    report = json.loads(layer_profiler.ProfileToJson(profile))
+    self.assertIn('ffn.ffn_0',
+                  [child['path'] for child in report['root']['children']])
+
+  def testProfileLayersTraced(self):
+    with self.session() as sess:
+      net, inputs, train_op = self._BuildNet(None)
+      static_profile = layer_profiler.ProfileLayers(net, sess.graph)
+      self.assertGreater(static_profile.root.total.num_unknown_shape_ops, 0)
+
+      sess.run(tf.global_variables_initializer())
+      run_metadata = layer_profiler.RunTraced(
+          sess, train_op,
+          feed_dict={inputs: np.ones([32, 8], dtype=np.float32)})
+      profile = layer_profiler.ProfileLayers(net, sess.graph, run_metadata)
+    self.assertTrue(profile.has_timing)
+    self.assertGreater(profile.root.total.micros, 0)
+    fc0 = self._Child(profile.root, 'ffn.ffn_0')
+    self.assertGreaterEqual(fc0.total.fprop_flops, 2 * 32 * 8 * 16)
+    self.assertIn('% time', layer_profiler.FormatProfile(profile))
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -2784,6 +2784,42 @@ class SimpleFullSoftmax(SoftmaxLayer):
     return self._LogitsUsingConcatenatedWeights(
         self._ConcatWeights(theta), self._GetInputs(inputs))
 
+  def ShortlistTheta(self, theta, class_ids):
+    """Returns the weights of a shortlist of the classes.
+
+    Only the weights of the classes in the shortlist are kept, e.g. to restrict
+    decoding to a candidate vocabulary. They can be computed once and passed to
+    `ShortlistLogits` many times.
+
+    Args:
+      theta: A `.NestedMap` object containing weights' values of this layer and
+        its children layers.
+      class_ids: an int tensor of shape [K], the classes of the shortlist.
+
+    Returns:
+      A `.NestedMap` of the concatenated weights of the classes class_ids.
+    """
+    theta = self._ConcatWeights(theta)
+    theta.wm = tf.gather(
+        theta.wm, class_ids, axis=0 if self._transpose_weight_params else 1)
+    theta.bias = tf.gather(theta.bias, class_ids)
+    return theta
+
+  def ShortlistLogits(self, shortlist_theta, inputs):
+    """Returns the logits of a shortlist of the classes.
+
+    Args:
+      shortlist_theta: The weights of the shortlist, see `ShortlistTheta`.
+      inputs: a list of a single tensor, or a single tensor with the shape [N,
+        input_dim].
+
+    Returns:
+      logits [batch, K], logits[:, k] is the logit of class class_ids[k] of
+      `ShortlistTheta`.
+    """
+    return self._LogitsUsingConcatenatedWeights(shortlist_theta,
+                                                self._GetInputs(inputs))
+
   def _XentLossByChunk(self, theta, activation, class_ids):
     """Computes per-example xent loss between activation and class_ids."""
     p = self.params
@@ -3219,12 +3255,21 @@ class DropoutLayer(base_layer.BaseLayer):
     return p
 
   def _Dropout(self, theta, inputs, noise_shape):
+    if py_utils.UseDeterministicDropout():
+      return self._DeterministicDropout(theta, inputs, noise_shape)
     return tf.nn.dropout(
         inputs,
         keep_prob=self.params.keep_prob,
         noise_shape=noise_shape,
         seed=self.params.random_seed)
 
+  def _DeterministicDropout(self, theta, inputs, noise_shape):
+    return py_utils.DeterministicDropout(
+        inputs,
+        keep_prob=self.params.keep_prob,
+        seeds=py_utils.GenerateStepSeedPair(self.params, theta.global_step),
+        noise_shape=noise_shape)
+
   @classmethod
   def NumOutputNodes(cls, p):
     # The layer does element-wise processing thus is input-shape agnostic.
@@ -3271,11 +3316,7 @@ class DeterministicDropoutLayer(DropoutLayer):
   """Apply dropout during trainig."""
 
   def _Dropout(self, theta, inputs, noise_shape):
-    return py_utils.DeterministicDropout(
-        inputs,
-        keep_prob=self.params.keep_prob,
-        seeds=py_utils.GenerateStepSeedPair(self.params, theta.global_step),
-        noise_shape=noise_shape)
+    return self._DeterministicDropout(theta, inputs, noise_shape)
 
 
 class LayerNorm(base_layer.BaseLayer):
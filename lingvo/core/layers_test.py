@@ -2819,6 +2819,28 @@ class SoftmaxLayerTest(test_utils.TestCase):
       self.assertAllEqual(xent_output.per_example_argmax,
                           np.argmax(xent_output.logits, axis=1))
 
+  def testSimpleFullSoftmaxShortlistLogits(self):
+    for num_shards, num_sampled in [(1, 0), (2, 0), (2, 8)]:
+      with self.session(use_gpu=False, graph=tf.Graph()) as sess:
+        np.random.seed(12345)
+        inputs = tf.constant(np.random.rand(3, 10), dtype=tf.float32)
+        params = layers.SimpleFullSoftmax.Params().Set(
+            name='softmax',
+            input_dim=10,
+            num_classes=32,
+            num_shards=num_shards,
+            num_sampled=num_sampled,
+            params_init=py_utils.WeightInit.Gaussian(0.5, 123456))
+        softmax = params.Instantiate()
+        class_ids = [30, 1, 17, 5]
+        logits = softmax.Logits(softmax.theta, [inputs])
+        shortlist_theta = softmax.ShortlistTheta(softmax.theta,
+                                                 tf.constant(class_ids))
+        shortlist_logits = softmax.ShortlistLogits(shortlist_theta, [inputs])
+        tf.global_variables_initializer().run()
+        logits, shortlist_logits = sess.run([logits, shortlist_logits])
+        self.assertAllClose(logits[:, class_ids], shortlist_logits)
+
   def testSimpleFullSoftmax_Basic_Distributions(self):
     with self.session(use_gpu=False) as sess:
       class_ids = tf.constant([1, 5, 10], dtype=tf.int32)
@@ -85,6 +85,17 @@ class Learner(base_layer.BaseLayer):
         'operations. This avoids some race conditions.')
     p.Define('colocate_gradients_with_ops', True,
              'If True, try colocating gradients with the corresponding op.')
+    p.Define(
+        'fused_grad_stats', False,
+        'If True, computes the gradient and variable norms, checks the '
+        'gradients for NaN and Inf and scales them on flat buffers of the '
+        'concatenated gradients, one per device and dtype, instead of with a '
+        'few ops per variable.')
+    p.Define(
+        'num_var_norm_summaries', None,
+        'The number of variables, evenly sampled, for which to add variable '
+        'and gradient norm summaries. If None, all the variables, or none if '
+        'fused_grad_stats.')
     return p
 
   @base_layer.initializer
@@ -288,17 +299,21 @@ class Learner(base_layer.BaseLayer):
 
     # Computes gradients' norm and adds their summaries. Note that all_grad_norm
     # may be nan, which may cause grad_scale to be nan.
-    for name, vg in var_grads.FlattenItems():
-      summary_utils.AddNormSummary(name + '/' + p.name,
-                                   py_utils.NestedMap(s=vg))
-    all_grad_norm = tf.sqrt(
-        py_utils.SumSquared(
-            [g for (_, g) in py_utils.NestedMap(child=var_grads).Flatten()]))
-    all_var_norm = tf.sqrt(
-        py_utils.SumSquared(
-            [v for (v, _) in py_utils.NestedMap(child=var_grads).Flatten()]))
-    grad_norm_is_nan_or_inf = tf.logical_or(
-        tf.is_nan(all_grad_norm), tf.is_inf(all_grad_norm))
+    self._AddNormSummaries(var_grads)
+    if p.fused_grad_stats:
+      stats = py_utils.FusedGradStats(var_grads)
+      all_grad_norm = stats.grad_norm
+      all_var_norm = stats.var_norm
+      grad_norm_is_nan_or_inf = stats.has_nan_or_inf
+    else:
+      all_grad_norm = tf.sqrt(
+          py_utils.SumSquared(
+              [g for (_, g) in py_utils.NestedMap(child=var_grads).Flatten()]))
+      all_var_norm = tf.sqrt(
+          py_utils.SumSquared(
+              [v for (v, _) in py_utils.NestedMap(child=var_grads).Flatten()]))
+      grad_norm_is_nan_or_inf = tf.logical_or(
+          tf.is_nan(all_grad_norm), tf.is_inf(all_grad_norm))
 
     # Optional gradient adjustment. Note that this happens after computing
     # all_grad_norm.
@@ -307,9 +322,18 @@ class Learner(base_layer.BaseLayer):
       var_grads = gradient_adjuster(var_grads)
 
     # Handles NaN/Inf gradients.
-    has_nan_or_inf = py_utils.HasNanOrInfGradient(var_grads)
-    # Grad norm can still be inf even if none of the individual grad is inf.
-    has_nan_or_inf = tf.logical_or(has_nan_or_inf, grad_norm_is_nan_or_inf)
+    if p.fused_grad_stats:
+      # The norm is NaN or Inf if any of the gradients is.
+      has_nan_or_inf = grad_norm_is_nan_or_inf
+      if gradient_adjuster is not None:
+        has_nan_or_inf = tf.logical_or(
+            has_nan_or_inf,
+            py_utils.FusedGradStats(var_grads,
+                                    with_var_norm=False).has_nan_or_inf)
+    else:
+      has_nan_or_inf = py_utils.HasNanOrInfGradient(var_grads)
+      # Grad norm can still be inf even if none of the individual grad is inf.
+      has_nan_or_inf = tf.logical_or(has_nan_or_inf, grad_norm_is_nan_or_inf)
 
     return_values = py_utils.NestedMap()
     if p.clip_gradient_single_norm_to_value:
@@ -327,13 +351,32 @@ class Learner(base_layer.BaseLayer):
       self._AddEvalMetric('grad_norm/all', all_grad_norm, tf.constant(1.0))
       self._AddEvalMetric('var_norm/all', all_var_norm, tf.constant(1.0))
       self._AddEvalMetric('grad_scale_all', grad_scale, tf.constant(1.0))
-      final_var_grads = py_utils.ApplyGradMultiplier(var_grads, grad_scale)
+      if p.fused_grad_stats:
+        final_var_grads = py_utils.FusedApplyGradMultiplier(
+            var_grads, grad_scale)
+      else:
+        final_var_grads = py_utils.ApplyGradMultiplier(var_grads, grad_scale)
       return_values.grad_scale = grad_scale
 
     return_values.has_nan_or_inf = has_nan_or_inf
     return_values.final_var_grads = final_var_grads
     return return_values
 
+  def _AddNormSummaries(self, var_grads):
+    """Adds the norm summaries of a sample of the variables and gradients."""
+    p = self.params
+    items = var_grads.FlattenItems()
+    num_summaries = p.num_var_norm_summaries
+    if num_summaries is None:
+      num_summaries = 0 if p.fused_grad_stats else len(items)
+    if num_summaries < len(items):
+      items = [
+          items[i * len(items) // num_summaries] for i in range(num_summaries)
+      ]
+    for name, vg in items:
+      summary_utils.AddNormSummary(name + '/' + p.name,
+                                   py_utils.NestedMap(s=vg))
+
   def _AddEvalMetric(self, key, value, weight):
     self._eval_metrics[key] = (value, weight)
 
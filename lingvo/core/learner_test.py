@@ -19,11 +19,15 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import time
+
 import lingvo.compat as tf
 from lingvo.core import base_layer
 from lingvo.core import learner
 from lingvo.core import optimizer
 from lingvo.core import py_utils
+import numpy as np
+from six.moves import range
 
 
 class TestLayer(base_layer.BaseLayer):
@@ -79,6 +83,28 @@ class LearnerTest(tf.test.TestCase):
     self.assertAllClose(var_grads, {'world': (0., -2.)})
     self.assertAllClose(updated_vars, {'hello': 0., 'world': 0.2})
 
+  def testFusedGradStats(self):
+    learner_p = learner.Learner.Params().Set(
+        name='learner',
+        learning_rate=.1,
+        optimizer=optimizer.SGD.Params(),
+        clip_gradient_norm_to_value=1.,
+        fused_grad_stats=True)
+    var_grads, updated_vars, stats = self._testLearner(learner_p)
+    # The global norm of the gradients is sqrt(5).
+    scale = 1. / np.sqrt(5.)
+    self.assertAllClose(var_grads, {
+        'hello': (0., scale),
+        'world': (0., -2. * scale)
+    })
+    self.assertAllClose(updated_vars, {
+        'hello': -0.1 * scale,
+        'world': 0.2 * scale
+    })
+    self.assertCountEqual(
+        list(stats.eval_metrics.keys()),
+        ['grad_norm/all', 'var_norm/all', 'grad_scale_all'])
+
   def _testLearner(self, learner_p):
     tf.train.get_or_create_global_step()  # needed for lr_schedule
     lrnr = learner_p.Instantiate()
@@ -93,5 +119,72 @@ class LearnerTest(tf.test.TestCase):
       return var_grads, updated_vars, stats
 
 
+class ManyVarsLayer(base_layer.BaseLayer):
+  """A layer with many small variables."""
+
+  @classmethod
+  def Params(cls):
+    p = super(ManyVarsLayer, cls).Params()
+    p.Define('num_vars', 1000, 'Number of variables.')
+    return p
+
+  @base_layer.initializer
+  def __init__(self, params):
+    super(ManyVarsLayer, self).__init__(params)
+    p = self.params
+    with tf.variable_scope(p.name):
+      for i in range(p.num_vars):
+        pc = py_utils.WeightParams(
+            shape=[16, 16],
+            init=py_utils.WeightInit.Gaussian(),
+            dtype=p.dtype,
+            collections=self._VariableCollections())
+        self.CreateVariable('w%d' % i, pc)
+
+  def Loss(self, theta):
+    return tf.add_n([tf.reduce_sum(tf.square(w)) for w in theta.Flatten()])
+
+
+class LearnerBenchmark(tf.test.Benchmark):
+  """Compares the graph construction and step time of fused_grad_stats."""
+
+  def _Benchmark(self, fused_grad_stats, num_vars, num_steps=20):
+    with tf.Graph().as_default():
+      start = time.time()
+      tf.train.get_or_create_global_step()
+      lrnr = learner.Learner.Params().Set(
+          name='learner',
+          learning_rate=1e-3,
+          optimizer=optimizer.SGD.Params(),
+          clip_gradient_norm_to_value=1.,
+          fused_grad_stats=fused_grad_stats).Instantiate()
+      layer = ManyVarsLayer.Params().Set(
+          name='many_vars', num_vars=num_vars).Instantiate()
+      update_op, _ = lrnr.Apply(layer.Loss(layer.theta), layer.vars)
+      graph_time = time.time() - start
+      num_ops = len(tf.get_default_graph().get_operations())
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        sess.run(update_op)
+        start = time.time()
+        for _ in range(num_steps):
+          sess.run(update_op)
+        step_time = (time.time() - start) / num_steps
+    self.report_benchmark(
+        name='Learner_%s_%d_vars' %
+        ('fused' if fused_grad_stats else 'unfused', num_vars),
+        iters=num_steps,
+        wall_time=step_time,
+        extras={
+            'graph_construction_time': graph_time,
+            'num_ops': num_ops
+        })
+
+  def benchmarkFusedGradStats(self):
+    for num_vars in [100, 2000]:
+      self._Benchmark(False, num_vars)
+      self._Benchmark(True, num_vars)
+
+
 if __name__ == '__main__':
   tf.test.main()
@@ -0,0 +1,257 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Estimates the memory footprint of training a model, before training it.
+
+The estimate is computed from a training graph (i.e. after
+ConstructFPropBPropGraph()), without running it:
+
+- variables: the bytes of the model variables, e.g. weights and batch norm
+  moving statistics.
+- gradients: one gradient per trainable variable, of the same size.
+- slots: the variables created by the optimizer (e.g. the Adam moments, or
+  the gradient accumulators of optimizer.Accumulator) for the trainable
+  variables.
+- activations: the forward tensors which are kept alive for the backward
+  pass, i.e. consumed by gradient ops, for each bucket of the input.
+
+Every byte is attributed to the device its op is placed on, so the estimate
+follows the cluster placement of the variables and the partitioning of the
+layers (e.g. GPipe cells) over the devices. Gradients are attributed to the
+device of their variable.
+
+Activations are an estimate: dimensions which are unknown statically are
+assumed to be the batch size (the first one) or the sequence length (the
+others), tensors inside tf.while_loop count once instead of once per
+iteration, and temporaries freed during the forward pass are ignored.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import lingvo.compat as tf
+from lingvo.core import hyperparams
+from lingvo.core import py_utils
+from six.moves import range
+from six.moves import zip
+
+
+def _IsGradientOp(op):
+  return any(scope.startswith('gradients') for scope in op.name.split('/'))
+
+
+def NumBytes(shape, dtype, batch_size=None, seq_len=None):
+  """Returns the bytes of a tensor, or 0 if they are unknown.
+
+  Args:
+    shape: The tf.TensorShape of the tensor.
+    dtype: The tf.DType of the tensor.
+    batch_size: The size of the first dimension unknown statically.
+    seq_len: The size of the other dimensions unknown statically.
+  """
+  if not (dtype.is_floating or dtype.is_integer or dtype.is_bool or
+          dtype.is_complex):
+    return 0
+  if shape.dims is None:
+    return 0
+  num_elements = 1
+  is_first_unknown = True
+  for dim in shape.as_list():
+    if dim is None:
+      dim = batch_size if is_first_unknown else seq_len
+      is_first_unknown = False
+      if dim is None:
+        return 0
+    num_elements *= dim
+  return num_elements * dtype.size
+
+
+def BucketSizes(input_params):
+  """Returns the (batch size, sequence length) of the buckets of an input.
+
+  Args:
+    input_params: The params of an input generator, or a Params of the input
+      generators of several tasks.
+
+  Returns:
+    A sorted list of (bucket_batch_limit, bucket_upper_bound) pairs. Empty if
+    the input is not bucketed.
+  """
+  if (hasattr(input_params, 'bucket_batch_limit') and
+      hasattr(input_params, 'bucket_upper_bound')):
+    return sorted(
+        set(
+            zip(input_params.bucket_batch_limit,
+                input_params.bucket_upper_bound)))
+  sizes = set()
+  if isinstance(input_params, hyperparams.Params):
+    for _, value in input_params.IterParams():
+      if isinstance(value, hyperparams.Params):
+        sizes.update(BucketSizes(value))
+  return sorted(sizes)
+
+
+def EstimateMemory(graph, bucket_sizes):
+  """Estimates the memory per device of a training graph.
+
+  Args:
+    graph: A tf.Graph with the forward and backward pass of a model.
+    bucket_sizes: A list of (batch size, sequence length) for which to estimate
+      the activations. If empty, only the activations of static shapes count.
+
+  Returns:
+    A dict from device to a `.NestedMap` of the bytes of 'variables',
+    'gradients' and 'slots', and a list of the bytes of 'activations' for
+    each of bucket_sizes.
+  """
+  bucket_sizes = list(bucket_sizes) or [(None, None)]
+  estimate = {}
+
+  def _Device(device):
+    if device not in estimate:
+      estimate[device] = py_utils.NestedMap(
+          variables=0,
+          gradients=0,
+          slots=0,
+          activations=[0] * len(bucket_sizes))
+    return estimate[device]
+
+  all_vars = graph.get_collection(tf.GraphKeys.GLOBAL_VARIABLES)
+  trainable_names = set(
+      v.op.name for v in graph.get_collection(tf.GraphKeys.TRAINABLE_VARIABLES))
+
+  for var in all_vars:
+    device = _Device(var.device)
+    num_bytes = NumBytes(var.shape, var.dtype.base_dtype)
+    if var.op.name in trainable_names:
+      device.variables += num_bytes
+      device.gradients += num_bytes
+    elif py_utils.PrimaryVariableName(var.op, trainable_names) is not None:
+      device.slots += num_bytes
+    else:
+      device.variables += num_bytes
+
+  activations = set()
+  for op in graph.get_operations():
+    if not _IsGradientOp(op):
+      continue
+    for tensor in op.inputs:
+      if not _IsGradientOp(tensor.op) and py_utils.VariableOpOf(tensor) is None:
+        activations.add(tensor)
+  for tensor in activations:
+    device = _Device(tensor.op.device)
+    for i, (batch_size, seq_len) in enumerate(bucket_sizes):
+      device.activations[i] += NumBytes(tensor.shape, tensor.dtype,
+                                        batch_size, seq_len)
+  return estimate
+
+
+def MeasurePeakBytes(sess, fetches, num_steps, feed_dict=None):
+  """Runs fetches a few times, and returns the peak memory of each device.
+
+  Args:
+    sess: A tf.Session.
+    fetches: What to run, e.g. the train op of a model.
+    num_steps: The number of times to run fetches.
+    feed_dict: Optional feed_dict for sess.run().
+
+  Returns:
+    A dict from device to the peak bytes allocated by its largest allocator.
+  """
+  run_options = tf.RunOptions(trace_level=tf.RunOptions.FULL_TRACE)
+  peaks = {}
+  for _ in range(num_steps):
+    run_metadata = tf.RunMetadata()
+    sess.run(
+        fetches,
+        feed_dict=feed_dict,
+        options=run_options,
+        run_metadata=run_metadata)
+    for dev_stats in run_metadata.step_stats.dev_stats:
+      for memory in dev_stats.memory:
+        peaks[dev_stats.device] = max(
+            peaks.get(dev_stats.device, 0), memory.peak_bytes)
+  return peaks
+
+
+def _FormatBytes(num_bytes):
+  return '%.1fMiB' % (num_bytes / 1024.**2)
+
+
+def FormatMemoryEstimate(estimate,
+                         bucket_sizes,
+                         measured_peaks=None,
+                         adam_slots_ratio=None):
+  """Returns a text report of the result of EstimateMemory.
+
+  Args:
+    estimate: The result of EstimateMemory().
+    bucket_sizes: The bucket_sizes passed to EstimateMemory().
+    measured_peaks: Optional result of MeasurePeakBytes(), to compare with.
+    adam_slots_ratio: If set, the size of the slots of Adam relative to the
+      trainable variables, e.g. 2 for Adam alone or 3 when wrapped by an
+      optimizer.Accumulator, to report the bytes saved by the slots of the
+      optimizer vs those of Adam, e.g. when the optimizer is Adafactor.
+
+  Returns:
+    A string with the bytes per device, with the activations of the largest
+    bucket, followed by the activations of each bucket.
+  """
+  lines = [
+      '%-50s %12s %12s %12s %12s %12s' %
+      ('device', 'variables', 'gradients', 'slots', 'activations', 'total')
+  ]
+  totals = [0] * 5
+  for device in sorted(estimate):
+    row = estimate[device]
+    values = [
+        row.variables, row.gradients, row.slots,
+        max(row.activations or [0])
+    ]
+    values.append(sum(values))
+    totals = [t + v for t, v in zip(totals, values)]
+    lines.append('%-50s %12s %12s %12s %12s %12s' %
+                 tuple([device or '(unplaced)'] +
+                       [_FormatBytes(v) for v in values]))
+  lines.append('%-50s %12s %12s %12s %12s %12s' %
+               tuple(['total'] + [_FormatBytes(v) for v in totals]))
+  if totals[1]:
+    # The gradients are as large as the trainable variables.
+    lines.append('')
+    slots_line = 'optimizer slots: %.1f%% of the trainable variables' % (
+        100. * totals[2] / totals[1])
+    if adam_slots_ratio:
+      slots_line += ' (Adam: %.0f%%), %s saved vs Adam' % (
+          100. * adam_slots_ratio,
+          _FormatBytes(adam_slots_ratio * totals[1] - totals[2]))
+    lines.append(slots_line)
+
+  if bucket_sizes:
+    lines.append('')
+    lines.append('%-12s %12s %12s' % ('batch size', 'seq len', 'activations'))
+    for i, (batch_size, seq_len) in enumerate(bucket_sizes):
+      lines.append('%-12d %12d %12s' %
+                   (batch_size, seq_len,
+                    _FormatBytes(
+                        sum(row.activations[i] for row in estimate.values()))))
+
+  if measured_peaks:
+    lines.append('')
+    lines.append('%-50s %12s' % ('measured device', 'peak'))
+    for device in sorted(measured_peaks):
+      lines.append('%-50s %12s' %
+                   (device, _FormatBytes(measured_peaks[device])))
+  return '\n'.join(lines)
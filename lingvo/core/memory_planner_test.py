@@ -0,0 +1,109 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for memory_planner."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import lingvo.compat as tf
+from lingvo.core import base_input_generator
+from lingvo.core import hyperparams
+from lingvo.core import memory_planner
+from lingvo.core import test_utils
+import numpy as np
+
+
+class MemoryPlannerTest(test_utils.TestCase):
+
+  def _BuildGraph(self):
+    """Returns a graph with one Adam trained layer, and its feeds."""
+    graph = tf.Graph()
+    with graph.as_default(), tf.device('/cpu:0'):
+      x = tf.placeholder(tf.float32, [None, 8])
+      w = tf.get_variable('w', [8, 16])
+      h = tf.tanh(tf.matmul(x, w))
+      loss = tf.reduce_sum(h * h)
+      train_op = tf.train.AdamOptimizer(0.1).minimize(loss)
+      init_op = tf.global_variables_initializer()
+    return graph, x, train_op, init_op
+
+  def testBucketSizes(self):
+    p = base_input_generator.BaseSequenceInputGenerator.Params()
+    p.bucket_upper_bound = [10, 20]
+    p.bucket_batch_limit = [8, 4]
+    self.assertEqual([(4, 20), (8, 10)], memory_planner.BucketSizes(p))
+
+    other = base_input_generator.BaseSequenceInputGenerator.Params()
+    other.bucket_upper_bound = [20]
+    other.bucket_batch_limit = [4]
+    tasks = hyperparams.Params()
+    tasks.Define('a', p, '')
+    tasks.Define('b', other, '')
+    self.assertEqual([(4, 20), (8, 10)], memory_planner.BucketSizes(tasks))
+    self.assertEqual([], memory_planner.BucketSizes(None))
+
+  def testEstimateMemory(self):
+    graph, _, _, _ = self._BuildGraph()
+    estimate = memory_planner.EstimateMemory(graph, [(4, 10), (8, 10)])
+    self.assertEqual(['/device:CPU:0'], list(estimate))
+    cpu = estimate['/device:CPU:0']
+    self.assertEqual(8 * 16 * 4, cpu.variables)
+    self.assertEqual(8 * 16 * 4, cpu.gradients)
+    # The two Adam moments, and its scalar beta powers.
+    self.assertGreaterEqual(cpu.slots, 2 * 8 * 16 * 4)
+    self.assertLess(cpu.slots, 3 * 8 * 16 * 4)
+    # At least the input and the tanh output of each example are kept for the
+    # backward pass.
+    self.assertGreaterEqual(cpu.activations[0], 4 * (8 + 16) * 4)
+    self.assertGreater(cpu.activations[1], cpu.activations[0])
+
+    report = memory_planner.FormatMemoryEstimate(estimate, [(4, 10), (8, 10)],
+                                                 {'/device:CPU:0': 1024**2})
+    self.assertIn('/device:CPU:0', report)
+    self.assertIn('total', report)
+    self.assertIn('1.0MiB', report)
+    # The slots of Adam are about twice the size of the variables.
+    self.assertIn('optimizer slots: 2', report)
+    self.assertNotIn('vs Adam', report)
+    report = memory_planner.FormatMemoryEstimate(
+        estimate, [(4, 10), (8, 10)], adam_slots_ratio=3)
+    self.assertIn('(Adam: 300%)', report)
+    self.assertIn('saved vs Adam', report)
+
+  def testEstimateMemoryWithoutBuckets(self):
+    graph, _, _, _ = self._BuildGraph()
+    estimate = memory_planner.EstimateMemory(graph, [])
+    # The batch size is unknown, only static shapes count.
+    self.assertEqual(1, len(estimate['/device:CPU:0'].activations))
+    self.assertLess(estimate['/device:CPU:0'].activations[0], 8 * 16 * 4)
+
+  def testMeasurePeakBytes(self):
+    graph, x, train_op, init_op = self._BuildGraph()
+    with self.session(graph=graph) as sess:
+      sess.run(init_op)
+      peaks = memory_planner.MeasurePeakBytes(
+          sess,
+          train_op,
+          num_steps=2,
+          feed_dict={x: np.ones([1024, 8], dtype=np.float32)})
+    self.assertTrue(peaks)
+    # At least the input is allocated.
+    self.assertGreaterEqual(max(peaks.values()), 1024 * 8 * 4)
+
+
+if __name__ == '__main__':
+  tf.test.main()
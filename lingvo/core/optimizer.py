@@ -20,6 +20,7 @@ from __future__ import division
 from __future__ import print_function
 
 import lingvo.compat as tf
+from lingvo.core import adafactor
 from lingvo.core import base_layer
 from lingvo.core import py_utils
 from lingvo.core import summary_utils
@@ -226,6 +227,59 @@ class Adam(Base):
     summary_utils.scalar('adam_lr', lr)
 
 
+class Adafactor(Base):
+  """Adafactor, with factored second moments and no first moment by default.
+
+  The optimizer state of a [R, C] matrix is R + C floats, instead of 2 * R * C
+  for Adam. See `.adafactor.AdafactorOptimizer`.
+  """
+
+  @classmethod
+  def Params(cls):
+    p = super(Adafactor, cls).Params()
+    p.Define(
+        'decay_rate', None, 'Decay rate of the second moment averages. If '
+        'None, 1 - (step + 1)^-decay_exponent.')
+    p.Define('decay_exponent', 0.8,
+             'Exponent of the decay rate, if decay_rate is None.')
+    p.Define('beta1', 0.0,
+             'Decay rate of the first moment. 0 for no first moment.')
+    p.Define(
+        'clipping_threshold', 1.0,
+        'If not None, the RMS of the updates is clipped to this threshold.')
+    p.Define(
+        'multiply_by_parameter_scale', False,
+        'If True, the learning rate is relative to the RMS of each variable.')
+    p.Define('factored', True, 'Whether to factor the second moments.')
+    p.Define(
+        'min_dim_size_to_factor', 128,
+        'Only factor the second moments of variables whose two last '
+        'dimensions are at least this size.')
+    p.Define('epsilon1', 1e-30, 'Added to the squared gradients.')
+    p.Define('epsilon2', 1e-3,
+             'Min parameter scale, if multiply_by_parameter_scale.')
+    p.name = 'Adafactor'
+    return p
+
+  def GetOptimizer(self, lr):
+    p = self.params
+    return adafactor.AdafactorOptimizer(
+        learning_rate=lr,
+        decay_rate=p.decay_rate,
+        decay_exponent=p.decay_exponent,
+        beta1=p.beta1,
+        clipping_threshold=p.clipping_threshold,
+        multiply_by_parameter_scale=p.multiply_by_parameter_scale,
+        factored=p.factored,
+        min_dim_size_to_factor=p.min_dim_size_to_factor,
+        epsilon1=p.epsilon1,
+        epsilon2=p.epsilon2,
+        name=p.name)
+
+  def AddSummary(self, lr, optimizer, var_grad):
+    summary_utils.scalar('adafactor_lr', lr)
+
+
 class Accumulator(Base):
   """Gradient accumulator wrapper."""
 
@@ -162,6 +162,43 @@ class OptimizerTest(test_utils.TestCase):
     self.assertAllClose(vars2, vars2_intermediate)
     self.assertAllClose(vars1_1, vars2_1)
 
+  def testAccumulatorAdafactor(self):
+    with self.session(use_gpu=True, graph=tf.Graph()) as sess:
+      params = layers.ProjectionLayer.Params()
+      params.name = 'proj'
+      params.input_dim = 256
+      params.output_dim = 128
+      params.params_init = py_utils.WeightInit.Gaussian(0.01, 123456)
+      params.is_eval = False
+      params.batch_norm = False
+      proj_layer = layers.ProjectionLayer(params)
+      inputs = tf.placeholder(shape=[2, 4, 256], dtype=tf.float32)
+      in_padding = tf.zeros([2, 4, 1], dtype=tf.float32)
+      loss = tf.reduce_sum(proj_layer.FPropDefaultTheta(inputs, in_padding))
+      var_grads = py_utils.ComputeGradients(loss, proj_layer.vars)
+      op = optimizer.Accumulator.Params().Set(
+          accum_steps=2, optimizer_tpl=optimizer.Adafactor.Params())
+      opt = op.Instantiate()
+      var_update_op = opt.Apply(1e-2, var_grads)
+      increment_global_step_op = tf.assign_add(
+          py_utils.GetOrCreateGlobalStepVar(), 1)
+
+      # The second moment of the [256, 128] weights is factored.
+      slot_shapes = sorted(
+          v.shape.as_list()
+          for v in tf.global_variables()
+          if v.op.name.startswith('proj/w/var/Adafactor'))
+      self.assertEqual([[128], [256]], slot_shapes)
+
+      sess.run(tf.global_variables_initializer())
+      feed_dict = {inputs: np.random.normal(size=[2, 4, 256])}
+      w0 = sess.run(proj_layer.vars.w)
+      sess.run(var_update_op, feed_dict=feed_dict)
+      self.assertAllClose(w0, sess.run(proj_layer.vars.w))
+      sess.run(increment_global_step_op)
+      sess.run(var_update_op, feed_dict=feed_dict)
+      self.assertNotAllClose(w0, sess.run(proj_layer.vars.w))
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -31,26 +31,22 @@ from __future__ import print_function
 
 import threading
 import lingvo.compat as tf
-from lingvo.core import inference_graph_pb2
+from lingvo.core import inference_graph_io
 from lingvo.core import py_utils
 import six
 
-from google.protobuf import text_format
-
 
 def LoadInferenceGraph(path):
   """Parse the given path as an InferenceGraph proto.
 
   Args:
-    path: The path to the file to load.
+    path: The path to the file to load, in text or binary format (see
+      `.inference_graph_io`). The format is detected from its content.
 
   Returns:
     An InferenceGraph object.
   """
-  inference_graph = inference_graph_pb2.InferenceGraph()
-  with tf.gfile.Open(path, "r") as f:
-    text_format.Parse(f.read(), inference_graph)
-  return inference_graph
+  return inference_graph_io.ReadInferenceGraph(path)
 
 
 class Predictor(object):
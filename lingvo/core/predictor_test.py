@@ -19,6 +19,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
+
 import lingvo.compat as tf
 from lingvo.core import base_input_generator
 from lingvo.core import base_model
@@ -54,6 +56,17 @@ class PredictorTest(test_utils.TestCase):
     [fetch1] = pred.Run(['fetch1'], feed1=[12345])
     self.assertEqual(12345, fetch1)
 
+  def testPredictorFromFile(self):
+    p = base_model.SingleTaskModel.Params(DummyModel.Params().Set(name='test'))
+    p.input = base_input_generator.BaseInputGenerator.Params().Set(name='test')
+    for binary in [False, True]:
+      path = os.path.join(self.get_temp_dir(), 'inference_%s' % binary)
+      inference_graph_exporter.InferenceGraphExporter.Export(
+          p, export_path=path, export_binary=binary)
+      pred = predictor.Predictor(path)
+      [fetch1] = pred.Run(['fetch1'], feed1=[12345])
+      self.assertEqual(12345, fetch1)
+
   def testMissingFeedRaisesInvalidArgumentError(self):
     pred = predictor.Predictor(self._testInferenceGraph())
     with self.assertRaisesRegex(tf.errors.InvalidArgumentError, 'feed1'):
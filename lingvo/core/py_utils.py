@@ -1526,6 +1526,46 @@ def CreateVariable(name,
       return tf.identity(var), var
 
 
+# Types of the ops which create variables.
+VARIABLE_OPS = frozenset(
+    ['Variable', 'VariableV2', 'AutoReloadVariable', 'VarHandleOp'])
+
+
+def VariableOpOf(tensor):
+  """Returns the variable op which tensor is or reads, or None."""
+  op = tensor.op
+  while op.type in ('Identity', 'ReadVariableOp') and op.inputs:
+    op = op.inputs[0].op
+  return op if op.type in VARIABLE_OPS else None
+
+
+def PrimaryVariableName(var_op, var_names):
+  """Returns the name of the primary variable of a slot variable.
+
+  A slot variable (e.g. an optimizer accumulator) is either colocated with its
+  primary variable, or named after it, e.g. 'foo/var/Adam' is a slot of
+  'foo/var'.
+
+  Args:
+    var_op: The op of a variable.
+    var_names: The op names of the candidate primary variables.
+
+  Returns:
+    The name in var_names of the primary of var_op, or None if var_op is not a
+    slot variable.
+  """
+  for group in var_op.colocation_groups():
+    name = tf.compat.as_text(group)[len('loc:@'):]
+    if name != var_op.name and name in var_names:
+      return name
+  parts = var_op.name.split('/')
+  for i in range(len(parts) - 1, 0, -1):
+    prefix = '/'.join(parts[:i])
+    if prefix in var_names:
+      return prefix
+  return None
+
+
 _global_variable_scope = None
 
 
@@ -2026,6 +2066,130 @@ def HasNanOrInfGradient(var_grads):
   return tf.reduce_any([HasNanOrInf(g) for (_, g) in var_grads.Flatten()])
 
 
+def _FusedGradGroups(var_grads):
+  """Groups the dense gradients of var_grads by device and dtype.
+
+  Args:
+    var_grads: A `.NestedMap` with (var, grad) tuple as the map value.
+
+  Returns:
+    (groups, sparse), where groups is a list of lists of indices in
+    var_grads.Flatten() of dense gradients which can be concatenated, and
+    sparse is the list of indices of `tf.IndexedSlices` gradients.
+  """
+  groups = py_collections.OrderedDict()
+  sparse = []
+  for i, (var, grad) in enumerate(var_grads.Flatten()):
+    assert grad is not None, ('No grad found for ', var.name)
+    if isinstance(grad, tf.IndexedSlices):
+      sparse.append(i)
+    else:
+      key = (var.device, grad.dtype, var.dtype.base_dtype)
+      groups.setdefault(key, []).append(i)
+  return list(groups.values()), sparse
+
+
+def _FlatBuffer(tensors):
+  return tf.concat([tf.reshape(t, [-1]) for t in tensors], axis=0)
+
+
+def _FloatSumSquared(x):
+  if x.dtype.is_complex:
+    x = tf.abs(x)
+  return tf.reduce_sum(tf.square(tf.cast(x, tf.float32)))
+
+
+def FusedGradStats(var_grads, with_var_norm=True):
+  """Computes the global norms of gradients and variables on flat buffers.
+
+  The dense gradients, and their variables, are concatenated into one flat
+  buffer per device and dtype. The statistics then take a few ops per buffer,
+  instead of a few ops per variable as with `SumSquared` and
+  `HasNanOrInfGradient`. Sparse gradients are reduced one by one.
+
+  Args:
+    var_grads: A `.NestedMap` with (var, grad) tuple as the map value.
+    with_var_norm: Whether to compute the norm of the variables.
+
+  Returns:
+    A `.NestedMap` with
+
+    - grad_norm: the float32 global norm of the gradients.
+    - var_norm: the float32 global norm of the variables, if with_var_norm.
+    - has_nan_or_inf: a bool scalar, whether grad_norm is NaN or Inf. This is
+      the case iff a gradient has a NaN or Inf, or if the sum of their squares
+      overflows.
+  """
+  flat = var_grads.Flatten()
+  groups, sparse = _FusedGradGroups(var_grads)
+  grad_sums = []
+  var_sums = []
+  with tf.name_scope('FusedGradStats'):
+    for indices in groups:
+      with tf.device(flat[indices[0]][0].device):
+        grad_sums.append(
+            _FloatSumSquared(_FlatBuffer([flat[i][1] for i in indices])))
+        if with_var_norm:
+          var_sums.append(
+              _FloatSumSquared(_FlatBuffer([flat[i][0] for i in indices])))
+    for i in sparse:
+      var, grad = flat[i]
+      with tf.device(var.device):
+        grad_sums.append(_FloatSumSquared(grad.values))
+        if with_var_norm:
+          var_sums.append(_FloatSumSquared(var))
+    grad_norm = tf.sqrt(tf.add_n(grad_sums or [tf.constant(0.)]))
+    stats = NestedMap(
+        grad_norm=grad_norm,
+        has_nan_or_inf=tf.logical_not(tf.is_finite(grad_norm)))
+    if with_var_norm:
+      stats.var_norm = tf.sqrt(tf.add_n(var_sums or [tf.constant(0.)]))
+  return stats
+
+
+def FusedApplyGradMultiplier(var_grads, grad_scale):
+  """Scales gradients by grad_scale, on flat buffers.
+
+  Like `ApplyGradMultiplier` with a single grad_scale, but the dense gradients
+  are concatenated into one flat buffer per device and dtype, which is scaled
+  by a single op and split back.
+
+  Args:
+    var_grads: A `.NestedMap` of (variable, gradient).
+    grad_scale: A scalar, the scale of all the gradients.
+
+  Returns:
+    A `.NestedMap` of (variable, gradient * grad_scale). In particular, if
+    grad_scale is 0, the result gradient is always 0, even if the input
+    gradient is inf or nan.
+  """
+  flat = var_grads.Flatten()
+  groups, sparse = _FusedGradGroups(var_grads)
+  results = list(flat)
+  with tf.name_scope('FusedApplyGradMultiplier'):
+    for indices in groups:
+      grads = [flat[i][1] for i in indices]
+      with tf.device(flat[indices[0]][0].device):
+        buf = CheckNumerics(_FlatBuffer(grads), 'Gradients are not finite.')
+        buf = tf.where(
+            tf.equal(grad_scale, 0.), tf.zeros_like(buf),
+            tf.cast(grad_scale, buf.dtype) * buf)
+        if all(g.shape.is_fully_defined() for g in grads):
+          sizes = [g.shape.num_elements() for g in grads]
+        else:
+          sizes = tf.stack([tf.size(g) for g in grads])
+        for i, grad, split in zip(indices, grads,
+                                  tf.split(buf, sizes, num=len(grads))):
+          results[i] = (flat[i][0], tf.reshape(split, GetShape(grad)))
+  if sparse:
+    sparse_var_grads = NestedMap(sparse=[flat[i] for i in sparse])
+    for i, vg in zip(sparse,
+                     ApplyGradMultiplier(sparse_var_grads,
+                                         grad_scale).sparse):
+      results[i] = vg
+  return var_grads.Pack(results)
+
+
 def ApplyGradNormCliping(vs_gs, norm=1.0):
   """Clip gradients to norm on same device as corresponding variables.
 
@@ -3222,6 +3386,33 @@ def SequencesToDebugStrings(ids, lens, summarize=5):
   return strs
 
 
+_DETERMINISTIC_DROPOUT_STACK = _ThreadLocalStack().stack
+
+
+@contextlib.contextmanager
+def DeterministicDropoutScope():
+  """Makes the dropout of layers deterministic within the scope.
+
+  In this scope, `.layers.DropoutLayer` and attention dropout use
+  `DeterministicDropout` seeded by `GenerateStepSeedPair`, e.g. so that a
+  computation which is run twice, like a rematerialized layer, draws the same
+  dropout masks each time.
+
+  Yields:
+    None.
+  """
+  _DETERMINISTIC_DROPOUT_STACK.append(True)
+  try:
+    yield
+  finally:
+    _DETERMINISTIC_DROPOUT_STACK.pop()
+
+
+def UseDeterministicDropout():
+  """Returns True within a `DeterministicDropoutScope`."""
+  return bool(_DETERMINISTIC_DROPOUT_STACK)
+
+
 def RematerializeFn(fn, *xs):
   """Calls fn and rematerializes fn in the backward pass.
 
@@ -3318,6 +3509,11 @@ _STATEFUL_RANDOM_OPS = {
 }
 
 
+def StatefulRandomOps(ops):
+  """Returns the sorted types of the stateful random ops among ops."""
+  return sorted(set(op.type for op in ops if op.type in _STATEFUL_RANDOM_OPS))
+
+
 def StatefulRandomOpsInDefun(func, graph=None):
   """Checks whether the Defun depends on stateful random number ops.
 
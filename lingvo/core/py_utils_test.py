@@ -536,6 +536,21 @@ class PyUtilsTest(test_utils.TestCase):
       self.assertTrue(gs1 is gs)
     self.assertEqual(gs1.name, 'global_step:0')
 
+  def testVariableOpOfAndPrimaryVariableName(self):
+    with self.session(use_gpu=False, graph=tf.Graph()):
+      w = tf.get_variable('w', [2, 3])
+      with tf.colocate_with(w):
+        acc = tf.get_variable('acc', [2, 3])
+      slot = tf.get_variable('w/Adam', [2, 3])
+      other = tf.get_variable('other', [2, 3])
+      var_names = [w.op.name]
+      self.assertEqual(w.op, py_utils.VariableOpOf(tf.identity(w)))
+      self.assertIsNone(py_utils.VariableOpOf(w * 2.))
+      self.assertEqual('w', py_utils.PrimaryVariableName(acc.op, var_names))
+      self.assertEqual('w', py_utils.PrimaryVariableName(slot.op, var_names))
+      self.assertIsNone(py_utils.PrimaryVariableName(w.op, var_names))
+      self.assertIsNone(py_utils.PrimaryVariableName(other.op, var_names))
+
   def testCreateLocalTheta(self):
     methods = [py_utils.WeightInit.Gaussian, py_utils.WeightInit.Uniform]
     dtypes = [tf.float32, tf.complex64]
@@ -2145,6 +2160,76 @@ class StatefulRandomOpsInDefunTest(tf.test.TestCase):
         py_utils.StatefulRandomOpsInDefun(FunctionWithStatelessFunctionalFor))
 
 
+class FusedGradTest(test_utils.TestCase):
+
+  def _VarGrads(self):
+    a = tf.get_variable('a', initializer=[[1., 2.], [3., 4.]])
+    b = tf.get_variable('b', initializer=[5., 6., 7.])
+    c = tf.get_variable('c', initializer=np.array([2., 3.], np.float64))
+    emb = tf.get_variable('emb', initializer=np.ones([4, 2], np.float32))
+    return py_utils.NestedMap(
+        a=(a, tf.constant([[1., -1.], [2., 0.]])),
+        b=(b, tf.placeholder_with_default([3., 0., -4.], shape=None)),
+        c=[(c, tf.constant([2., -1.], tf.float64))],
+        emb=(emb,
+             tf.IndexedSlices(
+                 tf.constant([[1., 2.]]), tf.constant([1]),
+                 tf.constant([4, 2]))))
+
+  def testFusedGradStats(self):
+    with self.session() as sess:
+      var_grads = self._VarGrads()
+      fused = py_utils.FusedGradStats(var_grads)
+      grad_norm = tf.sqrt(
+          py_utils.SumSquared([
+              tf.cast(g.values if isinstance(g, tf.IndexedSlices) else g,
+                      tf.float32) for _, g in var_grads.Flatten()
+          ]))
+      var_norm = tf.sqrt(
+          py_utils.SumSquared(
+              [tf.cast(v, tf.float32) for v, _ in var_grads.Flatten()]))
+      tf.global_variables_initializer().run()
+      actual, expected_grad_norm, expected_var_norm = sess.run(
+          [fused, grad_norm, var_norm])
+    self.assertAllClose(expected_grad_norm, actual.grad_norm)
+    self.assertAllClose(expected_var_norm, actual.var_norm)
+    self.assertFalse(actual.has_nan_or_inf)
+
+  def testFusedGradStatsNaN(self):
+    with self.session() as sess:
+      var_grads = self._VarGrads()
+      var_grads.b = (var_grads.b[0], tf.constant([1., np.nan, 0.]))
+      stats = py_utils.FusedGradStats(var_grads, with_var_norm=False)
+      self.assertNotIn('var_norm', stats)
+      tf.global_variables_initializer().run()
+      self.assertTrue(sess.run(stats.has_nan_or_inf))
+
+  def testFusedApplyGradMultiplier(self):
+    with self.session() as sess:
+      var_grads = self._VarGrads()
+      scale = tf.placeholder(tf.float32, [])
+      expected = py_utils.ApplyGradMultiplier(var_grads, scale)
+      actual = py_utils.FusedApplyGradMultiplier(var_grads, scale)
+      self.assertEqual(expected.a[1].shape, actual.a[1].shape)
+      self.assertIsInstance(actual.emb[1], tf.IndexedSlices)
+      tf.global_variables_initializer().run()
+      for value in [0.5, 0.]:
+        expected_grads, actual_grads = sess.run(
+            [[g for _, g in expected.Flatten()],
+             [g for _, g in actual.Flatten()]],
+            feed_dict={scale: value})
+        for e, a in zip(expected_grads, actual_grads):
+          self.assertAllClose(e, a)
+
+  def testFusedApplyGradMultiplierZeroScaleNaN(self):
+    with self.session() as sess:
+      var_grads = self._VarGrads()
+      var_grads.a = (var_grads.a[0], tf.constant([[1., np.inf], [np.nan, 0.]]))
+      actual = py_utils.FusedApplyGradMultiplier(var_grads, 0.)
+      tf.global_variables_initializer().run()
+      self.assertAllEqual(np.zeros([2, 2]), sess.run(actual.a[1]))
+
+
 class RecordFormatTest(tf.test.TestCase):
 
   def testRecordFormatFromFilePattern(self):
@@ -0,0 +1,332 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""A model-wide policy to rematerialize the layers of layer stacks.
+
+A rematerialized layer does not keep its intermediate activations for the
+backward pass, it recomputes them from its inputs instead (see
+`.py_utils.RematerializeFn`). This trades compute for memory, e.g. to train
+with larger batches or longer sequences on a fixed amount of device memory.
+
+The policy is set once on a model, e.g.::
+
+    p.remat_policy = remat_policy.RematerializationPolicy.Params().Set(
+        every_n_layers=2)
+
+`remat_policy` is a `.base_layer.BaseLayer` param, which is copied to the
+children of a layer. The layer stacks (e.g. `.mt.layers.TransformerStack`,
+`.mt.decoder.TransformerDecoder`, `.rnn_layers.StackedFRNNLayerByLayer` and
+the cells of `.layers_with_gpipe.GPipeTransformerStack`) call the FProp of
+their layers through `LayerFProp()`, which rematerializes the layers selected
+by the policy. Variables and checkpoints are unchanged.
+
+Rematerialized layers are recomputed with the same random numbers: their
+dropout is made deterministic (see `.py_utils.DeterministicDropoutScope`), and
+a layer which uses other stateful random ops cannot be rematerialized.
+
+Layers are only rematerialized in training. For each layer, the policy
+estimates the bytes of its activations, from the static shapes of the tensors
+it creates, and the FLOPs of its forward pass, which are recomputed in the
+backward pass if it is rematerialized.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import lingvo.compat as tf
+from lingvo.core import hyperparams
+from lingvo.core import layer_profiler
+from lingvo.core import memory_planner
+from lingvo.core import py_utils
+import six
+from six.moves import zip
+
+
+def _Flatten(x):
+  """Flattens the nested lists, tuples and dicts of x into a list."""
+  if isinstance(x, (list, tuple)):
+    return [y for v in x for y in _Flatten(v)]
+  if isinstance(x, dict):
+    return [y for k in sorted(x) for y in _Flatten(x[k])]
+  return [x]
+
+
+def _Pack(tmpl, values):
+  """Returns the structure of tmpl, with its leaves replaced by values."""
+  values = iter(values)
+
+  def _Replace(x):
+    if isinstance(x, (list, tuple)):
+      items = [_Replace(v) for v in x]
+      if hasattr(x, '_fields'):
+        return type(x)(*items)
+      return type(x)(items)
+    if isinstance(x, dict):
+      items = {k: _Replace(x[k]) for k in sorted(x)}
+      return type(x)(items)
+    return next(values)
+
+  return _Replace(tmpl)
+
+
+class RematerializationPolicy(object):
+  """Decides which layers of a layer stack to rematerialize.
+
+  A layer is a candidate if its class name is in layer_types, or if
+  layer_types is None. A candidate is rematerialized if it is one of every
+  every_n_layers layers of its stack, or if keeping its activations would
+  exceed memory_budget_bytes. If neither every_n_layers nor
+  memory_budget_bytes are set, all the candidates are rematerialized.
+  """
+
+  @classmethod
+  def Params(cls):
+    p = hyperparams.InstantiableParams(cls)
+    p.Define(
+        'every_n_layers', None,
+        'If set, rematerializes the layers of index 0, n, 2n, ... of each '
+        'layer stack.')
+    p.Define(
+        'memory_budget_bytes', None,
+        'If set, rematerializes the layers of each layer stack whose estimated '
+        'activations do not fit in this budget, once the activations of the '
+        'previous layers of the stack are kept.')
+    p.Define(
+        'layer_types', None,
+        'If set, a list of the class names of the layers which may be '
+        'rematerialized, e.g. ["TransformerLayer"].')
+    p.Define(
+        'batch_size', None,
+        'The size of the first dimension unknown statically, to estimate the '
+        'activation bytes and FLOPs of the layers.')
+    p.Define(
+        'seq_len', None,
+        'The size of the other dimensions unknown statically, to estimate the '
+        'activation bytes and FLOPs of the layers.')
+    return p
+
+  def __init__(self, params):
+    self._params = params.Copy()
+    # Estimated activation bytes, by layer class name.
+    self._bytes_per_type = {}
+    # Activation bytes kept by the layers of the stack so far.
+    self._kept_bytes = 0
+    # The stats of the last FProp of each layer, by layer path.
+    self._stats = {}
+
+  @property
+  def params(self):
+    return self._params
+
+  def ShouldRematerialize(self, index, layer):
+    """Returns True if the index-th layer of a stack should be rematerialized.
+
+    Args:
+      index: The index of the layer in its stack. The layers of a stack must
+        be called by increasing index.
+      layer: The layer.
+    """
+    p = self.params
+    if index == 0:
+      self._kept_bytes = 0
+    if layer.params.is_eval:
+      return False
+    if p.layer_types is not None and type(layer).__name__ not in p.layer_types:
+      return False
+    if not p.every_n_layers and not p.memory_budget_bytes:
+      return True
+    if p.every_n_layers and index % p.every_n_layers == 0:
+      return True
+    if p.memory_budget_bytes:
+      # The activations of the first layer of each type are always kept, to
+      # estimate those of the next ones.
+      expected_bytes = self._bytes_per_type.get(type(layer).__name__)
+      if (expected_bytes is not None and
+          self._kept_bytes + expected_bytes > p.memory_budget_bytes):
+        return True
+    return False
+
+  def _Shape(self, tensor):
+    """Returns the shape of tensor, with the unknown dims of the params."""
+    p = self.params
+    if tensor.shape.dims is None:
+      return None
+    shape = []
+    is_first_unknown = True
+    for dim in tensor.shape.as_list():
+      if dim is None:
+        dim = p.batch_size if is_first_unknown else p.seq_len
+        is_first_unknown = False
+        if dim is None:
+          return None
+      shape.append(dim)
+    return shape
+
+  def _Estimate(self, ops, outputs):
+    """Returns the activation bytes and FLOPs of ops, and output bytes."""
+    p = self.params
+    act_bytes = 0
+    flops = 0
+    for op in ops:
+      for tensor in op.outputs:
+        if tensor.dtype.is_floating:
+          act_bytes += memory_planner.NumBytes(tensor.shape, tensor.dtype,
+                                               p.batch_size, p.seq_len)
+      flops += layer_profiler.OpFlops(op, self._Shape) or 0
+    output_bytes = sum(
+        memory_planner.NumBytes(x.shape, x.dtype, p.batch_size, p.seq_len)
+        for x in outputs)
+    return act_bytes, flops, output_bytes
+
+  def FProp(self, index, layer, theta, *args, **kwargs):
+    """Calls layer.FProp(theta, *args, **kwargs), maybe rematerialized.
+
+    Args:
+      index: The index of the layer in its stack.
+      layer: The layer.
+      theta: The theta of the layer.
+      *args: The positional args of layer.FProp. Nested structures of tensors
+        are supported.
+      **kwargs: The keyword args of layer.FProp.
+
+    Returns:
+      The outputs of layer.FProp.
+    """
+    rematerialize = self.ShouldRematerialize(index, layer)
+    inputs = (theta, args, kwargs)
+    flat_inputs = _Flatten(inputs)
+    tensor_indices = [
+        i for i, x in enumerate(flat_inputs)
+        if isinstance(x, (tf.Tensor, tf.Variable))
+    ]
+    traced = py_utils.NestedMap()
+    # A rematerialized function must not capture tensors, so the global step
+    # is one of its inputs.
+    global_step = py_utils.GetGlobalStep() if rematerialize else None
+
+    def _Fn(*xs):
+      """Calls layer.FProp on xs, and estimates its cost on the first call."""
+      flat = list(flat_inputs)
+      for i, x in zip(tensor_indices, xs):
+        flat[i] = x
+      fn_theta, fn_args, fn_kwargs = _Pack(inputs, flat)
+      graph = tf.get_default_graph()
+      num_ops = len(graph.get_operations())
+      if rematerialize:
+        fn_global_step = xs[-1] if global_step is not None else None
+        # The dropout masks must be the same when the layer is recomputed in
+        # the backward pass.
+        with py_utils.GlobalStepContext(fn_global_step):
+          with py_utils.DeterministicDropoutScope():
+            outputs = layer.FProp(fn_theta, *fn_args, **fn_kwargs)
+      else:
+        outputs = layer.FProp(fn_theta, *fn_args, **fn_kwargs)
+      output_tensors = [
+          x for x in _Flatten(outputs) if isinstance(x, tf.Tensor)
+      ]
+      # _Fn is called again to recompute the activations in the backward pass.
+      if 'outputs' not in traced:
+        new_ops = graph.get_operations()[num_ops:]
+        stateful_ops = py_utils.StatefulRandomOps(new_ops)
+        if rematerialize and stateful_ops:
+          raise ValueError(
+              'Cannot rematerialize %s: its stateful random ops %s would draw '
+              'different values when it is recomputed in the backward pass. '
+              'Use stateless ops, e.g. py_utils.DeterministicDropout.' %
+              (layer.path, stateful_ops))
+        traced.outputs = outputs
+        traced.stats = self._Estimate(new_ops, output_tensors)
+      if rematerialize and len(output_tensors) == 1:
+        return output_tensors[0]
+      return tuple(output_tensors)
+
+    xs = [flat_inputs[i] for i in tensor_indices]
+    if not rematerialize:
+      _Fn(*xs)
+      outputs = traced.outputs
+    else:
+      xs = [tf.convert_to_tensor(x) for x in xs]
+      if global_step is not None:
+        xs.append(tf.convert_to_tensor(global_step))
+      ys = py_utils.RematerializeFn(_Fn, *xs)
+      if isinstance(ys, tf.Tensor):
+        ys = (ys,)
+      ys = list(ys)
+      outputs = _Pack(traced.outputs, [
+          ys.pop(0) if isinstance(x, tf.Tensor) else x
+          for x in _Flatten(traced.outputs)
+      ])
+
+    act_bytes, flops, output_bytes = traced.stats
+    layer_type = type(layer).__name__
+    if not rematerialize:
+      self._bytes_per_type[layer_type] = act_bytes
+      self._kept_bytes += act_bytes
+    else:
+      self._bytes_per_type.setdefault(layer_type, act_bytes)
+      self._kept_bytes += output_bytes
+    self._stats[layer.path] = py_utils.NestedMap(
+        rematerialized=rematerialize,
+        activation_bytes=act_bytes,
+        saved_bytes=max(act_bytes - output_bytes, 0) if rematerialize else 0,
+        recompute_flops=flops if rematerialize else 0)
+    if rematerialize:
+      tf.logging.info(
+          'Rematerializing %s: saves ~%.1fMiB of activations, recomputes '
+          '~%.3g FLOPs.', layer.path, self._stats[layer.path].saved_bytes /
+          1024.**2, flops)
+    return outputs
+
+  def Report(self):
+    """Returns a `.NestedMap` of the estimated savings and costs so far.
+
+    - num_layers: The number of layers called through the policy.
+    - num_rematerialized: The number of rematerialized layers.
+    - saved_bytes: The activation bytes which are not kept for the backward
+      pass.
+    - recompute_flops: The FLOPs of the forward pass of the rematerialized
+      layers, which are recomputed in the backward pass.
+    """
+    stats = list(six.itervalues(self._stats))
+    return py_utils.NestedMap(
+        num_layers=len(stats),
+        num_rematerialized=sum(s.rematerialized for s in stats),
+        saved_bytes=sum(s.saved_bytes for s in stats),
+        recompute_flops=sum(s.recompute_flops for s in stats))
+
+
+def Instantiate(params):
+  """Returns a policy from params, or None if params is None."""
+  return params.Instantiate() if params is not None else None
+
+
+def LayerFProp(policy, index, layer, theta, *args, **kwargs):
+  """Calls layer.FProp, rematerialized if policy decides so.
+
+  Args:
+    policy: A RematerializationPolicy, or None to call layer.FProp.
+    index: The index of the layer in its stack.
+    layer: The layer.
+    theta: The theta of the layer.
+    *args: The positional args of layer.FProp.
+    **kwargs: The keyword args of layer.FProp.
+
+  Returns:
+    The outputs of layer.FProp.
+  """
+  if policy is None:
+    return layer.FProp(theta, *args, **kwargs)
+  return policy.FProp(index, layer, theta, *args, **kwargs)
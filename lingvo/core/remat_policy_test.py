@@ -0,0 +1,210 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for remat_policy."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import lingvo.compat as tf
+from lingvo.core import base_layer
+from lingvo.core import layers
+from lingvo.core import py_utils
+from lingvo.core import remat_policy
+from lingvo.core import test_utils
+import numpy as np
+from six.moves import range
+
+
+class _FCDropoutLayer(base_layer.BaseLayer):
+  """A FC layer followed by dropout."""
+
+  @classmethod
+  def Params(cls):
+    p = super(_FCDropoutLayer, cls).Params()
+    p.Define('dim', 8, 'Dimension of the layer.')
+    p.Define('dropout_tpl', layers.DropoutLayer.Params(), 'Dropout params.')
+    return p
+
+  @base_layer.initializer
+  def __init__(self, params):
+    super(_FCDropoutLayer, self).__init__(params)
+    p = self.params
+    with tf.variable_scope(p.name):
+      self.CreateChild(
+          'fc',
+          layers.FCLayer.Params().Set(input_dim=p.dim, output_dim=p.dim))
+      self.CreateChild('dropout', p.dropout_tpl)
+
+  def FProp(self, theta, inputs):
+    return self.dropout.FProp(theta.dropout,
+                              self.fc.FProp(theta.fc, inputs))
+
+
+class _NoiseLayer(base_layer.BaseLayer):
+  """Adds stateful random noise to its inputs."""
+
+  def FProp(self, theta, inputs):
+    return inputs + tf.random.normal(tf.shape(inputs))
+
+
+class _FCStack(base_layer.BaseLayer):
+  """A stack of FC layers, followed by a projection."""
+
+  @classmethod
+  def Params(cls):
+    p = super(_FCStack, cls).Params()
+    p.Define('num_layers', 4, 'Number of FC layers.')
+    p.Define('dim', 8, 'Dimension of the layers.')
+    p.Define('dropout_tpl', None,
+             'If set, each FC layer is followed by this dropout layer.')
+    return p
+
+  @base_layer.initializer
+  def __init__(self, params):
+    super(_FCStack, self).__init__(params)
+    p = self.params
+    if p.dropout_tpl:
+      fc_params = [
+          _FCDropoutLayer.Params().Set(
+              name='fc_%d' % i, dim=p.dim, dropout_tpl=p.dropout_tpl)
+          for i in range(p.num_layers)
+      ]
+    else:
+      fc_params = [
+          layers.FCLayer.Params().Set(
+              name='fc_%d' % i, input_dim=p.dim, output_dim=p.dim)
+          for i in range(p.num_layers)
+      ]
+    with tf.variable_scope(p.name):
+      self.CreateChildren('fc', fc_params)
+      self.CreateChild(
+          'proj',
+          layers.ProjectionLayer.Params().Set(
+              input_dim=p.dim, output_dim=p.dim, batch_norm=False))
+    self._remat_policy = remat_policy.Instantiate(p.remat_policy)
+    self.policy = self._remat_policy
+
+  def FProp(self, theta, inputs, paddings):
+    layer_list = list(self.fc) + [self.proj]
+    theta_list = list(theta.fc) + [theta.proj]
+    for i, (layer, layer_theta) in enumerate(zip(layer_list, theta_list)):
+      if layer is self.proj:
+        inputs = remat_policy.LayerFProp(
+            self._remat_policy, i, layer, layer_theta, inputs,
+            paddings=paddings)
+      else:
+        inputs = remat_policy.LayerFProp(self._remat_policy, i, layer,
+                                         layer_theta, inputs)
+    return inputs
+
+
+class RematPolicyTest(test_utils.TestCase):
+
+  def _Run(self, policy_params=None, is_eval=False, **stack_params):
+    """Returns the loss and gradients of a stack, and its policy."""
+    with self.session(graph=tf.Graph()) as sess:
+      tf.set_random_seed(1234)
+      # The global step seeds the deterministic dropout.
+      py_utils.GetOrCreateGlobalStepVar()
+      p = _FCStack.Params().Set(
+          name='stack', remat_policy=policy_params, is_eval=is_eval)
+      p.Set(**stack_params)
+      p.params_init = py_utils.WeightInit.Gaussian(0.1, seed=12345)
+      stack = p.Instantiate()
+      inputs = tf.constant(
+          np.random.RandomState(1).normal(size=[5, 8]), dtype=tf.float32)
+      paddings = tf.zeros([5, 1])
+      loss = tf.reduce_sum(
+          tf.square(stack.FPropDefaultTheta(inputs, paddings)))
+      grads = tf.gradients(loss, [inputs] + stack.vars.Flatten())
+      tf.global_variables_initializer().run()
+      return sess.run([loss, grads]), stack.policy
+
+  def testDefaultIsAllLayers(self):
+    (loss, grads), _ = self._Run()
+    (remat_loss, remat_grads), policy = self._Run(
+        remat_policy.RematerializationPolicy.Params().Set(batch_size=5))
+    self.assertAllClose(loss, remat_loss)
+    for grad, remat_grad in zip(grads, remat_grads):
+      self.assertAllClose(grad, remat_grad)
+    report = policy.Report()
+    self.assertEqual(5, report.num_layers)
+    self.assertEqual(5, report.num_rematerialized)
+    self.assertGreater(report.saved_bytes, 0)
+    # At least the matmuls of the FC layers and the projection.
+    self.assertGreaterEqual(report.recompute_flops, 5 * 2 * 5 * 8 * 8)
+
+  def testEveryNLayersAndLayerTypes(self):
+    (loss, grads), _ = self._Run()
+    (remat_loss, remat_grads), policy = self._Run(
+        remat_policy.RematerializationPolicy.Params().Set(
+            every_n_layers=2, layer_types=['FCLayer']))
+    self.assertAllClose(loss, remat_loss)
+    for grad, remat_grad in zip(grads, remat_grads):
+      self.assertAllClose(grad, remat_grad)
+    # fc_0 and fc_2, the projection is not a FCLayer.
+    self.assertEqual(2, policy.Report().num_rematerialized)
+
+  def testMemoryBudget(self):
+    _, policy = self._Run(
+        remat_policy.RematerializationPolicy.Params().Set(
+            memory_budget_bytes=1, batch_size=5, layer_types=['FCLayer']))
+    # The first FC layer estimates the activations of the others, which do
+    # not fit in the budget.
+    self.assertEqual(3, policy.Report().num_rematerialized)
+
+    _, policy = self._Run(
+        remat_policy.RematerializationPolicy.Params().Set(
+            memory_budget_bytes=1024**2, batch_size=5))
+    self.assertEqual(0, policy.Report().num_rematerialized)
+
+  def testDropoutIsDeterministic(self):
+    # The first layer is rematerialized. Its DropoutLayer then draws the
+    # masks of DeterministicDropoutLayer, also when it is recomputed.
+    (loss, grads), _ = self._Run(
+        num_layers=1,
+        dropout_tpl=layers.DeterministicDropoutLayer.Params().Set(
+            keep_prob=0.5))
+    (remat_loss, remat_grads), policy = self._Run(
+        remat_policy.RematerializationPolicy.Params().Set(
+            layer_types=['_FCDropoutLayer']),
+        num_layers=1,
+        dropout_tpl=layers.DropoutLayer.Params().Set(keep_prob=0.5))
+    self.assertEqual(1, policy.Report().num_rematerialized)
+    self.assertAllClose(loss, remat_loss)
+    for grad, remat_grad in zip(grads, remat_grads):
+      self.assertAllClose(grad, remat_grad)
+    (no_dropout_loss, _), _ = self._Run(
+        num_layers=1, dropout_tpl=layers.DropoutLayer.Params())
+    self.assertNotAllClose(no_dropout_loss, loss)
+
+  def testStatefulRandomOpsRaise(self):
+    with self.session(graph=tf.Graph()):
+      layer = _NoiseLayer.Params().Set(name='noise').Instantiate()
+      policy = remat_policy.RematerializationPolicy.Params().Instantiate()
+      with self.assertRaisesRegex(ValueError, 'stateful random ops'):
+        policy.FProp(0, layer, layer.theta, tf.zeros([2, 8]))
+
+  def testNoRematerializationInEval(self):
+    _, policy = self._Run(
+        remat_policy.RematerializationPolicy.Params(), is_eval=True)
+    self.assertEqual(5, policy.Report().num_layers)
+    self.assertEqual(0, policy.Report().num_rematerialized)
+
+
+if __name__ == '__main__':
+  tf.test.main()
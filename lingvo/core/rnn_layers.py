@@ -27,6 +27,7 @@ from lingvo.core import layers_with_attention
 from lingvo.core import py_utils
 from lingvo.core import quant_utils
 from lingvo.core import recurrent
+from lingvo.core import remat_policy
 from lingvo.core import rnn_cell
 from six.moves import range
 from six.moves import zip
@@ -248,6 +249,7 @@ class StackedFRNNLayerByLayer(StackedRNNBase, quant_utils.QuantizableLayer):
     self.CreateChildren('rnn', rnn_params)
     self.CreateChild('dropout', p.dropout)
     self.TrackQTensor('residual')
+    self._remat_policy = remat_policy.Instantiate(p.remat_policy)
 
   def zero_state(self, theta, batch_size):
     p = self.params
@@ -279,8 +281,9 @@ class StackedFRNNLayerByLayer(StackedRNNBase, quant_utils.QuantizableLayer):
     xs = inputs
     state1 = py_utils.NestedMap(rnn=[None] * p.num_layers)
     for i in range(p.num_layers):
-      ys, state1.rnn[i] = self.rnn[i].FProp(theta.rnn[i], xs, paddings,
-                                            state0.rnn[i])
+      ys, state1.rnn[i] = remat_policy.LayerFProp(self._remat_policy, i,
+                                                  self.rnn[i], theta.rnn[i], xs,
+                                                  paddings, state0.rnn[i])
       ys = self.dropout.FProp(theta.dropout, ys)
       if (p.skip_start >= 0 and i >= p.skip_start and
           (p.num_input_nodes <= 0 or i != 0) and
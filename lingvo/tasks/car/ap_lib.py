@@ -0,0 +1,557 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""NumPy implementation of the KITTI average precision of 3D boxes.
+
+This mirrors the `average_precision3d` op (ops/average_precision_3d_op.cc) with
+algorithm='KITTI', without depending on the op library or a TF session:
+
+- Rotated box IoU is computed with a vectorized Sutherland-Hodgman clipping
+  over all (groundtruth, prediction) pairs of a frame, after a cheap axis
+  aligned prefilter.
+- The two KITTI matching passes run frame by frame, reusing the IoUs of the
+  first pass across all the score thresholds of the second pass.
+
+Frames, and the problems of `AveragePrecision3DBatch` (e.g. classes and
+breakdown bins), are split into chunks which can be processed by a
+`multiprocessing.Pool`.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+from lingvo.core import py_utils
+import numpy as np
+from six.moves import range
+
+# Constants of ops/box_util.cc.
+_EPS = 1e-8
+_MIN_BOX_DIM = 1e-3
+_MAX_BOX_DIM = 1e6
+
+# Ignore types, see ops/image_metrics.h.
+_DONT_IGNORE = 0
+_IGNORE_ALL_MATCHES = 2
+
+# Maximum number of vertices of the intersection of two rectangles, with some
+# slack for degenerate cases.
+_MAX_VERTICES = 12
+
+
+def _BoxVertices(boxes):
+  """Returns the [N, 4, 2] BEV corners of [N, 7] boxes."""
+  cx, cy, w, h, heading = (boxes[:, 0], boxes[:, 1], boxes[:, 3], boxes[:, 4],
+                           boxes[:, 6])
+  dxcos = (w / 2.) * np.cos(heading)
+  dxsin = (w / 2.) * np.sin(heading)
+  dycos = (h / 2.) * np.cos(heading)
+  dysin = (h / 2.) * np.sin(heading)
+  return np.stack([
+      np.stack([cx - dxcos + dysin, cy - dxsin - dycos], axis=-1),
+      np.stack([cx + dxcos + dysin, cy + dxsin - dycos], axis=-1),
+      np.stack([cx + dxcos - dysin, cy + dxsin + dycos], axis=-1),
+      np.stack([cx - dxcos - dysin, cy - dxsin + dycos], axis=-1),
+  ],
+                  axis=1)
+
+
+def _PolygonArea(vertices, num_vertices):
+  """Returns the areas of [P, K, 2] convex polygons with [P] vertices."""
+  rows = np.arange(vertices.shape[0])
+  total = np.zeros(vertices.shape[0])
+  for j in range(vertices.shape[1]):
+    nxt = np.where(j + 1 < num_vertices, j + 1, 0)
+    cross = (
+        vertices[:, j, 0] * vertices[rows, nxt, 1] -
+        vertices[:, j, 1] * vertices[rows, nxt, 0])
+    total += np.where(j < num_vertices, cross, 0.)
+  area = np.abs(0.5 * total)
+  return np.where(num_vertices <= 2, 0., area)
+
+
+def _IntersectionArea(subject, clip):
+  """Returns the intersection areas of pairs of [P, 4, 2] convex quads."""
+  num_pairs = subject.shape[0]
+  rows = np.arange(num_pairs)
+  poly = np.zeros([num_pairs, _MAX_VERTICES, 2])
+  poly[:, :4] = subject
+  n = np.full([num_pairs], 4)
+  for i in range(4):
+    p = clip[:, i]
+    q = clip[:, (i + 1) % 4]
+    # The cutting line a * x + b * y + c = 0.
+    a = q[:, 1] - p[:, 1]
+    b = p[:, 0] - q[:, 0]
+    c = q[:, 0] * p[:, 1] - q[:, 1] * p[:, 0]
+    active = n > 2
+    values = a[:, np.newaxis] * poly[..., 0] + b[:, np.newaxis] * poly[
+        ..., 1] + c[:, np.newaxis]
+    new_poly = np.zeros_like(poly)
+    new_n = np.zeros_like(n)
+    for j in range(min(int(np.max(n)), _MAX_VERTICES)):
+      valid = active & (j < n)
+      nxt = np.where(j + 1 < n, j + 1, 0)
+      s = poly[:, j]
+      t = poly[rows, nxt]
+      s_val = values[:, j]
+      t_val = values[rows, nxt]
+      keep = valid & ((s_val <= 0) | (np.abs(s_val) <= _EPS)) & (
+          new_n < _MAX_VERTICES)
+      new_poly[rows[keep], new_n[keep]] = s[keep]
+      new_n += keep
+      cross = valid & (np.abs(t_val) > _EPS) & (((s_val > 0) & (t_val < 0)) |
+                                                ((s_val < 0) & (t_val > 0)))
+      if not np.any(cross):
+        continue
+      # Intersects the cutting line with the line through s and t.
+      a2 = t[:, 1] - s[:, 1]
+      b2 = s[:, 0] - t[:, 0]
+      c2 = t[:, 0] * s[:, 1] - t[:, 1] * s[:, 0]
+      w = np.where(cross, a * b2 - b * a2, 1.)
+      point = np.stack([(b * c2 - c * b2) / w, (c * a2 - a * c2) / w], axis=-1)
+      cross &= new_n < _MAX_VERTICES
+      new_poly[rows[cross], new_n[cross]] = point[cross]
+      new_n += cross
+    poly = np.where(active[:, np.newaxis, np.newaxis], new_poly, poly)
+    n = np.where(active, new_n, n)
+  area = _PolygonArea(poly, n)
+  return np.where(np.abs(area) <= _EPS, 0., area)
+
+
+def _IoUOfPairs(boxes_a, boxes_b, idx_a, idx_b, bev=False):
+  """Computes the IoU of boxes_a[idx_a] and boxes_b[idx_b].
+
+  Args:
+    boxes_a: [N, 7] boxes.
+    boxes_b: [M, 7] boxes.
+    idx_a: [P] indices into boxes_a.
+    idx_b: [P] indices into boxes_b.
+    bev: If True, computes the IoU of the top down (BEV) rotated boxes.
+      Otherwise, the IoU of the upright 3D boxes.
+
+  Returns:
+    A [P] float64 array.
+  """
+  boxes_a = np.asarray(boxes_a, dtype=np.float64)
+  boxes_b = np.asarray(boxes_b, dtype=np.float64)
+  iou = np.zeros([len(idx_a)])
+  if not len(idx_a):
+    return iou
+
+  def _Valid(boxes):
+    w, h = boxes[:, 3], boxes[:, 4]
+    valid = ((w > _MIN_BOX_DIM) & (h > _MIN_BOX_DIM) & (w < _MAX_BOX_DIM) &
+             (h < _MAX_BOX_DIM))
+    if not bev:
+      valid &= boxes[:, 5] > 0
+    return valid
+
+  def _LooseBounds(boxes):
+    r = np.maximum(boxes[:, 3], boxes[:, 4]) / 2. * 1.5
+    return boxes[:, 0] - r, boxes[:, 0] + r, boxes[:, 1] - r, boxes[:, 1] + r
+
+  def _Area(boxes):
+    area = _PolygonArea(_BoxVertices(boxes), np.full([len(boxes)], 4))
+    return np.where(np.abs(area) <= _EPS, 0., area)
+
+  # Axis aligned prefilter: only pairs whose circumscribing squares overlap
+  # may intersect.
+  ax0, ax1, ay0, ay1 = [x[idx_a] for x in _LooseBounds(boxes_a)]
+  bx0, bx1, by0, by1 = [x[idx_b] for x in _LooseBounds(boxes_b)]
+  candidates = (
+      _Valid(boxes_a)[idx_a] & _Valid(boxes_b)[idx_b] & (ax0 <= bx1) &
+      (ax1 >= bx0) & (ay0 <= by1) & (ay1 >= by0))
+  if not bev:
+    za0 = boxes_a[idx_a, 2] - boxes_a[idx_a, 5] / 2
+    za1 = boxes_a[idx_a, 2] + boxes_a[idx_a, 5] / 2
+    zb0 = boxes_b[idx_b, 2] - boxes_b[idx_b, 5] / 2
+    zb1 = boxes_b[idx_b, 2] + boxes_b[idx_b, 5] / 2
+    z_inter = np.maximum(0., np.minimum(za1, zb1) - np.maximum(za0, zb0))
+    candidates &= z_inter > 0
+  pairs = np.flatnonzero(candidates)
+  if not pairs.size:
+    return iou
+
+  ia = idx_a[pairs]
+  ib = idx_b[pairs]
+  inter = _IntersectionArea(
+      _BoxVertices(boxes_a[ia]), _BoxVertices(boxes_b[ib]))
+  area_a = _Area(boxes_a[ia])
+  area_b = _Area(boxes_b[ib])
+  if bev:
+    union = area_a + area_b - inter
+    ok = (inter != 0) & (np.abs(union) > _EPS)
+    iou[pairs] = np.where(ok, inter / np.where(ok, union, 1.), 0.)
+  else:
+    vol_inter = inter * z_inter[pairs]
+    vol_union = (
+        area_a * (za1 - za0)[pairs] + area_b * (zb1 - zb0)[pairs] - vol_inter)
+    ok = vol_inter > 0
+    iou[pairs] = np.where(ok, vol_inter / np.where(ok, vol_union, 1.), 0.)
+  return iou
+
+
+def PairwiseIoU(boxes_a, boxes_b, bev=False):
+  """Computes the IoU of every pair of 7-DOF boxes.
+
+  Boxes are [x, y, z, dx, dy, dz, phi] as in `ap_metric.Boxes3D`. Degenerate
+  boxes have an IoU of 0 with every box, as in ops/box_util.cc.
+
+  Args:
+    boxes_a: [N, 7] boxes.
+    boxes_b: [M, 7] boxes.
+    bev: If True, computes the IoU of the top down (BEV) rotated boxes.
+      Otherwise, the IoU of the upright 3D boxes.
+
+  Returns:
+    A [N, M] float64 array.
+  """
+  n, m = len(boxes_a), len(boxes_b)
+  idx_a, idx_b = np.meshgrid(np.arange(n), np.arange(m), indexing='ij')
+  return _IoUOfPairs(boxes_a, boxes_b, idx_a.ravel(), idx_b.ravel(),
+                     bev).reshape([n, m])
+
+
+def _MatchFrame(candidates, overlaps, gt_ignore, pd_ignore, pd_score,
+                eligible, best_iou):
+  """Greedily matches the groundtruths of a frame, like MatchOneScene.
+
+  Args:
+    candidates: [G, P] bool. Whether the IoU of a pair exceeds the threshold.
+    overlaps: [G, P] float32 IoUs.
+    gt_ignore: [G] ignore types of the groundtruths.
+    pd_ignore: [P] ignore types of the predictions.
+    pd_score: [P] float32 scores.
+    eligible: [P] bool. Predictions above the score threshold.
+    best_iou: If True, matches to the prediction of largest IoU (pass 2),
+      else of best score (pass 1).
+
+  Returns:
+    (gt_match, pd_match): the matched prediction of each groundtruth and the
+    matched groundtruth of each prediction, or -1 if unmatched.
+  """
+  num_gt, num_pd = candidates.shape
+  gt_match = np.full([num_gt], -1)
+  pd_match = np.full([num_pd], -1)
+  rows = np.flatnonzero((gt_ignore != _IGNORE_ALL_MATCHES) &
+                        np.any(candidates & eligible, axis=1))
+  for i in rows:
+    idx = np.flatnonzero(candidates[i] & eligible & (pd_match < 0))
+    if not idx.size:
+      continue
+    if best_iou:
+      # Non ignored predictions always win over ignored ones; the first one
+      # encountered wins ties.
+      not_ignored = idx[pd_ignore[idx] == _DONT_IGNORE]
+      if not_ignored.size:
+        j = not_ignored[np.argmax(overlaps[i, not_ignored])]
+      else:
+        j = idx[0]
+    else:
+      j = idx[np.argmax(pd_score[idx])]
+    gt_match[i] = j
+    pd_match[j] = i
+  return gt_match, pd_match
+
+
+def _FrameOverlaps(frames, iou_threshold, bev):
+  """Computes the [G, P] IoUs of all frames in one vectorized call."""
+  idx_a = []
+  idx_b = []
+  gt_offset = 0
+  pd_offset = 0
+  for f in frames:
+    g, p = len(f.gt_bbox), len(f.pd_bbox)
+    ia, ib = np.meshgrid(
+        np.arange(g) + gt_offset, np.arange(p) + pd_offset, indexing='ij')
+    idx_a.append(ia.ravel())
+    idx_b.append(ib.ravel())
+    gt_offset += g
+    pd_offset += p
+  # The IoU is computed in double and compared in float, as in the op.
+  iou = _IoUOfPairs(
+      np.concatenate([f.gt_bbox for f in frames]),
+      np.concatenate([f.pd_bbox for f in frames]), np.concatenate(idx_a),
+      np.concatenate(idx_b), bev).astype(np.float32)
+  overlaps = []
+  start = 0
+  for f in frames:
+    size = len(f.gt_bbox) * len(f.pd_bbox)
+    o = iou[start:start + size].reshape([len(f.gt_bbox), len(f.pd_bbox)])
+    overlaps.append((o > iou_threshold, o))
+    start += size
+  return overlaps
+
+
+class _Frame(object):
+  """The boxes of a frame."""
+
+  def __init__(self, gt_bbox, gt_ignore, pd_bbox, pd_ignore, pd_score):
+    self.gt_bbox = gt_bbox
+    self.gt_ignore = gt_ignore
+    self.pd_bbox = pd_bbox
+    self.pd_ignore = pd_ignore
+    self.pd_score = pd_score
+
+
+def _ProcessChunk(task):
+  """Runs one KITTI matching pass over a chunk of frames.
+
+  Args:
+    task: A tuple (frames, iou_threshold, bev, thresholds). If thresholds is
+      None, runs the first pass, else the second pass for every threshold.
+
+  Returns:
+    For the first pass, (matched_scores, num_gt) where matched_scores are the
+    scores of the predictions matched to a groundtruth, and num_gt is the
+    number of evaluated groundtruths. For the second pass, (tp, total) int
+    arrays with the number of true positives and evaluated predictions at
+    every threshold.
+  """
+  frames, iou_threshold, bev, thresholds = task
+  iou_threshold = np.float32(iou_threshold)
+  matched = [f for f in frames if len(f.gt_bbox) and len(f.pd_bbox)]
+  overlaps = dict(
+      zip([id(f) for f in matched],
+          _FrameOverlaps(matched, iou_threshold, bev) if matched else []))
+
+  if thresholds is None:
+    matched_scores = []
+    num_gt = 0
+    for f in frames:
+      # Groundtruths ignoring all matches are skipped by the matching, so their
+      # assignment keeps the default kDontIgnore type and they are counted.
+      num_gt += np.sum(f.gt_ignore != 1)
+      if id(f) not in overlaps:
+        continue
+      candidates, o = overlaps[id(f)]
+      gt_match, _ = _MatchFrame(candidates, o, f.gt_ignore, f.pd_ignore,
+                                f.pd_score, f.pd_score >= 0, False)
+      ok = ((gt_match >= 0) & (f.gt_ignore == _DONT_IGNORE))
+      ok[ok] &= f.pd_ignore[gt_match[ok]] == _DONT_IGNORE
+      matched_scores.append(f.pd_score[gt_match[ok]])
+    if matched_scores:
+      matched_scores = np.concatenate(matched_scores)
+    else:
+      matched_scores = np.zeros([0], dtype=np.float32)
+    return matched_scores, num_gt
+
+  tp = np.zeros([len(thresholds)], dtype=np.int64)
+  total = np.zeros([len(thresholds)], dtype=np.int64)
+  for f in frames:
+    if not len(f.pd_bbox):
+      continue
+    if id(f) not in overlaps:
+      # Without groundtruth, no prediction is a true positive.
+      for k, threshold in enumerate(thresholds):
+        total[k] += np.sum((f.pd_score >= threshold) &
+                           (f.pd_ignore == _DONT_IGNORE))
+      continue
+    candidates, o = overlaps[id(f)]
+    prev_num_eligible = -1
+    for k, threshold in enumerate(thresholds):
+      eligible = f.pd_score >= threshold
+      num_eligible = np.sum(eligible)
+      # Thresholds are decreasing, so the same number of eligible predictions
+      # means the same matching as for the previous threshold.
+      if num_eligible != prev_num_eligible:
+        _, pd_match = _MatchFrame(candidates, o, f.gt_ignore, f.pd_ignore,
+                                  f.pd_score, eligible, True)
+        gt_ignore = np.zeros_like(f.pd_ignore)
+        gt_ignore[pd_match >= 0] = f.gt_ignore[pd_match[pd_match >= 0]]
+        evaluated = (
+            eligible & (gt_ignore == _DONT_IGNORE) &
+            (f.pd_ignore == _DONT_IGNORE))
+        frame_total = np.sum(evaluated)
+        frame_tp = np.sum(evaluated & (pd_match >= 0))
+        prev_num_eligible = num_eligible
+      tp[k] += frame_tp
+      total[k] += frame_total
+  return tp, total
+
+
+def _FindThresholds(matched_scores, num_gt, num_recall_points):
+  """Returns the score thresholds of the recall points, as FindThresholds."""
+  if num_gt == 0 or not len(matched_scores):
+    return np.zeros([0], dtype=np.float32)
+  scores = -np.sort(-matched_scores.astype(np.float32))
+  i = np.arange(1, len(scores) + 1)
+  # float32 arithmetic, as in the op.
+  left = i.astype(np.float32) / np.float32(num_gt)
+  right = (i + 1).astype(np.float32) / np.float32(num_gt)
+  denom = np.float32(num_recall_points - 1)
+  thresholds = []
+  start = 0
+  with np.errstate(divide='ignore', invalid='ignore'):
+    while start < len(scores):
+      target = np.float32(len(thresholds)) / denom
+      cond = (right[start:] - target) >= (target - left[start:])
+      cond[-1] = True
+      k = start + int(np.argmax(cond))
+      thresholds.append(scores[k])
+      start = k + 1
+  return np.array(thresholds[:num_recall_points], dtype=np.float32)
+
+
+def _Frames(problem):
+  """Splits the boxes of a problem into a list of _Frame."""
+  gt, pd = problem.gt, problem.pd
+  gt_imgid = np.asarray(gt.imgid).astype(np.int64)
+  pd_imgid = np.asarray(pd.imgid).astype(np.int64)
+  gt_bbox = np.asarray(gt.bbox, dtype=np.float32).reshape([-1, 7])
+  pd_bbox = np.asarray(pd.bbox, dtype=np.float32).reshape([-1, 7])
+  gt_ignore = np.asarray(gt.ignore).astype(np.int32)
+  pd_ignore = np.asarray(pd.ignore).astype(np.int32)
+  pd_score = np.asarray(pd.score, dtype=np.float32)
+
+  # Stable sorts keep the order of the boxes within a frame.
+  gt_order = np.argsort(gt_imgid, kind='mergesort')
+  pd_order = np.argsort(pd_imgid, kind='mergesort')
+  imgids = np.union1d(gt_imgid, pd_imgid)
+  gt_bounds = np.searchsorted(gt_imgid[gt_order], imgids, side='left')
+  gt_ends = np.searchsorted(gt_imgid[gt_order], imgids, side='right')
+  pd_bounds = np.searchsorted(pd_imgid[pd_order], imgids, side='left')
+  pd_ends = np.searchsorted(pd_imgid[pd_order], imgids, side='right')
+  frames = []
+  for g0, g1, p0, p1 in zip(gt_bounds, gt_ends, pd_bounds, pd_ends):
+    gi = gt_order[g0:g1]
+    pi = pd_order[p0:p1]
+    frames.append(
+        _Frame(gt_bbox[gi], gt_ignore[gi], pd_bbox[pi], pd_ignore[pi],
+               pd_score[pi]))
+  return frames
+
+
+def _Chunks(frames, frames_per_chunk):
+  return [
+      frames[i:i + frames_per_chunk]
+      for i in range(0, len(frames), frames_per_chunk)
+  ]
+
+
+def AveragePrecision3DBatch(problems,
+                            num_recall_points,
+                            bev=False,
+                            pool=None,
+                            frames_per_chunk=256):
+  """Computes the KITTI AP of several problems, e.g. classes or bins.
+
+  Args:
+    problems: A list of NestedMaps as returned by
+      `KITTIAPMetrics._GetData()`, with:
+
+      - iou_threshold: the IoU threshold.
+      - gt: NestedMap of bbox [N, 7], imgid [N] and ignore [N].
+      - pd: NestedMap of bbox [M, 7], imgid [M], ignore [M] and score [M].
+
+      The ignore types are those of the `average_precision3d` op.
+    num_recall_points: Number of points on the PR curve.
+    bev: If True, uses the top down (BEV) IoU instead of the 3D IoU.
+    pool: An optional `multiprocessing.Pool`. If set, chunks of frames of all
+      problems are processed by the pool.
+    frames_per_chunk: Number of frames processed together.
+
+  Returns:
+    A list with an (ap, pr) pair per problem, where ap is a float32 scalar and
+    pr a [num_recall_points, 2] float32 array of (precision, recall), as
+    returned by the `average_precision3d` op.
+  """
+  map_fn = pool.map if pool else lambda fn, tasks: [fn(t) for t in tasks]
+  chunks = [
+      _Chunks(_Frames(problem), frames_per_chunk) for problem in problems
+  ]
+
+  # Pass 1: matches by best score to find the thresholds of the recall points.
+  tasks = []
+  for problem, problem_chunks in zip(problems, chunks):
+    tasks += [(c, problem.iou_threshold, bev, None) for c in problem_chunks]
+  results = iter(map_fn(_ProcessChunk, tasks))
+  thresholds = []
+  for problem_chunks in chunks:
+    matched_scores = []
+    num_gt = 0
+    for _ in problem_chunks:
+      chunk_scores, chunk_num_gt = next(results)
+      matched_scores.append(chunk_scores)
+      num_gt += chunk_num_gt
+    matched_scores = (
+        np.concatenate(matched_scores)
+        if matched_scores else np.zeros([0], np.float32))
+    thresholds.append(
+        _FindThresholds(matched_scores, num_gt, num_recall_points))
+
+  # Pass 2: matches by best IoU above every threshold.
+  tasks = []
+  for problem, problem_chunks, t in zip(problems, chunks, thresholds):
+    if len(t):
+      tasks += [(c, problem.iou_threshold, bev, t) for c in problem_chunks]
+  results = iter(map_fn(_ProcessChunk, tasks))
+  outputs = []
+  recall_denom = np.float32(num_recall_points - 1)
+  for problem_chunks, t in zip(chunks, thresholds):
+    tp = np.zeros([len(t)], dtype=np.int64)
+    total = np.zeros([len(t)], dtype=np.int64)
+    if len(t):
+      for _ in problem_chunks:
+        chunk_tp, chunk_total = next(results)
+        tp += chunk_tp
+        total += chunk_total
+    with np.errstate(divide='ignore', invalid='ignore'):
+      precision = np.where(total > 0,
+                           tp.astype(np.float32) / total.astype(np.float32),
+                           np.float32(1.)).astype(np.float32)
+      pr = np.zeros([num_recall_points, 2], dtype=np.float32)
+      pr[:, 1] = np.arange(num_recall_points).astype(np.float32) / recall_denom
+    ap = np.float32(0.)
+    for p in precision:
+      ap += p
+    # Precision is made monotonically decreasing in recall.
+    pr[:len(t), 0] = np.maximum.accumulate(precision[::-1])[::-1]
+    outputs.append((np.float32(ap / np.float32(num_recall_points)), pr))
+  return outputs
+
+
+def AveragePrecision3D(iou_threshold,
+                       groundtruth_bbox,
+                       groundtruth_imageid,
+                       groundtruth_ignore,
+                       prediction_bbox,
+                       prediction_imageid,
+                       prediction_ignore,
+                       prediction_score,
+                       num_recall_points=1,
+                       bev=False,
+                       pool=None):
+  """NumPy equivalent of `ops.average_precision3d` with algorithm='KITTI'.
+
+  See `AveragePrecision3DBatch` for `bev` and `pool`.
+
+  Returns:
+    (ap, pr): a float32 scalar and a [num_recall_points, 2] float32 array of
+    (precision, recall).
+  """
+  problem = py_utils.NestedMap(
+      iou_threshold=iou_threshold,
+      gt=py_utils.NestedMap(
+          bbox=groundtruth_bbox,
+          imgid=groundtruth_imageid,
+          ignore=groundtruth_ignore),
+      pd=py_utils.NestedMap(
+          bbox=prediction_bbox,
+          imgid=prediction_imageid,
+          ignore=prediction_ignore,
+          score=prediction_score))
+  return AveragePrecision3DBatch([problem], num_recall_points, bev, pool)[0]
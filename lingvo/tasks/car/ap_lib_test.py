@@ -0,0 +1,204 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for ap_lib."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import multiprocessing
+
+from lingvo import compat as tf
+from lingvo.core import py_utils
+from lingvo.core import test_utils
+from lingvo.tasks.car import ap_lib
+from lingvo.tasks.car import kitti_ap_metric
+from lingvo.tasks.car import kitti_metadata
+from lingvo.tasks.car import ops
+import numpy as np
+from six.moves import range
+
+
+class APLibTest(test_utils.TestCase):
+
+  def _GenerateRandomBBoxes(self, num_images, num_bboxes):
+    xyz = np.random.uniform(low=-1.0, high=1.0, size=(num_bboxes, 3))
+    dimension = np.random.uniform(low=0.1, high=1.0, size=(num_bboxes, 3))
+    rotation = np.random.uniform(low=-np.pi, high=np.pi, size=(num_bboxes, 1))
+    bboxes = np.concatenate([xyz, dimension, rotation], axis=-1)
+    imageid = np.random.randint(0, num_images, size=[num_bboxes])
+    return bboxes.astype(np.float32), imageid.astype(np.int32)
+
+  def _GenerateProblem(self, num_images, num_gt, num_pd):
+    """Returns gt and noisy copies of them as predictions, with ignores."""
+    gt_bbox, gt_imgid = self._GenerateRandomBBoxes(num_images, num_gt)
+    indices = np.random.randint(0, num_gt, size=[num_pd])
+    pd_bbox = gt_bbox[indices] + np.random.normal(
+        scale=0.05, size=(num_pd, 7)).astype(np.float32)
+    pd_imgid = gt_imgid[indices]
+    # Some predictions are false positives in random places.
+    fp_bbox, fp_imgid = self._GenerateRandomBBoxes(num_images, num_pd // 4)
+    return py_utils.NestedMap(
+        iou_threshold=0.5,
+        gt=py_utils.NestedMap(
+            bbox=gt_bbox,
+            imgid=gt_imgid,
+            ignore=np.random.choice([0, 0, 0, 1, 2],
+                                    size=[num_gt]).astype(np.int32)),
+        pd=py_utils.NestedMap(
+            bbox=np.concatenate([pd_bbox, fp_bbox]),
+            imgid=np.concatenate([pd_imgid, fp_imgid]),
+            ignore=np.random.choice([0, 0, 1], size=[num_pd + num_pd // 4
+                                                    ]).astype(np.int32),
+            # Rounded scores have ties.
+            score=np.round(
+                np.random.uniform(size=[num_pd + num_pd // 4]),
+                2).astype(np.float32)))
+
+  def _GetOpAP(self, problem, num_recall_points):
+    g = tf.Graph()
+    with g.as_default():
+      ap, pr = ops.average_precision3d(
+          iou_threshold=problem.iou_threshold,
+          groundtruth_bbox=problem.gt.bbox,
+          groundtruth_imageid=problem.gt.imgid,
+          groundtruth_ignore=problem.gt.ignore,
+          prediction_bbox=problem.pd.bbox,
+          prediction_imageid=problem.pd.imgid,
+          prediction_ignore=problem.pd.ignore,
+          prediction_score=problem.pd.score,
+          num_recall_points=num_recall_points,
+          algorithm='KITTI')
+    with self.session(graph=g) as sess:
+      return sess.run([ap, pr])
+
+  def _GetAP(self, problem, num_recall_points, pool=None):
+    return ap_lib.AveragePrecision3D(
+        problem.iou_threshold,
+        problem.gt.bbox,
+        problem.gt.imgid,
+        problem.gt.ignore,
+        problem.pd.bbox,
+        problem.pd.imgid,
+        problem.pd.ignore,
+        problem.pd.score,
+        num_recall_points=num_recall_points,
+        pool=pool)
+
+  def testPairwiseIoUMatchesOp(self):
+    np.random.seed(12345)
+    boxes_a, _ = self._GenerateRandomBBoxes(1, 50)
+    boxes_b, _ = self._GenerateRandomBBoxes(1, 60)
+    # Degenerate boxes have no overlap.
+    boxes_a[:3, 3] = 0.
+    boxes_b[:2, 5] = -1.
+    with self.session():
+      expected = ops.pairwise_iou3d(boxes_a, boxes_b).eval()
+    iou = ap_lib.PairwiseIoU(boxes_a, boxes_b)
+    self.assertAllClose(expected, iou)
+    self.assertAllEqual(np.zeros([3, 60]), iou[:3])
+    self.assertAllClose(np.ones([50 - 3]),
+                        np.diag(ap_lib.PairwiseIoU(boxes_a, boxes_a))[3:])
+
+  def testAPMatchesOp(self):
+    np.random.seed(12345)
+    for num_recall_points in [11, 41]:
+      for num_images, num_gt, num_pd in [(10, 100, 80), (3, 40, 120),
+                                         (20, 5, 5)]:
+        problem = self._GenerateProblem(num_images, num_gt, num_pd)
+        expected_ap, expected_pr = self._GetOpAP(problem, num_recall_points)
+        ap, pr = self._GetAP(problem, num_recall_points)
+        self.assertAllClose(expected_ap, ap)
+        self.assertAllClose(expected_pr, pr)
+
+  def testAPOfPerfectAndEmptyDetections(self):
+    np.random.seed(12345)
+    gt_bbox, gt_imgid = self._GenerateRandomBBoxes(10, 100)
+    no_ignore = np.zeros([100], np.int32)
+    ap, _ = ap_lib.AveragePrecision3D(0.5, gt_bbox, gt_imgid, no_ignore,
+                                      gt_bbox, gt_imgid, no_ignore,
+                                      np.ones([100], np.float32), 41)
+    self.assertEqual(1., ap)
+    ap, pr = ap_lib.AveragePrecision3D(0.5, gt_bbox, gt_imgid, no_ignore,
+                                       gt_bbox, gt_imgid + 100, no_ignore,
+                                       np.ones([100], np.float32), 41)
+    self.assertEqual(0., ap)
+    self.assertAllEqual(np.zeros([41]), pr[:, 0])
+
+  def testAPWithPool(self):
+    np.random.seed(12345)
+    problems = [self._GenerateProblem(50, 300, 300) for _ in range(3)]
+    expected = ap_lib.AveragePrecision3DBatch(problems, 41)
+    pool = multiprocessing.Pool(2)
+    try:
+      # Small chunks spread every problem over several tasks.
+      actual = ap_lib.AveragePrecision3DBatch(
+          problems, 41, pool=pool, frames_per_chunk=7)
+    finally:
+      pool.close()
+      pool.join()
+    for (expected_ap, expected_pr), (ap, pr) in zip(expected, actual):
+      self.assertEqual(expected_ap, ap)
+      self.assertAllEqual(expected_pr, pr)
+
+  def testKITTIAPMetricsNumpyBackend(self):
+    np.random.seed(12345)
+    metadata = kitti_metadata.KITTIMetadata()
+    num_classes = metadata.NumClasses()
+    all_metrics = [
+        kitti_ap_metric.KITTIAPMetrics.Params(metadata).Set(
+            breakdown_metrics=['distance'],
+            ap_backend=ap_backend,
+            num_processes=num_processes).Instantiate()
+        for ap_backend, num_processes in [('op', 0), ('numpy', 0), ('numpy', 2)]
+    ]
+    n = 10
+    for frame in range(20):
+      gt_labels = np.random.randint(1, num_classes, size=[3 * n])
+      gt_boxes = np.concatenate([
+          np.random.uniform(-30., 30., size=(3 * n, 3)),
+          np.random.uniform(1., 4., size=(3 * n, 3)),
+          np.random.uniform(-np.pi, np.pi, size=(3 * n, 1))
+      ],
+                                axis=-1)
+      det_boxes = np.zeros([num_classes, n, 7])
+      det_boxes[1:] = gt_boxes[np.random.randint(
+          0, 3 * n, size=(num_classes - 1, n))]
+      det_boxes[1:, :, :3] += np.random.normal(
+          scale=0.3, size=(num_classes - 1, n, 3))
+      result = py_utils.NestedMap(
+          groundtruth_labels=gt_labels,
+          groundtruth_bboxes=gt_boxes,
+          groundtruth_difficulties=np.random.randint(1, 4, size=[3 * n]),
+          groundtruth_num_points=np.ones([3 * n]),
+          detection_scores=np.random.uniform(size=(num_classes, n)),
+          detection_boxes=det_boxes,
+          detection_heights_in_pixels=np.random.uniform(
+              10., 100., size=(num_classes, n)))
+      for metrics in all_metrics:
+        metrics.Update('frame%d' % frame, result)
+
+    expected = all_metrics[0].Summary('kitti').value
+    for metrics in all_metrics[1:]:
+      actual = metrics.Summary('kitti').value
+      self.assertEqual(len(expected), len(actual))
+      for expected_value, value in zip(expected, actual):
+        self.assertEqual(expected_value.tag, value.tag)
+        self.assertAllClose(expected_value.simple_value, value.simple_value)
+
+
+if __name__ == '__main__':
+  tf.test.main()
@@ -93,6 +93,19 @@ class Boxes3D(object):
     ret[:arr.shape[0]] = arr
     return ret
 
+  def Gather(self, indices):
+    """Returns a new Boxes3D with the boxes at `indices`, in that order."""
+    # pylint: disable=protected-access
+    ret = Boxes3D()
+    ret._buf = self._buf.Transform(lambda x: x[:self._size][indices])
+    ret._capacity = ret._size = len(indices)
+    # pylint: enable=protected-access
+    return ret
+
+  @property
+  def size(self):
+    return self._size
+
   @property
   def imgids(self):
     return self._buf.imgids[:self._size]
@@ -170,6 +183,16 @@ class APMetrics(BaseMetric):
     self._groundtruth = {}  # keyed by class id.
     self._prediction = {}  # keyed by class id.
     self._str_to_imgid = {}
+    # Keyed by (box_type, class id, field), caches the boxes grouped by bin.
+    self._boxes_by_bin = {}
+    # The graph and session computing the AP metrics. They are built lazily and
+    # reused by every _ComputeFinalMetrics call, which only feeds new data.
+    self._metric_graph = None
+    self._metric_session = None
+    # Keyed by (class id, slot), the fetches and placeholders of the slot-th
+    # copy of the metric of a class. Breakdowns computed in the same session
+    # run use different slots.
+    self._metric_fetches = {}
     self._iou_thresholds = self.params.metadata.IoUThresholds()
 
     self.metadata = self.params.metadata
@@ -247,52 +270,63 @@ class APMetrics(BaseMetric):
       return None
     boxes = boxes_by_class[class_id]
 
-    if boxes is not None and distance is not None:
-      # Filter bounding boxes based a binned (integer) distance.
-      filtered_boxes = None
-      for i, s, b, d, dist, n, r, h, v in zip(boxes.imgids, boxes.scores,
-                                              boxes.boxes, boxes.difficulties,
-                                              boxes.distances, boxes.num_points,
-                                              boxes.rotations,
-                                              boxes.heights_in_pixels,
-                                              boxes.speeds):
-        if dist == distance:
-          if filtered_boxes is None:
-            filtered_boxes = Boxes3D()
-          filtered_boxes.Add(i, s, b, d, dist, n, r, h, v)
-      boxes = filtered_boxes
-
-    if boxes is not None and num_points is not None:
-      # Filter bounding boxes based a binned (integer) number of points.
-      filtered_boxes = None
-      for i, s, b, d, dist, n, r, h, v in zip(boxes.imgids, boxes.scores,
-                                              boxes.boxes, boxes.difficulties,
-                                              boxes.distances, boxes.num_points,
-                                              boxes.rotations,
-                                              boxes.heights_in_pixels,
-                                              boxes.speeds):
-        if n == num_points:
-          if filtered_boxes is None:
-            filtered_boxes = Boxes3D()
-          filtered_boxes.Add(i, s, b, d, dist, n, r, h, v)
-      boxes = filtered_boxes
-
-    if boxes is not None and rotation is not None:
-      # Filter bounding boxes based a binned (integer) rotation.
-      filtered_boxes = None
-      for i, s, b, d, dist, n, r, h, v in zip(boxes.imgids, boxes.scores,
-                                              boxes.boxes, boxes.difficulties,
-                                              boxes.distances, boxes.num_points,
-                                              boxes.rotations,
-                                              boxes.heights_in_pixels,
-                                              boxes.speeds):
-        if r == rotation:
-          if filtered_boxes is None:
-            filtered_boxes = Boxes3D()
-          filtered_boxes.Add(i, s, b, d, dist, n, r, h, v)
-      boxes = filtered_boxes
-
-    return boxes
+    bin_filters = [(field, value) for field, value in [
+        ('distances', distance), ('num_points', num_points),
+        ('rotations', rotation)
+    ] if value is not None]
+    if len(bin_filters) == 1:
+      # Filtering by a single bin, which is what the breakdown metrics do for
+      # every bin in turn, is served from the grouping of all bins.
+      field, value = bin_filters[0]
+      return self._GroupBoxesByBin(box_type, class_id, field).get(value)
+
+    if not bin_filters:
+      return boxes
+
+    mask = np.ones([boxes.size], dtype=bool)
+    for field, value in bin_filters:
+      mask &= getattr(boxes, field) == value
+    if not np.any(mask):
+      return None
+    return boxes.Gather(np.flatnonzero(mask))
+
+  def _GroupBoxesByBin(self, box_type, class_id, field):
+    """Groups the boxes of a class by a binned field.
+
+    The grouping is computed once for all bins and cached until more boxes are
+    added.
+
+    Args:
+      box_type: string. Either 'groundtruth' or 'prediction'
+      class_id: int32 specifying the class
+      field: The Boxes3D field holding the bin ids, e.g. 'distances'.
+
+    Returns:
+      A dict mapping each non-empty bin id to a Boxes3D with the boxes of that
+      bin, sorted by decreasing score.
+    """
+    if box_type == 'groundtruth':
+      boxes = self._groundtruth[class_id]
+    else:
+      boxes = self._prediction[class_id]
+    key = (box_type, class_id, field)
+    cached = self._boxes_by_bin.get(key)
+    if cached is not None and cached[0] == boxes.size:
+      return cached[1]
+
+    # A stable sort by score followed by a stable sort by bin id makes the
+    # boxes of every bin contiguous and sorted by score within the bin.
+    order = np.argsort(-boxes.scores, kind='mergesort')
+    bin_ids = getattr(boxes, field)[order].astype(np.int64)
+    assert np.all(bin_ids >= 0), 'Negative %s bin.' % field
+    order = order[np.argsort(bin_ids, kind='mergesort')]
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(bin_ids))])
+    groups = {}
+    for b in range(len(offsets) - 1):
+      if offsets[b + 1] > offsets[b]:
+        groups[b] = boxes.Gather(order[offsets[b]:offsets[b + 1]])
+    self._boxes_by_bin[key] = (boxes.size, groups)
+    return groups
 
   def _GetData(self,
                classid,
@@ -320,15 +354,79 @@ class APMetrics(BaseMetric):
     """
     raise NotImplementedError('_GetData must be implemented')
 
-  def _BuildMetric(self, feed_data, classid):
+  def _BuildMetric(self, classid):
+    """Builds the metric tensors of a class, fed through placeholders.
+
+    Args:
+      classid: integer.
+
+    Returns:
+      A tuple (scalar_metrics, curve_metrics, placeholders):
+
+      - scalar_metrics: a dict mapping all the metric names to fetch tensors.
+      - curve_metrics: a dict mapping all the curve names to fetch tensors.
+      - placeholders: a NestedMap of placeholders. Each is fed the value at
+        the same key in the NestedMap returned by _GetData().
+    """
     raise NotImplementedError('_BuildMetric must be implemented')
 
+  def _DummyMetrics(self, classid):
+    """Returns the metrics of a class without any groundtruth or predictions.
+
+    Args:
+      classid: integer.
+
+    Returns:
+      A tuple (scalar_metrics, curve_metrics) of dicts with the same keys as
+      those of _BuildMetric(), mapping to numpy values.
+    """
+    raise NotImplementedError('_DummyMetrics must be implemented')
+
+  def _GetMetricFetches(self, classid, slot):
+    """Returns the _BuildMetric() output of the slot-th copy of a class."""
+    key = (classid, slot)
+    if key not in self._metric_fetches:
+      if self._metric_graph is None:
+        self._metric_graph = tf.Graph()
+      # Extending the graph is fine after the session is created; the session
+      # picks up the new ops on its next run.
+      with self._metric_graph.as_default():
+        self._metric_fetches[key] = self._BuildMetric(classid)
+    if self._metric_session is None:
+      self._metric_session = tf.Session(graph=self._metric_graph)
+    return self._metric_fetches[key]
+
+  def _ComputeMetrics(self, inputs):
+    """Computes the metrics of a list of _GetData() outputs.
+
+    The default implementation feeds all of them to the metric graph and
+    computes them with a single session run.
+
+    Args:
+      inputs: A list of (slot, classid, data) tuples, where data is the
+        non-None output of _GetData() for classid. Inputs with the same classid
+        have different slots.
+
+    Returns:
+      A list with a (scalar_metrics, curve_metrics) tuple of dicts mapping
+      metric names to numpy values for each input.
+    """
+    feed_dict = {}
+    fetches = []
+    for slot, classid, data in inputs:
+      scalars, curves, placeholders = self._GetMetricFetches(classid, slot)
+      for key, placeholder in placeholders.FlattenItems():
+        feed_dict[placeholder] = data.GetItem(key)
+      fetches.append((scalars, curves))
+    return self._metric_session.run(fetches, feed_dict=feed_dict)
+
   def _ComputeFinalMetrics(self,
                            classids=None,
                            difficulty=None,
                            distance=None,
                            num_points=None,
-                           rotation=None):
+                           rotation=None,
+                           breakdowns=None):
     """Compute precision-recall curves as well as average precision.
 
     Args:
@@ -341,6 +439,10 @@ class APMetrics(BaseMetric):
         ground truth bounding box. If None is specified, all boxes are selected.
       rotation: int32 specifying a binned rotation within the ground truth
         bounding box. If None is specified, all boxes are selected.
+      breakdowns: If not None, a list of dicts of the conditioning arguments
+        above (difficulty, distance, num_points, rotation), which override
+        them. The metrics of all breakdowns are computed with a single session
+        run.
 
     Returns:
       (dict, dict):
@@ -350,29 +452,41 @@ class APMetrics(BaseMetric):
       - curve_metrics: A list of C dicts mapping metrics names to np.float32
         arrays of shape [NumberOfPrecisionRecallPoints()+1, 2]. In the last
         dimension, 0 indexes precision and 1 indexes recall.
+
+      If `breakdowns` is given, a list with one such pair per breakdown.
     """
     assert classids is not None, 'classids must be supplied.'
-    feed_dict = {}
-    g = tf.Graph()
-    scalar_fetches = []
-    curve_fetches = []
-    with g.as_default():
-      for classid in classids:
-        data = self._GetData(
-            classid,
-            difficulty=difficulty,
-            distance=distance,
-            num_points=num_points,
-            rotation=rotation)
-        scalars, curves, class_feed_dict = self._BuildMetric(data, classid)
-        scalar_fetches += [scalars]
-        curve_fetches += [curves]
-        feed_dict.update(class_feed_dict)
-
-    with tf.Session(graph=g) as sess:
-      results = sess.run([scalar_fetches, curve_fetches], feed_dict=feed_dict)
-
-    return results[0], results[1]
+    single_breakdown = breakdowns is None
+    if single_breakdown:
+      breakdowns = [
+          dict(
+              difficulty=difficulty,
+              distance=distance,
+              num_points=num_points,
+              rotation=rotation)
+      ]
+    results = [([None] * len(classids), [None] * len(classids))
+               for _ in breakdowns]
+    inputs = []
+    input_indices = []
+    for b, breakdown in enumerate(breakdowns):
+      for c, classid in enumerate(classids):
+        data = self._GetData(classid, **breakdown)
+        if data is None:
+          results[b][0][c], results[b][1][c] = self._DummyMetrics(classid)
+          continue
+        inputs.append((b, classid, data))
+        input_indices.append((b, c))
+
+    if inputs:
+      for (b, c), (scalars, curves) in zip(input_indices,
+                                           self._ComputeMetrics(inputs)):
+        results[b][0][c] = scalars
+        results[b][1][c] = curves
+
+    if single_breakdown:
+      return results[0]
+    return results
 
   def Update(self, str_id, result):
     """Update this metric with a newly evaluated image.
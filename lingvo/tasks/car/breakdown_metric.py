@@ -66,7 +66,8 @@ class BreakdownMetric(object):
     Args:
       compute_metrics_fn: Function that that calculates precision-recall metrics
         and accepts named arguments for conditioning. Typically, this would be
-        APMetrics._ComputeFinalMetrics().
+        APMetrics._ComputeFinalMetrics(). Passing a list of conditioning
+        arguments as `breakdowns` computes the metrics of all of them at once.
 
     Returns:
        nothing
@@ -115,10 +116,16 @@ class BreakdownMetric(object):
     assert np.max(statistics) < self._histogram.shape[0], (
         'Histogram shape too small %d vs %d' %
         (np.max(statistics), self._histogram.shape[0]))
-    for l in range(p.metadata.NumClasses()):
-      indices = np.where(labels == l)[0]
-      for s in statistics[indices]:
-        self._histogram[s, l] += 1
+    num_classes = p.metadata.NumClasses()
+    statistics = np.reshape(statistics, [-1])
+    labels = np.reshape(labels, [-1]).astype(np.int64)
+    valid = np.logical_and(labels >= 0, labels < num_classes)
+    # Counts every (bin, label) pair at once by flattening them into a single
+    # index of the histogram.
+    counts = np.bincount(
+        statistics[valid] * num_classes + labels[valid],
+        minlength=self._histogram.size)
+    self._histogram += counts.reshape(self._histogram.shape).astype(np.int32)
 
   def _AccumulateCumulative(self, statistics=None, labels=None):
     """Accumulate cumulative of real-valued statistic by label.
@@ -131,10 +138,21 @@ class BreakdownMetric(object):
       nothing
     """
     p = self.params
-    for l in range(p.metadata.NumClasses()):
-      indices = np.where(labels == l)[0]
-      if indices.size:
-        self._cumulative_distribution[l].extend(statistics[indices].tolist())
+    num_classes = p.metadata.NumClasses()
+    labels = np.reshape(labels, [-1]).astype(np.int64)
+    indices = np.flatnonzero(np.logical_and(labels >= 0, labels < num_classes))
+    if not indices.size:
+      return
+    # A stable sort by label makes the statistics of each label contiguous
+    # and in their original order.
+    indices = indices[np.argsort(labels[indices], kind='mergesort')]
+    offsets = np.concatenate(
+        [[0], np.cumsum(np.bincount(labels[indices], minlength=num_classes))])
+    for l in range(num_classes):
+      start, end = offsets[l], offsets[l + 1]
+      if end > start:
+        self._cumulative_distribution[l].extend(
+            statistics[indices[start:end]].tolist())
 
   def AccumulateCumulative(self, result):
     """Accumulate cumulative of real-valued statistic by label.
@@ -215,11 +233,12 @@ class ByDistance(BreakdownMetric):
   def ComputeMetrics(self, compute_metrics_fn):
     tf.logging.info('Calculating AP by distance: start')
     p = self.params
-    for d in range(self.NumBinsOfHistogram()):
+    bins = list(range(self.NumBinsOfHistogram()))
+    results = compute_metrics_fn(breakdowns=[{'distance': d} for d in bins])
+    for d, (scalars, _) in zip(bins, results):
       value_at_histogram = (
           d * p.metadata.DistanceBinWidth() +
           p.metadata.DistanceBinWidth() / 2.0)
-      scalars, _ = compute_metrics_fn(distance=d)
       self._average_precisions[d] = [s['ap'] for s in scalars]
       self._values[d] = value_at_histogram
     assert len(self._values) == len(self._average_precisions.keys())
@@ -324,8 +343,9 @@ class ByNumPoints(BreakdownMetric):
     # Note that we skip the last edge as the number of edges is one greater
     # then the number of bins.
     self._values = self._LogSpacedBinEdgesofPoints()[:-1]
-    for n, _ in enumerate(self._values):
-      _, curves = compute_metrics_fn(num_points=n)
+    results = compute_metrics_fn(
+        breakdowns=[{'num_points': n} for n in range(len(self._values))])
+    for n, (_, curves) in enumerate(results):
       self._precision_recall[n] = np.array([c['pr'] for c in curves])
     assert len(self._values) == len(self._precision_recall.keys())
     tf.logging.info('Calculating max recall by number of points: finished')
@@ -522,10 +542,11 @@ class ByRotation(BreakdownMetric):
         shape=(self.NumBinsOfHistogram(), 1), dtype=np.float32)
     bin_width = (
         p.metadata.MaximumRotation() / float(self.NumBinsOfHistogram()))
-    for r in range(self.NumBinsOfHistogram()):
+    bins = list(range(self.NumBinsOfHistogram()))
+    results = compute_metrics_fn(breakdowns=[{'rotation': r} for r in bins])
+    for r, (scalars, _) in zip(bins, results):
       # Calculate the center of the histogram bin.
       value_at_histogram = r * bin_width + bin_width / 2.0
-      scalars, _ = compute_metrics_fn(rotation=r)
       self._average_precisions[r] = [s['ap'] for s in scalars]
       self._values[r] = value_at_histogram
     assert len(self._values) == len(self._average_precisions.keys())
@@ -617,8 +638,10 @@ class ByDifficulty(BreakdownMetric):
   def ComputeMetrics(self, compute_metrics_fn):
     p = self.params
     tf.logging.info('Calculating AP by difficulty: start')
-    for difficulty in self.params.metadata.DifficultyLevels():
-      scalars, curves = compute_metrics_fn(difficulty=difficulty)
+    difficulties = list(p.metadata.DifficultyLevels())
+    results = compute_metrics_fn(
+        breakdowns=[{'difficulty': d} for d in difficulties])
+    for difficulty, (scalars, curves) in zip(difficulties, results):
       self._average_precisions[difficulty] = [s[p.ap_key] for s in scalars]
       self._precision_recall[difficulty] = np.array(
           [c[p.pr_key] for c in curves])
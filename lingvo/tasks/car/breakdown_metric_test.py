@@ -18,6 +18,9 @@
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
+
+import time
+
 from lingvo import compat as tf
 from lingvo.core import py_utils
 from lingvo.core import test_utils
@@ -25,6 +28,7 @@ from lingvo.tasks.car import breakdown_metric
 from lingvo.tasks.car import kitti_ap_metric
 from lingvo.tasks.car import kitti_metadata
 import numpy as np
+from six.moves import range
 
 FLAGS = tf.flags.FLAGS
 
@@ -324,6 +328,22 @@ class BreakdownMetricTest(test_utils.TestCase):
                   test_data.expected_objects_at_rotation[label, rotation]
               ]), data.imgids)
 
+  def testLoadBoundingBoxesMultipleBins(self):
+    metadata = kitti_metadata.KITTIMetadata()
+    num_classes = len(metadata.ClassNames())
+    test_data = self._GenerateMetricsWithTestData(num_classes)
+    metrics = test_data.metrics
+    for label in range(1, num_classes):
+      gt = metrics._groundtruth[label]
+      for distance, rotation in zip(gt.distances, gt.rotations):
+        data = metrics._LoadBoundingBoxes(
+            'groundtruth', label, distance=distance, rotation=rotation)
+        expected = (gt.distances == distance) & (gt.rotations == rotation)
+        self.assertAllEqual(gt.boxes[expected], data.boxes)
+      self.assertIsNone(
+          metrics._LoadBoundingBoxes(
+              'groundtruth', label, distance=-1, rotation=0))
+
   def testAccumulateHistogram(self):
     metadata = kitti_metadata.KITTIMetadata()
     num_per_class = np.arange(metadata.NumClasses()) + 1
@@ -351,6 +371,63 @@ class BreakdownMetricTest(test_utils.TestCase):
       self.assertEqual(n, test_breakdown_metric._histogram[1, class_index])
       self.assertEqual(2 * n, test_breakdown_metric._histogram[2, class_index])
 
+  def testAccumulateCumulative(self):
+    metadata = kitti_metadata.KITTIMetadata()
+    metrics_params = breakdown_metric.BreakdownMetric.Params().Set(
+        metadata=metadata)
+    test_breakdown_metric = breakdown_metric.ByNumPoints(metrics_params)
+    test_breakdown_metric._AccumulateCumulative(
+        statistics=np.array([5., 1., 7., 3.]), labels=np.array([2, 1, 2, 1]))
+    test_breakdown_metric._AccumulateCumulative(
+        statistics=np.array([2.]), labels=np.array([1]))
+    self.assertEqual([1., 3., 2.],
+                     test_breakdown_metric._cumulative_distribution[1])
+    self.assertEqual([5., 7.],
+                     test_breakdown_metric._cumulative_distribution[2])
+    self.assertEqual([], test_breakdown_metric._cumulative_distribution[0])
+
+  def testGroupBoxesByBin(self):
+    metadata = kitti_metadata.KITTIMetadata()
+    num_classes = len(metadata.ClassNames())
+    test_data = self._GenerateMetricsWithTestData(num_classes)
+    metrics = test_data.metrics
+    for label in range(1, num_classes):
+      predictions = metrics._prediction[label]
+      groups = metrics._GroupBoxesByBin('prediction', label, 'distances')
+      self.assertEqual(predictions.size,
+                       sum(boxes.size for boxes in groups.values()))
+      for distance, boxes in groups.items():
+        self.assertAllEqual(
+            np.sort(predictions.scores[predictions.distances == distance]),
+            np.sort(boxes.scores))
+        # Boxes are sorted by decreasing score.
+        self.assertAllEqual(-np.sort(-boxes.scores), boxes.scores)
+        self.assertAllEqual(distance * np.ones([boxes.size]), boxes.distances)
+      # The grouping is cached.
+      self.assertIs(groups,
+                    metrics._GroupBoxesByBin('prediction', label, 'distances'))
+
+  def testComputeFinalMetricsWithBreakdowns(self):
+    metadata = kitti_metadata.KITTIMetadata()
+    num_classes = len(metadata.ClassNames())
+    test_data = self._GenerateMetricsWithTestData(num_classes)
+    metrics = test_data.metrics
+    classids = metadata.EvalClassIndices()
+    num_bins = metrics._breakdown_metrics['distance'].NumBinsOfHistogram()
+    results = metrics._ComputeFinalMetrics(
+        classids=classids,
+        breakdowns=[{
+            'distance': d
+        } for d in range(num_bins)])
+    self.assertEqual(num_bins, len(results))
+    for d, (scalars, curves) in enumerate(results):
+      expected_scalars, expected_curves = metrics._ComputeFinalMetrics(
+          classids=classids, distance=d)
+      self.assertAllClose([s['ap'] for s in expected_scalars],
+                          [s['ap'] for s in scalars])
+      self.assertAllClose([c['pr'] for c in expected_curves],
+                          [c['pr'] for c in curves])
+
   def testByName(self):
     metric_class = breakdown_metric.ByName('difficulty')
     self.assertEqual(metric_class, breakdown_metric.ByDifficulty)
@@ -358,5 +435,72 @@ class BreakdownMetricTest(test_utils.TestCase):
       breakdown_metric.ByName('undefined')
 
 
+class APMetricsBenchmark(tf.test.Benchmark):
+  """Benchmarks finalizing the AP metrics of a large synthetic eval set."""
+
+  def _Metrics(self, num_frames, num_boxes_per_class, **kwargs):
+    """Returns KITTIAPMetrics updated with `num_frames` random frames."""
+    metadata = kitti_metadata.KITTIMetadata()
+    num_classes = metadata.NumClasses()
+    ap_params = kitti_ap_metric.KITTIAPMetrics.Params(metadata).Set(
+        breakdown_metrics=['rotation', 'num_points', 'distance'], **kwargs)
+    metrics = ap_params.Instantiate()
+    n = num_boxes_per_class
+    for frame in range(num_frames):
+      # Boxes spread over the distance bins, with groundtruth of every eval
+      # class and noisy detections of them.
+      gt_labels = np.repeat(np.arange(1, num_classes), n)
+      gt_boxes = np.concatenate([
+          np.random.uniform(-60., 60., size=(len(gt_labels), 3)),
+          np.random.uniform(1., 4., size=(len(gt_labels), 3)),
+          np.random.uniform(-np.pi, np.pi, size=(len(gt_labels), 1))
+      ],
+                                axis=-1)
+      det_boxes = np.zeros([num_classes, n, 7])
+      det_boxes[1:] = np.reshape(gt_boxes, [num_classes - 1, n, 7])
+      det_boxes[1:, :, :3] += np.random.normal(
+          scale=0.5, size=(num_classes - 1, n, 3))
+      det_scores = np.random.uniform(size=(num_classes, n))
+      metrics.Update(
+          'frame%d' % frame,
+          py_utils.NestedMap(
+              groundtruth_labels=gt_labels,
+              groundtruth_bboxes=gt_boxes,
+              groundtruth_difficulties=np.ones(len(gt_labels)),
+              groundtruth_num_points=np.random.randint(
+                  1, 2000, size=len(gt_labels)),
+              detection_scores=det_scores,
+              detection_boxes=det_boxes,
+              detection_heights_in_pixels=np.ones([num_classes, n]) * 100))
+    return metrics
+
+  def _RunFinalizeAPMetrics(self, name, **kwargs):
+    # A Waymo Open Dataset validation run has ~40k frames with ~100 objects.
+    # The defaults are scaled down to keep the benchmark reasonably fast.
+    np.random.seed(12345)
+    metrics = self._Metrics(num_frames=200, num_boxes_per_class=30, **kwargs)
+    num_iters = 3
+    wall_times = []
+    for _ in range(num_iters):
+      # Invalidates the evaluation, as new updates would.
+      metrics._is_eval_complete = False
+      start = time.time()
+      metrics.Summary('benchmark')
+      wall_times.append(time.time() - start)
+    # The first iteration builds the AP graph, later ones only feed it.
+    self.report_benchmark(
+        name=name,
+        iters=num_iters,
+        wall_time=np.mean(wall_times[1:]),
+        extras={'first_wall_time': wall_times[0]})
+
+  def benchmarkFinalizeAPMetrics(self):
+    self._RunFinalizeAPMetrics('FinalizeAPMetrics')
+
+  def benchmarkFinalizeAPMetricsNumpy(self):
+    self._RunFinalizeAPMetrics(
+        'FinalizeAPMetricsNumpy', ap_backend='numpy', num_processes=4)
+
+
 if __name__ == '__main__':
   tf.test.main()
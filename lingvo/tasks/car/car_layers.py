@@ -44,6 +44,11 @@ class SamplingAndGroupingLayer(base_layer.BaseLayer):
         'sample_neighbors_uniformly', True,
         'Whether to sample neighbors uniformly within the ball radius. '
         'If False, this will pick the nearest neighbors by distance.')
+    p.Define(
+        'max_points_per_cell', None,
+        'If set, neighbors are searched on a grid with cells of size '
+        'ball_radius, comparing at most this many points per cell instead of '
+        'all points. See car_lib.NeighborhoodIndices.')
     return p
 
   def FProp(self, theta, input_data):
@@ -83,7 +88,8 @@ class SamplingAndGroupingLayer(base_layer.BaseLayer):
         p.group_size,
         points_padding=padding,
         max_distance=p.ball_radius,
-        sample_neighbors_uniformly=p.sample_neighbors_uniformly)
+        sample_neighbors_uniformly=p.sample_neighbors_uniformly,
+        max_points_per_cell=p.max_points_per_cell)
     grouped_points = car_lib.MatmulGather(points, grouped_idx)
     # Normalize the grouped points based on the location of the query point.
     grouped_points -= tf.expand_dims(query_points, -2)
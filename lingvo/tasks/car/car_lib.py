@@ -19,9 +19,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import itertools
+
 # pylint:enable=g-direct-tensorflow-import
 import lingvo.compat as tf
 from lingvo.core import py_utils
+import numpy as np
 
 
 def SquaredDistanceMatrix(pa, pb, mem_optimized=False):
@@ -87,7 +90,12 @@ def NeighborSquaredDistanceMatrix(points, neighbor_points):
   return py_utils.HasShape(sq_dist, [n, p1, k])
 
 
-def KnnIndices(points, query_points, k, valid_num=None, max_distance=None):
+def KnnIndices(points,
+               query_points,
+               k,
+               valid_num=None,
+               max_distance=None,
+               max_points_per_cell=None):
   """k-nearest neighbors of query_points in points.
 
   The caller should ensure that points[i, :valid_num[i], :] are the non-padding
@@ -120,6 +128,8 @@ def KnnIndices(points, query_points, k, valid_num=None, max_distance=None):
       be. If there are no points within the distance, then the closest point is
       returned (regardless of distance). If this is set to None, then
       max_distance is not used.
+    max_points_per_cell: Optional integer. If set, neighbors are searched on
+      a grid. See NeighborhoodIndices.
 
   Returns:
     A pair of tensors:
@@ -134,7 +144,13 @@ def KnnIndices(points, query_points, k, valid_num=None, max_distance=None):
   if valid_num is not None:
     padding = tf.greater_equal(tf.range(p1), tf.expand_dims(
         valid_num, -1))  # [N, P1], False/True padding
-  return NeighborhoodIndices(points, query_points, k, padding, max_distance)
+  return NeighborhoodIndices(
+      points,
+      query_points,
+      k,
+      padding,
+      max_distance,
+      max_points_per_cell=max_points_per_cell)
 
 
 def NeighborhoodIndices(points,
@@ -142,7 +158,8 @@ def NeighborhoodIndices(points,
                         k,
                         points_padding=None,
                         max_distance=None,
-                        sample_neighbors_uniformly=False):
+                        sample_neighbors_uniformly=False,
+                        max_points_per_cell=None):
   """Get indices to k-neighbors of query_points in points.
 
   Padding is returned along-side indices. Non-padded points are guaranteed to
@@ -172,6 +189,13 @@ def NeighborhoodIndices(points,
       filtering by distance is performed.
     sample_neighbors_uniformly: boolean specifying whether to sample neighbors
       uniformly if they are within max distance.
+    max_points_per_cell: Optional integer. If set, neighbors are searched on a
+      grid with cells of size max_distance (which must be set): only the points
+      of the 3^dims cells around a query point are compared, using at most
+      max_points_per_cell points of each cell. This avoids the [N, P2, P1]
+      distance matrix, which is faster and uses less memory when P1 is much
+      larger than 3^dims * max_points_per_cell; otherwise the dense search is
+      used. See _GridNeighborhoodIndices for when the results differ.
 
   Returns:
     A pair of tensors:
@@ -185,6 +209,24 @@ def NeighborhoodIndices(points,
   query_points = py_utils.HasShape(query_points, [n, -1, -1])
   _, p2 = py_utils.GetShape(query_points, 2)
 
+  if max_points_per_cell is not None:
+    if max_distance is None:
+      raise ValueError('Grid neighbor search requires specifying '
+                       'max_distance.')
+    dims = py_utils.GetShape(points, 3)[2]
+    if not isinstance(dims, int):
+      raise ValueError('Grid neighbor search requires a static number of '
+                       'dimensions.')
+    num_candidates = 3**dims * max_points_per_cell
+    if k > num_candidates:
+      raise ValueError('k=%d exceeds the %d candidates of the grid neighbor '
+                       'search.' % (k, num_candidates))
+    # The dense search compares at most as many points for small inputs.
+    if not isinstance(p1, int) or p1 > num_candidates:
+      return _GridNeighborhoodIndices(points, query_points, k, points_padding,
+                                      max_distance, sample_neighbors_uniformly,
+                                      max_points_per_cell)
+
   # Compute pair-wise squared distances.
   # Note that dist_mat contains the squared distance (without sqrt). Thus, when
   # using max_distance, we will need to square max_distance to make sure it's
@@ -240,6 +282,138 @@ def NeighborhoodIndices(points,
   return indices, paddings
 
 
+def _GridNeighborhoodIndices(points, query_points, k, points_padding,
+                             max_distance, sample_neighbors_uniformly,
+                             max_points_per_cell):
+  """NeighborhoodIndices searching the neighbors of query_points on a grid.
+
+  Points are bucketed into cubic cells of size max_distance, keyed by their
+  linearized cell coordinates and sorted by key. The points of each of the
+  3^dims cells around a query point are found by a binary search on the sorted
+  keys, so that every point within max_distance is a candidate.
+
+  Real neighbors (padding 0) are the same as those of the dense search, up to
+  the order of equidistant points, as long as no cell around a query point has
+  more than max_points_per_cell points; otherwise only the first
+  max_points_per_cell points of the cell, by index, are candidates. Padded
+  neighbors are duplicates of the closest candidate, which is the closest
+  point if it is within max_distance and an arbitrary point if the query has
+  no candidate at all.
+
+  Args:
+    points: tensor of shape [N, P1, dims].
+    query_points: tensor of shape [N, P2, dims]
+    k: Integer.
+    points_padding: optional tensor of shape [N, P1], see NeighborhoodIndices.
+    max_distance: float. The maximum distance of neighbors and the cell size.
+    sample_neighbors_uniformly: boolean specifying whether to sample neighbors
+      uniformly if they are within max distance.
+    max_points_per_cell: Integer. The maximum number of candidate points per
+      cell.
+
+  Returns:
+    A pair of tensors (indices, padding) as returned by NeighborhoodIndices.
+  """
+  n, p1, dims = py_utils.GetShape(points, 3)
+  query_points = py_utils.HasShape(query_points, [n, -1, dims])
+  _, p2 = py_utils.GetShape(query_points, 2)
+  offsets = np.array(list(itertools.product([-1, 0, 1], repeat=dims)))
+  num_cells = offsets.shape[0]
+  num_candidates = num_cells * max_points_per_cell
+
+  if points_padding is None:
+    is_real = tf.ones([n, p1], dtype=tf.bool)
+  else:
+    is_real = tf.logical_not(tf.cast(points_padding, tf.bool))
+  is_real = py_utils.HasShape(is_real, [n, p1])
+
+  # Cells are slightly larger than max_distance, so that rounding never puts
+  # two points within max_distance more than one cell apart. The origin is one
+  # cell below the smallest real point, so that the cells around any real point
+  # have non-negative coordinates.
+  cell_size = max_distance * (1. + 1e-4)
+  origin = tf.reduce_min(
+      tf.where(
+          tf.tile(tf.expand_dims(is_real, -1), [1, 1, dims]), points,
+          tf.fill(tf.shape(points), np.inf)),
+      axis=1,
+      keepdims=True)
+  # Examples without real points.
+  origin = tf.where(tf.is_finite(origin), origin, tf.zeros_like(origin))
+  origin -= cell_size
+
+  def _Cells(x):
+    return tf.cast(tf.floor((x - origin) / cell_size), tf.int64)
+
+  points_cells = tf.where(
+      tf.tile(tf.expand_dims(is_real, -1), [1, 1, dims]), _Cells(points),
+      tf.zeros([n, p1, dims], dtype=tf.int64))
+  # [N, 1, dims]: the number of cells per dimension, and the strides to
+  # linearize cell coordinates.
+  grid_shape = tf.reduce_max(points_cells, axis=1, keepdims=True) + 2
+  strides = tf.cumprod(grid_shape, axis=2, exclusive=True, reverse=True)
+
+  # Padded points are sorted last and never match a cell.
+  points_keys = tf.where(is_real,
+                         tf.reduce_sum(points_cells * strides, axis=2),
+                         tf.fill([n, p1], tf.constant(np.iinfo(np.int64).max)))
+  # argsort is stable, which keeps the points of a cell in index order.
+  order = tf.argsort(points_keys, axis=1)
+  sorted_keys = tf.gather(points_keys, order, batch_dims=1)
+
+  # [N, P2, num_cells, dims]
+  neighbor_cells = (
+      tf.expand_dims(_Cells(query_points), 2) +
+      tf.constant(offsets, dtype=tf.int64))
+  grid_shape = tf.expand_dims(grid_shape, 1)
+  in_grid = tf.reduce_all(
+      tf.logical_and(neighbor_cells >= 0, neighbor_cells < grid_shape),
+      axis=3)
+  neighbor_keys = tf.where(
+      in_grid,
+      tf.reduce_sum(neighbor_cells * tf.expand_dims(strides, 1), axis=3),
+      tf.fill([n, p2, num_cells], tf.constant(-1, dtype=tf.int64)))
+  neighbor_keys = tf.reshape(neighbor_keys, [n, p2 * num_cells])
+  starts = tf.searchsorted(sorted_keys, neighbor_keys, side='left')
+  ends = tf.searchsorted(sorted_keys, neighbor_keys, side='right')
+
+  # [N, P2 * num_cells, max_points_per_cell] positions in the sorted points.
+  positions = tf.expand_dims(starts, -1) + tf.range(max_points_per_cell)
+  is_candidate = tf.less(positions, tf.expand_dims(ends, -1))
+  positions = tf.minimum(positions, p1 - 1)
+  candidates = tf.gather(
+      order, tf.reshape(positions, [n, -1]), batch_dims=1)
+  candidates = tf.reshape(candidates, [n, p2, num_candidates])
+  is_candidate = tf.reshape(is_candidate, [n, p2, num_candidates])
+
+  # Same as SquaredDistanceMatrix, restricted to the candidates.
+  candidate_points = tf.gather(points, candidates, batch_dims=1)
+  dist = tf.reduce_sum(
+      tf.square(tf.expand_dims(query_points, 2) - candidate_points), axis=3)
+  dist = tf.where(is_candidate, dist,
+                  tf.fill(tf.shape(dist), tf.constant(np.inf, dist.dtype)))
+  dist = py_utils.HasShape(dist, [n, p2, num_candidates])
+
+  if sample_neighbors_uniformly:
+    mask_by_distance = tf.less_equal(dist, max_distance**2)
+    dist = tf.where(
+        mask_by_distance,
+        tf.square(max_distance) * tf.random_uniform(tf.shape(dist)), dist)
+
+  top_k_dist, top_k_idx = tf.nn.top_k(-dist, k=k, sorted=True)
+  indices = tf.gather(candidates, top_k_idx, batch_dims=2)
+
+  # Padded points are never candidates, so all paddings come from candidates
+  # that are too far away, or missing.
+  paddings = tf.greater(-top_k_dist, tf.square(max_distance))
+  closest_idx = tf.tile(indices[:, :, :1], [1, 1, k])
+  indices = tf.where(paddings, closest_idx, indices)
+
+  indices = tf.reshape(indices, [n, p2, k])
+  paddings = tf.cast(paddings, tf.float32)
+  return indices, paddings
+
+
 def MatmulGather(source, indices):
   """Drop in replacement for tf.gather_nd() optimized for speed on TPU.
 
@@ -463,6 +637,403 @@ def FarthestPointSampler(points,
   return sampled_idx, closest_idx
 
 
+def _SpatialOrder(points, num_tiles):
+  """Returns a permutation of points that keeps nearby points together.
+
+  Points are sorted by the row major index of a coarse grid with about
+  num_tiles cells, so that consecutive points in the permutation are close to
+  each other and fixed size tiles of them have tight bounding boxes.
+
+  Args:
+    points: floating point tf.Tensor of shape [N, P1, dims].
+    num_tiles: integer (or scalar int32 tf.Tensor) number of tiles.
+
+  Returns:
+    tf.Tensor of shape [N, P1] of type tf.int32.
+  """
+  dims = py_utils.GetShape(points, 3)[2]
+  cells_per_dim = tf.maximum(
+      tf.round(
+          tf.pow(
+              tf.cast(num_tiles, tf.float32), 1. / tf.cast(dims, tf.float32))),
+      1.)
+  lower = tf.reduce_min(points, axis=1, keepdims=True)
+  extent = tf.maximum(
+      tf.reduce_max(points, axis=1, keepdims=True) - lower, 1e-6)
+  cells = tf.clip_by_value(
+      tf.floor((points - lower) / extent * cells_per_dim), 0.,
+      cells_per_dim - 1.)
+  # The number of cells is about num_tiles, so the keys are exact in float32.
+  strides = tf.pow(cells_per_dim,
+                   tf.cast(tf.range(dims - 1, -1, -1), tf.float32))
+  return tf.argsort(tf.reduce_sum(cells * strides, axis=2), axis=1)
+
+
+def BlockedFarthestPointSampler(points,
+                                padding,
+                                num_sampled_points,
+                                tile_size=1024,
+                                num_seeded_points=0,
+                                random_seed=None):
+  """Farthest point sampling over tiles of spatially sorted points.
+
+  Computes the same samples as FarthestPointSampler (up to ties), but instead
+  of updating the distance of every point to the selected set at every step,
+  the points are spatially sorted and split into tiles of tile_size points.
+  Each tile keeps a running buffer of the min distances of its points, and its
+  bounding box. A tile is only updated if the newly selected point is closer
+  to its bounding box than its farthest point is to the selected set, which
+  is rarely the case once a few points are selected. The next point is picked
+  from the per tile maxima, so each step costs O(P1 / tile_size) plus the cost
+  of the updated tiles, and no temporary is larger than the updated tiles.
+
+  The updated tiles have a dynamic shape, so this does not run on TPU.
+
+  Args:
+    points: floating point tf.Tensor of shape [N, P1, dims]
+    padding: A floating point tf.Tensor of shape [N, P1] with 0 if the point is
+      real, and 1 otherwise.
+    num_sampled_points: integer number of points to sample.
+    tile_size: integer number of points per tile.
+    num_seeded_points: If num_seeded_points > 0, then the first
+      num_seeded_points in points are considered to be seeded in the FPS
+      sampling. Note that we assume that these points are *not* padded, and do
+      not check padding when seeding them.
+    random_seed: optional integer random seed to use with all the random ops.
+
+  Returns:
+    A tuple of tf.Tensors (sampled_idx, closest_idx) of types
+    (tf.int32, tf.int32), as returned by FarthestPointSampler.
+  """
+  points = py_utils.HasRank(points, 3)
+  batch_size, num_points, dims = py_utils.GetShape(points, 3)
+  padding = py_utils.HasShape(padding, [batch_size, num_points])
+
+  points = py_utils.with_dependencies(
+      [py_utils.assert_greater_equal(num_points, num_sampled_points)], points)
+
+  # The same noise as FarthestPointSampler, so that all points are unique.
+  points += tf.random.uniform((batch_size, num_points, dims),
+                              minval=1e-6,
+                              maxval=1e-5,
+                              dtype=tf.float32,
+                              seed=random_seed)
+
+  num_tiles = (num_points + tile_size - 1) // tile_size
+  num_extra_points = num_tiles * tile_size - num_points
+
+  # order[i] is the original index of the i-th sorted point, and inverse_order
+  # the sorted position of each original point.
+  order = _SpatialOrder(points, num_tiles)
+  inverse_order = tf.argsort(order, axis=1)
+
+  # The last tile is filled up with copies of the last sorted point, which do
+  # not grow its bounding box. They count as already selected and are never
+  # sampled.
+  sorted_points = tf.gather(points, order, batch_dims=1)
+  sorted_points = tf.concat(
+      [sorted_points,
+       tf.tile(sorted_points[:, -1:], [1, num_extra_points, 1])],
+      axis=1)
+  sorted_padding = tf.concat([
+      tf.gather(padding, order, batch_dims=1),
+      tf.ones((batch_size, num_extra_points))
+  ],
+                             axis=1)
+  is_extra = tf.tile(
+      tf.expand_dims(tf.range(num_tiles * tile_size) >= num_points, 0),
+      [batch_size, 1])
+
+  tiled_points = tf.reshape(sorted_points,
+                            [batch_size, num_tiles, tile_size, dims])
+  tiled_padding = tf.reshape(sorted_padding,
+                             [batch_size, num_tiles, tile_size])
+  tiles_lower = tf.reduce_min(tiled_points, axis=2)
+  tiles_upper = tf.reduce_max(tiled_points, axis=2)
+
+  def _Priority(distance_to_selected, padding, is_selected):
+    """Returns the values whose argmax is the next point to select.
+
+    Real points rank by their distance to the selected set. Padded points rank
+    below all real points, but still by their distance, for when we are out of
+    real points. Selected points rank last.
+
+    Args:
+      distance_to_selected: tf.Tensor of shape [..., tile_size].
+      padding: tf.Tensor of shape [..., tile_size].
+      is_selected: boolean tf.Tensor of shape [..., tile_size].
+
+    Returns:
+      tf.Tensor of shape [..., tile_size].
+    """
+    priority = tf.where(
+        tf.equal(padding, 0.0), distance_to_selected,
+        -1.0 / (1.0 + distance_to_selected))
+    return tf.where(is_selected, -2.0 * tf.ones_like(priority), priority)
+
+  # Per point state, in the sorted and tiled order.
+  distance_to_selected = tf.reshape(
+      tf.where(is_extra, tf.zeros((batch_size, num_tiles * tile_size)),
+               float('inf') * tf.ones((batch_size, num_tiles * tile_size))),
+      [batch_size, num_tiles, tile_size])
+  is_selected = tf.reshape(is_extra, [batch_size, num_tiles, tile_size])
+  closest_idx = tf.zeros((batch_size, num_tiles, tile_size), dtype=tf.int32)
+
+  # Per tile state: the max priority and its position in the tile, and the max
+  # distance to the selected set.
+  priority = _Priority(distance_to_selected, tiled_padding, is_selected)
+  tiles_max_priority = tf.reduce_max(priority, axis=2)
+  tiles_argmax_priority = tf.argmax(priority, axis=2, output_type=tf.int32)
+  tiles_max_distance = tf.reduce_max(distance_to_selected, axis=2)
+
+  sampled_idx = tf.TensorArray(tf.int32, num_sampled_points)
+  curr_idx = tf.constant(0, dtype=tf.int32)
+
+  def _BodyFn(curr_idx, distance_to_selected, is_selected, closest_idx,
+              tiles_max_priority, tiles_argmax_priority, tiles_max_distance,
+              sampled_idx):
+    """Loop body for the blocked farthest point sampler."""
+
+    def _GetRandomRealPoint():
+      """Selects a random real point, as FarthestPointSampler does."""
+      random_values = tf.random.uniform((batch_size, num_points),
+                                        minval=0,
+                                        maxval=1,
+                                        dtype=tf.float32,
+                                        seed=random_seed)
+      random_values = tf.where(
+          tf.equal(padding, 0.0), random_values, padding * 10)
+      return tf.gather(
+          inverse_order,
+          tf.argmin(random_values, axis=1, output_type=tf.int32),
+          batch_dims=1)
+
+    def _GetFurthestPoint():
+      """Selects the point with the max priority over all tiles."""
+      tile_idx = tf.argmax(tiles_max_priority, axis=1, output_type=tf.int32)
+      return tile_idx * tile_size + tf.gather(
+          tiles_argmax_priority, tile_idx, batch_dims=1)
+
+    def _GetSeededPoint():
+      """Selects the next seeded point."""
+      return inverse_order[:, curr_idx]
+
+    def _Seeded():
+      return tf.cond(
+          tf.less(curr_idx, num_seeded_points), _GetSeededPoint,
+          _GetFurthestPoint)
+
+    def _Real():
+      return tf.cond(
+          tf.equal(curr_idx, 0), _GetRandomRealPoint, _GetFurthestPoint)
+
+    # The sorted position of the selected point.
+    new_selected = tf.cond(tf.greater(num_seeded_points, 0), _Seeded, _Real)
+    sampled_idx = sampled_idx.write(
+        curr_idx, tf.gather(order, new_selected, batch_dims=1))
+    new_tile_idx = new_selected // tile_size
+    new_idx_in_tile = new_selected % tile_size
+    new_points = tf.gather_nd(
+        tiled_points,
+        tf.stack([tf.range(batch_size), new_tile_idx, new_idx_in_tile],
+                 axis=1))
+
+    # A lower bound of the distance of the new point to the points of each
+    # tile. Tiles whose points are all closer than that to the selected set
+    # are unchanged. The tile of the new point is always updated, to mark it
+    # selected.
+    new_points = tf.expand_dims(new_points, 1)
+    gap = tf.maximum(
+        tf.maximum(tiles_lower - new_points, new_points - tiles_upper), 0.0)
+    is_active = tf.logical_or(
+        tf.less(tf.reduce_sum(tf.square(gap), axis=2), tiles_max_distance),
+        tf.cast(tf.one_hot(new_tile_idx, num_tiles, dtype=tf.int32), tf.bool))
+    # [A, 2] of (example, tile) indices of the updated tiles.
+    active_idx = tf.cast(tf.where(is_active), tf.int32)
+    active_example_idx = active_idx[:, 0]
+
+    # [A, tile_size]. The distances are computed as SquaredDistanceMatrix
+    # does, so that they are equal to those of FarthestPointSampler.
+    active_distance = tf.gather_nd(distance_to_selected, active_idx)
+    new_distance = tf.reduce_sum(
+        tf.square(
+            tf.gather_nd(tiled_points, active_idx) -
+            tf.gather(new_points, active_example_idx)),
+        axis=2)
+    is_newly_closest = tf.less(new_distance, active_distance)
+    active_distance = tf.minimum(active_distance, new_distance)
+    active_closest_idx = tf.where(
+        is_newly_closest, tf.fill(tf.shape(is_newly_closest), curr_idx),
+        tf.gather_nd(closest_idx, active_idx))
+    is_new_selected = tf.logical_and(
+        tf.equal(
+            tf.expand_dims(active_idx[:, 1], 1),
+            tf.expand_dims(tf.gather(new_tile_idx, active_example_idx), 1)),
+        tf.equal(
+            tf.expand_dims(tf.range(tile_size), 0),
+            tf.expand_dims(tf.gather(new_idx_in_tile, active_example_idx), 1)))
+    active_is_selected = tf.logical_or(
+        tf.gather_nd(is_selected, active_idx), is_new_selected)
+    active_priority = _Priority(active_distance,
+                                tf.gather_nd(tiled_padding, active_idx),
+                                active_is_selected)
+
+    distance_to_selected = tf.tensor_scatter_nd_update(
+        distance_to_selected, active_idx, active_distance)
+    is_selected = tf.tensor_scatter_nd_update(is_selected, active_idx,
+                                              active_is_selected)
+    closest_idx = tf.tensor_scatter_nd_update(closest_idx, active_idx,
+                                              active_closest_idx)
+    tiles_max_priority = tf.tensor_scatter_nd_update(
+        tiles_max_priority, active_idx,
+        tf.reduce_max(active_priority, axis=1))
+    tiles_argmax_priority = tf.tensor_scatter_nd_update(
+        tiles_argmax_priority, active_idx,
+        tf.argmax(active_priority, axis=1, output_type=tf.int32))
+    tiles_max_distance = tf.tensor_scatter_nd_update(
+        tiles_max_distance, active_idx, tf.reduce_max(active_distance, axis=1))
+    return (curr_idx + 1, distance_to_selected, is_selected, closest_idx,
+            tiles_max_priority, tiles_argmax_priority, tiles_max_distance,
+            sampled_idx)
+
+  loop_vars = (curr_idx, distance_to_selected, is_selected, closest_idx,
+               tiles_max_priority, tiles_argmax_priority, tiles_max_distance,
+               sampled_idx)
+  loop_vars = tf.while_loop(
+      lambda curr_idx, *args: tf.less(curr_idx, num_sampled_points),
+      _BodyFn,
+      loop_vars=loop_vars,
+      back_prop=False,
+      maximum_iterations=num_sampled_points)
+  closest_idx, sampled_idx = loop_vars[3], loop_vars[-1]
+
+  sampled_idx = tf.transpose(sampled_idx.stack(), [1, 0])
+  if isinstance(batch_size, int) and isinstance(num_sampled_points, int):
+    sampled_idx.set_shape((batch_size, num_sampled_points))
+
+  # Back to the original order of the points.
+  closest_idx = tf.reshape(closest_idx,
+                           [batch_size, num_tiles * tile_size])[:, :num_points]
+  closest_idx = tf.gather(closest_idx, inverse_order, batch_dims=1)
+  return sampled_idx, closest_idx
+
+
+def ApproximateFarthestPointSampler(points,
+                                    padding,
+                                    num_sampled_points,
+                                    voxel_size,
+                                    tile_size=1024,
+                                    num_seeded_points=0,
+                                    random_seed=None):
+  """Approximate farthest point sampling over a coarse voxel grid.
+
+  Points are first bucketed into voxels of voxel_size, and farthest point
+  sampling (BlockedFarthestPointSampler) only runs over one representative
+  real point per occupied voxel. Points which are not representatives are
+  assigned to the closest sampled point of the representative of their voxel.
+  The samples spread over the occupied voxels rather than over the points, and
+  the cost of sampling depends on the number of occupied voxels instead of the
+  number of points.
+
+  voxel_size should be small enough that at least num_sampled_points voxels
+  are occupied. Otherwise, the remaining samples are taken from the other
+  points, real or padded, in farthest point order.
+
+  Args:
+    points: floating point tf.Tensor of shape [N, P1, dims]
+    padding: A floating point tf.Tensor of shape [N, P1] with 0 if the point is
+      real, and 1 otherwise.
+    num_sampled_points: integer number of points to sample.
+    voxel_size: float, or list of dims floats, size of the voxels.
+    tile_size: integer number of points per tile of
+      BlockedFarthestPointSampler.
+    num_seeded_points: If num_seeded_points > 0, then the first
+      num_seeded_points in points are considered to be seeded in the FPS
+      sampling. Note that we assume that these points are *not* padded, and do
+      not check padding when seeding them.
+    random_seed: optional integer random seed to use with all the random ops.
+
+  Returns:
+    A tuple of tf.Tensors (sampled_idx, closest_idx) of types
+    (tf.int32, tf.int32), as returned by FarthestPointSampler. closest_idx of
+    padded points in voxels without real points is arbitrary.
+  """
+  points = py_utils.HasRank(points, 3)
+  batch_size, num_points, _ = py_utils.GetShape(points, 3)
+  padding = py_utils.HasShape(padding, [batch_size, num_points])
+
+  # Linearized voxel coordinates, in [N, P1].
+  voxels = tf.cast(
+      tf.floor(points / tf.constant(voxel_size, dtype=tf.float32)), tf.int64)
+  voxels -= tf.reduce_min(voxels, axis=1, keepdims=True)
+  grid_shape = tf.reduce_max(voxels, axis=1, keepdims=True) + 1
+  strides = tf.cumprod(grid_shape, axis=2, exclusive=True, reverse=True)
+  voxel_keys = tf.reduce_sum(voxels * strides, axis=2)
+
+  # Sort by voxel, with the real points of a voxel first. The first point of
+  # each voxel is its representative.
+  order = tf.argsort(
+      voxel_keys * 2 + tf.cast(padding, tf.int64), axis=1)
+  inverse_order = tf.argsort(order, axis=1)
+  sorted_keys = tf.gather(voxel_keys, order, batch_dims=1)
+  is_first = tf.concat([
+      tf.ones((batch_size, 1), dtype=tf.bool),
+      tf.not_equal(sorted_keys[:, 1:], sorted_keys[:, :-1])
+  ],
+                       axis=1)
+  # The sorted position of the representative of each sorted point.
+  positions = tf.tile(tf.expand_dims(tf.range(num_points), 0), [batch_size, 1])
+  voxel_idx = tf.cumsum(tf.cast(is_first, tf.int32), axis=1) - 1
+  voxel_start = tf.reshape(
+      tf.math.unsorted_segment_min(
+          positions,
+          voxel_idx + tf.expand_dims(tf.range(batch_size) * num_points, 1),
+          batch_size * num_points), [batch_size, num_points])
+  representative = tf.gather(
+      order, tf.gather(voxel_start, voxel_idx, batch_dims=1), batch_dims=1)
+  # Original index of the representative of each original point.
+  representative = tf.gather(representative, inverse_order, batch_dims=1)
+  is_representative = tf.logical_and(
+      tf.gather(is_first, inverse_order, batch_dims=1),
+      tf.equal(padding, 0.0))
+
+  # Seeded points, representatives, other real points, then padded points.
+  group = tf.where(
+      tf.equal(padding, 0.0),
+      tf.where(is_representative, tf.ones_like(positions),
+               2 * tf.ones_like(positions)), 3 * tf.ones_like(positions))
+  group = tf.where(positions < num_seeded_points, tf.zeros_like(group), group)
+  subset_order = tf.argsort(group, axis=1)
+  num_candidates = tf.maximum(
+      tf.reduce_max(
+          tf.reduce_sum(tf.cast(tf.less_equal(group, 1), tf.int32), axis=1)),
+      num_sampled_points)
+  subset_idx = subset_order[:, :num_candidates]
+
+  subset_sampled_idx, subset_closest_idx = BlockedFarthestPointSampler(
+      tf.gather(points, subset_idx, batch_dims=1),
+      tf.cast(
+          tf.greater(tf.gather(group, subset_idx, batch_dims=1), 1),
+          tf.float32),
+      num_sampled_points,
+      tile_size=tile_size,
+      num_seeded_points=num_seeded_points,
+      random_seed=random_seed)
+  sampled_idx = tf.gather(subset_idx, subset_sampled_idx, batch_dims=1)
+
+  # Points sampled over use their own closest sampled point, the others the
+  # one of their representative.
+  position_in_subset = tf.argsort(subset_order, axis=1)
+  position_in_subset = tf.where(
+      position_in_subset < num_candidates, position_in_subset,
+      tf.gather(position_in_subset, representative, batch_dims=1))
+  closest_idx = tf.gather(
+      subset_closest_idx,
+      tf.minimum(position_in_subset, num_candidates - 1),
+      batch_dims=1)
+  return sampled_idx, closest_idx
+
+
 # TODO(bencaine): This was moved so that we can make this more generic in the
 # future and provide min/avg/max pooling with one function.
 def MaxPool3D(points, point_features, pooling_idx, closest_idx):
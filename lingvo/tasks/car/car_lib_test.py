@@ -19,6 +19,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import time
+
 import lingvo.compat as tf
 from lingvo.core import test_utils
 from lingvo.tasks.car import car_lib
@@ -260,6 +262,89 @@ class CarLibTest(test_utils.TestCase):
       car_lib.NeighborhoodIndices(
           points, query_points, 1, padding, sample_neighbors_uniformly=True)
 
+  def _GridTestInputs(self, n=2, p1=2000, num_padded=100, num_queries=64):
+    """Random points in a 10^3 cube, with queries at real points."""
+    points = np.random.uniform(0., 10., size=(n, p1, 3)).astype(np.float32)
+    padding = np.zeros([n, p1], dtype=np.float32)
+    padding[:, p1 - num_padded:] = 1.
+    query_points = points[:, :num_queries]
+    return points, query_points, padding
+
+  def testNeighborhoodIndicesGridMatchesDense(self):
+    np.random.seed(12345)
+    points, query_points, padding = self._GridTestInputs()
+    for points_padding in [None, padding]:
+      dense = car_lib.NeighborhoodIndices(
+          points, query_points, 8, points_padding, max_distance=1.0)
+      grid = car_lib.NeighborhoodIndices(
+          points,
+          query_points,
+          8,
+          points_padding,
+          max_distance=1.0,
+          max_points_per_cell=16)
+      with self.session() as sess:
+        dense, grid = sess.run([dense, grid])
+      self.assertAllEqual(dense[0], grid[0])
+      self.assertAllEqual(dense[1], grid[1])
+      # Some neighborhoods are not full.
+      self.assertGreater(np.sum(grid[1]), 0)
+      self.assertLess(np.sum(grid[1]), grid[1].size)
+
+  def testKnnIndicesGridMatchesDense(self):
+    np.random.seed(12345)
+    points, query_points, _ = self._GridTestInputs(num_padded=0)
+    valid_num = tf.constant([1900, 1500])
+    dense = car_lib.KnnIndices(
+        points, query_points, 4, valid_num, max_distance=0.8)
+    grid = car_lib.KnnIndices(
+        points,
+        query_points,
+        4,
+        valid_num,
+        max_distance=0.8,
+        max_points_per_cell=8)
+    with self.session() as sess:
+      dense, grid = sess.run([dense, grid])
+    self.assertAllEqual(dense[0], grid[0])
+    self.assertAllEqual(dense[1], grid[1])
+
+  def testNeighborhoodIndicesGridWithUniformSampling(self):
+    np.random.seed(12345)
+    points, query_points, padding = self._GridTestInputs()
+    indices, paddings = car_lib.NeighborhoodIndices(
+        points,
+        query_points,
+        8,
+        padding,
+        max_distance=1.0,
+        sample_neighbors_uniformly=True,
+        max_points_per_cell=16)
+    with self.session() as sess:
+      indices, paddings = sess.run([indices, paddings])
+    for b in range(points.shape[0]):
+      neighbors = points[b][indices[b]]
+      dist = np.linalg.norm(neighbors - query_points[b][:, np.newaxis], axis=-1)
+      self.assertTrue(np.all(dist[paddings[b] == 0] <= 1.0))
+      self.assertTrue(np.all(padding[b][indices[b]][paddings[b] == 0] == 0))
+
+  def testNeighborhoodIndicesGridUsesDenseForSmallInputs(self):
+    with tf.Graph().as_default() as g:
+      points = tf.random_uniform((1, 100, 3))
+      car_lib.NeighborhoodIndices(
+          points, points, 4, max_distance=0.1, max_points_per_cell=8)
+    self.assertNotIn('LowerBound', [op.type for op in g.get_operations()])
+    with tf.Graph().as_default() as g:
+      points = tf.random_uniform((1, 1000, 3))
+      car_lib.NeighborhoodIndices(
+          points, points, 4, max_distance=0.1, max_points_per_cell=8)
+    self.assertIn('LowerBound', [op.type for op in g.get_operations()])
+
+  def testNeighborhoodIndicesGridRaisesIfNoMaxDistance(self):
+    points = tf.random_uniform((1, 1000, 3))
+    with self.assertRaisesRegex(ValueError, 'requires specifying max_distance'):
+      car_lib.NeighborhoodIndices(points, points, 4, max_points_per_cell=8)
+
   def testFarthestPointSamplerOnePoint(self):
     points = tf.constant([
         [[1, 1, 1, 1]],
@@ -410,6 +495,94 @@ class CarLibTest(test_utils.TestCase):
       np_selected_idx.sort(axis=1)
       self.assertAllEqual(np_selected_idx, np_expected_selected_idx)
 
+  def _FarthestPointSamplerTestInputs(self, n=2, p1=1000, num_padded=100):
+    """Random points in a 10^3 cube, with padding at the end."""
+    points = np.random.uniform(0., 10., size=(n, p1, 3)).astype(np.float32)
+    padding = np.zeros([n, p1], dtype=np.float32)
+    padding[:, p1 - num_padded:] = 1.
+    return points, padding
+
+  def testBlockedFarthestPointSamplerMatchesExact(self):
+    np.random.seed(12345)
+    points, padding = self._FarthestPointSamplerTestInputs()
+    # Past 900 samples, we are out of real points and sample padded ones.
+    for num_sampled_points in [64, 950]:
+      # The same seeds give the same noise and first point to both samplers.
+      expected = car_lib.FarthestPointSampler(
+          points,
+          padding,
+          num_sampled_points,
+          num_seeded_points=1,
+          random_seed=123)
+      actual = car_lib.BlockedFarthestPointSampler(
+          points,
+          padding,
+          num_sampled_points,
+          tile_size=64,
+          num_seeded_points=1,
+          random_seed=123)
+      with self.session() as sess:
+        expected, actual = sess.run([expected, actual])
+      self.assertAllEqual(expected[0], actual[0])
+      self.assertAllEqual(expected[1], actual[1])
+
+  def testBlockedFarthestPointSamplerPadding(self):
+    points = tf.constant([
+        [[0, 1, 1], [1, 1, 1], [2, 1, 1], [3, 1, 1], [4, 1, 1], [5, 1, 1]],
+        [[0, 2, 1], [1, 2, 1], [2, 2, 1], [3, 2, 1], [4, 2, 1], [5, 2, 1]],
+        [[0, 2, 3], [1, 2, 3], [2, 2, 3], [3, 2, 3], [4, 2, 3], [5, 2, 3]],
+        [[0, 2, 1], [1, 2, 1], [2, 2, 1], [3, 2, 1], [4, 2, 1], [5, 2, 1]],
+    ], dtype=tf.float32)  # pyformat: disable
+    padding = tf.constant([[0, 0, 0, 0, 1, 1], [0, 0, 1, 1, 0, 0],
+                           [1, 1, 0, 0, 0, 0], [1, 0, 0, 0, 0, 1]],
+                          dtype=tf.float32)
+    np_expected_selected_idx = np.array(
+        [[0, 1, 2, 3], [0, 1, 4, 5], [2, 3, 4, 5], [1, 2, 3, 4]],
+        dtype=np.int32)
+    # Tiles of 4 points leave an incomplete last tile.
+    selected_idx, closest_idx = car_lib.BlockedFarthestPointSampler(
+        points, padding, 4, tile_size=4)
+    with self.session() as sess:
+      np_selected_idx, closest_idx = sess.run([selected_idx, closest_idx])
+      np_selected_idx.sort(axis=1)
+      self.assertAllEqual(np_selected_idx, np_expected_selected_idx)
+      self.assertTrue(np.all((closest_idx >= 0) & (closest_idx < 4)))
+
+  def testApproximateFarthestPointSampler(self):
+    np.random.seed(12345)
+    # 5 points in each of 10^3 unit voxels, and some padded points.
+    voxels = np.stack(
+        np.meshgrid(np.arange(10), np.arange(10), np.arange(10)),
+        axis=-1).reshape([1, 1000, 3])
+    points = np.concatenate(
+        [voxels + np.random.uniform(0.1, 0.9, size=(2, 1000, 3))] * 5,
+        axis=1).astype(np.float32)
+    padding = np.zeros([2, 5000], dtype=np.float32)
+    padding[:, -100:] = 1.
+    num_sampled_points = 128
+    sampled_idx, closest_idx = car_lib.ApproximateFarthestPointSampler(
+        points,
+        padding,
+        num_sampled_points,
+        voxel_size=1.,
+        tile_size=128,
+        random_seed=123)
+    with self.session() as sess:
+      sampled_idx, closest_idx = sess.run([sampled_idx, closest_idx])
+    for batch_n in range(2):
+      # Samples are real points, each in a different voxel.
+      self.assertTrue(np.all(padding[batch_n, sampled_idx[batch_n]] == 0.))
+      sampled_voxels = np.floor(points[batch_n, sampled_idx[batch_n]])
+      self.assertEqual(num_sampled_points,
+                       len(set(map(tuple, sampled_voxels))))
+      # All the real points of a voxel have the same closest sampled point.
+      self.assertTrue(
+          np.all((closest_idx[batch_n] >= 0) &
+                 (closest_idx[batch_n] < num_sampled_points)))
+      real = padding[batch_n] == 0.
+      voxel_closest = np.tile(closest_idx[batch_n, :1000], [5])
+      self.assertAllEqual(voxel_closest[real], closest_idx[batch_n][real])
+
   def _testPooling3D(self, pooling_fn):
     num_points_in = 100
     num_points_out = 10
@@ -466,5 +639,128 @@ class CarLibTest(test_utils.TestCase):
     return self._testPooling3D(car_lib.SegmentPool3D)
 
 
+class NeighborhoodIndicesBenchmark(tf.test.Benchmark):
+  """Compares the dense and the grid neighbor search.
+
+  The dense search materializes [N, P2, P1, 3] differences, the grid search
+  [N, P2, 27 * max_points_per_cell, 3]. The grid search is faster and smaller
+  once P1 is well above 27 * max_points_per_cell; below that,
+  NeighborhoodIndices falls back to the dense search.
+  """
+
+  def _Run(self, num_points, num_queries, k=32, max_points_per_cell=32):
+    np.random.seed(12345)
+    # A lidar like spread of points, denser close to the sensor.
+    radius = np.random.exponential(15., size=(1, num_points))
+    angle = np.random.uniform(-np.pi, np.pi, size=(1, num_points))
+    points_data = np.stack([
+        radius * np.cos(angle), radius * np.sin(angle),
+        np.random.uniform(-2., 1., size=(1, num_points))
+    ],
+                           axis=-1).astype(np.float32)
+    with tf.Graph().as_default(), tf.Session() as sess:
+      points = tf.placeholder(tf.float32, [1, num_points, 3])
+      query_points = points[:, :num_queries]
+      outputs = {
+          'dense':
+              car_lib.NeighborhoodIndices(
+                  points, query_points, k, max_distance=1.0),
+          'grid':
+              car_lib.NeighborhoodIndices(
+                  points,
+                  query_points,
+                  k,
+                  max_distance=1.0,
+                  max_points_per_cell=max_points_per_cell),
+      }
+      num_iters = 10
+      wall_times = {}
+      for key, output in outputs.items():
+        sess.run(output, feed_dict={points: points_data})
+        start = time.time()
+        for _ in range(num_iters):
+          sess.run(output, feed_dict={points: points_data})
+        wall_times[key] = (time.time() - start) / num_iters
+    self.report_benchmark(
+        name='NeighborhoodIndices_%d_points_%d_queries' %
+        (num_points, num_queries),
+        iters=num_iters,
+        wall_time=wall_times['grid'],
+        extras={
+            'dense_wall_time': wall_times['dense'],
+            'dense_diff_bytes': num_queries * num_points * 3 * 4,
+            'grid_diff_bytes': num_queries * 27 * max_points_per_cell * 3 * 4,
+        })
+
+  def benchmarkNeighborhoodIndices(self):
+    for num_points in [2048, 8192, 32768, 65536]:
+      self._Run(num_points, num_queries=1024)
+
+
+class FarthestPointSamplerBenchmark(tf.test.Benchmark):
+  """Compares the exact, blocked and approximate farthest point samplers.
+
+  Reports the wall time of each sampler, and its coverage: the max distance of
+  a point to its closest sample, which farthest point sampling minimizes.
+  """
+
+  def _Run(self, num_points, num_sampled_points, tile_size=1024,
+           voxel_size=0.5):
+    np.random.seed(12345)
+    # A lidar like spread of points, denser close to the sensor.
+    radius = np.random.exponential(15., size=(1, num_points))
+    angle = np.random.uniform(-np.pi, np.pi, size=(1, num_points))
+    points_data = np.stack([
+        radius * np.cos(angle), radius * np.sin(angle),
+        np.random.uniform(-2., 1., size=(1, num_points))
+    ],
+                           axis=-1).astype(np.float32)
+    with tf.Graph().as_default(), tf.Session() as sess:
+      points = tf.placeholder(tf.float32, [1, num_points, 3])
+      padding = tf.zeros([1, num_points])
+      outputs = {
+          'exact':
+              car_lib.FarthestPointSampler(points, padding,
+                                           num_sampled_points),
+          'blocked':
+              car_lib.BlockedFarthestPointSampler(
+                  points, padding, num_sampled_points, tile_size=tile_size),
+          'approximate':
+              car_lib.ApproximateFarthestPointSampler(
+                  points,
+                  padding,
+                  num_sampled_points,
+                  voxel_size=voxel_size,
+                  tile_size=tile_size),
+      }
+      num_iters = 5
+      extras = {}
+      for key, output in outputs.items():
+        sampled_idx, _ = sess.run(output, feed_dict={points: points_data})
+        start = time.time()
+        for _ in range(num_iters):
+          sess.run(output, feed_dict={points: points_data})
+        extras['%s_wall_time' % key] = (time.time() - start) / num_iters
+        sampled_points = points_data[0, sampled_idx[0]]
+        coverage = 0.
+        # Chunks bound the memory of the distances.
+        for chunk in np.array_split(points_data[0], 64):
+          distances = np.sum(
+              np.square(chunk[:, np.newaxis] - sampled_points[np.newaxis]),
+              axis=-1)
+          coverage = max(coverage, np.sqrt(np.max(np.min(distances, axis=1))))
+        extras['%s_coverage' % key] = coverage
+    self.report_benchmark(
+        name='FarthestPointSampler_%d_points_%d_samples' %
+        (num_points, num_sampled_points),
+        iters=num_iters,
+        wall_time=extras['blocked_wall_time'],
+        extras=extras)
+
+  def benchmarkFarthestPointSampler(self):
+    for num_points in [8192, 32768, 131072]:
+      self._Run(num_points, num_sampled_points=1024)
+
+
 if __name__ == '__main__':
   tf.test.main()
@@ -741,21 +741,14 @@ class Utils3D(object):
     score_threshold = tf.broadcast_to(
         tf.convert_to_tensor(score_threshold), [num_classes])
 
-    def NMSBody(args):
-      per_sample_bboxes, per_sample_scores = args
-      indices, scores, mask = ops.non_max_suppression_3d(
-          per_sample_bboxes,
-          per_sample_scores,
-          nms_iou_threshold=nms_iou_threshold,
-          score_threshold=score_threshold,
-          max_boxes_per_class=max_boxes_per_class)
-      return indices, scores, mask
-
-    bbox_indices, bbox_scores, valid_mask = tf.map_fn(
-        fn=NMSBody,
-        elems=(bboxes, scores),
-        dtype=(tf.int32, tf.float32, tf.float32),
-        back_prop=False)
+    # The op processes all examples and classes of the batch at once, in
+    # parallel over the CPU threads.
+    bbox_indices, bbox_scores, valid_mask = ops.non_max_suppression_3d(
+        bboxes,
+        scores,
+        nms_iou_threshold=nms_iou_threshold,
+        score_threshold=score_threshold,
+        max_boxes_per_class=max_boxes_per_class)
 
     output_shape = [batch_size, num_classes, max_boxes_per_class]
     bbox_indices = py_utils.PadOrTrimTo(bbox_indices, output_shape)
@@ -228,6 +228,42 @@ def PointsToImagePlane(points, velo_to_image_plane):
   return points_image
 
 
+def PointsInImagePlane(points, velo_to_image_plane, width, height):
+  """Returns which 3D points project inside the image.
+
+  This is equivalent to checking that the output of `PointsToImagePlane` lies
+  within [0, width] x [0, height] for points in front of the camera, but
+  avoids building homogeneous coordinates for all points and dividing by the
+  last coordinate: the bounds are instead scaled by it.
+
+  Args:
+    points: A [N, 3] Floating point tensor containing xyz points. Points are
+      assumed to be in velo coordinates.
+    velo_to_image_plane: A [3, 4] matrix from velo xyz to image plane xy.
+    width: The image width in pixels, a scalar or a [1] tensor.
+    height: The image height in pixels, a scalar or a [1] tensor.
+
+  Returns:
+    A [N] boolean tensor, True for points projecting inside the image. Points
+    behind the camera are never inside the image.
+  """
+  points = py_utils.HasRank(points, 2)
+  num_points = tf.shape(points)[0]
+  points = py_utils.HasShape(points, [num_points, 3])
+  velo_to_image_plane = py_utils.HasShape(velo_to_image_plane, [3, 4])
+
+  # Unnormalized image coordinates: pixel (x, y) is (u / w, v / w).
+  uvw = tf.matmul(
+      points, velo_to_image_plane[:, :3],
+      transpose_b=True) + velo_to_image_plane[:, 3]
+  u, v, w = tf.unstack(uvw, axis=-1)
+  width = tf.cast(width, w.dtype)
+  height = tf.cast(height, w.dtype)
+  in_image_plane = ((w > 0.) & (u >= 0.) & (u <= width * w) & (v >= 0.) &
+                    (v <= height * w))
+  return py_utils.HasShape(in_image_plane, [num_points])
+
+
 def BBoxesToXYWH(bboxes):
   """Converts bboxes to xywh."""
   mtrx = tf.constant(
@@ -61,6 +61,35 @@ class GeometryTest(test_utils.TestCase):
                   [463.57763672, -32.7820015]]
       self.assertAllClose(expected, result)
 
+  def testPointsInImagePlane(self):
+    # From a KITTI example.
+    velo_to_image_plane = np.array(
+        [[6.09695409e+02, -7.21421597e+02, -1.25125855e+00, -1.23041806e+02],
+         [1.80384202e+02, 7.64479802e+00, -7.19651474e+02, -1.01016688e+02],
+         [9.99945389e-01, 1.24365378e-04, 1.04513030e-02, -2.69386912e-01]],
+        dtype=np.float32)
+    np.random.seed(12345)
+    points = np.random.uniform(
+        low=[0.5, -40., -3.], high=[70., 40., 3.],
+        size=(1000, 3)).astype(np.float32)
+    points[:3] = [[1.25120001e+01, -5.09700012e+00, -7.26999998e-01],
+                  [1.27309999e+01, -5.21099997e+00, 1.85000002e-01],
+                  [-100, -20, -30]]
+    width, height = 1242, 375
+
+    with self.session():
+      in_image_plane = geometry.PointsInImagePlane(
+          points, velo_to_image_plane, width, tf.constant([height])).eval()
+      points_image = geometry.PointsToImagePlane(
+          tf.constant(points), velo_to_image_plane).eval()
+    # The last of the first three points is behind the camera.
+    self.assertAllEqual([True, True, False], in_image_plane[:3])
+    # Points in front of the camera agree with the projection.
+    expected = ((points_image[:, 0] >= 0) & (points_image[:, 0] <= width) &
+                (points_image[:, 1] >= 0) & (points_image[:, 1] <= height))
+    self.assertAllEqual(expected[3:], in_image_plane[3:])
+    self.assertGreater(np.sum(in_image_plane), 0)
+
   def testReorderIndicesByPhi(self):
     # Picks the anchor point somewhere on the x-y plane.
     phi0 = 2 * np.pi / 3
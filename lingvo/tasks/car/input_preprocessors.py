@@ -1042,6 +1042,16 @@ class SparseCenterSelector(Preprocessor):
     p.Define(
         'fix_z_to_zero', True, 'Whether to fix z to 0 when retrieving the '
         'center xyz coordinates.')
+    p.Define(
+        'fps_tile_size', None,
+        'If set, farthest point sampling only updates the tiles of this many '
+        'points which can change at each step. See '
+        'car_lib.BlockedFarthestPointSampler.')
+    p.Define(
+        'fps_voxel_size', None,
+        'If set, farthest point sampling only runs over one point per voxel '
+        'of this size, which is faster but approximate. See '
+        'car_lib.ApproximateFarthestPointSampler.')
     return p
 
   @base_layer.initializer
@@ -1083,12 +1093,21 @@ class SparseCenterSelector(Preprocessor):
     points_padding = py_utils.PadOrTrimTo(
         points_padding, [padded_num_points], pad_val=1.0)
 
-    sampled_idx, _ = car_lib.FarthestPointSampler(
-        points_xy[tf.newaxis, ...],
-        points_padding[tf.newaxis, ...],
-        p.num_cell_centers,
-        num_seeded_points=num_seeded_points,
-        random_seed=p.random_seed)
+    kwargs = dict(
+        num_seeded_points=num_seeded_points, random_seed=p.random_seed)
+    if p.fps_voxel_size is not None:
+      sampler = car_lib.ApproximateFarthestPointSampler
+      kwargs['voxel_size'] = p.fps_voxel_size
+      if p.fps_tile_size is not None:
+        kwargs['tile_size'] = p.fps_tile_size
+    elif p.fps_tile_size is not None:
+      sampler = car_lib.BlockedFarthestPointSampler
+      kwargs['tile_size'] = p.fps_tile_size
+    else:
+      sampler = car_lib.FarthestPointSampler
+    sampled_idx, _ = sampler(points_xy[tf.newaxis, ...],
+                             points_padding[tf.newaxis, ...],
+                             p.num_cell_centers, **kwargs)
     sampled_idx = sampled_idx[0, :]
 
     # Gather centers.
@@ -1203,6 +1222,11 @@ class SparseCellGatherFeatures(Preprocessor):
         'Whether to sample the neighbor points for every cell center '
         'uniformly at random. If False, this will default to selecting by '
         'distance.')
+    p.Define(
+        'max_points_per_cell', None,
+        'If set, neighbor points are searched on a grid with cells of size '
+        'max_distance, comparing at most this many points per grid cell '
+        'instead of all points. See car_lib.NeighborhoodIndices.')
     return p
 
   def TransformFeatures(self, features):
@@ -1229,7 +1253,8 @@ class SparseCellGatherFeatures(Preprocessor):
         p.num_points_per_cell,
         points_padding=None,
         max_distance=p.max_distance,
-        sample_neighbors_uniformly=p.sample_neighbors_uniformly)
+        sample_neighbors_uniformly=p.sample_neighbors_uniformly,
+        max_points_per_cell=p.max_points_per_cell)
 
     # Take first example since NeighboorhoodIndices expects batch dimension.
     sample_indices = sample_indices[0, :, :]
@@ -1733,35 +1758,22 @@ class KITTIDropPointsOutOfFrustum(Preprocessor):
   """
 
   def TransformFeatures(self, features):
-    # Drop points behind the car (behind x-axis = 0).
     images = features.images
-    front_indices = features.lasers.points_xyz[:, 0] >= 0
-
-    if 'points_padding' not in features.lasers:
-      # Keep tensors unpadded and small using boolean_mask.
-      features.lasers.points_xyz = tf.boolean_mask(features.lasers.points_xyz,
-                                                   front_indices)
-      features.lasers.points_feature = tf.boolean_mask(
-          features.lasers.points_feature, front_indices)
-
-    # Drop those points outside the image plane.
-    points_image = geometry.PointsToImagePlane(features.lasers.points_xyz,
-                                               images.velo_to_image_plane)
-    in_image_plane = (
-        (points_image[:, 0] >= 0) &
-        (points_image[:, 0] <= tf.cast(images.width, tf.float32)) &
-        (points_image[:, 1] >= 0) &
-        (points_image[:, 1] <= tf.cast(images.height, tf.float32)))
+    # Drop points behind the car (behind x-axis = 0) and those outside the
+    # image plane.
+    points_mask = features.lasers.points_xyz[:, 0] >= 0
+    points_mask &= geometry.PointsInImagePlane(features.lasers.points_xyz,
+                                               images.velo_to_image_plane,
+                                               images.width, images.height)
 
     if 'points_padding' in features.lasers:
       # Update padding to only include front indices and in image plane.
-      points_mask = tf.cast(1 - features.lasers.points_padding, tf.bool)
-      points_mask &= front_indices
-      points_mask &= in_image_plane
+      points_mask &= tf.cast(1 - features.lasers.points_padding, tf.bool)
       features.lasers.points_padding = 1. - tf.cast(points_mask, tf.float32)
     else:
+      # Keep tensors unpadded and small using boolean_mask.
       features.lasers = features.lasers.Transform(
-          _GetApplyPointMaskFn(in_image_plane))
+          _GetApplyPointMaskFn(points_mask))
     return features
 
   def TransformShapes(self, shapes):
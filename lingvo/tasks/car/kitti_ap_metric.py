@@ -19,8 +19,12 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import contextlib
+import multiprocessing
+
 from lingvo import compat as tf
 from lingvo.core import py_utils
+from lingvo.tasks.car import ap_lib
 from lingvo.tasks.car import ap_metric
 from lingvo.tasks.car import ops
 import numpy as np
@@ -29,6 +33,24 @@ import numpy as np
 class KITTIAPMetrics(ap_metric.APMetrics):
   """The KITTI implementation of AP metric."""
 
+  @classmethod
+  def Params(cls, metadata):
+    """Params builder for KITTIAPMetrics."""
+    p = super(KITTIAPMetrics, cls).Params(metadata)
+    p.Define(
+        'ap_backend', 'op', 'How the AP is computed. One of ["op", "numpy"]: '
+        'op runs the average_precision3d op in a TensorFlow session, numpy '
+        'runs the equivalent ap_lib implementation on the CPU.')
+    p.Define(
+        'num_processes', 0,
+        'If > 0 and ap_backend is numpy, the number of processes the AP '
+        'computation is spread over.')
+    return p
+
+  def __init__(self, params):
+    super(KITTIAPMetrics, self).__init__(params)
+    assert self.params.ap_backend in ['op', 'numpy'], self.params.ap_backend
+
   def _GetData(self,
                classid,
                difficulty=None,
@@ -117,65 +139,70 @@ class KITTIAPMetrics(ap_metric.APMetrics):
         pd=py_utils.NestedMap(
             imgid=p.imgids, bbox=p.boxes, score=p.scores, ignore=pd_ignore))
 
-  def _BuildMetric(self, feed_data, classid):
-    """Construct tensors and the feed_dict for KITTI metric op.
+  def _BuildMetric(self, classid):
+    """Construct tensors and placeholders for KITTI metric op.
 
     Args:
-      feed_data: a NestedMap returned by _GetData()
       classid: integer. Unused in this implementation.
 
     Returns:
-      A tuple of 3 dicts:
+      A tuple (scalar_metrics, curve_metrics, placeholders):
 
       - scalar_metrics: a dict mapping all the metric names to fetch tensors.
-      - curves: a dict mapping all the curve names to fetch tensors.
-      - feed_dict: a dict mapping the tensors in feed_tensors to feed values.
+      - curve_metrics: a dict mapping all the curve names to fetch tensors.
+      - placeholders: a NestedMap of placeholders, fed with the values at the
+        same keys in the output of _GetData().
     """
-    if feed_data is None:
-      dummy_scalar = tf.constant(np.nan)
-      dummy_curve = tf.zeros([self.metadata.NumberOfPrecisionRecallPoints(), 2],
-                             tf.float32)
-      scalar_metrics = {'ap': dummy_scalar}
-      curve_metrics = {'pr': dummy_curve}
-      return scalar_metrics, curve_metrics, {}
-
-    feed_dict = {}
-
-    f_iou = tf.placeholder(tf.float32)
-    feed_dict[f_iou] = feed_data.iou_threshold
-
-    f_gt_bbox = tf.placeholder(tf.float32)
-    feed_dict[f_gt_bbox] = feed_data.gt.bbox
-
-    f_gt_imgid = tf.placeholder(tf.int32)
-    feed_dict[f_gt_imgid] = feed_data.gt.imgid
-
-    f_gt_ignore = tf.placeholder(tf.int32)
-    feed_dict[f_gt_ignore] = feed_data.gt.ignore
-
-    f_pd_bbox = tf.placeholder(tf.float32)
-    feed_dict[f_pd_bbox] = feed_data.pd.bbox
-
-    f_pd_imgid = tf.placeholder(tf.int32)
-    feed_dict[f_pd_imgid] = feed_data.pd.imgid
-
-    f_pd_ignore = tf.placeholder(tf.int32)
-    feed_dict[f_pd_ignore] = feed_data.pd.ignore
-
-    f_pd_score = tf.placeholder(tf.float32)
-    feed_dict[f_pd_score] = feed_data.pd.score
+    placeholders = py_utils.NestedMap(
+        iou_threshold=tf.placeholder(tf.float32),
+        gt=py_utils.NestedMap(
+            bbox=tf.placeholder(tf.float32),
+            imgid=tf.placeholder(tf.int32),
+            ignore=tf.placeholder(tf.int32)),
+        pd=py_utils.NestedMap(
+            bbox=tf.placeholder(tf.float32),
+            imgid=tf.placeholder(tf.int32),
+            ignore=tf.placeholder(tf.int32),
+            score=tf.placeholder(tf.float32)))
 
     ap, pr = ops.average_precision3d(
-        iou_threshold=f_iou,
-        groundtruth_bbox=f_gt_bbox,
-        groundtruth_imageid=f_gt_imgid,
-        groundtruth_ignore=f_gt_ignore,
-        prediction_bbox=f_pd_bbox,
-        prediction_imageid=f_pd_imgid,
-        prediction_ignore=f_pd_ignore,
-        prediction_score=f_pd_score,
+        iou_threshold=placeholders.iou_threshold,
+        groundtruth_bbox=placeholders.gt.bbox,
+        groundtruth_imageid=placeholders.gt.imgid,
+        groundtruth_ignore=placeholders.gt.ignore,
+        prediction_bbox=placeholders.pd.bbox,
+        prediction_imageid=placeholders.pd.imgid,
+        prediction_ignore=placeholders.pd.ignore,
+        prediction_score=placeholders.pd.score,
         num_recall_points=self.metadata.NumberOfPrecisionRecallPoints())
 
     scalar_metrics = {'ap': ap}
     curve_metrics = {'pr': pr}
-    return scalar_metrics, curve_metrics, feed_dict
+    return scalar_metrics, curve_metrics, placeholders
+
+  def _DummyMetrics(self, classid):
+    """Returns NaN AP and an all zero PR curve."""
+    dummy_curve = np.zeros([self.metadata.NumberOfPrecisionRecallPoints(), 2],
+                           np.float32)
+    return {'ap': np.float32(np.nan)}, {'pr': dummy_curve}
+
+  def _ComputeMetrics(self, inputs):
+    """Computes the metrics with the configured `ap_backend`."""
+    p = self.params
+    if p.ap_backend == 'op':
+      return super(KITTIAPMetrics, self)._ComputeMetrics(inputs)
+    data = [data for _, _, data in inputs]
+    num_recall_points = self.metadata.NumberOfPrecisionRecallPoints()
+    if p.num_processes > 0:
+      # The workers are spawned rather than forked from the multithreaded
+      # TensorFlow process, and are shut down once the metrics are computed,
+      # as a decoder creates new metrics for every checkpoint.
+      ctx = multiprocessing.get_context('spawn')
+      with contextlib.closing(ctx.Pool(p.num_processes)) as pool:
+        results = ap_lib.AveragePrecision3DBatch(
+            data, num_recall_points=num_recall_points, pool=pool)
+      pool.join()
+    else:
+      results = ap_lib.AveragePrecision3DBatch(
+          data, num_recall_points=num_recall_points)
+    return [({'ap': ap}, {'pr': pr}) for ap, pr in results]
@@ -233,6 +233,24 @@ double RotatedBox2D::IoU(const RotatedBox2D& other) const {
   return intersection_area / union_area;
 }
 
+Upright3DBox ParseBox(const float* box) {
+  const double center_x = box[0];
+  const double center_y = box[1];
+  const double center_z = box[2];
+  const double dimension_x = box[3];
+  const double dimension_y = box[4];
+  const double dimension_z = box[5];
+  const double heading = box[6];
+  const double z_min = center_z - dimension_z / 2;
+  const double z_max = center_z + dimension_z / 2;
+  if (dimension_x <= 0 || dimension_y <= 0) {
+    return Upright3DBox(RotatedBox2D(), z_min, z_max);
+  }
+  return Upright3DBox(
+      RotatedBox2D(center_x, center_y, dimension_x, dimension_y, heading),
+      z_min, z_max);
+}
+
 std::vector<Upright3DBox> ParseBoxesFromTensor(const Tensor& boxes_tensor) {
   int num_boxes = boxes_tensor.dim_size(0);
 
@@ -241,21 +259,7 @@ std::vector<Upright3DBox> ParseBoxesFromTensor(const Tensor& boxes_tensor) {
   std::vector<Upright3DBox> bboxes3d;
   bboxes3d.reserve(num_boxes);
   for (int i = 0; i < num_boxes; ++i) {
-    const double center_x = t_boxes_tensor(i, 0);
-    const double center_y = t_boxes_tensor(i, 1);
-    const double center_z = t_boxes_tensor(i, 2);
-    const double dimension_x = t_boxes_tensor(i, 3);
-    const double dimension_y = t_boxes_tensor(i, 4);
-    const double dimension_z = t_boxes_tensor(i, 5);
-    const double heading = t_boxes_tensor(i, 6);
-    const double z_min = center_z - dimension_z / 2;
-    const double z_max = center_z + dimension_z / 2;
-    RotatedBox2D box2d(center_x, center_y, dimension_x, dimension_y, heading);
-    if (dimension_x <= 0 || dimension_y <= 0) {
-      bboxes3d.emplace_back(RotatedBox2D(), z_min, z_max);
-    } else {
-      bboxes3d.emplace_back(box2d, z_min, z_max);
-    }
+    bboxes3d.push_back(ParseBox(&t_boxes_tensor(i, 0)));
   }
   return bboxes3d;
 }
@@ -120,6 +120,10 @@ struct Upright3DBox {
   bool NonZeroAndValid() const;
 };
 
+// Converts the 7 values at `box` to an Upright3DBox. Boxes with a
+// non-positive dimension in x or y are empty.
+Upright3DBox ParseBox(const float* box);
+
 // Converts a [N, 7] tensor to a vector of N Upright3DBox objects.
 std::vector<Upright3DBox> ParseBoxesFromTensor(const Tensor& boxes_tensor);
 
@@ -15,6 +15,7 @@ limitations under the License.
 
 #include "tensorflow/core/framework/op.h"
 #include "tensorflow/core/framework/shape_inference.h"
+#include "tensorflow/core/lib/core/errors.h"
 
 namespace tensorflow {
 namespace {
@@ -94,18 +95,31 @@ REGISTER_OP("NonMaxSuppression3D")
       shape_inference::ShapeHandle scores_shape;
       shape_inference::ShapeHandle iou_threshold_shape;
       shape_inference::ShapeHandle score_threshold_shape;
-      TF_RETURN_IF_ERROR(c->WithRank(c->input(0), 2, &bboxes_shape));
-      TF_RETURN_IF_ERROR(c->WithRank(c->input(1), 2, &scores_shape));
       TF_RETURN_IF_ERROR(c->WithRank(c->input(2), 1, &iou_threshold_shape));
       TF_RETURN_IF_ERROR(c->WithRank(c->input(3), 1, &score_threshold_shape));
+      if (!c->RankKnown(c->input(1))) {
+        c->set_output(0, c->UnknownShape());
+        c->set_output(1, c->UnknownShape());
+        c->set_output(2, c->UnknownShape());
+        return tensorflow::Status::OK();
+      }
+      const int32 rank = c->Rank(c->input(1));
+      if (rank != 2 && rank != 3) {
+        return errors::InvalidArgument("scores must be of rank 2 or 3, got ",
+                                       rank);
+      }
+      TF_RETURN_IF_ERROR(c->WithRank(c->input(0), rank, &bboxes_shape));
+      TF_RETURN_IF_ERROR(c->WithRank(c->input(1), rank, &scores_shape));
 
       int max_boxes_per_class;
       TF_RETURN_IF_ERROR(
           c->GetAttr("max_boxes_per_class", &max_boxes_per_class));
-      auto num_classes = c->Dim(c->input(1), 1);
+      auto num_classes = c->Dim(scores_shape, rank - 1);
 
       shape_inference::ShapeHandle output_shape =
-          c->MakeShape({num_classes, max_boxes_per_class});
+          rank == 3 ? c->MakeShape({c->Dim(scores_shape, 0), num_classes,
+                                    max_boxes_per_class})
+                    : c->MakeShape({num_classes, max_boxes_per_class});
       c->set_output(0, output_shape);
       c->set_output(1, output_shape);
       c->set_output(2, output_shape);
@@ -118,10 +132,15 @@ This implementation is rotation and class aware, and for each class takes the
 best boxes that are above our score_threshold and also don't overlap more than
 our nms_iou_threshold with any better scoring boxes.
 
-bboxes: A tf.float32 Tensor of shape [num_bboxes, 7] where the box is of
-  format [center_x, center_y, center_z, dim_x, dim_y, dim_z, heading].
-scores: A tf.float32 Tensor of shape [num_bboxes, num_classes] with a score
-  per box for each class.
+The inputs may have a leading batch dimension, in which case all examples and
+classes are processed in a single call, in parallel over the CPU threads. The
+exact rotated IoU is only computed for boxes whose axis aligned bounds overlap.
+
+bboxes: A tf.float32 Tensor of shape [num_bboxes, 7] or
+  [batch_size, num_bboxes, 7] where the box is of format
+  [center_x, center_y, center_z, dim_x, dim_y, dim_z, heading].
+scores: A tf.float32 Tensor of shape [num_bboxes, num_classes] or
+  [batch_size, num_bboxes, num_classes] with a score per box for each class.
 nms_iou_threshold: A tf.float32 Tensor of shape [num_classes] specifying the
   max overlap between two boxes we allow before saying these boxes overlap,
   and suppressing one of them.
@@ -131,14 +150,14 @@ max_boxes_per_class: An integer specifying how many (at most) boxes to
   return for each class.
 
 bbox_indices: A tf.int32 Tensor of shape
-  [num_classes, max_boxes_per_class] with the indices of selected boxes
-  for each class.
+  [(batch_size,) num_classes, max_boxes_per_class] with the indices of selected
+  boxes for each class.
 bbox_scores: A tf.float32 Tensor of shape
-  [num_classes, max_boxes_per_class] with the score of selected boxes
-  for each class.
+  [(batch_size,) num_classes, max_boxes_per_class] with the score of selected
+  boxes for each class.
 valid_mask: A tf.float32 Tensor of shape
-  [num_classes, max_boxes_per_class] with a 1 for a valid box and a 0
-  for invalid boxes for each class.
+  [(batch_size,) num_classes, max_boxes_per_class] with a 1 for a valid box and
+  a 0 for invalid boxes for each class.
 )doc");
 
 REGISTER_OP("AveragePrecision3D")
@@ -13,8 +13,8 @@ See the License for the specific language governing permissions and
 limitations under the License.
 ==============================================================================*/
 
-#include <queue>
-#include <unordered_map>
+#include <algorithm>
+#include <cmath>
 #include <vector>
 
 #include "lingvo/tasks/car/ops/box_util.h"
@@ -23,18 +23,48 @@ limitations under the License.
 #include "tensorflow/core/framework/tensor_shape.h"
 #include "tensorflow/core/lib/core/errors.h"
 #include "tensorflow/core/platform/logging.h"
+#include "tensorflow/core/util/work_sharder.h"
 
 namespace tensorflow {
 namespace lingvo {
 namespace {
 
-struct PairHashFn {
-  size_t operator()(const std::pair<int32, int32>& pair) const {
-    return std::hash<uint64>{}((static_cast<uint64>(pair.first) << 32) |
-                               static_cast<uint64>(pair.second));
-  }
+// Slack added to the axis aligned bounds, so that rounding errors never make
+// the prefilter skip a pair of boxes that intersect.
+constexpr double kBoundsSlack = 1e-6;
+
+struct Candidate {
+  int box_idx;
+  float score;
+};
+
+// A candidate selected by NMS, with the axis aligned bounds of its box.
+struct SelectedBox {
+  Candidate candidate;
+  box::Upright3DBox box;
+  double min_x, max_x, min_y, max_y;
 };
 
+// Returns the 3D box of the 7-DOF `bbox`, and its axis aligned bounds in x/y.
+SelectedBox MakeSelectedBox(const Candidate& candidate, const float* bbox) {
+  const double half_w = std::abs(bbox[3]) / 2.0;
+  const double half_h = std::abs(bbox[4]) / 2.0;
+  const double cos_r = std::abs(std::cos(static_cast<double>(bbox[6])));
+  const double sin_r = std::abs(std::sin(static_cast<double>(bbox[6])));
+  const double extent_x = half_w * cos_r + half_h * sin_r + kBoundsSlack;
+  const double extent_y = half_w * sin_r + half_h * cos_r + kBoundsSlack;
+  return SelectedBox{candidate,         box::ParseBox(bbox),
+                     bbox[0] - extent_x, bbox[0] + extent_x,
+                     bbox[1] - extent_y, bbox[1] + extent_y};
+}
+
+// Returns false if the two boxes certainly do not intersect.
+bool MaybeOverlaps(const SelectedBox& a, const SelectedBox& b) {
+  return a.min_x <= b.max_x && b.min_x <= a.max_x && a.min_y <= b.max_y &&
+         b.min_y <= a.max_y && a.box.z_min < b.box.z_max &&
+         b.box.z_min < a.box.z_max;
+}
+
 class NonMaxSuppression3DOp : public OpKernel {
  public:
   explicit NonMaxSuppression3DOp(OpKernelConstruction* ctx) : OpKernel(ctx) {
@@ -47,11 +77,14 @@ class NonMaxSuppression3DOp : public OpKernel {
     const Tensor& class_scores = ctx->input(1);
     const Tensor& nms_iou_threshold = ctx->input(2);
     const Tensor& score_threshold = ctx->input(3);
-    OP_REQUIRES(ctx, TensorShapeUtils::IsMatrix(bboxes_3d.shape()),
-                errors::InvalidArgument("In[0] must be a matrix, but get ",
-                                        bboxes_3d.shape().DebugString()));
-    OP_REQUIRES(ctx, TensorShapeUtils::IsMatrix(class_scores.shape()),
-                errors::InvalidArgument("In[1] must be a matrix, but get ",
+    const int rank = bboxes_3d.dims();
+    OP_REQUIRES(ctx, rank == 2 || rank == 3,
+                errors::InvalidArgument(
+                    "In[0] must be a matrix or a rank 3 tensor, but get ",
+                    bboxes_3d.shape().DebugString()));
+    OP_REQUIRES(ctx, class_scores.dims() == rank,
+                errors::InvalidArgument("In[1] must be of rank ", rank,
+                                        ", but get ",
                                         class_scores.shape().DebugString()));
     OP_REQUIRES(
         ctx, TensorShapeUtils::IsVector(nms_iou_threshold.shape()),
@@ -60,10 +93,19 @@ class NonMaxSuppression3DOp : public OpKernel {
     OP_REQUIRES(ctx, TensorShapeUtils::IsVector(score_threshold.shape()),
                 errors::InvalidArgument("In[3] must be a vector, but get ",
                                         score_threshold.shape().DebugString()));
-    OP_REQUIRES(ctx, bboxes_3d.dim_size(1) == 7,
-                errors::InvalidArgument("bboxes must be of shape [-1, 7]. Is: ",
-                                        bboxes_3d.shape().DebugString()));
-    const int num_classes = class_scores.dim_size(1);
+    OP_REQUIRES(
+        ctx, bboxes_3d.dim_size(rank - 1) == 7,
+        errors::InvalidArgument("bboxes must be of shape [..., 7]. Is: ",
+                                bboxes_3d.shape().DebugString()));
+    for (int i = 0; i < rank - 1; ++i) {
+      OP_REQUIRES(ctx, bboxes_3d.dim_size(i) == class_scores.dim_size(i),
+                  errors::InvalidArgument(
+                      "bboxes and scores must have the same leading "
+                      "dimensions: ",
+                      bboxes_3d.shape().DebugString(), " vs ",
+                      class_scores.shape().DebugString()));
+    }
+    const int num_classes = class_scores.dim_size(rank - 1);
     OP_REQUIRES(ctx, nms_iou_threshold.dim_size(0) == num_classes,
                 errors::InvalidArgument(
                     "nms_iou_threshold must be of shape [num_classes]. Is: ",
@@ -76,81 +118,91 @@ class NonMaxSuppression3DOp : public OpKernel {
 
   void Compute(OpKernelContext* ctx) override {
     CheckShapes(ctx);
+    if (!ctx->status().ok()) {
+      return;
+    }
     const Tensor& bboxes_3d = ctx->input(0);
     const Tensor& class_scores = ctx->input(1);
     const Tensor& nms_iou_threshold = ctx->input(2);
     const Tensor& score_threshold = ctx->input(3);
 
-    const int num_bboxes = bboxes_3d.dim_size(0);
-    const int num_classes = class_scores.dim_size(1);
-
-    // Parse data into usable forms
-    std::vector<box::Upright3DBox> boxes = box::ParseBoxesFromTensor(bboxes_3d);
-    const auto& t_class_scores = class_scores.matrix<float>();
-    const auto& t_nms_iou_threshold = nms_iou_threshold.vec<float>();
-    const auto& t_score_threshold = score_threshold.vec<float>();
+    // A matrix input is processed as a batch of one example.
+    const bool batched = bboxes_3d.dims() == 3;
+    const int batch_size = batched ? bboxes_3d.dim_size(0) : 1;
+    const int num_bboxes = bboxes_3d.dim_size(bboxes_3d.dims() - 2);
+    const int num_classes = class_scores.dim_size(class_scores.dims() - 1);
 
-    struct Candidate {
-      int box_idx;
-      float score;
-    };
-
-    auto score_cmp = [](const Candidate& box1, const Candidate& box2) {
-      return box1.score < box2.score;
-    };
+    const auto t_bboxes =
+        bboxes_3d.shaped<float, 3>({batch_size, num_bboxes, 7});
+    const auto t_class_scores =
+        class_scores.shaped<float, 3>({batch_size, num_bboxes, num_classes});
+    const auto t_nms_iou_threshold = nms_iou_threshold.vec<float>();
+    const auto t_score_threshold = score_threshold.vec<float>();
 
     // Allocate outputs
     Tensor* bbox_indices = nullptr;
     Tensor* bbox_scores = nullptr;
     Tensor* valid_mask = nullptr;
 
-    auto output_shape = TensorShape({num_classes, max_boxes_per_class_});
+    auto output_shape =
+        batched
+            ? TensorShape({batch_size, num_classes, max_boxes_per_class_})
+            : TensorShape({num_classes, max_boxes_per_class_});
     OP_REQUIRES_OK(
         ctx, ctx->allocate_output("bbox_indices", output_shape, &bbox_indices));
     OP_REQUIRES_OK(
         ctx, ctx->allocate_output("bbox_scores", output_shape, &bbox_scores));
     OP_REQUIRES_OK(
         ctx, ctx->allocate_output("valid_mask", output_shape, &valid_mask));
-    auto t_bbox_indices = bbox_indices->matrix<int>();
-    auto t_bbox_scores = bbox_scores->matrix<float>();
-    auto t_valid_mask = valid_mask->matrix<float>();
+    auto t_bbox_indices = bbox_indices->shaped<int32, 3>(
+        {batch_size, num_classes, max_boxes_per_class_});
+    auto t_bbox_scores = bbox_scores->shaped<float, 3>(
+        {batch_size, num_classes, max_boxes_per_class_});
+    auto t_valid_mask = valid_mask->shaped<float, 3>(
+        {batch_size, num_classes, max_boxes_per_class_});
     t_bbox_indices.setZero();
     t_bbox_scores.setZero();
     t_valid_mask.setZero();
 
-    // Create cache for IoU calculations
-    // Keys are pairs of box ids where the first id is always less than the
-    // second id due to symmetry in the calculation.
-    std::unordered_map<std::pair<int32, int32>, float, PairHashFn> iou_cache;
-    auto get_iou = [&iou_cache, &boxes](int32 idx1, int32 idx2) {
-      std::pair<int32, int32> key{std::min(idx1, idx2), std::max(idx1, idx2)};
-      auto it = iou_cache.find(key);
-      if (it != iou_cache.end()) {
-        return it->second;
-      }
-
-      float iou = boxes[idx1].IoU(boxes[idx2]);
-      iou_cache.emplace(key, iou);
-      return iou;
+    // Higher scores first. Ties are broken by the box index to make the
+    // output deterministic.
+    auto score_cmp = [](const Candidate& box1, const Candidate& box2) {
+      return box1.score < box2.score ||
+             (box1.score == box2.score && box1.box_idx > box2.box_idx);
     };
 
-    for (int cls_idx = 0; cls_idx < num_classes; ++cls_idx) {
-      // Use priority queue to sort candidates above the score threshold
-      std::priority_queue<Candidate, std::deque<Candidate>, decltype(score_cmp)>
-          candidate_priority_queue(score_cmp);
+    // Runs NMS on a single (example, class) pair. Every pair is independent,
+    // so all pairs of the batch are sharded over the CPU worker threads.
+    auto nms_fn = [&](int64 example_idx, int64 cls_idx) {
+      const float cls_score_threshold = t_score_threshold(cls_idx);
+      const float cls_iou_threshold = t_nms_iou_threshold(cls_idx);
+      std::vector<Candidate> candidates;
       for (int box_idx = 0; box_idx < num_bboxes; ++box_idx) {
-        if (t_class_scores(box_idx, cls_idx) >= t_score_threshold(cls_idx)) {
-          candidate_priority_queue.emplace(
-              Candidate({box_idx, t_class_scores(box_idx, cls_idx)}));
+        const float score = t_class_scores(example_idx, box_idx, cls_idx);
+        if (score >= cls_score_threshold) {
+          candidates.push_back(Candidate({box_idx, score}));
         }
       }
+      // Most classes of most examples have no box above the threshold.
+      if (candidates.empty()) {
+        return;
+      }
 
-      std::vector<Candidate> selected;
-      Candidate next_candidate;
+      // Candidates are popped lazily from a heap, since we usually stop after
+      // max_boxes_per_class_ selections long before all are sorted.
+      std::make_heap(candidates.begin(), candidates.end(), score_cmp);
+      // Disjoint boxes have an IoU of 0, which only suppresses when the
+      // threshold is negative.
+      const bool can_skip_disjoint = cls_iou_threshold >= 0;
+      std::vector<SelectedBox> selected;
+      auto heap_end = candidates.end();
       while ((selected.size() < max_boxes_per_class_) &&
-             (!candidate_priority_queue.empty())) {
-        next_candidate = candidate_priority_queue.top();
-        candidate_priority_queue.pop();
+             (heap_end != candidates.begin())) {
+        std::pop_heap(candidates.begin(), heap_end, score_cmp);
+        --heap_end;
+        const Candidate& next_candidate = *heap_end;
+        SelectedBox next_box = MakeSelectedBox(
+            next_candidate, &t_bboxes(example_idx, next_candidate.box_idx, 0));
 
         // Idea taken from tensorflow/core/kernels/non_max_suppression_op.cc
         // Overlapping boxes are likely to have similar scores,
@@ -159,15 +211,20 @@ class NonMaxSuppression3DOp : public OpKernel {
         bool should_select = true;
         for (int selected_idx = static_cast<int>(selected.size()) - 1;
              selected_idx >= 0; --selected_idx) {
-          if (get_iou(next_candidate.box_idx, selected[selected_idx].box_idx) >
-              t_nms_iou_threshold(cls_idx)) {
+          const SelectedBox& other = selected[selected_idx];
+          // The exact rotated IoU is only computed for boxes whose axis
+          // aligned bounds overlap.
+          if (can_skip_disjoint && !MaybeOverlaps(next_box, other)) {
+            continue;
+          }
+          if (next_box.box.IoU(other.box) > cls_iou_threshold) {
             should_select = false;
             break;
           }
         }
 
         if (should_select) {
-          selected.push_back(next_candidate);
+          selected.push_back(std::move(next_box));
         }
       }
 
@@ -175,12 +232,22 @@ class NonMaxSuppression3DOp : public OpKernel {
       // We can just use size since we protect against ever selecting more
       // than max_boxes_per_class_ per class.
       for (int insert_idx = 0; insert_idx < selected.size(); insert_idx++) {
-        const auto& to_insert = selected[insert_idx];
-        t_bbox_indices(cls_idx, insert_idx) = to_insert.box_idx;
-        t_bbox_scores(cls_idx, insert_idx) = to_insert.score;
-        t_valid_mask(cls_idx, insert_idx) = 1.0;
+        const auto& to_insert = selected[insert_idx].candidate;
+        t_bbox_indices(example_idx, cls_idx, insert_idx) = to_insert.box_idx;
+        t_bbox_scores(example_idx, cls_idx, insert_idx) = to_insert.score;
+        t_valid_mask(example_idx, cls_idx, insert_idx) = 1.0;
       }
-    }
+    };
+
+    auto workers = ctx->device()->tensorflow_cpu_worker_threads();
+    // Scanning the scores dominates the cost of classes without candidates.
+    const int64 cost_per_unit = 10 * num_bboxes + 1000 * max_boxes_per_class_;
+    Shard(workers->num_threads, workers->workers, batch_size * num_classes,
+          cost_per_unit, [&](int64 start, int64 limit) {
+            for (int64 i = start; i < limit; ++i) {
+              nms_fn(i / num_classes, i % num_classes);
+            }
+          });
   }
 
  private:
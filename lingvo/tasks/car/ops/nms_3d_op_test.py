@@ -161,6 +161,72 @@ class Nms3dOpTest(test_utils.TestCase):
         self.assertAllEqual(per_class_scores[0, per_class_mask],
                             multiclass_scores[cls_idx, multiclass_mask])
 
+  def _GreedyNMS(self, ious, scores, iou_threshold, score_threshold,
+                 max_boxes):
+    selected = []
+    for i in np.argsort(-scores, kind='mergesort'):
+      if scores[i] < score_threshold or len(selected) == max_boxes:
+        break
+      if all(ious[i, j] <= iou_threshold for j in selected):
+        selected.append(i)
+    return selected
+
+  def testBatchedMatchesPerExample(self):
+    np.random.seed(12345)
+    batch_size, num_bboxes, num_classes = 4, 300, 3
+    max_boxes_per_class = 20
+    centers = np.random.uniform(-10., 10., size=(batch_size, num_bboxes, 3))
+    dims = np.random.uniform(0.5, 4., size=(batch_size, num_bboxes, 3))
+    headings = np.random.uniform(
+        -np.pi, np.pi, size=(batch_size, num_bboxes, 1))
+    bboxes_3d = np.concatenate([centers, dims, headings],
+                               axis=-1).astype(np.float32)
+    class_scores = np.random.uniform(
+        size=(batch_size, num_bboxes, num_classes)).astype(np.float32)
+    # The last example has no box above the score threshold.
+    class_scores[-1] *= 0.1
+    nms_iou_threshold = [0.1, 0.3, 0.5]
+    score_threshold = [0.3, 0.5, 0.2]
+    with self.session() as sess:
+      batched_outputs = ops.non_max_suppression_3d(
+          bboxes_3d,
+          class_scores,
+          nms_iou_threshold=nms_iou_threshold,
+          score_threshold=score_threshold,
+          max_boxes_per_class=max_boxes_per_class)
+      for output in batched_outputs:
+        self.assertEqual([batch_size, num_classes, max_boxes_per_class],
+                         output.shape.as_list())
+      per_example_outputs = [
+          ops.non_max_suppression_3d(
+              bboxes_3d[b],
+              class_scores[b],
+              nms_iou_threshold=nms_iou_threshold,
+              score_threshold=score_threshold,
+              max_boxes_per_class=max_boxes_per_class)
+          for b in range(batch_size)
+      ]
+      pairwise_ious = [
+          ops.pairwise_iou3d(bboxes_3d[b], bboxes_3d[b])
+          for b in range(batch_size)
+      ]
+      batched, per_example, pairwise_ious = sess.run(
+          [batched_outputs, per_example_outputs, pairwise_ious])
+
+    indices, scores, mask = batched
+    self.assertGreater(mask[0].sum(), 0)
+    self.assertEqual(0, mask[-1].sum())
+    for b in range(batch_size):
+      self.assertAllEqual(per_example[b][0], indices[b])
+      self.assertAllEqual(per_example[b][1], scores[b])
+      self.assertAllEqual(per_example[b][2], mask[b])
+      # The axis aligned prefilter does not change the selected boxes.
+      for c in range(num_classes):
+        expected = self._GreedyNMS(pairwise_ious[b], class_scores[b, :, c],
+                                   nms_iou_threshold[c], score_threshold[c],
+                                   max_boxes_per_class)
+        self.assertAllEqual(expected, indices[b, c, mask[b, c] > 0])
+
   @unittest.skip('Speed benchmark')
   def testSpeed(self):
     num_bboxes_list = [500, 1000, 10000]
@@ -122,7 +122,8 @@ def ExtractNpContent(np_dict, calib):
   bboxes_2d = np_dict["bboxes_2d"]
 
   # Transform from velodyne coordinates to camera coordinates.
-  velo_to_cam_transform = kitti_data.VeloToCameraTransformation(calib)
+  velo_to_cam_transform = kitti_data.CalibrationTransformations(
+      calib)["velo_to_camera"]
   location_cam = np.zeros((len(bboxes), 3))
   dimension_cam = np.zeros((len(bboxes), 3))
   rotation_cam = np.zeros((len(bboxes), 1))
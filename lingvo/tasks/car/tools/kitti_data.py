@@ -18,9 +18,15 @@
 from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
+
+import hashlib
+
 from lingvo import compat as tf
 import numpy as np
 
+# Transformations derived from calibrations, keyed by CalibrationFingerprint.
+_CALIBRATION_TRANSFORMATIONS_CACHE = {}
+
 
 def LoadVeloBinFile(filepath):
   """Reads and parse raw KITTI velodyne binary file.
@@ -286,6 +292,49 @@ def CameraToVeloTransformation(calib):
   return np.linalg.pinv(VeloToCameraTransformation(calib))
 
 
+def CalibrationFingerprint(calib):
+  """Returns a string identifying the matrices of a calibration dictionary.
+
+  Args:
+    calib: A calibration dictionary returned by LoadCalibrationFile.
+
+  Returns:
+    A hex digest string, equal for calibrations with equal matrices.
+  """
+  h = hashlib.sha1()
+  for key in sorted(calib):
+    h.update(key.encode('utf-8'))
+    h.update(np.ascontiguousarray(calib[key], dtype=np.float64).tobytes())
+  return h.hexdigest()
+
+
+def CalibrationTransformations(calib):
+  """Returns the velo, camera and image plane transformations of a calibration.
+
+  KITTI frames recorded with the same sensor setup share their calibration, so
+  the transformations are computed once per CalibrationFingerprint and cached.
+
+  Args:
+    calib: A calibration dictionary returned by LoadCalibrationFile.
+
+  Returns:
+    A dictionary with keys velo_to_image_plane, velo_to_camera and
+    camera_to_velo containing read-only numpy transformation matrices.
+  """
+  fingerprint = CalibrationFingerprint(calib)
+  transformations = _CALIBRATION_TRANSFORMATIONS_CACHE.get(fingerprint)
+  if transformations is None:
+    transformations = {
+        'velo_to_image_plane': VeloToImagePlaneTransformation(calib),
+        'velo_to_camera': VeloToCameraTransformation(calib),
+        'camera_to_velo': CameraToVeloTransformation(calib),
+    }
+    for v in transformations.values():
+      v.setflags(write=False)
+    _CALIBRATION_TRANSFORMATIONS_CACHE[fingerprint] = transformations
+  return transformations
+
+
 def AnnotateKITTIObjectsWithBBox3D(objects, calib):
   """Add our canonical bboxes 3d format to KITTI objects.
 
@@ -302,8 +351,8 @@ def AnnotateKITTIObjectsWithBBox3D(objects, calib):
   """
 
   # All objects will share the same transformation matrix, which we compute
-  # once here.
-  transformation_matrix = CameraToVeloTransformation(calib)
+  # once per calibration.
+  transformation_matrix = CalibrationTransformations(calib)['camera_to_velo']
   for obj in objects:
     obj['bbox3d'] = _KITTIObjectToBBox3D(obj, transformation_matrix)
     obj['has_3d_info'] = _KITTIObjectHas3DInfo(obj)
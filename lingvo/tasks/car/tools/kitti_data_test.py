@@ -20,9 +20,11 @@ from __future__ import division
 from __future__ import print_function
 
 from lingvo import compat as tf
+from lingvo.core import py_utils
 from lingvo.core import test_helper
 from lingvo.core import test_utils
 from lingvo.tasks.car import geometry
+from lingvo.tasks.car import input_preprocessors
 from lingvo.tasks.car.tools import kitti_data
 import numpy as np
 
@@ -72,6 +74,33 @@ class KittiDataTest(test_utils.TestCase):
     cam_to_velo = kitti_data.CameraToVeloTransformation(calib)
     self.assertAllClose(cam_to_velo.dot(velo_to_cam), np.eye(4))
 
+  def testCalibrationTransformations(self):
+    calib = kitti_data.LoadCalibrationFile(self._calib_file)
+    transformations = kitti_data.CalibrationTransformations(calib)
+    self.assertAllClose(
+        kitti_data.VeloToImagePlaneTransformation(calib),
+        transformations['velo_to_image_plane'])
+    self.assertAllClose(
+        kitti_data.VeloToCameraTransformation(calib),
+        transformations['velo_to_camera'])
+    self.assertAllClose(
+        kitti_data.CameraToVeloTransformation(calib),
+        transformations['camera_to_velo'])
+
+    # Loading the same calibration again hits the cache.
+    same_calib = kitti_data.LoadCalibrationFile(self._calib_file)
+    self.assertEqual(
+        kitti_data.CalibrationFingerprint(calib),
+        kitti_data.CalibrationFingerprint(same_calib))
+    self.assertIs(transformations,
+                  kitti_data.CalibrationTransformations(same_calib))
+
+    other_calib = dict(calib)
+    other_calib['P2'] = calib['P2'] * 2.
+    self.assertNotEqual(
+        kitti_data.CalibrationFingerprint(calib),
+        kitti_data.CalibrationFingerprint(other_calib))
+
   def testAnnotateKITTIObjectsWithBBox3D(self):
     objects = kitti_data.LoadLabelFile(self._label_file)
     calib = kitti_data.LoadCalibrationFile(self._calib_file)
@@ -139,5 +168,62 @@ class KittiDataTest(test_utils.TestCase):
     self.assertAllClose(bbox, obj['bbox'], atol=0.1)
 
 
+class KITTIFrustumBenchmark(tf.test.Benchmark):
+  """Benchmarks dropping points outside of the camera frustum per example."""
+
+  def _Features(self, num_points):
+    calib = kitti_data.LoadCalibrationFile(
+        test_helper.test_src_dir_path(
+            'tasks/car/testdata/kitti_raw_calib_testdata.txt'))
+    velo_to_image_plane = kitti_data.CalibrationTransformations(
+        calib)['velo_to_image_plane']
+    # A KITTI scan has ~120k points within ~80m around the car.
+    points_xyz = np.random.uniform(
+        low=[-80., -80., -3.], high=[80., 80., 3.],
+        size=(num_points, 3)).astype(np.float32)
+    return py_utils.NestedMap(
+        lasers=py_utils.NestedMap(
+            points_xyz=tf.constant(points_xyz),
+            points_feature=tf.zeros([num_points, 1])),
+        images=py_utils.NestedMap(
+            velo_to_image_plane=tf.constant(
+                velo_to_image_plane, dtype=tf.float32),
+            width=tf.constant([1242]),
+            height=tf.constant([375])))
+
+  def benchmarkPointsToImagePlane(self):
+    with tf.Graph().as_default(), tf.Session() as sess:
+      features = self._Features(120000)
+      points_image = geometry.PointsToImagePlane(
+          features.lasers.points_xyz, features.images.velo_to_image_plane)
+      width = tf.cast(features.images.width, tf.float32)
+      height = tf.cast(features.images.height, tf.float32)
+      in_image_plane = ((points_image[:, 0] >= 0) &
+                        (points_image[:, 0] <= width) &
+                        (points_image[:, 1] >= 0) &
+                        (points_image[:, 1] <= height))
+      print(self.run_op_benchmark(sess, in_image_plane.op, min_iters=100))
+
+  def benchmarkPointsInImagePlane(self):
+    with tf.Graph().as_default(), tf.Session() as sess:
+      features = self._Features(120000)
+      in_image_plane = geometry.PointsInImagePlane(
+          features.lasers.points_xyz, features.images.velo_to_image_plane,
+          features.images.width, features.images.height)
+      print(self.run_op_benchmark(sess, in_image_plane.op, min_iters=100))
+
+  def benchmarkKITTIDropPointsOutOfFrustum(self):
+    with tf.Graph().as_default(), tf.Session() as sess:
+      p = input_preprocessors.KITTIDropPointsOutOfFrustum.Params()
+      preprocessor = p.Instantiate()
+      features = preprocessor.TransformFeatures(self._Features(120000))
+      print(
+          self.run_op_benchmark(
+              sess,
+              tf.group(features.lasers.points_xyz,
+                       features.lasers.points_feature),
+              min_iters=100))
+
+
 if __name__ == '__main__':
   tf.test.main()
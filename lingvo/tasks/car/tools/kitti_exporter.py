@@ -203,16 +203,15 @@ def _ReadObjectDataset(root_dir, frame_names):
     feature['object/velo/bbox/dim_xyz'].float_list.value[:] = dim_xyzs
     feature['object/velo/bbox/phi'].float_list.value[:] = phis
 
-    # Transformation matrices
-    velo_to_image_plane = kitti_data.VeloToImagePlaneTransformation(calib_dict)
+    # Transformation matrices, precomputed here so that input pipelines never
+    # derive them from the calibration.
+    transformations = kitti_data.CalibrationTransformations(calib_dict)
     feature['transform/velo_to_image_plane'].float_list.value[:] = (
-        velo_to_image_plane.ravel().tolist())
-    velo_to_camera = kitti_data.VeloToCameraTransformation(calib_dict)
+        transformations['velo_to_image_plane'].ravel().tolist())
     feature['transform/velo_to_camera'].float_list.value[:] = (
-        velo_to_camera.ravel().tolist())
-    cam_to_velo = kitti_data.CameraToVeloTransformation(calib_dict)
+        transformations['velo_to_camera'].ravel().tolist())
     feature['transform/camera_to_velo'].float_list.value[:] = (
-        cam_to_velo.ravel().tolist())
+        transformations['camera_to_velo'].ravel().tolist())
 
     examples.append(example)
     if frame_index % 100 == 0:
@@ -144,71 +144,51 @@ class WaymoAPMetrics(ap_metric.APMetrics):
         gt=py_utils.NestedMap(imgid=gt_imgids, bbox=gt_boxes, speed=gt_speeds),
         pd=py_utils.NestedMap(imgid=p.imgids, bbox=p.boxes, score=p.scores))
 
-  def _BuildMetric(self, feed_data, classid):
-    """Construct tensors and the feed_dict for Waymo metric op.
+  def _BuildMetric(self, classid):
+    """Construct tensors and placeholders for Waymo metric op.
 
     Args:
-      feed_data: a NestedMap returned by _GetData().
       classid: integer.
 
     Returns:
-      A tuple of 3 dicts:
+      A tuple (scalar_metrics, curve_metrics, placeholders):
 
       - scalar_metrics: a dict mapping all the metric names to fetch tensors.
-      - curves: a dict mapping all the curve names to fetch tensors.
-      - feed_dict: a dict mapping the tensors in feed_tensors to feed values.
+      - curve_metrics: a dict mapping all the curve names to fetch tensors.
+      - placeholders: a NestedMap of placeholders, fed with the values at the
+        same keys in the output of _GetData().
     """
     breakdown_names = config_util.get_breakdown_names_from_config(
         self._waymo_metric_config)
-    if feed_data is None:
-      dummy_scalar = tf.constant(np.nan)
-      dummy_curve = tf.zeros([self.metadata.NumberOfPrecisionRecallPoints(), 2],
-                             tf.float32)
-      scalar_metrics = {'ap': dummy_scalar, 'ap_ha_weighted': dummy_scalar}
-      curve_metrics = {'pr': dummy_curve, 'pr_ha_weighted': dummy_curve}
-
-      for i, metric in enumerate(breakdown_names):
-        scalar_metrics['ap_%s' % metric] = dummy_scalar
-        scalar_metrics['ap_ha_weighted_%s' % metric] = dummy_scalar
-        curve_metrics['pr_%s' % metric] = dummy_curve
-        curve_metrics['pr_ha_weighted_%s' % metric] = dummy_curve
-      return scalar_metrics, curve_metrics, {}
-
-    feed_dict = {}
-
-    f_gt_bbox = tf.placeholder(tf.float32)
-    feed_dict[f_gt_bbox] = feed_data.gt.bbox
-
-    f_gt_imgid = tf.placeholder(tf.int32)
-    feed_dict[f_gt_imgid] = feed_data.gt.imgid
-
-    f_gt_speed = tf.placeholder(tf.float32)
-    feed_dict[f_gt_speed] = feed_data.gt.speed
-
-    f_pd_bbox = tf.placeholder(tf.float32)
-    feed_dict[f_pd_bbox] = feed_data.pd.bbox
-
-    f_pd_imgid = tf.placeholder(tf.int32)
-    feed_dict[f_pd_imgid] = feed_data.pd.imgid
-
-    f_pd_score = tf.placeholder(tf.float32)
-    feed_dict[f_pd_score] = feed_data.pd.score
-
-    num_gt_bboxes = feed_data.gt.imgid.shape[0]
-    num_pd_bboxes = feed_data.pd.imgid.shape[0]
-    gt_class_ids = tf.constant(classid, dtype=tf.uint8, shape=[num_gt_bboxes])
-    pd_class_ids = tf.constant(classid, dtype=tf.uint8, shape=[num_pd_bboxes])
+    placeholders = py_utils.NestedMap(
+        gt=py_utils.NestedMap(
+            bbox=tf.placeholder(tf.float32),
+            imgid=tf.placeholder(tf.int32),
+            speed=tf.placeholder(tf.float32)),
+        pd=py_utils.NestedMap(
+            bbox=tf.placeholder(tf.float32),
+            imgid=tf.placeholder(tf.int32),
+            score=tf.placeholder(tf.float32)))
+    gt_imgid = placeholders.gt.imgid
+    pd_imgid = placeholders.pd.imgid
+
+    # The class ids are filled in the graph so that it does not depend on the
+    # number of boxes.
+    gt_class_ids = tf.fill(
+        tf.shape(gt_imgid), tf.constant(classid, dtype=tf.uint8))
+    pd_class_ids = tf.fill(
+        tf.shape(pd_imgid), tf.constant(classid, dtype=tf.uint8))
     ap, ap_ha, pr, pr_ha, _ = py_metrics_ops.detection_metrics(
-        prediction_bbox=f_pd_bbox,
+        prediction_bbox=placeholders.pd.bbox,
         prediction_type=pd_class_ids,
-        prediction_score=f_pd_score,
-        prediction_frame_id=tf.cast(f_pd_imgid, tf.int64),
-        prediction_overlap_nlz=tf.zeros_like(f_pd_imgid, dtype=tf.bool),
-        ground_truth_bbox=f_gt_bbox,
+        prediction_score=placeholders.pd.score,
+        prediction_frame_id=tf.cast(pd_imgid, tf.int64),
+        prediction_overlap_nlz=tf.zeros_like(pd_imgid, dtype=tf.bool),
+        ground_truth_bbox=placeholders.gt.bbox,
         ground_truth_type=gt_class_ids,
-        ground_truth_frame_id=tf.cast(f_gt_imgid, tf.int64),
-        ground_truth_difficulty=tf.zeros_like(f_gt_imgid, dtype=tf.uint8),
-        ground_truth_speed=f_gt_speed,
+        ground_truth_frame_id=tf.cast(gt_imgid, tf.int64),
+        ground_truth_difficulty=tf.zeros_like(gt_imgid, dtype=tf.uint8),
+        ground_truth_speed=placeholders.gt.speed,
         config=self._waymo_metric_config.SerializeToString())
 
     # All tensors returned by Waymo's metric op have a leading dimension
@@ -223,7 +203,23 @@ class WaymoAPMetrics(ap_metric.APMetrics):
       scalar_metrics['ap_ha_weighted_%s' % metric] = ap_ha[i]
       curve_metrics['pr_%s' % metric] = pr[i]
       curve_metrics['pr_ha_weighted_%s' % metric] = pr_ha[i]
-    return scalar_metrics, curve_metrics, feed_dict
+    return scalar_metrics, curve_metrics, placeholders
+
+  def _DummyMetrics(self, classid):
+    """Returns NaN APs and all zero PR curves for every breakdown."""
+    breakdown_names = config_util.get_breakdown_names_from_config(
+        self._waymo_metric_config)
+    dummy_scalar = np.float32(np.nan)
+    dummy_curve = np.zeros([self.metadata.NumberOfPrecisionRecallPoints(), 2],
+                           np.float32)
+    scalar_metrics = {'ap': dummy_scalar, 'ap_ha_weighted': dummy_scalar}
+    curve_metrics = {'pr': dummy_curve, 'pr_ha_weighted': dummy_curve}
+    for metric in breakdown_names:
+      scalar_metrics['ap_%s' % metric] = dummy_scalar
+      scalar_metrics['ap_ha_weighted_%s' % metric] = dummy_scalar
+      curve_metrics['pr_%s' % metric] = dummy_curve
+      curve_metrics['pr_ha_weighted_%s' % metric] = dummy_curve
+    return scalar_metrics, curve_metrics
 
   @property
   def value(self):
@@ -18,6 +18,7 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import functools
 import math
 import lingvo.compat as tf
 from lingvo.core import attention
@@ -29,6 +30,7 @@ from lingvo.core import model_helper
 from lingvo.core import plot
 from lingvo.core import py_utils
 from lingvo.core import quant_utils
+from lingvo.core import remat_policy
 from lingvo.core import rnn_cell
 from lingvo.core import rnn_layers
 from lingvo.core import summary_utils
@@ -885,6 +887,21 @@ class TransformerDecoder(MTBaseDecoder):
     p.Define(
         'use_lang_dependent_atten', False, 'If True, attention between '
         'encoder and decoder is language dependent.')
+    p.Define(
+        'early_exit_layers', None,
+        'If set, a list of the indices of the Transformer layers after which '
+        'ExtendStep may exit early, i.e. skip the next layers. An exit '
+        'computes the logits of the shared softmax on the layer output, and '
+        'exits if the top-1 probability of every hypothesis is at least '
+        'early_exit_threshold. Only used in decoding.')
+    p.Define(
+        'early_exit_threshold', 0.9,
+        'The min top-1 probability of the hypotheses to exit early, after '
+        'one of early_exit_layers. Within the shortlist if there is one.')
+    p.Define(
+        'shortlist', None, 'If set, the params of a shortlist.VocabShortlist. '
+        'Decoding then computes the softmax only over the target ids of '
+        'the shortlist of the batch, see AddShortlistCandidates.')
 
     # Default config for the token embedding.
     p.token_emb.vocab_size = 32000
@@ -977,6 +994,22 @@ class TransformerDecoder(MTBaseDecoder):
       p.softmax.input_dim = p.model_dim
       self.CreateChild('softmax', p.softmax)
 
+      if p.shortlist:
+        shortlist_p = p.shortlist.Copy()
+        shortlist_p.target_vocab_size = p.softmax.num_classes
+        shortlist_p.special_ids = sorted(
+            set(shortlist_p.special_ids) | {p.target_sos_id, p.target_eos_id})
+        self.CreateChild('shortlist', shortlist_p)
+
+    if p.early_exit_layers:
+      assert all(0 <= i < p.num_trans_layers - 1 for i in p.early_exit_layers)
+      assert 0. < p.early_exit_threshold <= 1.
+      # The self-attention states of the skipped layers are computed from the
+      # output of the exit layer.
+      assert all(hasattr(layer, 'self_atten') for layer in self.trans)
+
+    self._remat_policy = remat_policy.Instantiate(p.remat_policy)
+
   def _ExpandToNumHyps(self, source_enc_len, num_hyps_per_beam):
     """Repeat each value according to num hyps.
 
@@ -1044,6 +1077,32 @@ class TransformerDecoder(MTBaseDecoder):
     res /= s
     return res
 
+  def _CanExitEarly(self, theta, layer_out):
+    """Returns whether all the hyps are confident enough to exit early.
+
+    The decision is made for the whole batch, as the hyps are decoded
+    together: a single hyp which is not confident runs the next layers.
+
+    Args:
+      theta: A `.NestedMap` object containing weights' values of this layer and
+        its children layers.
+      layer_out: The output of an early exit layer, [batch, model_dim].
+
+    Returns:
+      A scalar bool tensor.
+    """
+    p = self.params
+    if 'shortlist_softmax' in theta:
+      # The confidence within the shortlist, which the step log probs are of.
+      logits = self.softmax.ShortlistLogits(theta.shortlist_softmax,
+                                            [layer_out])
+    else:
+      logits = self.softmax.Logits(theta.softmax, [layer_out])
+    top1_probs = tf.reduce_max(tf.nn.softmax(logits), axis=-1)
+    return tf.reduce_all(
+        tf.greater_equal(top1_probs,
+                         tf.cast(p.early_exit_threshold, top1_probs.dtype)))
+
   def _FProp(self, theta, encoder_outputs, targets):
     """Decodes `targets` given encoded source.
 
@@ -1146,7 +1205,10 @@ class TransformerDecoder(MTBaseDecoder):
       per_layer_attn_probs = []
       for i, (layer, layer_theta) in enumerate(zip(self.trans, theta.trans)):
         # [time, batch, model_dim]
-        layer_out, probs = layer.FProp(
+        layer_out, probs = remat_policy.LayerFProp(
+            self._remat_policy,
+            i,
+            layer,
             layer_theta,
             layer_in,
             target_paddings,
@@ -1195,6 +1257,69 @@ class TransformerDecoder(MTBaseDecoder):
       encoder_outputs['init_step_ids'] = targets.ids[:, 0]
     return encoder_outputs
 
+  def AddShortlistCandidates(self, encoder_outputs, src):
+    """Adds the target vocabulary shortlist candidates to encoder_outputs.
+
+    Args:
+      encoder_outputs: a NestedMap computed by encoder.
+      src: a NestedMap containing source input fields.
+
+    Returns:
+      encoder_outputs, with the candidate target ids of each source as
+      'shortlist_candidate_ids' if p.shortlist is set, of shape
+      [num_candidates, batch].
+    """
+    p = self.params
+    if p.shortlist:
+      encoder_outputs['shortlist_candidate_ids'] = (
+          self.shortlist.CandidateIds(src.ids, src.paddings))
+    return encoder_outputs
+
+  def _AddShortlistTheta(self, theta, encoder_outputs):
+    """Adds the shortlist of the batch and its softmax weights to theta.
+
+    They are loop-invariant, so they are computed once per batch rather than at
+    each decoding step. They are of the whole batch even when the beam search
+    compacts it, which decodes the same as without compaction.
+
+    Args:
+      theta: A `.NestedMap` object containing weights' values of this layer and
+        its children layers.
+      encoder_outputs: a NestedMap computed by encoder.
+
+    Returns:
+      theta, with 'shortlist_ids', see VocabShortlist.ShortlistIds, and
+      'shortlist_softmax', see SimpleFullSoftmax.ShortlistTheta, if
+      encoder_outputs has 'shortlist_candidate_ids' and theta does not have
+      them yet.
+    """
+    if ('shortlist_candidate_ids' not in encoder_outputs or
+        'shortlist_ids' in theta):
+      return theta
+    theta = theta.copy()
+    theta.shortlist_ids = self.shortlist.ShortlistIds(
+        encoder_outputs.shortlist_candidate_ids)
+    theta.shortlist_softmax = self.softmax.ShortlistTheta(
+        theta.softmax, theta.shortlist_ids)
+    return theta
+
+  def BeamSearchDecodeWithTheta(self,
+                                theta,
+                                encoder_outputs,
+                                num_hyps_per_beam_override=0):
+    return super(TransformerDecoder, self).BeamSearchDecodeWithTheta(
+        self._AddShortlistTheta(theta, encoder_outputs), encoder_outputs,
+        num_hyps_per_beam_override)
+
+  def GreedySearchDecodeWithTheta(self, theta, encoder_outputs):
+    return super(TransformerDecoder, self).GreedySearchDecodeWithTheta(
+        self._AddShortlistTheta(theta, encoder_outputs), encoder_outputs)
+
+  def SampleTargetSequences(self, theta, encoder_outputs, random_seed):
+    return super(TransformerDecoder, self).SampleTargetSequences(
+        self._AddShortlistTheta(theta, encoder_outputs), encoder_outputs,
+        random_seed)
+
   def ExtendStep(self, theta, encoder_outputs, new_ids, t, prefix_states):
     """Extend prefix as represented by `prefix_states` by one more step.
 
@@ -1216,7 +1341,8 @@ class TransformerDecoder(MTBaseDecoder):
 
     Returns:
       A tuple (last_decoder_out, prefix_states, atten_probs), where
-      last_decoder_out is the output of the last decoder layer of
+      last_decoder_out is the output of the last decoder layer (or of the
+      layer which exited early, see early_exit_layers) of
       shape [batch, model_dim], `prefix_states` is the update prefix states,
       and atten_probs contains attention in shape [batch, src_len] for the
       given target position.
@@ -1267,40 +1393,89 @@ class TransformerDecoder(MTBaseDecoder):
       # Make a copy of the input.
       out_prefix_states = prefix_states.Pack(prefix_states.Flatten())
 
-      layer_in = input_embs
-
       # Infer true source encoder length from the padding.
       src_enc_len = tf.reduce_sum(1 - source_paddings, axis=0)
 
       # Need to expand src_enc_len to reflect multiple hypotheses.
       src_enc_len = self._ExpandToNumHyps(src_enc_len, num_hyps_per_beam)
 
-      atten_probs = []
-      for i, (layer, layer_theta) in enumerate(zip(self.trans, theta.trans)):
-        # [time, batch, model_dim]
-        layer_prefix_states = prefix_states['layer_%i' % i]
-        layer_out, probs, updated_prefix_states = layer.ExtendStep(
-            layer_theta,
-            layer_in,
-            layer_prefix_states,
-            source_encs[i],
-            source_paddings,
-            t if p.beam_search.name == 'tpu_beam_search' else None,
-            atten_idx=atten_idx)
-        out_prefix_states['layer_%i' % i] = updated_prefix_states
-        layer_in = layer_out
-        # Enforce shape: [batch, src_len]
-        probs = tf.squeeze(probs)
-        # Remove attention weight on last (EOS) token and re-normalize
-        # so that last dimension sums to 1. See b/129097156.
-        probs_3d = tf.expand_dims(probs, axis=1)
-        probs_3d = self._RemoveEOSProbs(p, probs_3d, src_enc_len)
-        probs = tf.squeeze(probs_3d, axis=1)
-
-        atten_probs.append(probs)
+      step = t if p.beam_search.name == 'tpu_beam_search' else None
+
+      def _ExtendLayers(start, layer_in):
+        """Extends the layers from start, maybe exiting early.
+
+        Args:
+          start: The index of the first layer to extend.
+          layer_in: The input of the first layer, [batch, model_dim].
+
+        Returns:
+          A tuple (layer_out, states, atten_probs_sum, num_layers), where
+          states are the updated prefix states of the layers from start, and
+          atten_probs_sum is the sum of the attention probs of the num_layers
+          layers which were not skipped.
+        """
+        states = py_utils.NestedMap()
+        atten_probs = []
+        for i in range(start, p.num_trans_layers):
+          # [time, batch, model_dim]
+          layer_prefix_states = prefix_states['layer_%i' % i]
+          layer_out, probs, updated_prefix_states = self.trans[i].ExtendStep(
+              theta.trans[i],
+              layer_in,
+              layer_prefix_states,
+              source_encs[i],
+              source_paddings,
+              step,
+              atten_idx=atten_idx)
+          states['layer_%i' % i] = updated_prefix_states
+          layer_in = layer_out
+          # Enforce shape: [batch, src_len]
+          probs = tf.squeeze(probs)
+          # Remove attention weight on last (EOS) token and re-normalize
+          # so that last dimension sums to 1. See b/129097156.
+          probs_3d = tf.expand_dims(probs, axis=1)
+          probs_3d = self._RemoveEOSProbs(p, probs_3d, src_enc_len)
+          probs = tf.squeeze(probs_3d, axis=1)
+
+          atten_probs.append(probs)
+
+          if p.early_exit_layers and i in p.early_exit_layers:
+            layer_out, rest_states, rest_probs_sum, num_rest_layers = tf.cond(
+                self._CanExitEarly(theta, layer_out),
+                functools.partial(_SkipLayers, i + 1, layer_out, probs),
+                functools.partial(_ContinueLayers, i + 1, layer_out))
+            states.update(rest_states)
+            return (layer_out, states,
+                    tf.math.add_n(atten_probs) + rest_probs_sum,
+                    len(atten_probs) + num_rest_layers)
+        return layer_out, states, tf.math.add_n(atten_probs), len(atten_probs)
+
+      def _ContinueLayers(start, layer_in):
+        layer_out, states, atten_probs_sum, num_layers = _ExtendLayers(
+            start, layer_in)
+        return (layer_out, states, atten_probs_sum,
+                tf.cast(num_layers, atten_probs_sum.dtype))
+
+      def _SkipLayers(start, layer_out, probs):
+        """Skips the layers from start, copying layer_out forward.
+
+        The self-attention key and value of the skipped layers are computed
+        from layer_out, so that the next steps can attend to this step.
+        """
+        states = py_utils.NestedMap()
+        for i in range(start, p.num_trans_layers):
+          _, _, states['layer_%i' % i] = self.trans[i].self_atten.ExtendStep(
+              theta.trans[i].self_atten, layer_out,
+              prefix_states['layer_%i' % i], step)
+        return (layer_out, states, tf.zeros_like(probs),
+                tf.zeros([], probs.dtype))
+
+      layer_out, updated_states, atten_probs_sum, num_layers = _ExtendLayers(
+          0, input_embs)
+      out_prefix_states.update(updated_states)
 
       # Aggregate per-layer attention probs.
-      aggregated_atten_probs = tf.math.add_n(atten_probs) / len(atten_probs)
+      aggregated_atten_probs = atten_probs_sum / num_layers
       return layer_out, out_prefix_states, aggregated_atten_probs
 
   def ComputePredictions(self, theta, encoder_outputs, targets):
@@ -1437,6 +1612,8 @@ class TransformerDecoder(MTBaseDecoder):
 
     new_states = states.Pack(states.Flatten())
 
+    # Only computes the shortlist if the caller did not, see _AddShortlistTheta.
+    theta = self._AddShortlistTheta(theta, encoder_outputs)
     layer_out, updated_prefix_states, atten_probs = self.ExtendStep(
         theta, encoder_outputs, tf.squeeze(step_ids, 1), target_time,
         prefix_states)
@@ -1445,16 +1622,25 @@ class TransformerDecoder(MTBaseDecoder):
     new_states.time_step = target_time + 1
 
     softmax_input = tf.reshape(layer_out, [-1, p.softmax.input_dim])
-    logits = self.softmax.Logits(theta.softmax, [softmax_input])
+    if 'shortlist_ids' in theta:
+      num_classes = tf.size(theta.shortlist_ids)
+      logits = self.softmax.ShortlistLogits(theta.shortlist_softmax,
+                                            [softmax_input])
+    else:
+      num_classes = p.softmax.num_classes
+      logits = self.softmax.Logits(theta.softmax, [softmax_input])
 
     num_hyps = py_utils.GetShape(step_ids)[0]
     # [time * batch, num_classes] -> [time, batch, num_classes]
-    logits = tf.reshape(logits, (-1, num_hyps, p.softmax.num_classes))
+    logits = tf.reshape(logits, (-1, num_hyps, num_classes))
     # [time, batch, num_classes] -> [batch, time, num_classes]
     logits = tf.transpose(logits, (1, 0, 2))
 
     # Only return logits for the last ids
     log_probs = tf.nn.log_softmax(tf.squeeze(logits, axis=1))
+    if 'shortlist_ids' in theta:
+      log_probs = self.shortlist.ToVocabLogProbs(log_probs,
+                                                 theta.shortlist_ids)
 
     bs_results = py_utils.NestedMap({
         'atten_probs': atten_probs,
@@ -18,6 +18,8 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
+
 import lingvo.compat as tf
 from lingvo.core import base_layer
 from lingvo.core import input_generator_helper as ig_helper
@@ -27,6 +29,7 @@ from lingvo.core import test_utils
 from lingvo.core.ops.hyps_pb2 import Hypothesis
 from lingvo.core.test_utils import CompareToGoldenSingleFloat
 from lingvo.tasks.mt import decoder
+from lingvo.tasks.mt import shortlist
 import numpy as np
 from six.moves import range
 from six.moves import zip
@@ -750,6 +753,60 @@ class TransformerDecoderTest(TransformerDecoderTestCaseBase):
 
       self._testExtendStep(sess, dec, encoder_outputs, targets, num_hyps)
 
+  def testDecoderExtendStepWithEarlyExitNeverTaken(self, dtype=tf.float32):
+    with self.session(use_gpu=True) as sess:
+      tf.set_random_seed(_TF_RANDOM_SEED)
+      p = self._DecoderParams(dtype=dtype)
+      p.early_exit_layers = [1, 3]
+      # No hyp of this small model is that confident.
+      p.early_exit_threshold = 1.0
+      dec = decoder.TransformerDecoder(p)
+      encoder_outputs, targets, num_hyps = (
+          self._InputsForAttentionTest(dtype=dtype))
+
+      self._testExtendStep(sess, dec, encoder_outputs, targets, num_hyps)
+
+  def _ExtendSteps(self, p, num_steps=5):
+    """Returns the outputs and prefix states of num_steps ExtendStep calls."""
+    with self.session(use_gpu=True, graph=tf.Graph()) as sess:
+      tf.set_random_seed(_TF_RANDOM_SEED)
+      dec = decoder.TransformerDecoder(p)
+      encoder_outputs, tgts, _ = self._InputsForAttentionTest()
+      prefix_states = py_utils.NestedMap()
+      for i in range(p.num_trans_layers):
+        prefix_states['layer_%i' % i] = py_utils.NestedMap(
+            key=tf.zeros([0, self.tgt_batch, p.model_dim]),
+            value=tf.zeros([0, self.tgt_batch, p.model_dim]))
+      outs = []
+      for i in range(num_steps):
+        out, prefix_states, _ = dec.ExtendStep(dec.theta, encoder_outputs,
+                                               tgts.ids[:, i], i, prefix_states)
+        outs.append(out)
+      tf.global_variables_initializer().run()
+      return sess.run([tf.stack(outs), prefix_states])
+
+  def testDecoderExtendStepWithEarlyExit(self):
+    p = self._DecoderParams()
+    p.early_exit_layers = [1, 3]
+    # Every hyp is confident enough.
+    p.early_exit_threshold = 1e-6
+    outs, prefix_states = self._ExtendSteps(p)
+
+    # The same as a decoder with only the first 2 layers.
+    p = self._DecoderParams()
+    p.num_trans_layers = 2
+    expected_outs, expected_prefix_states = self._ExtendSteps(p)
+    self.assertAllClose(expected_outs, outs)
+    for i in range(2):
+      self.assertAllClose(expected_prefix_states['layer_%i' % i].key,
+                          prefix_states['layer_%i' % i].key)
+    # The skipped layers still extend their prefix.
+    for i in range(2, 6):
+      self.assertEqual((5, self.tgt_batch, p.model_dim),
+                       prefix_states['layer_%i' % i].key.shape)
+      self.assertEqual((5, self.tgt_batch, p.model_dim),
+                       prefix_states['layer_%i' % i].value.shape)
+
   def testTransparentDecoderExtendStep(self, dtype=tf.float32):
     with self.session(use_gpu=True) as sess:
       tf.set_random_seed(_TF_RANDOM_SEED)
@@ -914,6 +971,73 @@ class TransformerDecoderTest(TransformerDecoderTestCaseBase):
         init_step_ids=True,
         has_task_ids=False)
 
+  def testBeamSearchDecodeWithEarlyExit(self):
+    tf.set_random_seed(_TF_RANDOM_SEED)
+    p = self._DecoderParams()
+    p.beam_search.num_hyps_per_beam = 2
+    p.early_exit_layers = [1]
+    p.early_exit_threshold = 1e-6
+    p.is_eval = True
+    dec = decoder.TransformerDecoder(p)
+    encoder_outputs, _, _ = self._Inputs()
+    decode = dec.BeamSearchDecode(encoder_outputs)
+
+    with self.session(use_gpu=True) as sess:
+      tf.global_variables_initializer().run()
+      topk_ids, topk_lens = sess.run([decode.topk_ids, decode.topk_lens])
+    self.assertEqual((8, 5), topk_ids.shape)
+    self.assertEqual((8,), topk_lens.shape)
+
+  def _BeamSearchDecodeWithShortlist(self, frequent_ids=None, **dec_params):
+    with self.session(use_gpu=False, graph=tf.Graph()) as sess:
+      tf.set_random_seed(_TF_RANDOM_SEED)
+      p = self._DecoderParams()
+      p.beam_search.num_hyps_per_beam = 2
+      p.is_eval = True
+      p.Set(**dec_params)
+      if frequent_ids is not None:
+        table_path = os.path.join(FLAGS.test_tmpdir, 'shortlist.txt')
+        shortlist.WriteTable(table_path, frequent_ids, {3: [7, 8], 4: [9]})
+        p.shortlist = shortlist.VocabShortlist.Params().Set(
+            table_path=table_path,
+            source_vocab_size=20,
+            num_frequent=len(frequent_ids))
+      dec = decoder.TransformerDecoder(p)
+      encoder_outputs, _, _ = self._Inputs()
+      src = py_utils.NestedMap(
+          ids=tf.constant([[3, 4, 5, 2, 0]] * 4), paddings=tf.zeros([4, 5]))
+      encoder_outputs = dec.AddShortlistCandidates(encoder_outputs, src)
+      decode = dec.BeamSearchDecode(encoder_outputs)
+      tf.global_variables_initializer().run()
+      return sess.run([decode.topk_ids, decode.topk_lens, decode.topk_scores])
+
+  def testBeamSearchDecodeWithShortlist(self):
+    topk_ids, topk_lens, topk_scores = self._BeamSearchDecodeWithShortlist()
+    # A shortlist of the whole vocabulary does not change the results.
+    (full_topk_ids, full_topk_lens,
+     full_topk_scores) = self._BeamSearchDecodeWithShortlist(list(range(20)))
+    self.assertAllEqual(topk_ids, full_topk_ids)
+    self.assertAllEqual(topk_lens, full_topk_lens)
+    self.assertAllClose(topk_scores, full_topk_scores)
+
+    topk_ids, _, _ = self._BeamSearchDecodeWithShortlist([5])
+    # The frequent id, the translations and the source ids, <s> and </s>.
+    self.assertContainsSubset(topk_ids.flatten(), [0, 1, 2, 3, 4, 5, 7, 8, 9])
+
+  def testBeamSearchDecodeWithShortlistAndEarlyExit(self):
+    # The early exits are decided within the shortlist, so that a shortlist of
+    # the whole vocabulary does not change them.
+    for threshold in [1e-6, 0.1, 1.0]:
+      results = self._BeamSearchDecodeWithShortlist(
+          early_exit_layers=[1], early_exit_threshold=threshold)
+      full_results = self._BeamSearchDecodeWithShortlist(
+          list(range(20)),
+          early_exit_layers=[1],
+          early_exit_threshold=threshold)
+      self.assertAllEqual(results[0], full_results[0])
+      self.assertAllEqual(results[1], full_results[1])
+      self.assertAllClose(results[2], full_results[2])
+
 
 class InsertionDecoderTest(TransformerDecoderTestCaseBase):
 
@@ -25,6 +25,7 @@ from lingvo.core import generic_input
 from lingvo.core import py_utils
 from lingvo.core import tokenizers
 import six
+from six.moves import zip
 
 
 class NmtInput(base_input_generator.BaseSequenceInputGenerator):
@@ -41,30 +42,61 @@ class NmtInput(base_input_generator.BaseSequenceInputGenerator):
         'order if False. The value should be consistent with the underlying '
         'model. Set to True if training or using a natural order model, '
         'otherwise set to False.')
+    p.Define(
+        'decode_window_size', None,
+        'If set, enables the decode-time input mode: the examples are read in '
+        'file order, sorted by source length within windows of this many '
+        'examples, and batched by decode_batch_tokens instead of '
+        'bucket_batch_limit. InputBatch() then also has the sample_ids of the '
+        'examples, i.e. their index in the input files, so that the original '
+        'order can be restored after decoding.')
+    p.Define(
+        'decode_batch_tokens', 4096,
+        'In the decode-time input mode, the max number of source tokens times '
+        'decode_num_hyps_per_beam in a batch: the batch size of the examples '
+        'of a bucket is decode_batch_tokens // (bucket upper bound * '
+        'decode_num_hyps_per_beam).')
+    p.Define(
+        'decode_num_hyps_per_beam', 1,
+        'In the decode-time input mode, the number of hyps per beam of the '
+        'decoder.')
     p.tokenizer = tokenizers.VocabFileTokenizer.Params()
     p.source_max_length = 300
     return p
 
+  def _ParseRecord(self, record):
+    """Parses a serialized tf.Example record.
+
+    Args:
+      record: A string scalar.
+
+    Returns:
+      A tuple (features, bucket_key), where features is the list of the
+      source_id, source_padding, target_id, target_padding, target_label and
+      target_weight vectors of the example.
+    """
+    outputs = [
+        ('source_id', tf.VarLenFeature(tf.int64)),
+        ('source_padding', tf.VarLenFeature(tf.float32)),
+        ('target_id', tf.VarLenFeature(tf.int64)),
+        ('target_padding', tf.VarLenFeature(tf.float32)),
+        ('target_label', tf.VarLenFeature(tf.int64)),
+        ('target_weight', tf.VarLenFeature(tf.float32)),
+    ]
+    features = tf.parse_single_example(record, dict(outputs))
+    for k, v in six.iteritems(features):
+      features[k] = v.values
+    bucket_key = tf.cast(
+        tf.maximum(
+            tf.reduce_sum(1.0 - features['source_padding']),
+            tf.reduce_sum(1.0 - features['target_padding'])), tf.int32)
+    return [features[k] for k, _ in outputs], bucket_key
+
   def _DataSourceFromFilePattern(self, file_pattern):
 
     def Proc(record):
       """Parses a serialized tf.Example record."""
-      outputs = [
-          ('source_id', tf.VarLenFeature(tf.int64)),
-          ('source_padding', tf.VarLenFeature(tf.float32)),
-          ('target_id', tf.VarLenFeature(tf.int64)),
-          ('target_padding', tf.VarLenFeature(tf.float32)),
-          ('target_label', tf.VarLenFeature(tf.int64)),
-          ('target_weight', tf.VarLenFeature(tf.float32)),
-      ]
-      features = tf.parse_single_example(record, dict(outputs))
-      for k, v in six.iteritems(features):
-        features[k] = v.values
-      bucket_key = tf.cast(
-          tf.maximum(
-              tf.reduce_sum(1.0 - features['source_padding']),
-              tf.reduce_sum(1.0 - features['target_padding'])), tf.int32)
-      return [features[k] for k, _ in outputs], bucket_key
+      return self._ParseRecord(record)
 
     return generic_input.GenericInput(
         file_pattern=file_pattern,
@@ -73,6 +105,83 @@ class NmtInput(base_input_generator.BaseSequenceInputGenerator):
         dynamic_padding_constants=[0, 1, 0, 1, 0, 0],
         **self.CommonInputOpArgs())
 
+  def _BuildDecodeDataSource(self):
+    """Builds the input of the decode-time input mode.
+
+    See decode_window_size. Unlike the bucketing input op, the whole input is
+    read once per epoch, in file order, and the last batches of each bucket
+    are flushed at the end of the epoch.
+
+    Returns:
+      A tuple (features, bucket_keys, sample_ids), where features is the list
+      of the batched features of _ParseRecord(), bucket_keys the source
+      lengths and sample_ids the index of the examples in the input files.
+    """
+    p = self.params
+    assert isinstance(p.file_pattern, six.string_types), (
+        'The decode-time input mode needs a file_pattern string.')
+    files = []
+    for pattern in p.file_pattern.split(','):
+      assert pattern.startswith('tfrecord:'), (
+          'The decode-time input mode only reads tfrecord files: %s' % pattern)
+      files += sorted(tf.io.gfile.glob(pattern[len('tfrecord:'):]))
+    names = [
+        'src_ids', 'src_paddings', 'tgt_ids', 'tgt_paddings', 'tgt_labels',
+        'tgt_weights'
+    ]
+
+    def _Parse(sample_id, record):
+      features, _ = self._ParseRecord(record)
+      example = dict(zip(names, features))
+      example['src_len'] = tf.cast(
+          tf.round(tf.reduce_sum(1.0 - example['src_paddings'])), tf.int32)
+      example['src_size'] = tf.size(example['src_ids'])
+      example['tgt_size'] = tf.size(example['tgt_ids'])
+      example['sample_id'] = tf.cast(sample_id, tf.int32)
+      return example
+
+    def _SortWindow(window):
+      """Sorts a padded window of examples by source length."""
+      order = tf.argsort(window['src_len'], stable=True)
+      return tf.data.Dataset.from_tensor_slices(
+          {k: tf.gather(v, order) for k, v in six.iteritems(window)})
+
+    def _Unpad(example):
+      """Removes the padding of the window from an example."""
+      for k in names:
+        size = example['src_size' if k.startswith('src') else 'tgt_size']
+        example[k] = example[k][:size]
+      return example
+
+    max_len = p.bucket_upper_bound[-1]
+    dataset = tf.data.TFRecordDataset(files).apply(
+        tf.data.experimental.enumerate_dataset())
+    dataset = dataset.map(_Parse).filter(lambda x: x['src_len'] <= max_len)
+    # The paddings are padded with 1s, everything else with 0s.
+    padding_values = {
+        k: tf.constant(1 if k.endswith('_paddings') else 0, dtype)
+        for k, dtype in six.iteritems(dataset.output_types)
+    }
+    dataset = dataset.padded_batch(
+        p.decode_window_size,
+        padded_shapes=dataset.output_shapes,
+        padding_values=padding_values)
+    dataset = dataset.flat_map(_SortWindow).map(_Unpad)
+    # The examples of length <= upper_bound go to the bucket of upper_bound.
+    dataset = dataset.apply(
+        tf.data.experimental.bucket_by_sequence_length(
+            lambda x: x['src_len'],
+            bucket_boundaries=[b + 1 for b in p.bucket_upper_bound],
+            bucket_batch_sizes=[
+                max(1, p.decode_batch_tokens //
+                    (b * p.decode_num_hyps_per_beam))
+                for b in p.bucket_upper_bound
+            ] + [1],
+            padding_values=padding_values))
+    dataset = dataset.repeat().prefetch(1)
+    batch = dataset.make_one_shot_iterator().get_next()
+    return [batch[k] for k in names], batch['src_len'], batch['sample_id']
+
   @base_layer.initializer
   def __init__(self, params):
     super(NmtInput, self).__init__(params)
@@ -80,9 +189,16 @@ class NmtInput(base_input_generator.BaseSequenceInputGenerator):
 
     self.natural_order_model = p.natural_order_model
 
-    (self._src_ids, self._src_paddings, self._tgt_ids, self._tgt_paddings,
-     self._tgt_labels,
-     self._tgt_weights), self._bucket_keys = self._BuildDataSource()
+    self._decode_sample_ids = None
+    if p.decode_window_size:
+      assert not p.pad_to_max_seq_length
+      (self._src_ids, self._src_paddings, self._tgt_ids, self._tgt_paddings,
+       self._tgt_labels, self._tgt_weights), self._bucket_keys, (
+           self._decode_sample_ids) = self._BuildDecodeDataSource()
+    else:
+      (self._src_ids, self._src_paddings, self._tgt_ids, self._tgt_paddings,
+       self._tgt_labels,
+       self._tgt_weights), self._bucket_keys = self._BuildDataSource()
 
     if p.pad_to_max_seq_length:
       assert p.source_max_length
@@ -119,6 +235,8 @@ class NmtInput(base_input_generator.BaseSequenceInputGenerator):
     ret = py_utils.NestedMap()
 
     ret.bucket_keys = self._bucket_keys
+    if self._decode_sample_ids is not None:
+      ret.sample_ids = self._decode_sample_ids
 
     ret.src = py_utils.NestedMap()
     ret.src.ids = tf.cast(self._src_ids, dtype=tf.int32)
@@ -138,6 +138,29 @@ class InputTest(test_utils.TestCase):
     self.assertAllEqual(expected_ids_split_1, fetched[0].tgt.ids)
     self.assertAllEqual(expected_ids_split_2, fetched[1].tgt.ids)
 
+  def testDecodeWindow(self):
+    p = self._CreateNmtInputParams()
+    p.decode_window_size = 16
+    p.decode_batch_tokens = 160
+    p.decode_num_hyps_per_beam = 2
+    with self.session(use_gpu=False) as sess:
+      inp = input_generator.NmtInput(p)
+      batch = inp.GetPreprocessedInputBatch()
+      sample_ids = []
+      # Reads one epoch: the sample ids start over in the next one.
+      while True:
+        fetched = py_utils.NestedMap(sess.run(batch))
+        if sample_ids and fetched.sample_ids[0] in sample_ids:
+          break
+        src_lens = np.sum(1. - fetched.src.paddings, 1)
+        self.assertAllEqual(src_lens, fetched.bucket_keys)
+        # The batch size is bounded by the tokens budget of the bucket.
+        bucket = 20 if max(src_lens) <= 20 else 40
+        self.assertLessEqual(len(src_lens), 160 // (bucket * 2))
+        self.assertLessEqual(fetched.src.ids.shape[1], bucket)
+        sample_ids.extend(fetched.sample_ids)
+    self.assertCountEqual(list(range(len(sample_ids))), sample_ids)
+
 
 if __name__ == '__main__':
   tf.test.main()
@@ -22,6 +22,7 @@ import lingvo.compat as tf
 from lingvo.core import base_layer
 from lingvo.core import layers
 from lingvo.core import layers_with_attention
+from lingvo.core import remat_policy
 from six.moves import range
 
 
@@ -117,6 +118,8 @@ class TransformerStack(base_layer.BaseLayer):
           transparent_params.append(transparent_param)
         self.CreateChildren('transparent_merger', transparent_params)
 
+    self._remat_policy = remat_policy.Instantiate(p.remat_policy)
+
   def FProp(self,
             theta,
             transformer_input,
@@ -161,7 +164,10 @@ class TransformerStack(base_layer.BaseLayer):
       for i, transformer_l in enumerate(self.trans):
 
         # For encoder, keys, values and queries are the same
-        transformer_output, _ = transformer_l.FProp(
+        transformer_output, _ = remat_policy.LayerFProp(
+            self._remat_policy,
+            i,
+            transformer_l,
             theta.trans[i],
             transformer_input,
             paddings,
@@ -60,6 +60,9 @@ class MTBaseModel(base_model.BaseTask):
       with self._DecoderDevice():
         self.CreateChild('dec', p.decoder)
 
+    # The sample_ids of the buffered decode outputs, see DecodeFinalize().
+    self._decode_out_sample_ids = []
+
   def ComputePredictions(self, theta, batch):
     p = self.params
 
@@ -92,6 +95,8 @@ class MTBaseModel(base_model.BaseTask):
       encoder_outputs = self.enc.FPropDefaultTheta(input_batch.src)
       encoder_outputs = self.dec.AddExtraDecodingInfo(encoder_outputs,
                                                       input_batch.tgt)
+      encoder_outputs = self.dec.AddShortlistCandidates(encoder_outputs,
+                                                        input_batch.src)
       decoder_outs = self.dec.BeamSearchDecode(encoder_outputs)
 
       topk_hyps = decoder_outs.topk_hyps
@@ -126,8 +131,34 @@ class MTBaseModel(base_model.BaseTask):
           'topk_lens': topk_lens,
           'topk_scores': topk_scores,
       }
+      if decoder_outs.done_hyps is not None:
+        ret_dict['beam_steps'] = self._BeamSteps(decoder_outs.done_hyps)
+      if decoder_outs.active_batch_fraction is not None:
+        ret_dict['active_batch_fraction'] = decoder_outs.active_batch_fraction
+      if 'sample_ids' in input_batch:
+        ret_dict['sample_ids'] = input_batch.sample_ids
       return ret_dict
 
+  def _BeamSteps(self, done_hyps):
+    """Returns the number of steps each beam needed, [num_beams].
+
+    A beam needs the steps up to its last terminated hyp, beam search runs
+    until the last beam of the batch is done.
+
+    Args:
+      done_hyps: The done_hyps of a `.BeamSearchDecodeOutput`, [max_steps,
+        num_hyps_per_beam * num_beams].
+    """
+    p = self.params
+    max_steps = py_utils.GetShape(done_hyps)[0]
+    # [max_steps, num_hyps_per_beam, num_beams] -> [max_steps, num_beams]
+    is_done = tf.reduce_any(
+        tf.reshape(
+            tf.not_equal(done_hyps, ''),
+            [max_steps, p.decoder.beam_search.num_hyps_per_beam, -1]), 1)
+    steps = tf.expand_dims(tf.range(1, max_steps + 1), 1)
+    return tf.reduce_max(steps * tf.cast(is_done, tf.int32), 0)
+
   def _PostProcessBeamSearchDecodeOut(self, dec_out_dict, dec_metrics_dict):
     """Post processes the output from `_BeamSearchDecode`."""
     p = self.params
@@ -142,6 +173,21 @@ class MTBaseModel(base_model.BaseTask):
         '%s vs %s' % (num_samples, len(topk_decoded)))
     assert num_samples == len(sources)
     dec_metrics_dict['num_samples_in_batch'].Update(num_samples)
+    if 'beam_steps' in dec_out_dict and num_samples:
+      # The fraction of the beam steps of the batch which were not spent on
+      # beams which were already done.
+      beam_steps = dec_out_dict['beam_steps']
+      num_beam_steps = float(max(beam_steps)) * len(beam_steps)
+      if num_beam_steps:
+        dec_metrics_dict['beam_step_utilization'].Update(
+            sum(beam_steps) / num_beam_steps, num_beam_steps)
+    if 'active_batch_fraction' in dec_out_dict and num_samples:
+      # The fraction of the beams the decoder computed on per step, see
+      # BeamSearchHelper.Params().compact_every_n_steps.
+      dec_metrics_dict['active_batch_fraction'].Update(
+          dec_out_dict['active_batch_fraction'], num_samples)
+    if 'sample_ids' in dec_out_dict:
+      self._decode_out_sample_ids.extend(dec_out_dict['sample_ids'])
 
     key_value_pairs = []
     for i in range(num_samples):
@@ -167,6 +213,8 @@ class MTBaseModel(base_model.BaseTask):
     decoder_metrics = {
         'num_samples_in_batch': metrics.AverageMetric(),
         'corpus_bleu': metrics.CorpusBleuMetric(separator_type='wpm'),
+        'beam_step_utilization': metrics.AverageMetric(),
+        'active_batch_fraction': metrics.AverageMetric(),
     }
     return decoder_metrics
 
@@ -177,6 +225,25 @@ class MTBaseModel(base_model.BaseTask):
   def PostProcessDecodeOut(self, dec_out, dec_metrics):
     return self._PostProcessBeamSearchDecodeOut(dec_out, dec_metrics)
 
+  def DecodeFinalize(self, decode_finalize_args):
+    """Writes the decode outputs, in the order of the input if known.
+
+    With the decode-time input mode of `.NmtInput` (see decode_window_size),
+    the batches are sorted by source length, and the outputs are put back in
+    the order of the input files.
+
+    Args:
+      decode_finalize_args: A DecodeFinalizeArgs namedtuple.
+    """
+    decode_out = decode_finalize_args.decode_out
+    sample_ids = self._decode_out_sample_ids
+    self._decode_out_sample_ids = []
+    if sample_ids and len(sample_ids) == len(decode_out):
+      order = sorted(range(len(decode_out)), key=lambda i: sample_ids[i])
+      decode_finalize_args = decode_finalize_args._replace(
+          decode_out=[decode_out[i] for i in order])
+    super(MTBaseModel, self).DecodeFinalize(decode_finalize_args)
+
 
 class TransformerModel(MTBaseModel):
   """Transformer Model.
@@ -198,6 +265,51 @@ class TransformerModel(MTBaseModel):
     p = self.params
     assert p.encoder.model_dim == p.decoder.source_dim
 
+  def Inference(self):
+    """Constructs the inference subgraphs.
+
+    The decoder params, e.g. early_exit_layers, also apply to the exported
+    inference graph.
+
+    Returns:
+      dict: ``{'subgraph_name': (fetches, feeds)}``
+    """
+    subgraphs = dict()
+    with tf.name_scope('inference'):
+      subgraphs['default'] = self._InferenceSubgraph_Default()
+    return subgraphs
+
+  def _InferenceSubgraph_Default(self):
+    with tf.name_scope('inference'):
+      src_strings = tf.placeholder(tf.string, shape=[None])
+      _, src_ids, src_paddings = self.input_generator.StringsToIds(
+          src_strings, is_source=True, key=self._GetTokenizerKeyToUse('src'))
+
+      src_input_map = py_utils.NestedMap(ids=src_ids, paddings=src_paddings)
+      encoder_outputs = self.enc.FPropDefaultTheta(src_input_map)
+      encoder_outputs = self.dec.AddShortlistCandidates(encoder_outputs,
+                                                        src_input_map)
+      decoder_outs = self.dec.BeamSearchDecode(encoder_outputs)
+
+      topk_hyps = decoder_outs.topk_hyps
+      topk_ids = decoder_outs.topk_ids
+      topk_lens = decoder_outs.topk_lens
+
+      # topk_lens - 1 to remove the EOS id.
+      topk_decoded = self.input_generator.IdsToStrings(
+          topk_ids, topk_lens - 1, self._GetTokenizerKeyToUse('tgt'))
+      topk_decoded = tf.reshape(topk_decoded, tf.shape(topk_hyps))
+
+      feeds = py_utils.NestedMap({'src_strings': src_strings})
+      fetches = py_utils.NestedMap({
+          'src_ids': src_ids,
+          'topk_decoded': topk_decoded,
+          'topk_scores': decoder_outs.topk_scores,
+          'topk_hyps': topk_hyps,
+      })
+
+      return fetches, feeds
+
 
 class RNMTModel(MTBaseModel):
   """RNMT+ Model.
@@ -20,10 +20,16 @@ from __future__ import absolute_import
 from __future__ import division
 from __future__ import print_function
 
+import os
+import pickle
+import time
+
 import lingvo.compat as tf
 from lingvo.core import base_input_generator
 from lingvo.core import base_layer
+from lingvo.core import base_model
 from lingvo.core import cluster_factory
+from lingvo.core import inference_graph_exporter
 from lingvo.core import optimizer
 from lingvo.core import py_utils
 from lingvo.core import schedule
@@ -115,68 +121,75 @@ class TestInputGenerator(base_input_generator.BaseSequenceInputGenerator):
     return ret
 
 
-class TransformerModelTest(test_utils.TestCase):
+def _TransformerInputParams():
+  p = input_generator.NmtInput.Params()
+  input_file = test_helper.test_src_dir_path(
+      'tasks/mt/testdata/wmt14_ende_wpm_32k_test.tfrecord')
+  vocab_file = test_helper.test_src_dir_path(
+      'tasks/mt/testdata/wmt14_ende_wpm_32k_test.vocab')
+  p.file_pattern = 'tfrecord:' + input_file
+  p.file_random_seed = 31415
+  p.file_parallelism = 1
+  p.bucket_upper_bound = [40]
+  p.bucket_batch_limit = [8]
+  p.source_max_length = 200
+  p.target_max_length = 200
+
+  p.tokenizer.token_vocab_filepath = vocab_file
+  p.tokenizer.vocab_size = 32000
+  return p
+
+
+def _TransformerEncoderParams():
+  p = encoder.TransformerEncoder.Params()
+  p.name = 'encoder'
+  p.random_seed = 1234
+  p.model_dim = 4
+  p.token_emb.embedding_dim = 4
+  p.token_emb.max_num_shards = 1
+  p.token_emb.params_init = py_utils.WeightInit.GaussianSqrtDim(
+      seed=p.random_seed)
+  p.position_emb.embedding_dim = 4
+  p.transformer_stack.transformer_tpl.tr_atten_tpl.num_attention_heads = 2
+  p.transformer_stack.transformer_tpl.tr_fflayer_tpl.hidden_dim = 5
+  return p
+
+
+def _TransformerDecoderParams():
+  p = decoder.TransformerDecoder.Params()
+  p.name = 'decoder'
+  p.random_seed = 1234
+  p.source_dim = 4
+  p.model_dim = 4
+  p.token_emb.embedding_dim = 4
+  p.token_emb.max_num_shards = 1
+  p.token_emb.params_init = py_utils.WeightInit.GaussianSqrtDim(
+      seed=p.random_seed)
+  p.position_emb.embedding_dim = 4
+  p.trans_tpl.source_dim = 4
+  p.trans_tpl.tr_atten_tpl.source_dim = 4
+  p.trans_tpl.tr_atten_tpl.num_attention_heads = 2
+  p.trans_tpl.tr_fflayer_tpl.input_dim = 4
+  p.trans_tpl.tr_fflayer_tpl.hidden_dim = 8
+  p.softmax.num_shards = 1
+  p.target_seq_len = 5
+  return p
+
+
+def _TransformerModelParams():
+  p = model.TransformerModel.Params()
+  p.name = 'test_mdl'
+  p.input = _TransformerInputParams()
+  p.encoder = _TransformerEncoderParams()
+  p.decoder = _TransformerDecoderParams()
+  p.train.learning_rate = 2e-4
+  return p
 
-  def _InputParams(self):
-    p = input_generator.NmtInput.Params()
-    input_file = test_helper.test_src_dir_path(
-        'tasks/mt/testdata/wmt14_ende_wpm_32k_test.tfrecord')
-    vocab_file = test_helper.test_src_dir_path(
-        'tasks/mt/testdata/wmt14_ende_wpm_32k_test.vocab')
-    p.file_pattern = 'tfrecord:' + input_file
-    p.file_random_seed = 31415
-    p.file_parallelism = 1
-    p.bucket_upper_bound = [40]
-    p.bucket_batch_limit = [8]
-    p.source_max_length = 200
-    p.target_max_length = 200
 
-    p.tokenizer.token_vocab_filepath = vocab_file
-    p.tokenizer.vocab_size = 32000
-    return p
-
-  def _EncoderParams(self):
-    p = encoder.TransformerEncoder.Params()
-    p.name = 'encoder'
-    p.random_seed = 1234
-    p.model_dim = 4
-    p.token_emb.embedding_dim = 4
-    p.token_emb.max_num_shards = 1
-    p.token_emb.params_init = py_utils.WeightInit.GaussianSqrtDim(
-        seed=p.random_seed)
-    p.position_emb.embedding_dim = 4
-    p.transformer_stack.transformer_tpl.tr_atten_tpl.num_attention_heads = 2
-    p.transformer_stack.transformer_tpl.tr_fflayer_tpl.hidden_dim = 5
-    return p
-
-  def _DecoderParams(self):
-    p = decoder.TransformerDecoder.Params()
-    p.name = 'decoder'
-    p.random_seed = 1234
-    p.source_dim = 4
-    p.model_dim = 4
-    p.token_emb.embedding_dim = 4
-    p.token_emb.max_num_shards = 1
-    p.token_emb.params_init = py_utils.WeightInit.GaussianSqrtDim(
-        seed=p.random_seed)
-    p.position_emb.embedding_dim = 4
-    p.trans_tpl.source_dim = 4
-    p.trans_tpl.tr_atten_tpl.source_dim = 4
-    p.trans_tpl.tr_atten_tpl.num_attention_heads = 2
-    p.trans_tpl.tr_fflayer_tpl.input_dim = 4
-    p.trans_tpl.tr_fflayer_tpl.hidden_dim = 8
-    p.softmax.num_shards = 1
-    p.target_seq_len = 5
-    return p
+class TransformerModelTest(test_utils.TestCase):
 
   def _testParams(self):
-    p = model.TransformerModel.Params()
-    p.name = 'test_mdl'
-    p.input = self._InputParams()
-    p.encoder = self._EncoderParams()
-    p.decoder = self._DecoderParams()
-    p.train.learning_rate = 2e-4
-    return p
+    return _TransformerModelParams()
 
   def testConstruction(self):
     with self.session():
@@ -368,6 +381,78 @@ class TransformerModelTest(test_utils.TestCase):
       for k, v in key_value_pairs:
         self.assertIn(k, v)
 
+  def testDecodeWithActiveBatchCompaction(self):
+    with self.session(use_gpu=False) as sess:
+      tf.set_random_seed(93820985)
+      p = self._testParams()
+      p.decoder.beam_search.compact_every_n_steps = 2
+      mdl = p.Instantiate()
+      input_batch = mdl.input_generator.GetPreprocessedInputBatch()
+      dec_out_dict = mdl.Decode(input_batch)
+      tf.global_variables_initializer().run()
+      dec_out = sess.run(dec_out_dict)
+      metrics_dict = mdl.CreateDecoderMetrics()
+      key_value_pairs = mdl.PostProcessDecodeOut(dec_out, metrics_dict)
+      self.assertLen(key_value_pairs, 8)
+      fraction = metrics_dict['active_batch_fraction'].value
+      self.assertGreater(fraction, 0.)
+      self.assertLessEqual(fraction, 1.)
+
+  def testDecodeWindowRestoresInputOrder(self):
+    with self.session(use_gpu=False) as sess:
+      tf.set_random_seed(93820985)
+      p = self._testParams()
+      p.input.decode_window_size = 16
+      p.input.decode_batch_tokens = 160
+      p.input.decode_num_hyps_per_beam = p.decoder.beam_search.num_hyps_per_beam
+      mdl = p.Instantiate()
+      input_batch = mdl.input_generator.GetPreprocessedInputBatch()
+      dec_out_dict = mdl.Decode(input_batch)
+      tf.global_variables_initializer().run()
+      metrics_dict = mdl.CreateDecoderMetrics()
+      decode_out = []
+      sample_ids = []
+      for _ in range(3):
+        dec_out = sess.run(dec_out_dict)
+        sample_ids.extend(dec_out['sample_ids'])
+        decode_out.extend(mdl.PostProcessDecodeOut(dec_out, metrics_dict))
+      utilization = metrics_dict['beam_step_utilization'].value
+      self.assertGreater(utilization, 0.)
+      self.assertLessEqual(utilization, 1.)
+
+      decode_out_path = os.path.join(FLAGS.test_tmpdir, 'decode_out')
+      mdl.DecodeFinalize(
+          base_model.DecodeFinalizeArgs(
+              decode_out_path=decode_out_path, decode_out=decode_out))
+      with open(decode_out_path, 'rb') as f:
+        written = pickle.load(f)
+      self.assertEqual(
+          [decode_out[i] for i in np.argsort(sample_ids, kind='mergesort')],
+          written)
+
+  def testInference(self):
+    with self.session(use_gpu=False) as sess:
+      tf.set_random_seed(93820985)
+      p = self._testParams()
+      p.is_eval = True
+      mdl = p.Instantiate()
+      fetches, feeds = mdl.Inference()['default']
+
+      tf.global_variables_initializer().run()
+      src_strings = ['the cat sat on the mat', 'the dog sat on the mat']
+      dec_out = sess.run(fetches, {feeds['src_strings']: src_strings})
+      self.assertEqual((2, p.decoder.beam_search.num_hyps_per_beam),
+                       dec_out['topk_decoded'].shape)
+
+  def testExportInferenceGraphWithEarlyExit(self):
+    p = self._testParams()
+    p.decoder.early_exit_layers = [1, 3]
+    p.decoder.early_exit_threshold = 0.5
+    inference_graph = inference_graph_exporter.InferenceGraphExporter.Export(
+        base_model.SingleTaskModel.Params(p))
+    self.assertIn('default', inference_graph.subgraphs)
+    self.assertIn('src_strings', inference_graph.subgraphs['default'].feeds)
+
 
 class RNMTModelTest(test_utils.TestCase):
 
@@ -710,5 +795,43 @@ class InsertionModelTest(test_utils.TestCase):
       sess.run(mdl.loss)
 
 
+class EarlyExitBenchmark(tf.test.Benchmark):
+  """Measures the decoding time and BLEU of early exits on the WMT testdata.
+
+  The model of TransformerModelTest is not trained, restore a checkpoint in
+  _Benchmark to measure the tradeoff of a real model.
+  """
+
+  def _Benchmark(self, early_exit_threshold, num_batches=5):
+    with tf.Graph().as_default():
+      tf.set_random_seed(93820985)
+      p = _TransformerModelParams()
+      if early_exit_threshold is not None:
+        p.decoder.early_exit_layers = [1, 3]
+        p.decoder.early_exit_threshold = early_exit_threshold
+      mdl = p.Instantiate()
+      dec_out_dict = mdl.Decode(mdl.input_generator.GetPreprocessedInputBatch())
+      metrics_dict = mdl.CreateDecoderMetrics()
+      with tf.Session() as sess:
+        sess.run(tf.global_variables_initializer())
+        decode_time = 0.
+        for i in range(num_batches + 1):
+          start = time.time()
+          dec_out = sess.run(dec_out_dict)
+          # The first batch warms up the session.
+          if i > 0:
+            decode_time += time.time() - start
+          mdl.PostProcessDecodeOut(dec_out, metrics_dict)
+    self.report_benchmark(
+        name='EarlyExit_%s' % early_exit_threshold,
+        iters=num_batches,
+        wall_time=decode_time / num_batches,
+        extras={'corpus_bleu': metrics_dict['corpus_bleu'].value})
+
+  def benchmarkEarlyExit(self):
+    for early_exit_threshold in [None, 0.9, 0.5, 0.1]:
+      self._Benchmark(early_exit_threshold)
+
+
 if __name__ == '__main__':
   tf.test.main()
@@ -0,0 +1,321 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Target vocabulary shortlists for decoding.
+
+A shortlist restricts the softmax of a decoder to the target tokens which are
+likely given the sources of the batch: the top frequent target tokens, the
+top lexical translations of each source token and optionally the source tokens
+themselves.
+
+The shortlist table is built offline from training data, see
+lingvo/tools/gen_mt_shortlist.py. It is a text file whose first line is::
+
+  frequent<TAB><target ids, most frequent first>
+
+followed by one line per source id::
+
+  <source id><TAB><target ids, best translation first>
+
+with the ids separated by spaces.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import collections
+
+import lingvo.compat as tf
+from lingvo.core import base_layer
+from lingvo.core import py_utils
+import numpy as np
+import six
+
+_FREQUENT_KEY = 'frequent'
+
+# The log prob of the target ids which are not in the shortlist.
+_NOT_SHORTLISTED_LOG_PROB = -1e9
+
+
+def ReadTable(path):
+  """Reads a shortlist table.
+
+  Args:
+    path: The path of the table.
+
+  Returns:
+    A tuple (frequent_ids, translations), the list of the frequent target ids
+    and a dict from source id to the list of its target ids.
+  """
+  frequent_ids = []
+  translations = {}
+  with tf.io.gfile.GFile(path, 'r') as f:
+    for line in f:
+      key, _, ids = line.rstrip('\n').partition('\t')
+      ids = [int(x) for x in ids.split()]
+      if key == _FREQUENT_KEY:
+        frequent_ids = ids
+      else:
+        translations[int(key)] = ids
+  return frequent_ids, translations
+
+
+def WriteTable(path, frequent_ids, translations):
+  """Writes a shortlist table, see `ReadTable`."""
+  with tf.io.gfile.GFile(path, 'w') as f:
+    f.write('%s\t%s\n' % (_FREQUENT_KEY, ' '.join(map(str, frequent_ids))))
+    for src_id in sorted(translations):
+      f.write('%d\t%s\n' % (src_id, ' '.join(map(str, translations[src_id]))))
+
+
+def _Dice(pair_count, src_count, tgt_count):
+  return 2. * pair_count / (src_count + tgt_count)
+
+
+def _TopTranslations(counts, src_count, tgt_counts, n):
+  """Returns the n target ids of counts with the highest Dice coefficient."""
+  dice = [(_Dice(c, src_count, tgt_counts[tgt_id]), tgt_id)
+          for tgt_id, c in six.iteritems(counts)]
+  return [tgt_id for _, tgt_id in sorted(dice, key=lambda x: (-x[0], x[1]))
+         ][:n]
+
+
+def BuildTable(sentence_pairs,
+               num_frequent,
+               num_translations,
+               max_pairs_per_source=None):
+  """Builds a shortlist table from parallel data.
+
+  The translations of a source id are the target ids with the highest Dice
+  coefficient of the source and target ids occurring in the same sentence
+  pair, which unlike their co-occurrence counts does not favor frequent target
+  ids.
+
+  The co-occurrence counts of a source id are pruned to the
+  `max_pairs_per_source` target ids with the highest Dice coefficient so far
+  whenever they grow to twice as many, so that the memory is linear rather
+  than quadratic in the vocabulary size. Pruned counts restart from 0, which
+  only affects rare pairs.
+
+  Args:
+    sentence_pairs: An iterable of (source ids, target ids) pairs.
+    num_frequent: The number of frequent target ids to keep.
+    num_translations: The number of translations to keep per source id.
+    max_pairs_per_source: The number of co-occurrence counts kept per source
+      id when pruning. Defaults to 10 * num_translations.
+
+  Returns:
+    A tuple (frequent_ids, translations) as returned by `ReadTable`.
+  """
+  max_pairs_per_source = max_pairs_per_source or 10 * num_translations
+  src_counts = collections.Counter()
+  tgt_counts = collections.Counter()
+  tgt_token_counts = collections.Counter()
+  pair_counts = collections.defaultdict(collections.Counter)
+  for src_ids, tgt_ids in sentence_pairs:
+    tgt_token_counts.update(tgt_ids)
+    src_set, tgt_set = set(src_ids), set(tgt_ids)
+    src_counts.update(src_set)
+    tgt_counts.update(tgt_set)
+    for src_id in src_set:
+      counts = pair_counts[src_id]
+      counts.update(tgt_set)
+      if len(counts) >= 2 * max_pairs_per_source:
+        kept = _TopTranslations(counts, src_counts[src_id], tgt_counts,
+                                max_pairs_per_source)
+        pair_counts[src_id] = collections.Counter(
+            {tgt_id: counts[tgt_id] for tgt_id in kept})
+
+  frequent_ids = [
+      tgt_id for tgt_id, _ in sorted(
+          six.iteritems(tgt_token_counts), key=lambda x: (-x[1], x[0]))
+  ][:num_frequent]
+  translations = {
+      src_id: _TopTranslations(counts, src_counts[src_id], tgt_counts,
+                               num_translations)
+      for src_id, counts in six.iteritems(pair_counts)
+  }
+  return frequent_ids, translations
+
+
+def CandidateSet(src_ids, frequent_ids, translations, include_source_ids):
+  """Returns the set of candidate target ids of a source, see VocabShortlist."""
+  candidates = set(frequent_ids)
+  for src_id in src_ids:
+    candidates.update(translations.get(src_id, []))
+  if include_source_ids:
+    candidates.update(src_ids)
+  return candidates
+
+
+def Coverage(sentence_pairs, frequent_ids, translations, include_source_ids):
+  """Measures how well shortlists cover the targets of parallel data.
+
+  Args:
+    sentence_pairs: An iterable of (source ids, target ids) pairs.
+    frequent_ids: The frequent target ids to include in the shortlists.
+    translations: A dict from source id to the list of its target ids to
+      include in the shortlists.
+    include_source_ids: Whether the source ids are included in the shortlists.
+
+  Returns:
+    A `.NestedMap` of the fraction of the target tokens in the shortlist of
+    their sentence ('token_coverage'), the fraction of the target sentences
+    entirely in their shortlist ('sentence_coverage') and the average size of
+    the shortlist of a sentence ('avg_shortlist_size').
+  """
+  num_sentences = num_covered_sentences = 0
+  num_tokens = num_covered_tokens = 0
+  total_shortlist_size = 0
+  for src_ids, tgt_ids in sentence_pairs:
+    candidates = CandidateSet(src_ids, frequent_ids, translations,
+                              include_source_ids)
+    num_covered = sum(1 for tgt_id in tgt_ids if tgt_id in candidates)
+    num_sentences += 1
+    num_covered_sentences += int(num_covered == len(tgt_ids))
+    num_tokens += len(tgt_ids)
+    num_covered_tokens += num_covered
+    total_shortlist_size += len(candidates)
+  return py_utils.NestedMap(
+      token_coverage=num_covered_tokens / max(num_tokens, 1),
+      sentence_coverage=num_covered_sentences / max(num_sentences, 1),
+      avg_shortlist_size=total_shortlist_size / max(num_sentences, 1))
+
+
+class VocabShortlist(base_layer.BaseLayer):
+  """Builds the target vocabulary shortlist of a batch of sources.
+
+  The shortlist of a batch is the union of the candidate target ids of its
+  sources: the top `num_frequent` frequent target ids, the top
+  `num_translations` translations of each source id, optionally the source ids
+  and `special_ids`. The table is embedded in the graph as constants, so that
+  it ships with exported inference graphs.
+  """
+
+  @classmethod
+  def Params(cls):
+    p = super(VocabShortlist, cls).Params()
+    p.Define('table_path', '', 'The path of the shortlist table.')
+    p.Define('source_vocab_size', 32000, 'The size of the source vocabulary.')
+    p.Define('target_vocab_size', 32000, 'The size of the target vocabulary.')
+    p.Define('num_frequent', 100,
+             'The number of frequent target ids in the shortlist.')
+    p.Define('num_translations', 100,
+             'The number of translations per source id in the shortlist.')
+    p.Define(
+        'include_source_ids', True, 'Whether the source ids are in the '
+        'shortlist, e.g. for copying tokens with a shared vocabulary.')
+    p.Define('special_ids', [], 'Target ids which are always in the shortlist.')
+    p.name = 'shortlist'
+    return p
+
+  @base_layer.initializer
+  def __init__(self, params):
+    super(VocabShortlist, self).__init__(params)
+    p = self.params
+    assert p.table_path
+    frequent_ids, translations = ReadTable(p.table_path)
+    self._always_ids = np.array(
+        sorted(set(frequent_ids[:p.num_frequent]) | set(p.special_ids)),
+        dtype=np.int32)
+    # [source_vocab_size + 1, num_translations], padded with -1. The last row
+    # is for the source ids out of the source vocabulary, which have none.
+    self._translations = np.full(
+        [p.source_vocab_size + 1, p.num_translations], -1, dtype=np.int32)
+    for src_id, tgt_ids in six.iteritems(translations):
+      if src_id < p.source_vocab_size:
+        tgt_ids = tgt_ids[:p.num_translations]
+        self._translations[src_id, :len(tgt_ids)] = tgt_ids
+
+  def CandidateIds(self, src_ids, src_paddings):
+    """Returns the candidate target ids of each source.
+
+    The frequent and special ids are not included, see `ShortlistIds`. Source
+    ids out of the source vocabulary have no translations, and source ids out
+    of the target vocabulary are not candidates.
+
+    Args:
+      src_ids: An int tensor of shape [batch, time].
+      src_paddings: A tensor of shape [batch, time].
+
+    Returns:
+      An int tensor of shape [num_candidates, batch], time major as the encoder
+      outputs, padded with -1.
+    """
+    p = self.params
+    # [batch, time, num_translations].
+    candidate_ids = tf.gather(
+        tf.constant(self._translations),
+        tf.minimum(src_ids, p.source_vocab_size))
+    if p.include_source_ids:
+      src_tgt_ids = tf.where(src_ids < p.target_vocab_size, src_ids,
+                             -tf.ones_like(src_ids))
+      candidate_ids = tf.concat(
+          [candidate_ids, tf.expand_dims(src_tgt_ids, -1)], axis=-1)
+    is_padding = tf.expand_dims(tf.cast(src_paddings, tf.int32), -1)
+    candidate_ids = candidate_ids * (1 - is_padding) - is_padding
+    batch = py_utils.GetShape(src_ids)[0]
+    return tf.transpose(tf.reshape(candidate_ids, [batch, -1]))
+
+  def ShortlistIds(self, candidate_ids):
+    """Returns the shortlist of a batch.
+
+    Args:
+      candidate_ids: An int tensor of shape [num_candidates, batch], see
+        `CandidateIds`.
+
+    Returns:
+      An int tensor of shape [num_shortlisted], the sorted target ids of the
+      shortlist.
+    """
+    p = self.params
+    ids = tf.concat(
+        [tf.reshape(candidate_ids, [-1]),
+         tf.constant(self._always_ids)], axis=0)
+    # The ids of the table out of the target vocabulary are dropped too.
+    ids = tf.boolean_mask(
+        ids, tf.logical_and(ids >= 0, ids < p.target_vocab_size))
+    in_shortlist = tf.scatter_nd(
+        tf.expand_dims(ids, 1), tf.ones_like(ids), [p.target_vocab_size])
+    return tf.cast(tf.reshape(tf.where(in_shortlist > 0), [-1]), tf.int32)
+
+  def ToVocabLogProbs(self, log_probs, shortlist_ids):
+    """Maps the log probs of a shortlist back to the target vocabulary.
+
+    Args:
+      log_probs: A tensor of shape [batch, num_shortlisted].
+      shortlist_ids: An int tensor of shape [num_shortlisted], see
+        `ShortlistIds`.
+
+    Returns:
+      A tensor of shape [batch, target_vocab_size], in which the target ids
+      which are not in the shortlist have a log prob of -1e9.
+    """
+    p = self.params
+    num_shortlisted = tf.size(shortlist_ids)
+    # The index of each target id in the shortlist, num_shortlisted if it is
+    # not in the shortlist.
+    indices = tf.scatter_nd(
+        tf.expand_dims(shortlist_ids, 1),
+        tf.range(num_shortlisted) - num_shortlisted,
+        [p.target_vocab_size]) + num_shortlisted
+    batch = py_utils.GetShape(log_probs)[0]
+    log_probs = tf.concat([
+        log_probs,
+        tf.fill([batch, 1], tf.constant(_NOT_SHORTLISTED_LOG_PROB,
+                                        log_probs.dtype))
+    ], axis=1)
+    return tf.gather(log_probs, indices, axis=1)
@@ -0,0 +1,126 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+"""Tests for mt.shortlist."""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import os
+
+import lingvo.compat as tf
+from lingvo.core import test_utils
+from lingvo.tasks.mt import shortlist
+import numpy as np
+
+FLAGS = tf.flags.FLAGS
+
+_SENTENCE_PAIRS = [([3, 4, 2], [5, 6, 2]), ([3, 7, 2], [5, 8, 2]),
+                   ([4, 2], [6, 2])]
+
+
+class ShortlistTest(test_utils.TestCase):
+
+  def testBuildTable(self):
+    frequent_ids, translations = shortlist.BuildTable(
+        _SENTENCE_PAIRS, num_frequent=2, num_translations=1)
+    self.assertEqual([2, 5], frequent_ids)
+    self.assertEqual({2: [2], 3: [5], 4: [6], 7: [8]}, translations)
+
+    table_path = os.path.join(FLAGS.test_tmpdir, 'build_table.txt')
+    shortlist.WriteTable(table_path, frequent_ids, translations)
+    self.assertEqual((frequent_ids, translations),
+                     shortlist.ReadTable(table_path))
+
+  def testBuildTablePrunesPairCounts(self):
+    # Source id 3 always translates to 5, along with a new noise id each time.
+    sentence_pairs = [([3], [5, 10 + i]) for i in range(20)]
+    _, translations = shortlist.BuildTable(
+        sentence_pairs,
+        num_frequent=0,
+        num_translations=10,
+        max_pairs_per_source=2)
+    self.assertEqual(5, translations[3][0])
+    # The counts never grow to 2 * max_pairs_per_source.
+    self.assertLess(len(translations[3]), 4)
+
+  def testCoverage(self):
+    frequent_ids, translations = shortlist.BuildTable(
+        _SENTENCE_PAIRS, num_frequent=1, num_translations=1)
+    coverage = shortlist.Coverage(
+        _SENTENCE_PAIRS + [([7, 2], [9, 2])],
+        frequent_ids,
+        translations,
+        include_source_ids=False)
+    self.assertAllClose(0.9, coverage.token_coverage)
+    self.assertAllClose(0.75, coverage.sentence_coverage)
+    self.assertAllClose(2.5, coverage.avg_shortlist_size)
+
+  def testVocabShortlist(self):
+    table_path = os.path.join(FLAGS.test_tmpdir, 'vocab_shortlist.txt')
+    shortlist.WriteTable(table_path, [2, 5], {2: [2], 3: [5], 4: [6], 7: [8]})
+    p = shortlist.VocabShortlist.Params().Set(
+        table_path=table_path,
+        source_vocab_size=10,
+        target_vocab_size=10,
+        num_frequent=1,
+        num_translations=1,
+        special_ids=[1])
+    layer = p.Instantiate()
+    with self.session(use_gpu=False):
+      candidate_ids = layer.CandidateIds(
+          tf.constant([[3, 4, 0], [7, 2, 2]]),
+          tf.constant([[0., 0., 1.], [0., 0., 0.]]))
+      self.assertAllEqual(
+          [[5, 8], [3, 7], [6, 2], [4, 2], [-1, 2], [-1, 2]],
+          candidate_ids.eval())
+      self.assertAllEqual([1, 2, 3, 4, 5, 6, 7, 8],
+                          layer.ShortlistIds(candidate_ids).eval())
+      shortlist_ids = layer.ShortlistIds(candidate_ids[:, :1])
+      self.assertAllEqual([1, 2, 3, 4, 5, 6], shortlist_ids.eval())
+
+      log_probs = np.log(np.full([1, 6], 1. / 6, dtype=np.float32))
+      vocab_log_probs = layer.ToVocabLogProbs(
+          tf.constant(log_probs), shortlist_ids).eval()
+      self.assertEqual((1, 10), vocab_log_probs.shape)
+      self.assertAllClose(log_probs, vocab_log_probs[:, 1:7])
+      self.assertAllClose([[-1e9, -1e9, -1e9, -1e9]],
+                          vocab_log_probs[:, [0, 7, 8, 9]])
+
+  def testVocabShortlistWithMismatchedVocabSizes(self):
+    table_path = os.path.join(FLAGS.test_tmpdir, 'mismatched_shortlist.txt')
+    shortlist.WriteTable(table_path, [2, 9], {3: [5, 9], 7: [6]})
+    p = shortlist.VocabShortlist.Params().Set(
+        table_path=table_path,
+        source_vocab_size=5,
+        target_vocab_size=8,
+        num_frequent=2,
+        num_translations=2,
+        special_ids=[1])
+    layer = p.Instantiate()
+    with self.session(use_gpu=False):
+      # 7 has no translations as it is out of the source vocabulary, and 9 is
+      # out of both vocabularies.
+      candidate_ids = layer.CandidateIds(
+          tf.constant([[3, 7, 9]]), tf.zeros([1, 3]))
+      self.assertAllEqual([[5], [9], [3], [-1], [-1], [7], [-1], [-1], [-1]],
+                          candidate_ids.eval())
+      self.assertAllEqual([1, 2, 3, 5, 7],
+                          layer.ShortlistIds(candidate_ids).eval())
+
+
+if __name__ == '__main__':
+  tf.test.main()
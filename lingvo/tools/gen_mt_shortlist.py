@@ -0,0 +1,105 @@
+# Lint as: python2, python3
+# Copyright 2020 The TensorFlow Authors. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==============================================================================
+r"""Builds and evaluates MT target vocabulary shortlist tables.
+
+Builds a table from the training data:
+
+  gen_mt_shortlist --mode=build --input_filepattern=train.tfrecord-* \
+      --shortlist_table=/tmp/shortlist.txt
+
+Measures the coverage of the shortlists of the test data:
+
+  gen_mt_shortlist --mode=coverage --input_filepattern=test.tfrecord-* \
+      --shortlist_table=/tmp/shortlist.txt --num_frequent=100 \
+      --num_translations=50
+
+To measure the BLEU impact, decode the test set with and without
+p.decoder.shortlist (a shortlist.VocabShortlist with the same table_path,
+num_frequent and num_translations) and compare the corpus_bleu decoder metrics.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import lingvo.compat as tf
+from lingvo.tasks.mt import shortlist
+import six
+
+tf.flags.DEFINE_enum('mode', 'build', ['build', 'coverage'],
+                     'Whether to build a table or measure its coverage.')
+tf.flags.DEFINE_string('input_filepattern', '',
+                       'File pattern of the tfrecord files of MT examples.')
+tf.flags.DEFINE_string('shortlist_table', '', 'Path of the shortlist table.')
+tf.flags.DEFINE_integer('num_frequent', 100,
+                        'Number of frequent target ids in the shortlists.')
+tf.flags.DEFINE_integer(
+    'num_translations', 100,
+    'Number of translations per source id in the shortlists.')
+tf.flags.DEFINE_integer(
+    'max_pairs_per_source', 0,
+    'Number of co-occurrence counts kept per source id when building the '
+    'table, 0 for 10 * num_translations.')
+tf.flags.DEFINE_bool('include_source_ids', True,
+                     'Whether the source ids are in the shortlists.')
+tf.flags.DEFINE_list(
+    'special_ids', ['1', '2'],
+    'Target ids which are always in the shortlists, e.g. <s> and </s>.')
+tf.flags.DEFINE_string('source_feature', 'source_id',
+                       'Name of the feature of the source ids.')
+tf.flags.DEFINE_string('target_feature', 'target_label',
+                       'Name of the feature of the target ids.')
+
+FLAGS = tf.flags.FLAGS
+
+
+def _ReadSentencePairs():
+  """Yields the (source ids, target ids) pairs of the input files."""
+  for filepath in tf.io.gfile.glob(FLAGS.input_filepattern):
+    for serialized in tf.compat.v1.io.tf_record_iterator(filepath):
+      ex = tf.train.Example()
+      ex.ParseFromString(serialized)
+      features = ex.features.feature
+      yield (list(features[FLAGS.source_feature].int64_list.value),
+             list(features[FLAGS.target_feature].int64_list.value))
+
+
+def main(_):
+  tf.logging.set_verbosity(tf.logging.INFO)
+  if FLAGS.mode == 'build':
+    frequent_ids, translations = shortlist.BuildTable(
+        _ReadSentencePairs(), FLAGS.num_frequent, FLAGS.num_translations,
+        FLAGS.max_pairs_per_source)
+    shortlist.WriteTable(FLAGS.shortlist_table, frequent_ids, translations)
+    tf.logging.info('Wrote the translations of %d source ids to %s',
+                    len(translations), FLAGS.shortlist_table)
+  else:
+    frequent_ids, translations = shortlist.ReadTable(FLAGS.shortlist_table)
+    frequent_ids = frequent_ids[:FLAGS.num_frequent] + [
+        int(x) for x in FLAGS.special_ids
+    ]
+    translations = {
+        k: v[:FLAGS.num_translations] for k, v in six.iteritems(translations)
+    }
+    coverage = shortlist.Coverage(_ReadSentencePairs(), frequent_ids,
+                                  translations, FLAGS.include_source_ids)
+    tf.logging.info('Token coverage: %f', coverage.token_coverage)
+    tf.logging.info('Sentence coverage: %f', coverage.sentence_coverage)
+    tf.logging.info('Average shortlist size: %f', coverage.avg_shortlist_size)
+
+
+if __name__ == '__main__':
+  tf.app.run(main)
@@ -46,10 +46,14 @@ from lingvo import model_registry
 import lingvo.compat as tf
 from lingvo.core import base_model
 from lingvo.core import base_model_params
+from lingvo.core import bucket_tuner
 from lingvo.core import checkpointer
 from lingvo.core import cluster_factory
 from lingvo.core import inference_graph_exporter
+from lingvo.core import input_benchmark
+from lingvo.core import memory_planner
 from lingvo.core import metrics
+from lingvo.core import optimizer
 from lingvo.core import py_utils
 import numpy as np
 import six
@@ -92,9 +96,13 @@ tf.flags.DEFINE_string(
     'async: used in an async training setup; '
     'sync: used in a sync training setup; '
     'shell: an interactive shell for development; '
+    'inspect_model: print the variables and memory estimate of the model; '
     'inspect_evaler: print evaler dataset names; '
     'inspect_decoder: print decoder dataset names; '
-    'write_inference_graph: write inference graphs to logdir.')
+    'inspect_placement: print the variable load of the ps devices; '
+    'write_inference_graph: write inference graphs to logdir; '
+    'benchmark_input: measure the throughput of the training input; '
+    'tune_buckets: suggest bucketing params for the training input.')
 tf.flags.DEFINE_string('job', '', 'trainer/controller/eval, etc.')
 tf.flags.DEFINE_integer('task', 0, 'Task id within the job.')
 
@@ -112,6 +120,18 @@ tf.flags.DEFINE_integer('worker_split_size', 1,
 tf.flags.DEFINE_string('ps_job', '/job:ps', 'Job name')
 tf.flags.DEFINE_integer('ps_replicas', 1, 'Number of replicas.')
 tf.flags.DEFINE_integer('ps_gpus', 0, 'Number of gpus to use per replica.')
+tf.flags.DEFINE_integer(
+    'inspect_model_measure_steps', 0,
+    'If > 0, --mode=inspect_model also runs this many training steps '
+    'locally, and prints the measured peak memory of each device.')
+tf.flags.DEFINE_string(
+    'var_placement_strategy', None,
+    'How variables are placed on the ps devices: least_loaded or '
+    'traffic_balanced. If None, uses the cluster params default.')
+tf.flags.DEFINE_string(
+    'var_traffic_weights_file', '',
+    'Optional file of "<regex> <weight>" lines, with the estimated traffic '
+    'weights of variables for the traffic_balanced placement strategy.')
 
 tf.flags.DEFINE_string('input_job', '/job:input', 'Job name')
 tf.flags.DEFINE_integer('input_replicas', 0, 'Number of replicas.')
@@ -167,6 +187,29 @@ tf.flags.DEFINE_bool(
     'operation without a separate Controller task.'
     'TODO(b/137871213) migrate file/summaries from Controller.')
 
+tf.flags.DEFINE_integer(
+    'input_benchmark_batches', 100,
+    'Number of batches measured per setting in --mode=benchmark_input.')
+
+tf.flags.DEFINE_bool(
+    'input_benchmark_sweep', False,
+    'If True, --mode=benchmark_input sweeps file_parallelism, '
+    'num_batcher_threads and file_buffer_size and suggests the fastest '
+    'setting.')
+
+tf.flags.DEFINE_integer('bucket_tuner_num_buckets', 8,
+                        'Maximum number of buckets for --mode=tune_buckets.')
+
+tf.flags.DEFINE_integer(
+    'bucket_tuner_tokens_per_batch', 0,
+    'Memory budget of a batch, in padded tokens, for --mode=tune_buckets. '
+    'If 0, the largest bucket_upper_bound * bucket_batch_limit of the current '
+    'input params is used.')
+
+tf.flags.DEFINE_integer(
+    'bucket_tuner_num_samples', 100000,
+    'Number of example lengths sampled for --mode=tune_buckets.')
+
 tf.flags.DEFINE_string(
     'tpu', None,
     'The Cloud TPU on GCP to use for training. This should be either the name '
@@ -253,6 +296,28 @@ def _ModelAnalysis(model):
   return output, analyzer.total
 
 
+def _AdamSlotsRatio(optimizer_params):
+  """Returns the slots of Adam relative to the variables, if it is compared to.
+
+  Args:
+    optimizer_params: The params of the optimizer of a task.
+
+  Returns:
+    The size of the slots of Adam, wrapped by the same optimizer.Accumulators
+    as the optimizer, relative to the trainable variables, or None if the
+    optimizer is not an Adafactor.
+  """
+  # The two moments of Adam.
+  ratio = 2
+  while issubclass(optimizer_params.cls, optimizer.Accumulator):
+    # The gradient accumulator.
+    ratio += 1
+    optimizer_params = optimizer_params.optimizer_tpl
+  if issubclass(optimizer_params.cls, optimizer.Adafactor):
+    return ratio
+  return None
+
+
 class Controller(base_runner.BaseRunner):
   """Controller for a training cluster."""
 
@@ -398,11 +463,16 @@ class Trainer(base_runner.BaseRunner):
 
   def __init__(self, *args, **kwargs):
     super(Trainer, self).__init__(*args, **kwargs)
+    self._steps_per_loop = min(self.params.train.steps_per_loop,
+                               self.params.train.max_steps)
     with self._graph.as_default(), tf.container(self._container_id):
       with self._cluster, tf.device(self._cluster.GetPlacer()):
         self._model = self.params.Instantiate()
         self._params = self._model.params
-        self._model.ConstructFPropBPropGraph()
+        if self._steps_per_loop > 1:
+          self._ConstructTrainLoop()
+        else:
+          self._model.ConstructFPropBPropGraph()
       self.initialize_tables = tf.tables_initializer()
       self._initialize_local_vars = tf.local_variables_initializer()
       self.enqueue_ops = tf.get_collection(py_utils.ENQUEUE_OPS)
@@ -433,6 +503,66 @@ class Trainer(base_runner.BaseRunner):
     self._start_up_delay_steps = (((worker_id + 1) * worker_id / 2) *
                                   self.params.train.start_up_delay_steps)
 
+  def _ConstructTrainLoop(self):
+    """Builds `self._steps_per_loop` training steps in an in-graph loop.
+
+    Like `TrainerTpu`, the model is constructed inside the loop body and the
+    eval metrics are summed across the loop steps, so a single session run
+    trains `self._steps_per_loop` steps and fetches their averaged metrics.
+    The per-example tensors of the last step are kept in local variables and
+    fetched once per loop.
+    """
+    if len(self._model.tasks) != 1:
+      raise ValueError('train.steps_per_loop > 1 is only supported for single '
+                       'task models.')
+    if self.params.train.ema_decay > 0:
+      raise ValueError('train.steps_per_loop > 1 does not support ema_decay.')
+    self._loop_eval_metrics = metrics.TpuEvalMetrics()
+    per_example_vars = {}
+
+    def _LoopCond(i, *args):
+      del args
+      return i < self._steps_per_loop
+
+    def _LoopBody(i, *args):
+      """Runs one training step and sums its metrics into `args`."""
+      self._model.ConstructFPropBPropGraph()
+      task = self._model.GetTask()
+      step_metrics = self._loop_eval_metrics.SetMetrics(task.eval_metrics,
+                                                        args)
+      assign_ops = [task.train_op]
+      for index, (key, value) in enumerate(
+          sorted(six.iteritems(task.per_example_tensors))):
+        # The initializer is lifted out of the loop as it is a callable.
+        per_example_vars[key] = tf.Variable(
+            lambda dtype=value.dtype: tf.zeros([], dtype=dtype),
+            name='last_per_example_tensor_%d' % index,
+            trainable=False,
+            collections=[tf.GraphKeys.LOCAL_VARIABLES],
+            validate_shape=False)
+        assign_ops.append(
+            tf.assign(per_example_vars[key], value, validate_shape=False))
+      with tf.control_dependencies(assign_ops):
+        summed_metrics = [x + y for x, y in zip(step_metrics, args)]
+      return [i + 1] + summed_metrics
+
+    loop_result = tf.while_loop(
+        _LoopCond,
+        _LoopBody, [tf.constant(0)] + self._loop_eval_metrics.initial_values,
+        parallel_iterations=1,
+        back_prop=False)
+    num_metrics = len(self._loop_eval_metrics.metrics.Flatten())
+    summed_metrics = loop_result[1:1 + 2 * num_metrics]
+    final_metrics = []
+    for value, weight in zip(summed_metrics[::2], summed_metrics[1::2]):
+      final_metrics += [value / weight, weight]
+    with tf.control_dependencies(loop_result):
+      global_step = tf.identity(py_utils.GetGlobalStep())
+      per_example_tensors = {
+          k: v.read_value() for k, v in six.iteritems(per_example_vars)
+      }
+    self._train_loop_ops = [final_metrics, global_step, per_example_tensors]
+
   def _SummarizeValue(self, steps, tag, value, writer):
     if writer:
       writer.add_summary(metrics.CreateScalarSummary(tag, value), steps)
@@ -522,12 +652,17 @@ class Trainer(base_runner.BaseRunner):
             except AttributeError:
               pass
 
-        _, global_step, eval_metrics, per_example_tensors = sess.run([
-            model_task.train_op,
-            py_utils.GetGlobalStep(),
-            model_task.eval_metrics,
-            model_task.per_example_tensors,
-        ])
+        if self._steps_per_loop > 1:
+          values, global_step, per_example_tensors = sess.run(
+              self._train_loop_ops)
+          eval_metrics = self._loop_eval_metrics.PackMetricsValues(values)
+        else:
+          _, global_step, eval_metrics, per_example_tensors = sess.run([
+              model_task.train_op,
+              py_utils.GetGlobalStep(),
+              model_task.eval_metrics,
+              model_task.per_example_tensors,
+          ])
         msg = 'step:%6d' % global_step
         for key, (val, _) in sorted(six.iteritems(eval_metrics)):
           msg += ' %s:%.8g' % (key, val)
@@ -1503,6 +1638,10 @@ class RunnerManager(object):
     cluster.ps.name = FLAGS.ps_job
     cluster.ps.replicas = FLAGS.ps_replicas
     cluster.ps.gpus_per_replica = FLAGS.ps_gpus
+    if FLAGS.var_placement_strategy:
+      cluster.var_placement_strategy = FLAGS.var_placement_strategy
+    if FLAGS.var_traffic_weights_file:
+      cluster.var_traffic_weights_file = FLAGS.var_traffic_weights_file
 
     cluster.input.name = FLAGS.input_job
     cluster.input.replicas = FLAGS.input_replicas
@@ -1699,14 +1838,88 @@ class RunnerManager(object):
       FLAGS.decoder_gpus = 0
 
   def InspectModel(self):
-    """Prints out model analysis for the model."""
+    """Prints out model analysis and memory estimate for the model."""
     FLAGS.mode = 'sync'
     p = self.GetParamsForDataset('controller', 'Train')
     c = cluster_factory.Cluster(p.cluster)
-    with tf.Graph().as_default(), c, tf.device(c.GetPlacer()):
-      analysis, _ = _ModelAnalysis(p.Instantiate())
+    with tf.Graph().as_default() as graph, c, tf.device(c.GetPlacer()):
+      model = p.Instantiate()
+      analysis, _ = _ModelAnalysis(model)
+      model.ConstructFPropBPropGraph()
+      train_op = tf.group(*[task.train_op for task in model.tasks])
+      init_op = tf.group(tf.global_variables_initializer(),
+                         tf.tables_initializer())
     print(analysis)
 
+    bucket_sizes = memory_planner.BucketSizes(p.input)
+    estimate = memory_planner.EstimateMemory(graph, bucket_sizes)
+    measured_peaks = None
+    if FLAGS.inspect_model_measure_steps:
+      with tf.Session(
+          graph=graph, config=py_utils.SessionConfig(
+              soft_placement=True)) as sess:
+        sess.run(init_op)
+        measured_peaks = memory_planner.MeasurePeakBytes(
+            sess, train_op, FLAGS.inspect_model_measure_steps)
+    # Adam is only compared to Adafactor, with the same slots for all tasks.
+    adam_slots_ratios = set(
+        _AdamSlotsRatio(task.params.train.optimizer) for task in model.tasks)
+    print(
+        memory_planner.FormatMemoryEstimate(
+            estimate,
+            bucket_sizes,
+            measured_peaks,
+            adam_slots_ratio=(adam_slots_ratios.pop()
+                              if len(adam_slots_ratios) == 1 else None)))
+
+  def InspectPlacement(self):
+    """Prints out the bytes and traffic of the variables per ps device."""
+    p = self.GetParamsForDataset('controller', 'Train')
+    c = cluster_factory.Cluster(p.cluster)
+    with tf.Graph().as_default(), c, tf.device(c.GetPlacer()):
+      p.Instantiate()
+      print(c.VarPlacementSummary(tf.global_variables()))
+
+  def BenchmarkInput(self):
+    """Measures the throughput of the model's training input."""
+    FLAGS.mode = 'sync'
+    p = self.GetParamsForDataset('controller', 'Train')
+    input_params = p.input
+    if FLAGS.model_task_name:
+      input_params = input_params.Get(FLAGS.model_task_name)
+    with cluster_factory.Cluster(p.cluster):
+      if FLAGS.input_benchmark_sweep:
+        results = input_benchmark.SweepInputParams(
+            input_params, num_batches=FLAGS.input_benchmark_batches)
+        print(input_benchmark.FormatSweepResults(results))
+      else:
+        summary = input_benchmark.BenchmarkInput(
+            input_params, num_batches=FLAGS.input_benchmark_batches)
+        print(input_benchmark.FormatSummary(summary))
+
+  def TuneBuckets(self):
+    """Prints bucketing params override for the model's training input."""
+    FLAGS.mode = 'sync'
+    p = self.GetParamsForDataset('controller', 'Train')
+    input_params = p.input
+    prefix = 'input'
+    if FLAGS.model_task_name:
+      input_params = input_params.Get(FLAGS.model_task_name)
+      prefix += '.' + FLAGS.model_task_name
+    tokens_per_batch = FLAGS.bucket_tuner_tokens_per_batch
+    if not tokens_per_batch:
+      tokens_per_batch = max(
+          b * l for b, l in zip(input_params.bucket_upper_bound,
+                                input_params.bucket_batch_limit))
+    with cluster_factory.Cluster(p.cluster):
+      lengths = bucket_tuner.SampleLengths(input_params,
+                                           FLAGS.bucket_tuner_num_samples)
+    result = bucket_tuner.SolveBuckets(lengths, FLAGS.bucket_tuner_num_buckets,
+                                       tokens_per_batch)
+    tf.logging.info('Estimated padding ratio with %d samples: %.4f',
+                    len(lengths), result.padding_ratio)
+    print(bucket_tuner.ParamsOverride(result, prefix))
+
   def InspectDatasets(self):
     """Prints out datasets configured for the model."""
     cls = self.model_registry.GetClass(self._model_name)
@@ -1807,6 +2020,10 @@ class RunnerManager(object):
       self.InspectModel()
       return
 
+    if FLAGS.mode == 'inspect_placement':
+      self.InspectPlacement()
+      return
+
     if FLAGS.mode == 'inspect_evaler':
       self.InspectDatasets()
       return
@@ -1819,6 +2036,14 @@ class RunnerManager(object):
       self.WriteInferenceGraph()
       return
 
+    if FLAGS.mode == 'benchmark_input':
+      self.BenchmarkInput()
+      return
+
+    if FLAGS.mode == 'tune_buckets':
+      self.TuneBuckets()
+      return
+
     if FLAGS.mode == 'shell':
       _StartShell(locals())
       return
@@ -31,6 +31,7 @@ import lingvo.compat as tf
 from lingvo.core import base_input_generator
 from lingvo.core import base_layer
 from lingvo.core import base_model
+from lingvo.core import optimizer
 from lingvo.core import py_utils
 from lingvo.core import test_utils
 from lingvo.core import trainer_test_utils
@@ -208,6 +209,54 @@ class TrainerTest(BaseTrainerTest):
     self.assertTrue(self._HasFile(inference_files, 'inference.pbtxt'))
     self.assertTrue(self._HasFile(inference_files, 'inference_tpu.pbtxt'))
 
+  def testIdentityRegressionModelWithStepsPerLoop(self):
+    logdir = os.path.join(
+        tf.test.get_temp_dir(),
+        'identity_regression_loop_test' + str(random.random()))
+    FLAGS.logdir = logdir
+
+    steps = 100
+    steps_per_loop = 10
+    cfg = trainer_test_utils.IdentityRegressionModel.Params()
+    cfg.cluster.task = 0
+    cfg.cluster.mode = 'sync'
+    cfg.cluster.job = 'trainer_client'
+    cfg.cluster.worker.name = '/job:local'
+    cfg.cluster.worker.replicas = 1
+    cfg.cluster.worker.gpus_per_replica = 0
+    cfg.cluster.ps.name = '/job:local'
+    cfg.cluster.ps.replicas = 1
+    cfg.cluster.ps.gpus_per_replica = 0
+    cfg.train.max_steps = steps
+    cfg.train.steps_per_loop = steps_per_loop
+    cfg.task.train.learning_rate = 0.025
+
+    runners = [self._CreateController(cfg), self._CreateTrainer(cfg)]
+
+    runner_manager = trainer.RunnerManager(cfg.name)
+    runner_manager.StartRunners(runners)
+    train = runners[1]
+
+    # ProcessFPropResults is called once per loop, with the metrics averaged
+    # over the loop steps.
+    num_loops = steps // steps_per_loop
+    self.assertAllEqual(
+        [(2, steps_per_loop)] * num_loops,
+        [m['num_samples_in_batch'] for m in train._model.metrics])
+    expected_global_steps = [
+        (i + 1) * steps_per_loop for i in range(num_loops)
+    ]
+    self.assertAllEqual(expected_global_steps, train._model.global_steps)
+
+    # The per-example tensors are those of the last step of each loop.
+    expected_input_tensors = [{
+        'input':
+            np.array([[4 * i, 4 * i + 1], [4 * i + 2, 4 * i + 3]])
+    } for i in range(steps_per_loop - 1, steps, steps_per_loop)]
+    self.assertAllClose(expected_input_tensors, [{
+        'input': d['input']
+    } for d in train._model.result_per_example_tensors])
+
 
 class TrainerWithTrialTest(TrainerTest):
 
@@ -365,5 +414,21 @@ class ProcessFPropResultsTest(BaseTrainerTest):
                     10.0)
 
 
+class AdamSlotsRatioTest(test_utils.TestCase):
+
+  def testAdamSlotsRatio(self):
+    self.assertIsNone(trainer._AdamSlotsRatio(optimizer.Adam.Params()))
+    self.assertEqual(2, trainer._AdamSlotsRatio(optimizer.Adafactor.Params()))
+    # The Adafactor wrapped by an Accumulator is compared to the Adam wrapped
+    # by an Accumulator.
+    self.assertEqual(
+        3,
+        trainer._AdamSlotsRatio(optimizer.Accumulator.Params().Set(
+            optimizer_tpl=optimizer.Adafactor.Params())))
+    self.assertIsNone(
+        trainer._AdamSlotsRatio(optimizer.Accumulator.Params().Set(
+            optimizer_tpl=optimizer.Adam.Params())))
+
+
 if __name__ == '__main__':
   tf.test.main()